@@ -3,9 +3,25 @@ from theagent.nodes import (
     DocAgentNode, SummaryAgentNode, TestGenerationAgentNode, BugDetectionAgentNode,
     RefactorCodeAgentNode, TypeAnnotationAgentNode, MigrationAgentNode,
     IntentRecognitionNode, ClarificationNode, FileManagementNode, SafetyCheckNode,
-    ContextAwarenessNode, ErrorHandlingNode, UserApprovalNode
+    ContextAwarenessNode, ErrorHandlingNode, UserApprovalNode, AnswerNode,
+    MultiActionNode, BackgroundJobNode
 )
 
+AGENT_NODES = {
+    'doc': DocAgentNode,
+    'summary': SummaryAgentNode,
+    'test': TestGenerationAgentNode,
+    'bug': BugDetectionAgentNode,
+    'refactor': RefactorCodeAgentNode,
+    'type': TypeAnnotationAgentNode,
+    'migration': MigrationAgentNode,
+}
+
+def create_agent_node(args, llm_proxy, provider='openai', model=None):
+    if args.agent not in AGENT_NODES:
+        raise ValueError(f"Unknown agent type: {args.agent}")
+    return AGENT_NODES[args.agent](args, llm_proxy, provider=provider, model=model)
+
 def create_doc_agent_flow(args, llm_proxy, provider='openai', model=None):
     doc_node = DocAgentNode(args, llm_proxy, provider=provider, model=model)
     return Flow(start=doc_node)
@@ -15,22 +31,7 @@ def create_enhanced_agent_flow(args, llm_proxy, provider='openai', model=None):
     context_node = ContextAwarenessNode()
     safety_node = SafetyCheckNode('in_place_modification', getattr(args, 'file', None))
     
-    if args.agent == 'doc':
-        agent_node = DocAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'summary':
-        agent_node = SummaryAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'test':
-        agent_node = TestGenerationAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'bug':
-        agent_node = BugDetectionAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'refactor':
-        agent_node = RefactorCodeAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'type':
-        agent_node = TypeAnnotationAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'migration':
-        agent_node = MigrationAgentNode(args, llm_proxy, provider=provider, model=model)
-    else:
-        raise ValueError(f"Unknown agent type: {args.agent}")
+    agent_node = create_agent_node(args, llm_proxy, provider=provider, model=model)
     
     approval_node = UserApprovalNode('result', "Please review the generated result:", "Result Review")
     error_node = ErrorHandlingNode('main_operation')
@@ -49,22 +50,7 @@ def create_simple_enhanced_flow(args, llm_proxy, provider='openai', model=None):
     """Create a simple enhanced flow with basic safety and error handling."""
     context_node = ContextAwarenessNode()
 
-    if args.agent == 'doc':
-        agent_node = DocAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'summary':
-        agent_node = SummaryAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'test':
-        agent_node = TestGenerationAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'bug':
-        agent_node = BugDetectionAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'refactor':
-        agent_node = RefactorCodeAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'type':
-        agent_node = TypeAnnotationAgentNode(args, llm_proxy, provider=provider, model=model)
-    elif args.agent == 'migration':
-        agent_node = MigrationAgentNode(args, llm_proxy, provider=provider, model=model)
-    else:
-        raise ValueError(f"Unknown agent type: {args.agent}")
+    agent_node = create_agent_node(args, llm_proxy, provider=provider, model=model)
     
     error_node = ErrorHandlingNode('main_operation')
 
@@ -73,8 +59,16 @@ def create_simple_enhanced_flow(args, llm_proxy, provider='openai', model=None):
     
     return Flow(start=context_node)
 
-def create_chat_flow(args, llm_proxy, provider='openai', model=None):
-    """Create a chat flow with intent recognition."""
+def create_batch_agent_flow(args, llm_proxy, provider='openai', model=None):
+    """Create the per-file flow used in directory/glob mode (no prompts, no context banner)."""
+    return Flow(start=create_agent_node(args, llm_proxy, provider=provider, model=model))
+
+def create_chat_flow(args, llm_proxy, provider='openai', model=None, jobs=None):
+    """Create a chat flow with intent recognition.
+
+    With a JobManager, agent requests (code generation/analysis, multi-action) start background
+    jobs instead of running in the foreground.
+    """
     intent_node = IntentRecognitionNode(args, llm_proxy, provider=provider, model=model)
     clarification_node = ClarificationNode("Please clarify your request")
     file_management_node = FileManagementNode(args, llm_proxy, provider=provider, model=model)
@@ -83,12 +77,21 @@ def create_chat_flow(args, llm_proxy, provider='openai', model=None):
   
     doc_node = DocAgentNode(args, llm_proxy, provider=provider, model=model)
     summary_node = SummaryAgentNode(args, llm_proxy, provider=provider, model=model)
+    answer_node = AnswerNode(args, llm_proxy, provider=provider, model=model)
+    multi_action_node = MultiActionNode(args, llm_proxy, provider=provider, model=model)
     
     intent_node - "clarification" >> clarification_node
     intent_node - "file_management" >> file_management_node
-    intent_node - "code_generation" >> doc_node
-    intent_node - "code_analysis" >> summary_node
-    intent_node - "general_question" >> error_node
+    intent_node - "general_question" >> answer_node
+    if jobs is not None:
+        job_node = BackgroundJobNode(args, llm_proxy, jobs, provider=provider, model=model)
+        intent_node - "code_generation" >> job_node
+        intent_node - "code_analysis" >> job_node
+        intent_node - "multi_action" >> job_node
+    else:
+        intent_node - "code_generation" >> doc_node
+        intent_node - "code_analysis" >> summary_node
+        intent_node - "multi_action" >> multi_action_node
 
     clarification_node >> intent_node
     file_management_node >> error_node
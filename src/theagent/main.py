@@ -4,15 +4,11 @@ import sys
 import json
 import toml
 import importlib.metadata
-from theagent.flow import (
-    create_doc_agent_flow, create_enhanced_agent_flow, create_simple_enhanced_flow,
-    create_chat_flow
-)
 
 class Args:
     pass
 
-SESSION_FILE_DEFAULT = "theagent_session.json"
+SESSION_FILE_DEFAULT = "theagent_session.jsonl"
 
 def setup_shared_context(args_obj):
     """Setup shared context with current directory and file information."""
@@ -53,7 +49,7 @@ def load_config():
             print(f"[WARN] Could not load config file {CONFIG_FILE}: {e}")
     return {}
 
-def setup_llm_proxy(args):
+def setup_llm_proxy(args, response_cache_size=0):
     from theagent.utils.call_llm import GeneralLLMProxy
     config = load_config()
     def resolve(key, cli_value, config_key=None):
@@ -67,113 +63,618 @@ def setup_llm_proxy(args):
         anthropic_api_key=resolve('anthropic_api_key', getattr(args, 'anthropic_api_key', None)),
         google_api_key=resolve('google_api_key', getattr(args, 'google_api_key', None)),
         ollama_host=resolve('ollama_host', getattr(args, 'ollama_host', None)),
+        response_cache_size=response_cache_size,
     )
 
 def run_sync_flow(flow, shared):
     """Run a synchronous flow."""
     return flow.run(shared)
 
+def wait_for_memory(shared):
+    """Let the background conversation summary catch up before the session is written."""
+    memory = shared.get('memory')
+    if memory is not None:
+        try:
+            memory.wait(timeout=30)
+        except Exception as e:
+            print(f"[WARN] Conversation summary not finished, saving the turns it was working on: {e}")
+
 def save_session(shared, filename=SESSION_FILE_DEFAULT):
-    data = {
-        'chat_history': shared.get('chat_history', []),
-        'project_context': shared.get('project_context', {})
-    }
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
+    """Write the whole session to filename as a compacted session log."""
+    from theagent.utils.session_log import SessionLog
+    wait_for_memory(shared)
+    SessionLog(filename).rewrite(shared)
     print(f"[INFO] Session saved to {filename}")
 
 def load_session(shared, filename=SESSION_FILE_DEFAULT):
+    """Load the recent turns of a session log (or an old JSON session); returns the log, or None."""
+    from theagent.utils.session_log import SessionLog
+    log = SessionLog(filename)
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        shared['chat_history'] = data.get('chat_history', [])
-        shared['project_context'] = data.get('project_context', {})
-        print(f"[INFO] Session loaded from {filename}")
+        state = log.load()
+        shared['chat_history'] = state['chat_history']
+        shared['project_context'] = state['project_context']
+        shared['memory_state'] = state['memory_state']
+        print(f"[INFO] Session loaded from {filename} ({len(state['chat_history'])} recent message(s))")
+        return log
     except Exception as e:
         print(f"[WARN] Could not load session: {e}")
+        return None
+
+def start_session(shared, args_obj, llm_proxy, log=None):
+    """Load --load-session, attach conversation memory and open the --save-session log (or None).
+
+    Passing the log of a running chat (after an error) picks the session up from that log instead.
+    """
+    from theagent.utils.session_log import SessionLog, is_legacy_session
+    load_path = getattr(args_obj, 'load_session', None)
+    save_path = getattr(args_obj, 'save_session', None)
+    if log is not None:
+        load_path = save_path = log.path
+        log = load_session(shared, log.path)
+    else:
+        log = load_session(shared, load_path) if load_path else None
+    memory = attach_memory(shared, args_obj, llm_proxy)
+    if not save_path:
+        return None
+    if log is None or os.path.abspath(save_path) != os.path.abspath(load_path):
+        # A new log, starting with whatever was loaded.
+        log = SessionLog(save_path)
+        log.rewrite(shared)
+    elif is_legacy_session(save_path):
+        log.rewrite(shared)
+    # Turns are logged before memory folds them out of the history.
+    memory.on_fold = lambda messages: log.record(shared)
+    return log
+
+def finish_session(shared, session_log):
+    if session_log is not None:
+        wait_for_memory(shared)
+        session_log.record(shared)
+        print(f"[INFO] Session saved to {session_log.path}")
 
 def load_project_context(shared, files=None):
-    """Load project context (README, main files, config) into shared['project_context']."""
-    context = {}
+    """Load project context (README, main files, config) into shared['project_context'].
+
+    Entries hold a content hash and a digest (headline and symbols); the file text goes to the
+    blob store, and files are only re-read when their mtime or size changed.
+    """
+    from theagent.utils.project_context import ContextCache, default_context_files
     if files is None:
-        files = []
-        # Default: README.md, pyproject.toml, requirements.txt, main.py
-        for fname in ["README.md", "pyproject.toml", "requirements.txt", "main.py"]:
-            if os.path.exists(fname):
-                files.append(fname)
-    for fname in files:
+        files = default_context_files()
+    cache = shared.get('context_cache')
+    if cache is None:
+        cache = shared['context_cache'] = ContextCache()
+    shared['project_context_files'] = files
+    shared['project_context'] = cache.refresh(files)
+
+def run_batch_mode(args_obj, llm_proxy, extra_shared=None):
+    """Run the selected agent over every file found by --path/--glob (or changed under --since/--staged) and print one report."""
+    from theagent.flow import create_batch_agent_flow
+    from theagent.utils.discovery import discover_files
+    from theagent.utils.batch import run_batch, format_batch_report
+    import time
+    changed_lines = getattr(args_obj, 'changed_lines', None)
+    if args_obj.path or args_obj.glob:
+        files = discover_files(args_obj.path, args_obj.glob)
+        if changed_lines is not None:
+            files = [f for f in files if os.path.realpath(f) in changed_lines]
+    else:
+        files = sorted(changed_lines or {})
+    if not files:
+        print("[WARN] No Python files found")
+        return
+    if getattr(args_obj, 'queue', None):
+        run_queue_mode(args_obj, files)
+        return
+    shard = getattr(args_obj, 'shard', None)
+    if shard is not None:
+        from theagent.utils.sharding import assign_shard, read_originals
+        files, universe, owned, shard_lines = assign_shard(files, shard[0], shard[1], os.getcwd(),
+                                                           by=args_obj.shard_by, changed_lines=changed_lines)
+        if shard_lines is not None:
+            args_obj.changed_lines = shard_lines
+        originals = read_originals(files, os.getcwd(), args_obj.agent)
+        print(f"[INFO] Shard {shard[0]}/{shard[1]}: {len(owned)} of {len(universe)} unit(s) by {args_obj.shard_by}")
+    print(f"[INFO] Processing {len(files)} file(s) with {args_obj.workers} worker(s)...")
+    flow_args = dict(provider=getattr(args_obj, 'provider', 'openai'), model=getattr(args_obj, 'model', None))
+    start = time.time()
+    open_journal(args_obj)
+    journal_path = args_obj.journal.path if args_obj.journal is not None else None
+    try:
+        results = run_batch(args_obj, files, lambda file_args: create_batch_agent_flow(file_args, llm_proxy, **flow_args),
+                            workers=args_obj.workers, extra_shared=extra_shared)
+    finally:
+        close_journal(args_obj)
+    print("\n[REPORT] " + format_batch_report(results, time.time() - start))
+    if shard is not None:
+        from theagent.utils.sharding import write_bundle, default_bundle_dir
+        bundle = args_obj.bundle or default_bundle_dir(shard)
+        manifest = write_bundle(bundle, args_obj, os.getcwd(), shard, universe, owned, results, originals, journal_path)
+        print(f"[INFO] Wrote shard bundle to {bundle} ({len(manifest['patches'])} patch(es)); "
+              f"combine all shards with `theagent merge`")
+
+# Options that stay with each worker rather than travelling with the job.
+LOCAL_OPTIONS = ('openai_api_key', 'anthropic_api_key', 'google_api_key', 'ollama_host', 'journal', 'changed_lines',
+                 'subcommand', 'queue', 'no_daemon')
+
+def job_options(args_obj):
+    """The run's options as plain JSON values, for workers to rebuild the same configuration."""
+    options = {}
+    for name, value in vars(args_obj).items():
+        if name in LOCAL_OPTIONS:
+            continue
+        try:
+            json.dumps(value)
+        except TypeError:
+            continue
+        options[name] = value
+    return options
+
+def run_queue_mode(args_obj, files):
+    """Coordinator for --queue: enqueue the files, wait for `theagent worker` processes to drain them, print one report."""
+    from theagent.utils.work_queue import open_queue, format_queue_status
+    from theagent.utils.journal import job_id, file_hash
+    from theagent.utils.batch import format_batch_report
+    import time
+    queue = open_queue(args_obj.queue)
+    job = job_id(args_obj)
+    if not (args_obj.resume and queue.get_meta('job') == job):
+        queue.reset()
+    queue.set_meta('options', job_options(args_obj))
+    queue.set_meta('job', job)
+    changed_lines = getattr(args_obj, 'changed_lines', None)
+    units, hashes = [], {}
+    for path in files:
+        rel = os.path.relpath(path).replace(os.sep, '/')
+        ranges = None if changed_lines is None else changed_lines.get(os.path.realpath(path), [])
+        hashes[rel] = file_hash(path)
+        # Largest first, as in batch mode, so the longest units start early.
+        units.append((rel, {'file': rel, 'ranges': ranges, 'hash': hashes[rel], 'job': job}, os.path.getsize(path)))
+    added = queue.enqueue(units)
+    print(f"[INFO] Queued {added} file(s) on {args_obj.queue}" + (f" ({len(units) - added} kept from the last run)" if added < len(units) else ""))
+    print(f"[INFO] Start workers with: theagent worker --queue {args_obj.queue}")
+    start = time.time()
+    last_status = None
+    try:
+        while True:
+            status = format_queue_status(queue)
+            if status != last_status:
+                print("[PROGRESS] " + status)
+                last_status = status
+            counts = queue.counts()
+            if counts['pending'] == 0 and counts['leased'] == 0:
+                break
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        print("\n[INFO] Stopped waiting; workers keep going. Re-run the same command with --resume to pick up the results.")
+        return
+    results = []
+    for rel, result in sorted(queue.results().items()):
+        result = dict(result, file=rel)
+        result.setdefault('duration', 0.0)
+        result.setdefault('error', None)
+        code = result.get('code')
+        if (args_obj.output == 'in-place' and result['status'] == 'ok' and isinstance(code, str)
+                and rel in hashes and file_hash(rel) == hashes[rel]):
+            # The worker ran on another machine; bring its rewrite into this checkout.
+            with open(rel, 'w', encoding='utf-8') as f:
+                f.write(code.rstrip() + '\n')
+        results.append(result)
+    print("\n[REPORT] " + format_batch_report(results, time.time() - start))
+    queue.close()
+
+def run_worker_command(args_obj, llm_proxy):
+    """`theagent worker`: pull files from a --queue run and process them until stopped (or drained)."""
+    from theagent.flow import create_batch_agent_flow
+    from theagent.utils.work_queue import open_queue, format_queue_status, run_worker, default_worker_name
+    import time
+    queue = open_queue(args_obj.worker_queue)
+    if args_obj.status:
+        print(format_queue_status(queue, now=time.time()))
+        return
+    name = args_obj.name or default_worker_name()
+    print(f"[INFO] Worker {name} pulling from {args_obj.worker_queue}. Stop with Ctrl+C.")
+    served = None
+    try:
+        while True:
+            job = queue.get_meta('job')
+            counts = queue.counts()
+            if job is None or (job == served and counts['pending'] == 0 and counts['leased'] == 0):
+                if args_obj.exit_when_idle and served is not None:
+                    break
+                time.sleep(1.0)
+                continue
+            job_args = build_parser().parse_args([])
+            for key, value in (queue.get_meta('options') or {}).items():
+                setattr(job_args, key, value)
+            job_args.verbose = job_args.verbose or args_obj.verbose
+            flow_args = dict(provider=job_args.provider, model=job_args.model)
+            done = run_worker(queue, job_args, lambda file_args: create_batch_agent_flow(file_args, llm_proxy, **flow_args),
+                              name=name, lease_seconds=args_obj.lease, exit_when_idle=True,
+                              should_stop=lambda: queue.get_meta('job') != job)
+            print(f"[INFO] Worker {name}: {done} file(s) finished for job {job}")
+            served = job
+    except KeyboardInterrupt:
+        print(f"\n[GOODBYE] Worker {name} stopped; its current lease will expire and be retried.")
+    finally:
+        queue.close()
+
+def run_merge_command(args_obj):
+    """`theagent merge`: check that shard bundles cover the run exactly once and combine their results."""
+    from theagent.utils.sharding import merge_bundles
+    try:
+        merged = merge_bundles(args_obj.bundles, apply=args_obj.apply)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Could not read bundles: {e}")
+        return 1
+    print(f"[REPORT] {merged['shards']} shard(s), {merged['units']} unit(s)\n" + merged['report'])
+    for error in merged['errors']:
+        print(f"[ERROR] {error}")
+    for conflict in merged['conflicts']:
+        print(f"[ERROR] Conflict: {conflict}")
+    if args_obj.report:
+        with open(args_obj.report, 'w', encoding='utf-8') as f:
+            f.write(merged['report'] + '\n')
+    if args_obj.patch:
+        with open(args_obj.patch, 'w', encoding='utf-8') as f:
+            f.write(merged['patch'])
+        print(f"[INFO] Wrote combined change set to {args_obj.patch}")
+    if merged['errors'] or merged['conflicts']:
+        if args_obj.apply:
+            print("[WARN] Nothing applied; fix the problems above first")
+        return 1
+    if args_obj.apply:
+        print(f"[SUCCESS] Applied changes to {len(merged['applied'])} file(s)")
+    return 0
+
+def open_journal(args_obj):
+    """Attach the job journal for this run configuration (continued under --resume, fresh otherwise)."""
+    from theagent.utils.journal import JobJournal
+    try:
+        args_obj.journal = JobJournal.for_args(args_obj)
+    except OSError as e:
+        print(f"[WARN] Could not open job journal, progress will not be checkpointed: {e}")
+        args_obj.journal = None
+        return
+    if args_obj.resume:
+        print(f"[INFO] Resuming from {args_obj.journal.path} ({len(args_obj.journal.completed)} unit(s) done)")
+
+def close_journal(args_obj):
+    journal = getattr(args_obj, 'journal', None)
+    if journal is not None:
+        if journal.replayed:
+            print(f"[INFO] Replayed {journal.replayed} unit(s) from the job journal")
+        journal.close()
+        args_obj.journal = None
+
+def attach_prefetcher(shared, args_obj):
+    """Prefetch the files chat input mentions while the intent call runs (off with --no-prefetch).
+
+    The prefetcher goes on args_obj, where the chat nodes (and their copies in jobs) look for it.
+    """
+    args_obj.prefetch = None
+    if getattr(args_obj, 'no_prefetch', False):
+        return None
+    from theagent.utils.prefetch import Prefetcher
+    args_obj.prefetch = Prefetcher(symbol_index=shared.get('symbol_index'))
+    return args_obj.prefetch
+
+def attach_symbol_index(shared, root=None):
+    """Open and incrementally update the symbol index if `theagent index` has been run here."""
+    from theagent.utils.symbol_index import SymbolIndex
+    if not SymbolIndex.exists(root):
+        return None
+    try:
+        index = SymbolIndex(root)
+        stats = index.update()
+        if shared.get('verbose'):
+            print(f"[INFO] Symbol index: {stats['files']} files, {stats['parsed']} re-parsed in {stats['seconds']:.2f}s")
+        shared['symbol_index'] = index
+        return index
+    except Exception as e:
+        print(f"[WARN] Could not update symbol index: {e}")
+        return None
+
+def attach_memory(shared, args_obj, llm_proxy):
+    """Keep the chat history within --memory-budget tokens, summarizing older turns in the background."""
+    from theagent.utils.memory import ConversationMemory, llm_summarizer
+    shared['memory'] = ConversationMemory(
+        shared['chat_history'],
+        token_budget=getattr(args_obj, 'memory_budget', None) or 1500,
+        summarize=llm_summarizer(llm_proxy, provider=shared['provider'], model=shared['model']),
+        state=shared.pop('memory_state', None))
+    return shared['memory']
+
+def attach_retriever(shared, args_obj):
+    """Build or refresh the BM25 chunk index used to pick chat context, unless disabled."""
+    if getattr(args_obj, 'no_retrieval', False):
+        return None
+    from theagent.utils.retrieval import BM25Index
+    try:
+        retriever = BM25Index()
+        changed = retriever.update()
+        if shared.get('verbose'):
+            print(f"[INFO] Retrieval index: {len(retriever.chunks)} chunks ({changed} file(s) re-indexed)")
+        shared['retriever'] = retriever
+        return retriever
+    except Exception as e:
+        print(f"[WARN] Could not build retrieval index, falling back to fixed project context: {e}")
+        return None
+
+def attach_semantic_index(shared, args_obj):
+    """Open and sync the embedding index for --semantic (needs numpy and a local Ollama embedding model)."""
+    if not getattr(args_obj, 'semantic', False):
+        return None
+    from theagent.utils.embeddings import EmbeddingIndex, OllamaEmbedder
+    try:
+        embedder = OllamaEmbedder(args_obj.embedding_model, host=getattr(args_obj, 'ollama_host', None))
+        index = EmbeddingIndex(embedder)
+        embedded = index.update()
+        if shared.get('verbose'):
+            print(f"[INFO] Semantic index: {len(index)} chunks ({embedded} embedded)")
+        shared['semantic_index'] = index
+        return index
+    except Exception as e:
+        print(f"[WARN] Could not build semantic index: {e}")
+        return None
+
+def run_watch_command(args_obj, llm_proxy):
+    """Re-run the selected agents on the functions/classes changed by each save, until interrupted."""
+    import copy
+    import time
+    from theagent.flow import create_batch_agent_flow, AGENT_NODES
+    from theagent.utils.discovery import discover_files
+    from theagent.utils.batch import run_batch, format_batch_report
+    from theagent.utils.watcher import create_watcher, wait_for_changes, WatchSession, agent_outputs
+    agents = [a.strip() for a in args_obj.watch_agents.split(',') if a.strip()]
+    unknown = [a for a in agents if a not in AGENT_NODES]
+    if not agents or unknown:
+        print(f"[ERROR] Unknown agent(s): {', '.join(unknown) or '(none)'}; choose from {', '.join(AGENT_NODES)}")
+        return
+    root = args_obj.watch_path or os.getcwd()
+    if not os.path.isdir(root):
+        print(f"[ERROR] Not a directory: {root}")
+        return
+    shared = {'verbose': args_obj.verbose}
+    # Providers, caches and indexes are created once and stay warm across runs.
+    warm = {}
+    for key, index in (('symbol_index', attach_symbol_index(shared)), ('semantic_index', attach_semantic_index(shared, args_obj))):
+        if index is not None:
+            warm[key] = index
+    flow_args = dict(provider=getattr(args_obj, 'provider', 'openai'), model=getattr(args_obj, 'model', None))
+    session = WatchSession(discover_files(root, args_obj.watch_glob))
+    watcher = create_watcher(root, poll=args_obj.poll, interval=args_obj.poll_interval)
+    print(f"[INFO] Watching {os.path.abspath(root)} ({type(watcher).__name__}) for: {', '.join(agents)}. Press Ctrl+C to stop.")
+    try:
+        while True:
+            touched = wait_for_changes(watcher, debounce=args_obj.debounce)
+            watched = {os.path.realpath(f) for f in discover_files(root, args_obj.watch_glob)}
+            changes = session.changes(p for p in touched if os.path.realpath(p) in watched)
+            if not changes:
+                continue
+            files = sorted(changes)
+            print(f"\n[INFO] {len(files)} file(s) changed: {', '.join(os.path.relpath(f) for f in files)}")
+            start = time.time()
+            for index in warm.values():
+                index.update()
+            skipped = set()
+            for agent in agents:
+                agent_args = copy.copy(args_obj)
+                agent_args.agent = agent
+                # Against the last version seen before this save, so later agents also cover lines earlier ones rewrote.
+                agent_args.changed_lines = {f: session.ranges_since(f) for f in files}
+                results = run_batch(agent_args, files,
+                                    lambda file_args: create_batch_agent_flow(file_args, llm_proxy, **flow_args),
+                                    workers=args_obj.watch_workers or args_obj.workers, extra_shared=warm)
+                skipped.update(r['file'] for r in results if r['status'] == 'skipped')
+                print(f"\n[REPORT] {agent}: " + format_batch_report(results))
+            # Files that do not parse yet keep their old baseline, so the next save still covers this edit.
+            kept = [f for f in files if f not in skipped]
+            session.remember(agent_outputs(kept, start) if args_obj.output != 'console' else kept)
+            print(f"[INFO] Done in {time.time() - start:.1f}s; watching...")
+    except KeyboardInterrupt:
+        print("\n[GOODBYE] Stopped watching.")
+    finally:
+        watcher.close()
+
+def run_index_command(args_obj, index=None):
+    from theagent.utils.symbol_index import SymbolIndex, format_symbols
+    owned = index is None
+    if owned:
+        index = SymbolIndex(args_obj.root)
+    stats = index.update(rebuild=args_obj.rebuild)
+    counts = index.stats()
+    print(f"[INFO] Indexed {stats['files']} file(s) in {stats['seconds']:.2f}s "
+          f"({stats['parsed']} parsed, {stats['removed']} removed): "
+          f"{counts['symbols']} symbols, {counts['imports']} imports, {counts['calls']} call edges")
+    if args_obj.search:
+        print(format_symbols(index.find_symbols(args_obj.search)))
+    if args_obj.callers:
+        callers = index.callers(args_obj.callers)
+        print('\n'.join(f"{c['file']}:{c['line']} {c['caller']} -> {c['target']}" for c in callers) or "No call sites found.")
+    if owned:
+        index.close()
+
+def load_changed_lines(args_obj):
+    """Record changed line ranges per file for --since/--staged; returns False if git failed."""
+    if not (args_obj.since or args_obj.staged):
+        return True
+    from theagent.utils.git_changes import changed_hunks, GitError
+    try:
+        args_obj.changed_lines = changed_hunks(args_obj.since, args_obj.staged)
+    except GitError as e:
+        print(f"[ERROR] Could not read git changes: {e}")
+        return False
+    source = 'the index' if args_obj.staged else args_obj.since
+    print(f"[INFO] {len(args_obj.changed_lines)} changed Python file(s) against {source}")
+    return True
+
+async def in_daemon_thread(fn, *args):
+    """Await fn(*args) run on a daemon thread, so a blocked call (input, a cancelled turn) never keeps the process alive."""
+    import asyncio
+    import threading
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(setter, value):
+        if not future.done():
+            setter(value)
+
+    def run():
         try:
-            with open(fname, 'r', encoding='utf-8') as f:
-                context[fname] = f.read()
+            result = fn(*args)
         except Exception as e:
-            context[fname] = f"[ERROR] Could not load: {e}"
-    shared['project_context'] = context
+            loop.call_soon_threadsafe(settle, future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(settle, future.set_result, result)
 
-def chat_with_theagent(args_obj, llm_proxy):
-    """Enhanced chat function with better context awareness and error handling."""
-    print("\n[TheAgent Chat] Type your instructions or questions. Type 'exit' to quit.")
-    print("[TIP] Try: 'list files', 'read main.py', 'generate docstrings for main.py', or ask general questions.\n")
-    
-    shared = setup_shared_context(args_obj)
-    if getattr(args_obj, 'load_session', None):
-        load_session(shared, args_obj.load_session)
-    # Load project context
-    context_files = getattr(args_obj, 'context_files', None)
-    if context_files:
-        files = [f.strip() for f in context_files.split(',') if f.strip()]
-        load_project_context(shared, files)
-    else:
-        load_project_context(shared)
-    
-    # Pass provider/model to flow if needed
-    flow = create_chat_flow(args_obj, llm_proxy, provider=shared['provider'], model=shared['model'])
-    
+    threading.Thread(target=run, daemon=True).start()
+    return await future
+
+def post_job_results(shared, jobs, session_log=None):
+    """Add the results of background jobs that finished since the last turn to the conversation."""
+    finished = jobs.collect() if jobs is not None else []
+    for job in finished:
+        if job.status == 'done':
+            content = f"Result of job {job.id} ({job.description}):\n{job.result}"
+        elif job.status == 'failed':
+            content = f"Job {job.id} ({job.description}) failed: {job.error}"
+        else:
+            content = f"Job {job.id} ({job.description}) was cancelled."
+        memory = shared.get('memory')
+        if memory is not None:
+            memory.add('agent', content)
+        else:
+            shared['chat_history'].append({'role': 'agent', 'content': content})
+    if finished and session_log is not None:
+        session_log.record(shared)
+    return finished
+
+async def chat_loop(args_obj, llm_proxy, shared, session_log, flow, jobs, retriever=None, semantic_index=None):
+    """The chat REPL: one turn at a time in the foreground, agent runs as background jobs."""
+    import asyncio
     while True:
         try:
-            user_input = input('You: ')
+            post_job_results(shared, jobs, session_log)
+            user_input = await in_daemon_thread(input, 'You: ')
+            post_job_results(shared, jobs, session_log)
             if user_input.strip().lower() in {'exit', 'quit', 'bye'}:
+                if jobs is not None and jobs.running():
+                    print(f"[INFO] Cancelling {len(jobs.running())} running job(s)")
                 print('[GOODBYE] Thanks for using TheAgent!')
-                if getattr(args_obj, 'save_session', None):
-                    save_session(shared, args_obj.save_session)
+                finish_session(shared, session_log)
                 break
+            reply = await jobs.command(user_input) if jobs is not None else None
+            if reply is not None:
+                print(reply)
+                continue
             
             shared['chat_history'].append({'role': 'user', 'content': user_input})
             args_obj.instruction = user_input
+            shared['user_input'] = user_input
+            if shared.get('project_context_files'):
+                load_project_context(shared, shared['project_context_files'])
+            if retriever is not None:
+                retriever.update()
+            if semantic_index is not None:
+                semantic_index.update()
             try:
-                result = flow.run(shared)
+                result = await in_daemon_thread(flow.run, shared)
                 if result:
                     print(f"TheAgent: {result}")
                     shared['chat_history'].append({'role': 'agent', 'content': result})
+                if session_log is not None:
+                    session_log.record(shared)
             except Exception as e:
                 handle_error(e, shared, args_obj)
                 print("[RECOVER] Attempting to recover...")
                 shared['last_error'] = e
                 
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
             print("\n\n[GOODBYE] Chat interrupted. Goodbye!")
-            if getattr(args_obj, 'save_session', None):
-                save_session(shared, args_obj.save_session)
+            finish_session(shared, session_log)
             break
         except EOFError:
             print("\n\n[GOODBYE] End of input. Goodbye!")
-            if getattr(args_obj, 'save_session', None):
-                save_session(shared, args_obj.save_session)
+            finish_session(shared, session_log)
             break
         except Exception as e:
             print(f"[ERROR] Unexpected error: {e}")
             print("[RESTART] Restarting chat...")
             shared = setup_shared_context(args_obj)
-            if getattr(args_obj, 'load_session', None):
-                load_session(shared, args_obj.load_session)
+            session_log = start_session(shared, args_obj, llm_proxy, log=session_log)
 
-def main():
-    """Main entry point for TheAgent."""
+def chat_with_theagent(args_obj, llm_proxy):
+    """Enhanced chat function with better context awareness and error handling."""
+    import asyncio
+    from theagent.utils.jobs import JobManager
+    print("\n[TheAgent Chat] Type your instructions or questions. Type 'exit' to quit.")
+    print("[TIP] Try: 'list files', 'read main.py', 'generate docstrings for main.py', or ask general questions.")
+    print("[TIP] Slash commands skip the LLM: /ls, /read FILE, /find NAME, /doc FILE, /summary FILE")
+    
+    shared = setup_shared_context(args_obj)
+    attach_symbol_index(shared)
+    prefetch = attach_prefetcher(shared, args_obj)
+    session_log = start_session(shared, args_obj, llm_proxy)
+    retriever = attach_retriever(shared, args_obj)
+    semantic_index = attach_semantic_index(shared, args_obj)
+    # Load project context
+    context_files = getattr(args_obj, 'context_files', None)
+    if context_files:
+        files = [f.strip() for f in context_files.split(',') if f.strip()]
+        load_project_context(shared, files)
+    elif retriever is None and semantic_index is None:
+        load_project_context(shared)
+    
+    jobs = None
+    if not getattr(args_obj, 'no_background', False):
+        jobs = JobManager(workers=getattr(args_obj, 'workers', None))
+        print("[TIP] Agent runs continue in the background: /jobs, /wait ID, /cancel ID")
+    print()
+    # Pass provider/model to flow if needed
+    from theagent.flow import create_chat_flow
+    flow = create_chat_flow(args_obj, llm_proxy, provider=shared['provider'], model=shared['model'], jobs=jobs)
+    try:
+        asyncio.run(chat_loop(args_obj, llm_proxy, shared, session_log, flow, jobs, retriever, semantic_index))
+    finally:
+        if jobs is not None:
+            jobs.shutdown()
+        if prefetch is not None:
+            if shared.get('verbose'):
+                print(f"[INFO] Prefetch: {prefetch.hits} hit(s), {prefetch.misses} miss(es)")
+            prefetch.close()
+
+def shard_spec(value):
+    """argparse type for --shard: 'i/N' -> (i, N)."""
+    from theagent.utils.sharding import parse_shard
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def build_parser():
+    """Argument parser for the CLI (also used by the daemon to parse forwarded commands)."""
     parser = argparse.ArgumentParser(description="TheAgent - AI-powered code assistant")
     parser.add_argument('--version', action='version', version=f'TheAgent {get_version()}', help='Show version and exit')
     subparsers = parser.add_subparsers(dest="subcommand")
 
     # Main agent options
     parser.add_argument("--file", "-f", help="Python file to process")
+    parser.add_argument("--path", help="Process every Python file under this directory (honours .gitignore)")
+    parser.add_argument("--glob", help="Process Python files matching this glob pattern (e.g. 'src/**/*.py')")
+    parser.add_argument("--since", metavar="REF", help="Only process functions/classes changed since a git ref (e.g. HEAD~1, origin/main)")
+    parser.add_argument("--staged", action="store_true", help="Only process functions/classes changed in staged (git index) changes")
+    parser.add_argument("--workers", type=int, default=4, help="Number of files processed concurrently in --path/--glob mode")
+    parser.add_argument("--shard", type=shard_spec, metavar="I/N",
+                       help="Only process shard I of N (1-based) in --path/--glob/--since mode and write a result bundle")
+    parser.add_argument("--shard-by", choices=["file", "symbol"], default="file",
+                       help="Split shards by file or by top-level function/class")
+    parser.add_argument("--bundle", metavar="DIR", help="Where --shard writes its result bundle (default: .theagent/bundles/)")
+    parser.add_argument("--queue", metavar="URL",
+                       help="Enqueue the files for `theagent worker` processes instead of running them here (SQLite path or redis://host:port/db)")
+    parser.add_argument("--resume", action="store_true",
+                       help="Skip files and functions the last run with the same options already finished (from the job journal)")
     parser.add_argument("--agent", "-a", choices=["doc", "summary", "test", "bug", "refactor", "type", "migration"], 
                        help="Type of agent to use")
     parser.add_argument("--output", "-o", choices=["console", "in-place", "new-file"], 
@@ -190,9 +691,42 @@ def main():
                        help="Skip user confirmation prompts")
     parser.add_argument("--migration-target", default="Python 3", 
                        help="Target for code migration")
+    parser.add_argument("--summary-mode", choices=["full", "map-reduce"], default="full",
+                       help="Summary agent mode: whole file at once, or hierarchical map-reduce (accepts a directory)")
+    parser.add_argument("--test-mode", choices=["module", "per-function"], default="module",
+                       help="Test agent mode: whole module at once, or one dependency-sliced prompt per function")
+    parser.add_argument("--edit-format", choices=["full", "diff", "edits"], default="full",
+                       help="How refactor/type/migration agents return changes: whole file, unified diff, or SEARCH/REPLACE edits")
+    parser.add_argument("--prefilter", action="store_true",
+                       help="Bug agent: run local static analysis first and send only flagged regions to the LLM")
+    parser.add_argument("--local-only", action="store_true",
+                       help="Bug agent: report local static analysis findings without any LLM call")
+    parser.add_argument("--complexity-threshold", type=int, default=10,
+                       help="Bug agent prefilter: send functions above this cyclomatic complexity to the LLM")
+    parser.add_argument("--validate-tests", action="store_true",
+                       help="Test agent: run the generated tests in sandboxed subprocess workers and report per-test results")
+    parser.add_argument("--repair-tests", type=int, default=0, metavar="ROUNDS",
+                       help="Test agent: send only the failing tests back for repair, up to ROUNDS times (implies validation)")
+    parser.add_argument("--test-timeout", type=int, default=30, help="Per-test timeout in seconds for --validate-tests")
+    parser.add_argument("--test-memory-mb", type=int, default=1024, help="Per-test memory limit in MB for --validate-tests")
     parser.add_argument("--save-session", help="Save chat session to file on exit")
     parser.add_argument("--load-session", help="Load chat session from file at start")
     parser.add_argument("--context-files", help="Comma-separated list of files to load as project context")
+    parser.add_argument("--context-budget", type=int, default=1500, help="Token budget for retrieved code chunks in chat prompts")
+    parser.add_argument("--context-top-k", type=int, default=5, help="Maximum number of retrieved code chunks per chat prompt")
+    parser.add_argument("--route-threshold", type=float, default=0.85,
+                       help="Chat: confidence needed to route a request locally without asking the LLM (above 1 disables local rules)")
+    parser.add_argument("--no-prefetch", action="store_true",
+                       help="In chat, do not read the files a message mentions while its intent is being recognized")
+    parser.add_argument("--no-background", action="store_true",
+                       help="In chat, run agent requests in the foreground instead of as background jobs")
+    parser.add_argument("--memory-budget", type=int, default=1500,
+                       help="Chat: token budget for conversation history per prompt; older turns are folded into a rolling summary")
+    parser.add_argument("--no-retrieval", action="store_true", help="Disable BM25 retrieval of chat context (use the fixed project files instead)")
+    parser.add_argument("--semantic", action="store_true",
+                       help="Add embedding-based code search to chat context and test slices (needs numpy and an Ollama embedding model)")
+    parser.add_argument("--embedding-model", default="nomic-embed-text", help="Ollama embedding model for --semantic")
+    parser.add_argument("--no-daemon", action="store_true", help="Run in this process even if a `theagent serve` daemon is running")
     parser.add_argument("--provider", choices=["openai", "anthropic", "google", "ollama"], default="openai", help="LLM provider to use")
     parser.add_argument("--model", help="LLM model to use (e.g., gpt-4o, claude-3-haiku-20240307, gemini-2.5-flash)")
     parser.add_argument("--openai-api-key", help="OpenAI API key (overrides env)")
@@ -200,6 +734,51 @@ def main():
     parser.add_argument("--google-api-key", help="Google Gemini API key (overrides env)")
     parser.add_argument("--ollama-host", help="Ollama host URL (overrides env)")
 
+    # Index subcommand
+    index_parser = subparsers.add_parser("index", help="Build or update the repository symbol index")
+    index_parser.add_argument("--root", help="Repository root to index (default: current directory)")
+    index_parser.add_argument("--rebuild", action="store_true", help="Drop the index and re-parse every file")
+    index_parser.add_argument("--search", metavar="NAME", help="Find functions/classes by name after updating")
+    index_parser.add_argument("--callers", metavar="NAME", help="List call sites of a function/method after updating")
+
+    # Watch subcommand
+    watch_parser = subparsers.add_parser("watch", help="Re-run agents on changed functions/classes whenever files are saved")
+    watch_parser.add_argument("--agent", "-a", dest="watch_agents", metavar="AGENTS", required=True,
+                              help="Comma-separated agents to run on each change (e.g. doc,type)")
+    watch_parser.add_argument("--path", dest="watch_path", metavar="DIR", help="Directory to watch (default: current directory)")
+    watch_parser.add_argument("--glob", dest="watch_glob", metavar="PATTERN", help="Only react to files matching this glob pattern")
+    watch_parser.add_argument("--workers", dest="watch_workers", metavar="N", type=int, help="Number of files processed concurrently")
+    watch_parser.add_argument("--debounce", type=float, default=0.3,
+                              help="Seconds without new events before a burst of saves is processed")
+    watch_parser.add_argument("--poll", action="store_true", help="Poll file stats instead of using inotify")
+    watch_parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between scans with --poll")
+
+    # Serve subcommand
+    serve_parser = subparsers.add_parser("serve", help="Run a daemon that keeps providers, caches and indexes warm for the CLI")
+    serve_parser.add_argument("--tcp", action="store_true", help="Listen on localhost TCP instead of a Unix socket")
+    serve_parser.add_argument("--port", type=int, default=0, help="TCP port for --tcp (default: any free port)")
+    serve_parser.add_argument("--response-cache", type=int, default=256, metavar="N",
+                              help="Keep up to N LLM responses in memory for identical prompts (0 disables)")
+    serve_parser.add_argument("--stop", action="store_true", help="Stop the daemon running in this directory")
+    serve_parser.add_argument("--status", action="store_true", help="Show the status of the daemon running in this directory")
+
+    # Worker subcommand
+    worker_parser = subparsers.add_parser("worker", help="Pull files from a --queue run and process them")
+    worker_parser.add_argument("--queue", dest="worker_queue", metavar="URL", required=True,
+                               help="Queue to pull from (SQLite path or redis://host:port/db)")
+    worker_parser.add_argument("--name", help="Worker name shown in progress reports (default: host-pid)")
+    worker_parser.add_argument("--lease", type=float, default=60.0,
+                               help="Seconds a unit stays leased without a heartbeat before it is handed to another worker")
+    worker_parser.add_argument("--exit-when-idle", action="store_true", help="Exit once the current job is drained")
+    worker_parser.add_argument("--status", action="store_true", help="Show queue progress and per-worker throughput, then exit")
+
+    # Merge subcommand
+    merge_parser = subparsers.add_parser("merge", help="Combine the result bundles of a sharded run")
+    merge_parser.add_argument("bundles", nargs="+", metavar="BUNDLE", help="Bundle directories written by --shard")
+    merge_parser.add_argument("--apply", action="store_true", help="Apply the combined changes to the working tree")
+    merge_parser.add_argument("--patch", metavar="FILE", help="Write the combined change set as one unified diff")
+    merge_parser.add_argument("--report", metavar="FILE", help="Write the combined report to FILE")
+
     # Config subcommand
     config_parser = subparsers.add_parser("config", help="Configure TheAgent (API keys, providers, etc.)")
     config_subparsers = config_parser.add_subparsers(dest="config_cmd")
@@ -213,7 +792,40 @@ def main():
     # config show
     config_show = config_subparsers.add_parser("show", help="Show current config and source")
 
-    args_obj = parser.parse_args()
+    return parser
+
+def main(argv=None):
+    """Main entry point for TheAgent."""
+    parser = build_parser()
+    argv = sys.argv[1:] if argv is None else argv
+    args_obj = parser.parse_args(argv)
+    if args_obj.repair_tests:
+        args_obj.validate_tests = True
+
+    if getattr(args_obj, "subcommand", None) == "serve":
+        from theagent.server import run_server
+        run_server(args_obj)
+        return
+
+    # Hand the command to a running daemon (theagent serve) if there is one; it has everything warm.
+    if not args_obj.no_daemon:
+        from theagent.server import can_forward, forward_to_daemon
+        if can_forward(args_obj):
+            exit_code = forward_to_daemon(argv)
+            if exit_code is not None:
+                if exit_code:
+                    sys.exit(exit_code)
+                return
+
+    if getattr(args_obj, "subcommand", None) == "index":
+        run_index_command(args_obj)
+        return
+
+    if getattr(args_obj, "subcommand", None) == "merge":
+        exit_code = run_merge_command(args_obj)
+        if exit_code:
+            sys.exit(exit_code)
+        return
 
     # Handle config subcommands
     if getattr(args_obj, "subcommand", None) == "config":
@@ -226,20 +838,36 @@ def main():
         elif args_obj.config_cmd == "show":
             show_config()
             return
-    
+
+    run_command(args_obj, parser)
+
+def run_command(args_obj, parser, llm_proxy=None, extra_shared=None):
+    """Run an agent, batch, watch or chat command; the daemon passes its warm proxy and indexes."""
+    from theagent.flow import create_doc_agent_flow, create_enhanced_agent_flow, create_simple_enhanced_flow
     shared = {
         "verbose": args_obj.verbose,
         "no_confirm": args_obj.no_confirm
     }
     
     try:
-        llm_proxy = setup_llm_proxy(args_obj)
+        llm_proxy = llm_proxy or setup_llm_proxy(args_obj)
         
-        if args_obj.chat:
+        if getattr(args_obj, "subcommand", None) == "watch":
+            run_watch_command(args_obj, llm_proxy)
+        elif getattr(args_obj, "subcommand", None) == "worker":
+            run_worker_command(args_obj, llm_proxy)
+        elif args_obj.chat:
             print("[INFO] Starting chat mode...")
             chat_with_theagent(args_obj, llm_proxy)
+        elif not load_changed_lines(args_obj):
+            sys.exit(1)
         elif args_obj.file and args_obj.agent:
             print("[INFO] Starting processing...")
+            if extra_shared is None:
+                attach_symbol_index(shared)
+                attach_semantic_index(shared, args_obj)
+            else:
+                shared.update(extra_shared)
             flow_args = dict(provider=getattr(args_obj, 'provider', 'openai'), model=getattr(args_obj, 'model', None))
             if args_obj.enhanced:
                 flow = create_enhanced_agent_flow(args_obj, llm_proxy, **flow_args)
@@ -250,7 +878,13 @@ def main():
                     flow = create_simple_enhanced_flow(args_obj, llm_proxy, **flow_args)
                 else:
                     flow = create_simple_enhanced_flow(args_obj, llm_proxy, **flow_args)
-            run_sync_flow(flow, shared)
+            open_journal(args_obj)
+            try:
+                run_sync_flow(flow, shared)
+            finally:
+                close_journal(args_obj)
+        elif (args_obj.path or args_obj.glob or args_obj.since or args_obj.staged) and args_obj.agent:
+            run_batch_mode(args_obj, llm_proxy, extra_shared)
         else:
             parser.print_help()
             return
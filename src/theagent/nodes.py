@@ -1,8 +1,32 @@
 from pocketflow import Node
 from theagent.utils.call_llm import GeneralLLMProxy
+from theagent.utils.summary_tree import HierarchicalSummarizer, render_summary_tree
+from theagent.utils.code_slicer import build_test_slices, merge_test_modules, strip_code_fences
+from theagent.utils.test_runner import (
+    run_tests_parallel, collect_test_ids, format_test_results, extract_definitions, replace_definitions,
+    DEFAULT_TEST_TIMEOUT, DEFAULT_MEMORY_LIMIT_MB
+)
+from theagent.utils.patching import apply_patch_response, PatchError
+from theagent.utils.static_analysis import (
+    analyze_source, select_regions, format_findings, DEFAULT_COMPLEXITY_THRESHOLD
+)
+from theagent.utils.git_changes import ranges_for, overlaps, symbols_in_ranges
+from theagent.utils.symbol_index import format_symbols
+from theagent.utils.retrieval import format_chunks, fuse_results, DEFAULT_TOP_K, DEFAULT_CONTEXT_BUDGET
+from theagent.utils.embeddings import RELATED_CODE_CHUNKS, RELATED_CODE_BUDGET
+from theagent.utils.journal import unit_key
+from theagent.utils.cache import content_hash
+from theagent.utils.project_context import format_project_context
+from theagent.utils.intent_router import route_locally, log_routing, DEFAULT_ROUTE_THRESHOLD
+from theagent.utils.console import OutputThreadPoolExecutor, capture_output
+from theagent.utils.stream_parser import IncrementalIntentParser
 import ast
+import copy
 import os
 import shutil
+import tempfile
+import textwrap
+import time
 import re
 import yaml
 from typing import Dict, List, Optional, Any
@@ -19,9 +43,25 @@ class BaseAgentNode(Node):
         file_path = self.args.file
         if not os.path.isfile(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
+        entry = self.prefetched()
+        if entry is not None:
+            return entry['text']
         with open(file_path, 'r', encoding='utf-8') as f:
             return f.read()
 
+    def prefetched(self):
+        """What was loaded ahead for args.file (chat prefetch, batch worker): text, tree, summary; or None."""
+        prefetch = getattr(self.args, 'prefetch', None)
+        if prefetch is None or not getattr(self.args, 'file', None):
+            return None
+        return prefetch.get(self.args.file)
+
+    def parse_source(self, source_code):
+        entry = self.prefetched()
+        if entry is not None and entry.get('tree') is not None and entry['text'] == source_code:
+            return entry['tree']
+        return ast.parse(source_code)
+
     def write_output(self, content, suffix, console_title=None):
         output_mode = getattr(self.args, 'output', 'console')
         file_path = self.args.file
@@ -44,6 +84,88 @@ class BaseAgentNode(Node):
             if verbose:
                 print(f"Wrote {console_title or 'output'} to {new_file}")
 
+    def rewrite_code(self, source_code, task, full_rewrite):
+        """Run a code-rewriting task, requesting only edits when --edit-format asks for them.
+
+        Falls back to full_rewrite() (whole-file regeneration) if the patch cannot be applied.
+        """
+        edit_format = getattr(self.args, 'edit_format', 'full')
+        if edit_format in ('diff', 'edits'):
+            try:
+                response = self.llm_proxy.generate_patch(
+                    source_code, task, edit_format=edit_format, provider=self.provider, model=self.model)
+                if response and response.startswith('Error:'):
+                    raise PatchError(response)
+                return apply_patch_response(source_code, response)
+            except PatchError as e:
+                print(f"[WARNING] Could not apply patch ({e}); falling back to full regeneration")
+        return full_rewrite()
+
+    def journaled(self, name, code, compute):
+        """compute() for one function-level unit; with --resume, replayed from the job journal if it already finished."""
+        journal = getattr(self.args, 'journal', None)
+        if journal is None:
+            return compute()
+        return journal.replay(unit_key(type(self).__name__, self.args.file, name), content_hash(code), compute,
+                              file=self.args.file, function=name)
+
+    def changed_ranges(self):
+        """Changed line ranges of the file under --since/--staged, or None outside that mode."""
+        changed_lines = getattr(self.args, 'changed_lines', None)
+        if changed_lines is None:
+            return None
+        return ranges_for(changed_lines, self.args.file)
+
+    def changed_symbols(self, source_code):
+        """Functions and classes overlapping changed hunks, or None to work on the whole file."""
+        ranges = self.changed_ranges()
+        if ranges is None:
+            return None
+        try:
+            return symbols_in_ranges(source_code, ranges)
+        except SyntaxError as e:
+            print(f"[WARNING] Could not parse {self.args.file} ({e}); processing the whole file")
+            return None
+
+    def rewrite_changed(self, source_code, task, regenerate):
+        """rewrite_code() on the whole file, or on each changed symbol under --since/--staged.
+
+        regenerate(code) is the full-regeneration fallback for a piece of code. Rewritten
+        symbols are spliced back in place; the rest of the file is left untouched.
+        """
+        symbols = self.changed_symbols(source_code)
+        if symbols is None:
+            return self.rewrite_code(source_code, task, lambda: regenerate(source_code))
+        if not symbols:
+            print("[INFO] No changed functions or classes; leaving the file unchanged")
+            return source_code
+
+        def rewrite(symbol):
+            code = textwrap.dedent(symbol['code'])
+            def compute():
+                new_code = self.rewrite_code(code, task, lambda: regenerate(code))
+                if new_code is None or new_code.startswith('# Error'):
+                    raise ValueError(new_code or "no result")
+                new_code = strip_code_fences(new_code)
+                ast.parse(new_code)
+                return new_code
+            try:
+                return self.journaled(symbol['name'], code, compute)
+            except Exception as e:
+                print(f"[WARNING] Could not rewrite {symbol['name']} ({e}); keeping it unchanged")
+                return None
+
+        with OutputThreadPoolExecutor(max_workers=getattr(self.args, 'workers', None) or 4) as pool:
+            rewritten = list(pool.map(rewrite, symbols))
+        lines = source_code.split('\n')
+        for symbol, new_code in sorted(zip(symbols, rewritten), key=lambda pair: pair[0]['start'], reverse=True):
+            if new_code is None:
+                continue
+            first_line = symbol['code'].split('\n', 1)[0]
+            indent = first_line[:len(first_line) - len(first_line.lstrip())]
+            lines[symbol['start'] - 1:symbol['end']] = textwrap.indent(new_code.rstrip('\n'), indent).split('\n')
+        return '\n'.join(lines)
+
     def _find_end_line(self, node):
         max_line = getattr(node, 'lineno', 0)
         for child in ast.iter_child_nodes(node):
@@ -61,12 +183,15 @@ class DocAgentNode(BaseAgentNode):
     def prep(self, shared):
         try:
             source_code = self.read_source()
-            tree = ast.parse(source_code)
+            tree = self.parse_source(source_code)
+            ranges = self.changed_ranges()
             functions = []
             for node in ast.walk(tree):
                 if isinstance(node, ast.FunctionDef):
                     start_line = node.lineno
                     end_line = self._find_end_line(node)
+                    if ranges is not None and not overlaps(ranges, start_line, end_line):
+                        continue
                     function_code = self._manual_source_segment(source_code, start_line, end_line)
                     functions.append({
                         'name': node.name,
@@ -74,7 +199,10 @@ class DocAgentNode(BaseAgentNode):
                         'line': start_line
                     })
             if not functions:
-                print("[WARNING] No functions found in the file")
+                if ranges is not None:
+                    print("[INFO] No changed functions in the file")
+                else:
+                    print("[WARNING] No functions found in the file")
                 return []
             return functions
         except Exception as e:
@@ -93,8 +221,8 @@ class DocAgentNode(BaseAgentNode):
         results = []
         for func in functions:
             try:
-                docstring = self.llm_proxy.generate_docstring(
-                    func['code'], provider=self.provider, model=self.model)
+                docstring = self.journaled(func['name'], func['code'], lambda: self.llm_proxy.generate_docstring(
+                    func['code'], provider=self.provider, model=self.model))
                 if docstring:
                     docstring = self._clean_docstring(docstring)
                 else:
@@ -151,6 +279,7 @@ class DocAgentNode(BaseAgentNode):
             new_lines[start:end] = docstring_lines
         new_source = ''.join(new_lines)
         self.write_output(new_source, 'documented', 'Documented Code')
+        shared['documented_code'] = new_source
         shared['docstring_results'] = exec_res
         return "default"
 
@@ -162,14 +291,48 @@ class DocAgentNode(BaseAgentNode):
 
 class SummaryAgentNode(BaseAgentNode):
     def prep(self, shared):
-        return self.read_source()
+        if getattr(self.args, 'summary_mode', 'full') == 'map-reduce':
+            # Map-reduce mode accepts a file or a whole package/repository directory.
+            if not os.path.exists(self.args.file):
+                raise FileNotFoundError(f"File not found: {self.args.file}")
+            return self.args.file
+        source_code = self.read_source()
+        symbols = self.changed_symbols(source_code)
+        if symbols is not None:
+            return '\n\n'.join(symbol['code'] for symbol in symbols)
+        return source_code
+
+    def _map_reduce_summary(self, path):
+        summarizer = HierarchicalSummarizer(
+            self.llm_proxy, provider=self.provider, model=self.model,
+            max_workers=getattr(self.args, 'workers', None) or 4)
+        if os.path.isdir(path):
+            tree = summarizer.summarize_tree(path)
+        else:
+            tree = summarizer.summarize_file(path)
+        if getattr(self.args, 'verbose', False):
+            print(f"[INFO] Map-reduce summary used {summarizer.llm_calls} LLM call(s); the rest came from cache")
+        return render_summary_tree(tree)
 
     def exec(self, source_code):
+        if getattr(self.args, 'summary_mode', 'full') == 'map-reduce':
+            try:
+                return self._map_reduce_summary(source_code)
+            except Exception as e:
+                print(f"[ERROR] Failed to generate summary: {e}")
+                return "Error: Failed to generate summary"
+        if self.changed_ranges() is not None and not source_code.strip():
+            return "No changed functions or classes."
+        entry = self.prefetched() if self.changed_ranges() is None else None
+        if entry is not None and entry.get('summary') and entry['text'] == source_code:
+            return entry['summary']
         try:
             summary = self.llm_proxy.summarize_code(
                 source_code, provider=self.provider, model=self.model)
             if summary is None:
                 summary = "Error: Failed to generate summary"
+            elif entry is not None:
+                self.args.prefetch.remember_summary(source_code, summary)
             return summary
         except Exception as e:
             print(f"[ERROR] Failed to generate summary: {e}")
@@ -177,7 +340,7 @@ class SummaryAgentNode(BaseAgentNode):
 
     def post(self, shared, prep_res, exec_res):
         output_mode = getattr(self.args, 'output', 'console')
-        if output_mode == 'new-file':
+        if output_mode == 'new-file' and os.path.isfile(self.args.file):
             self.write_output(exec_res, 'summary', 'Summary')
         print(f"\n[SUMMARY] Summary of {self.args.file}:")
         print("=" * 50)
@@ -188,9 +351,108 @@ class SummaryAgentNode(BaseAgentNode):
 
 class TestGenerationAgentNode(BaseAgentNode):
     def prep(self, shared):
-        return self.read_source()
+        # A reused node must not report the previous run's validation results.
+        self.test_results = None
+        source_code = self.read_source()
+        ranges = self.changed_ranges()
+        # Under --since/--staged tests are always built per function so only changed ones are sent.
+        if getattr(self.args, 'test_mode', 'module') == 'per-function' or ranges is not None:
+            module_name = os.path.splitext(os.path.basename(self.args.file))[0]
+            try:
+                slices = build_test_slices(source_code, module_name)
+                if ranges is not None:
+                    slices = [s for s in slices if overlaps(ranges, s['line'], s['end'])]
+                if shared.get('semantic_index') is not None:
+                    self._add_related_code(shared['semantic_index'], slices)
+                return slices
+            except SyntaxError as e:
+                print(f"[WARNING] Could not parse {self.args.file} ({e}); falling back to whole-module tests")
+        return source_code
+
+    def _add_related_code(self, index, slices):
+        """Append the closest chunks from other files so the model sees how each function is used."""
+        rel = os.path.relpath(os.path.abspath(self.args.file), index.root).replace(os.sep, '/')
+        for code_slice in slices:
+            try:
+                related = index.search(code_slice['code'], k=RELATED_CODE_CHUNKS,
+                                       token_budget=RELATED_CODE_BUDGET, exclude_file=rel)
+            except Exception as e:
+                print(f"[WARN] Semantic search failed for {code_slice['name']}: {e}")
+                return
+            if related:
+                code_slice['code'] += f"\n\n# Related code elsewhere in the repository:\n{format_chunks(related)}"
+
+    def _generate_slice_tests(self, code_slice):
+        try:
+            tests = self.journaled(code_slice['name'], code_slice['code'], lambda: self.llm_proxy.generate_tests(
+                code_slice['code'], provider=self.provider, model=self.model))
+            if tests is None or tests.startswith('Error:'):
+                print(f"[ERROR] Failed to generate tests for {code_slice['name']}: {tests}")
+                return ''
+            return tests
+        except Exception as e:
+            print(f"[ERROR] Failed to generate tests for {code_slice['name']}: {e}")
+            return ''
 
     def exec(self, source_code):
+        tests = self._generate_tests(source_code)
+        if getattr(self.args, 'validate_tests', False) and not tests.startswith('# Error') and not tests.startswith('# No functions'):
+            tests = self._validate_tests(tests)
+        return tests
+
+    def _validate_tests(self, tests):
+        """Run the generated tests in sandboxed workers, optionally sending failures back for repair."""
+        tests = strip_code_fences(tests).rstrip('\n') + '\n'
+        source_dir = os.path.dirname(os.path.abspath(self.args.file))
+        module_name = os.path.splitext(os.path.basename(self.args.file))[0]
+        timeout = getattr(self.args, 'test_timeout', None) or DEFAULT_TEST_TIMEOUT
+        memory_mb = getattr(self.args, 'test_memory_mb', None) or DEFAULT_MEMORY_LIMIT_MB
+        with tempfile.TemporaryDirectory(prefix='theagent-generated-') as tmp:
+            test_file = os.path.join(tmp, f"test_{module_name}_generated.py")
+            with open(test_file, 'w', encoding='utf-8') as f:
+                f.write(tests)
+            results = run_tests_parallel([test_file], timeout=timeout, memory_mb=memory_mb,
+                                         source_dirs={test_file: source_dir})
+            for _ in range(getattr(self.args, 'repair_tests', 0) or 0):
+                failing = [r for r in results if r['status'] != 'passed' and r['test'] != '<module>']
+                if not failing:
+                    break
+                print(f"[INFO] Sending {len(failing)} failing test(s) back for repair")
+                try:
+                    fixed = self.llm_proxy.repair_tests(
+                        extract_definitions(tests, [r['test'] for r in failing]),
+                        '\n'.join(r['output'][-2000:] for r in failing),
+                        self.read_source(), provider=self.provider, model=self.model)
+                    tests = replace_definitions(tests, strip_code_fences(fixed))
+                except SyntaxError as e:
+                    print(f"[WARNING] Repaired tests do not parse ({e}); keeping the previous version")
+                    break
+                except Exception as e:
+                    print(f"[ERROR] Failed to repair tests: {e}")
+                    break
+                with open(test_file, 'w', encoding='utf-8') as f:
+                    f.write(tests)
+                # Re-run only the repaired (or newly added) tests; passing results are kept.
+                known = {r['test'] for r in results}
+                only = {r['test'] for r in failing} | (set(collect_test_ids(tests)) - known)
+                rerun = {r['test']: r for r in run_tests_parallel(
+                    [test_file], timeout=timeout, memory_mb=memory_mb, source_dirs={test_file: source_dir}, only=only)}
+                results = [rerun.pop(r['test'], r) for r in results] + list(rerun.values())
+        print(f"\n[TEST VALIDATION] {format_test_results(results)}")
+        self.test_results = results
+        return tests
+
+    def _generate_tests(self, source_code):
+        if isinstance(source_code, list):
+            if not source_code:
+                print("[WARNING] No functions found to test")
+                return "# No functions found to test"
+            workers = getattr(self.args, 'workers', None) or 4
+            with OutputThreadPoolExecutor(max_workers=workers) as pool:
+                pieces = list(pool.map(self._generate_slice_tests, source_code))
+            if not any(pieces):
+                return "# Error: Failed to generate tests"
+            return merge_test_modules(pieces)
         try:
             tests = self.llm_proxy.generate_tests(
                 source_code, provider=self.provider, model=self.model)
@@ -204,6 +466,8 @@ class TestGenerationAgentNode(BaseAgentNode):
     def post(self, shared, prep_res, exec_res):
         self.write_output(exec_res, 'tests', 'Generated Tests')
         shared['tests'] = exec_res
+        if getattr(self, 'test_results', None) is not None:
+            shared['test_results'] = self.test_results
         return "default"
 
 class MigrationAgentNode(BaseAgentNode):
@@ -213,8 +477,11 @@ class MigrationAgentNode(BaseAgentNode):
     def exec(self, source_code):
         migration_target = getattr(self.args, 'migration_target', 'Python 3')
         try:
-            migrated_code = self.llm_proxy.migrate_code(
-                source_code, migration_target, provider=self.provider, model=self.model)
+            migrated_code = self.rewrite_changed(
+                source_code,
+                f"Migrate this Python code to {migration_target}: update deprecated functions and syntax while keeping its functionality.",
+                lambda code: self.llm_proxy.migrate_code(
+                    code, migration_target, provider=self.provider, model=self.model))
             if migrated_code is None:
                 migrated_code = "# Error: Failed to migrate code"
             return migrated_code
@@ -231,7 +498,52 @@ class BugDetectionAgentNode(BaseAgentNode):
     def prep(self, shared):
         return self.read_source()
 
+    def _review_region(self, region):
+        code = f"# Region: {region['name']} (lines {region['start']}-{region['end']} of {os.path.basename(self.args.file)})\n"
+        if region['findings']:
+            hints = '\n'.join(f"# line {f['line']}: [{f['check']}] {f['message']}" for f in region['findings'])
+            code += f"# Local static analysis findings (hints):\n{hints}\n"
+        code += f"\n{region['code']}"
+        try:
+            analysis = self.llm_proxy.detect_bugs(code, provider=self.provider, model=self.model)
+            return analysis if analysis is not None else "Error: Failed to detect bugs"
+        except Exception as e:
+            print(f"[ERROR] Failed to detect bugs in {region['name']}: {e}")
+            return "Error: Failed to detect bugs"
+
+    def _prefiltered_detection(self, source_code):
+        """Run local checks and send only flagged or complex regions to the LLM."""
+        threshold = getattr(self.args, 'complexity_threshold', None) or DEFAULT_COMPLEXITY_THRESHOLD
+        findings, tree = analyze_source(source_code, complexity_threshold=threshold)
+        symbols = self.changed_symbols(source_code)
+        if symbols is not None:
+            findings = [f for f in findings if any(s['start'] <= f['line'] <= s['end'] for s in symbols)
+                        or overlaps(self.changed_ranges(), f['line'], f['line'])]
+        report = "Local analysis:\n" + format_findings(findings)
+        if getattr(self.args, 'local_only', False):
+            return report
+        regions = select_regions(source_code, findings, tree)
+        if not regions:
+            return report + "\n\nNo regions needed LLM review."
+        if getattr(self.args, 'verbose', False):
+            reviewed = sum(r['end'] - r['start'] + 1 for r in regions)
+            print(f"[INFO] Sending {len(regions)} region(s), {reviewed}/{len(source_code.splitlines())} lines, to the LLM")
+        return report + "\n\nLLM review:\n" + self._review_regions(regions)
+
+    def _review_regions(self, regions):
+        workers = getattr(self.args, 'workers', None) or 4
+        with OutputThreadPoolExecutor(max_workers=workers) as pool:
+            analyses = list(pool.map(self._review_region, regions))
+        return '\n\n'.join(f"[{r['name']} lines {r['start']}-{r['end']}]\n{a}" for r, a in zip(regions, analyses))
+
     def exec(self, source_code):
+        if getattr(self.args, 'prefilter', False) or getattr(self.args, 'local_only', False):
+            return self._prefiltered_detection(source_code)
+        symbols = self.changed_symbols(source_code)
+        if symbols is not None:
+            if not symbols:
+                return "No changed functions or classes to review."
+            return self._review_regions([dict(symbol, findings=[]) for symbol in symbols])
         try:
             bugs = self.llm_proxy.detect_bugs(
                 source_code, provider=self.provider, model=self.model)
@@ -256,8 +568,11 @@ class RefactorCodeAgentNode(BaseAgentNode):
 
     def exec(self, source_code):
         try:
-            refactored = self.llm_proxy.refactor_code(
-                source_code, provider=self.provider, model=self.model)
+            refactored = self.rewrite_changed(
+                source_code,
+                "Refactor this Python code to improve readability, performance, and maintainability without changing its behaviour.",
+                lambda code: self.llm_proxy.refactor_code(
+                    code, provider=self.provider, model=self.model))
             if refactored is None:
                 refactored = "# Error: Failed to refactor code"
             return refactored
@@ -276,8 +591,11 @@ class TypeAnnotationAgentNode(BaseAgentNode):
 
     def exec(self, source_code):
         try:
-            typed_code = self.llm_proxy.add_type_annotations(
-                source_code, provider=self.provider, model=self.model)
+            typed_code = self.rewrite_changed(
+                source_code,
+                "Add modern Python type hints to all functions, importing from typing where needed.",
+                lambda code: self.llm_proxy.add_type_annotations(
+                    code, provider=self.provider, model=self.model))
             if typed_code is None:
                 typed_code = "# Error: Failed to add type annotations"
             return typed_code
@@ -297,6 +615,51 @@ def get_relevant_history(chat_history, n=3, topic=None):
         return filtered[-n:]
     return chat_history[-n:]
 
+def history_context(shared, n=5):
+    """Conversation history for a prompt: the token-budgeted memory if chat set one up, else the last n turns."""
+    memory = shared.get('memory')
+    if memory is not None:
+        memory.compact()
+        return memory.render()
+    relevant = get_relevant_history(shared.get('chat_history', []), n=n)
+    return "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in relevant)
+
+def conversation_turns(shared, n=5):
+    """(summary text, recent messages) of the chat history, for prompts sent as a message list."""
+    memory = shared.get('memory')
+    if memory is not None:
+        memory.compact()
+        return memory.summary_text(), list(memory.messages)
+    return '', get_relevant_history(shared.get('chat_history', []), n=n)
+
+def retrieve_context(shared, query, k=DEFAULT_TOP_K, token_budget=DEFAULT_CONTEXT_BUDGET, exclude_file=None):
+    """Top chunks for query from the BM25 retriever and/or semantic index in shared, fused by rank."""
+    result_lists = []
+    for key in ('retriever', 'semantic_index'):
+        index = shared.get(key)
+        if index is None:
+            continue
+        try:
+            results = index.search(query, k=k, token_budget=token_budget)
+            result_lists.append([r for r in results if r['file'] != exclude_file])
+        except Exception as e:
+            print(f"[WARN] Retrieval from {key} failed: {e}")
+    if len(result_lists) == 1:
+        return result_lists[0]
+    return fuse_results(result_lists, k=k, token_budget=token_budget)
+
+def lookup_mentioned_symbols(index, text, limit=10):
+    """Index entries for identifiers in text that exactly name a known function, class or method."""
+    symbols, seen = [], set()
+    for word in re.findall(r'[A-Za-z_][A-Za-z0-9_]{2,}', text):
+        if word in seen:
+            continue
+        seen.add(word)
+        symbols.extend(s for s in index.find_symbols(word, limit=3) if s['name'] == word)
+        if len(symbols) >= limit:
+            break
+    return symbols[:limit]
+
 class OrchestratorAgentNode(Node):
     def __init__(self, args, llm_proxy):
         super().__init__()
@@ -308,18 +671,11 @@ class OrchestratorAgentNode(Node):
         if not user_input:
             user_input = input("Enter your instruction: ")
             shared['user_input'] = user_input
-        chat_history = shared.get('chat_history', [])
-        relevant = get_relevant_history(chat_history, n=5)
-        context = "\n".join([
-            f"{msg['role'].capitalize()}: {msg['content']}" for msg in relevant
-        ])
+        context = history_context(shared, n=5)
         # Project context summary
         project_context = shared.get('project_context', {})
         if project_context:
-            context_snippet = "\n".join([
-                f"[{fname}]\n{content[:500]}{'...\n' if len(content) > 500 else ''}" for fname, content in project_context.items()
-            ])
-            context = f"Project Context:\n{context_snippet}\n\n" + context
+            context = f"Project Context:\n{format_project_context(project_context)}\n\n" + context
         return user_input, context
 
     def exec(self, context_data):
@@ -441,6 +797,56 @@ class UserApprovalNode(Node):
     def post(self, shared, prep_res, exec_res):
         return exec_res
 
+INTENT_SYSTEM_PROMPT = """You are an intelligent assistant that helps users with code-related tasks. Your job is to understand the user's intent and determine the best course of action.
+
+Available actions:
+1. file_management - For file operations (list, read, create, delete files, search for symbols, read_reference to show an earlier output the history only refers to as [ref-...])
+2. code_generation - For generating code, docstrings, tests, etc.
+3. code_analysis - For analyzing, summarizing, or reviewing code
+4. general_question - For answering general programming questions
+5. clarification_needed - When the request is ambiguous or missing information
+6. multi_action - Several independent requests in one message (list each one under actions)
+
+Return your response in YAML format, with the fields in this order:
+```yaml
+intent: <action_name>
+parameters:
+  file_path: <if relevant>
+  operation: <specific operation>
+  query: <symbol name, for search>
+  reference: <ref-id, for read_reference>
+  agent_type: <if code generation needed>
+confidence: <0.0-1.0>
+reasoning: <brief explanation>
+```
+
+For multi_action, give each request its own intent and parameters under actions:
+```yaml
+intent: multi_action
+actions:
+  - intent: <action_name>
+    parameters:
+      file_path: <if relevant>
+      operation: <specific operation>
+      agent_type: <if code generation needed>
+      question: <for general_question>
+confidence: <0.0-1.0>
+reasoning: <brief explanation>
+```
+
+If the intent is general_question, answer the question right after the closing ``` of the YAML block,
+as plain text. For every other intent, stop after the YAML block.
+
+Examples:
+- "list files" → file_management with operation: list
+- "read main.py" → file_management with operation: read, file_path: main.py
+- "where is parse_config defined?" → file_management with operation: search, query: parse_config
+- "show that test output again" (history has [ref-1a2b3c4d: ...]) → file_management with operation: read_reference, reference: ref-1a2b3c4d
+- "generate docstrings" → clarification_needed (missing file)
+- "what is Python?" → general_question
+- "summarize this code" → clarification_needed (missing file)
+- "summarize utils.py and main.py" → multi_action with two code_analysis actions (agent_type: summary)"""
+
 class IntentRecognitionNode(Node):
     """Node for recognizing user intent in chat mode."""
     
@@ -456,50 +862,52 @@ class IntentRecognitionNode(Node):
         if not user_input:
             user_input = input("Enter your instruction: ")
             shared['user_input'] = user_input
-        chat_history = shared.get('chat_history', [])
-        relevant = get_relevant_history(chat_history, n=5)
-        context = "\n".join([
-            f"{msg['role'].capitalize()}: {msg['content']}" for msg in relevant
-        ])
-        # Project context summary
+        self.started = time.time()
+        prefetch = getattr(self.args, 'prefetch', None)
+        if prefetch is not None:
+            # Load the files the input mentions while the intent call is in flight.
+            prefetch.start(user_input)
+        self.route = route_locally(user_input, getattr(self.args, 'route_threshold', None) or DEFAULT_ROUTE_THRESHOLD)
+        if self.route['route'] != 'llm':
+            # Routed without the LLM, so the prompt context is not needed.
+            shared['context'] = self.route['intent']['reasoning']
+            return user_input, shared['context']
+        # Background that rarely changes goes into the system message; per-turn context into the
+        # last user message, so the provider can reuse the prefix of the conversation.
+        background, turn_context = [], []
         project_context = shared.get('project_context', {})
         if project_context:
-            context_snippet = "\n".join([
-                f"[{fname}]\n{content[:500]}{'...\n' if len(content) > 500 else ''}" for fname, content in project_context.items()
-            ])
-            context = f"Project Context:\n{context_snippet}\n\n" + context
+            background.append(f"Project Context:\n{format_project_context(project_context)}")
+        if shared.get('retriever') is not None or shared.get('semantic_index') is not None:
+            chunks = retrieve_context(shared, user_input,
+                                      k=getattr(self.args, 'context_top_k', None) or DEFAULT_TOP_K,
+                                      token_budget=getattr(self.args, 'context_budget', None) or DEFAULT_CONTEXT_BUDGET)
+            shared['retrieved_context'] = chunks
+            if chunks:
+                turn_context.append(f"Relevant code from the repository:\n{format_chunks(chunks)}")
+        index = shared.get('symbol_index')
+        if index is not None:
+            symbols = lookup_mentioned_symbols(index, user_input)
+            if symbols:
+                turn_context.insert(0, f"Symbols mentioned (from the repository index):\n{format_symbols(symbols)}")
+        context = "\n\n".join(turn_context + background + [history_context(shared, n=5)])
         shared['context'] = context
+
+        summary, history = conversation_turns(shared, n=5)
+        if history and history[-1]['role'] == 'user' and history[-1]['content'] == user_input:
+            history = history[:-1]
+        system = "\n\n".join(part for part in [INTENT_SYSTEM_PROMPT, *background, summary] if part)
+        request = "\n\n".join(turn_context + [f"User input: {user_input}\n\nAnalyze the user's intent and respond with the appropriate action."])
+        self.messages = ([{'role': 'system', 'content': system}]
+                         + [{'role': m['role'], 'content': m['content']} for m in history]
+                         + [{'role': 'user', 'content': request}])
         return user_input, context
 
     def exec(self, context_data):
         user_input, context = context_data
-        
-        system_prompt = """You are an intelligent assistant that helps users with code-related tasks. Your job is to understand the user's intent and determine the best course of action.
-
-Available actions:
-1. file_management - For file operations (list, read, create, delete files)
-2. code_generation - For generating code, docstrings, tests, etc.
-3. code_analysis - For analyzing, summarizing, or reviewing code
-4. general_question - For answering general programming questions
-5. clarification_needed - When the request is ambiguous or missing information
-
-Return your response in YAML format:
-```yaml
-intent: <action_name>
-confidence: <0.0-1.0>
-reasoning: <brief explanation>
-parameters:
-  file_path: <if relevant>
-  operation: <specific operation>
-  agent_type: <if code generation needed>
-```
-
-Examples:
-- "list files" → file_management with operation: list
-- "read main.py" → file_management with operation: read, file_path: main.py
-- "generate docstrings" → clarification_needed (missing file)
-- "what is Python?" → general_question
-- "summarize this code" → clarification_needed (missing file)"""
+        route = getattr(self, 'route', None)
+        if route is not None and route['route'] != 'llm':
+            return route['intent']
 
         prompt = f"""Context from previous conversation:
 {context}
@@ -509,14 +917,24 @@ User input: {user_input}
 Analyze the user's intent and respond with the appropriate action."""
 
         try:
+            messages = getattr(self, 'messages', None)
+            chat_messages_stream = getattr(self.llm_proxy, 'chat_messages_stream', None)
+            if messages and chat_messages_stream is not None:
+                # Native multi-turn chat: history as messages, instructions in the system role.
+                return self._read_stream(chat_messages_stream(messages, provider=self.provider, model=self.model))
+            chat_stream = getattr(self.llm_proxy, 'chat_stream', None)
+            if chat_stream is not None:
+                return self._read_stream(chat_stream(f"{INTENT_SYSTEM_PROMPT}\n\n{prompt}", provider=self.provider, model=self.model))
             response = self.llm_proxy.chat(
-                prompt, provider=self.provider, model=self.model)
+                f"{INTENT_SYSTEM_PROMPT}\n\n{prompt}", provider=self.provider, model=self.model)
             
             # Extract YAML from response
             yaml_match = re.search(r'```yaml\s*(.*?)\s*```', response, re.DOTALL)
             if yaml_match:
                 yaml_content = yaml_match.group(1)
                 result = yaml.safe_load(yaml_content)
+                if result.get('intent') == 'general_question' and not result.get('answer'):
+                    result['answer'] = response[yaml_match.end():].strip()
             else:
                 # Fallback parsing
                 result = {
@@ -537,12 +955,79 @@ Analyze the user's intent and respond with the appropriate action."""
                 'parameters': {}
             }
 
+    def _read_stream(self, chunks):
+        """Parse the intent block as the response streams in.
+
+        Routing needs only the intent and the parameters its action requires, so the stream is
+        closed as soon as those have arrived (the file named so far is prefetched meanwhile). For a
+        general question the answer that follows the block is printed as it arrives.
+        """
+        parser, result, answer = IncrementalIntentParser(), None, []
+        prefetch, prefetched = getattr(self.args, 'prefetch', None), set()
+        try:
+            for chunk in chunks:
+                if result is None:
+                    parser.feed(chunk)
+                    file_path = parser.parameters.get('file_path')
+                    if prefetch is not None and isinstance(file_path, str) and file_path not in prefetched:
+                        prefetched.add(file_path)
+                        prefetch.add(file_path)
+                    if not parser.ready:
+                        continue
+                    result = parser.result
+                    if result.get('intent') != 'general_question':
+                        break
+                    chunk = parser.tail.lstrip()
+                    if result.get('answer'):
+                        break
+                    print("TheAgent: ", end='', flush=True)
+                    result['answer_streamed'] = True
+                if chunk:
+                    answer.append(chunk)
+                    print(chunk, end='', flush=True)
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        if result is None and parser.finish() is not None:
+            # The response ended right after the block (no newline after the closing fence).
+            result = parser.result
+            if result.get('intent') == 'general_question' and not result.get('answer'):
+                result['answer'] = parser.tail.strip()
+        if result is None:
+            # No intent block: the model answered in prose, which is an answer to a general question.
+            return {'intent': 'general_question', 'confidence': 0.5,
+                    'reasoning': 'No intent block in the response, treating it as an answer',
+                    'parameters': {}, 'answer': parser.text.strip()}
+        if result.get('answer_streamed'):
+            print()
+            result['answer'] = ''.join(answer).strip()
+        return result
+
     def post(self, shared, prep_res, exec_res):
+        actions = [a for a in exec_res.get('actions') or [] if isinstance(a, dict) and a.get('intent')]
+        if len(actions) == 1:
+            # A one-item action list is an ordinary request.
+            exec_res = {**{k: v for k, v in exec_res.items() if k != 'actions'}, **actions[0]}
         shared['intent_result'] = exec_res
         intent = exec_res.get('intent', 'general_question')
+        if len(actions) > 1:
+            exec_res['actions'] = actions
+            intent = 'multi_action'
+        route = getattr(self, 'route', None)
+        if route is not None:
+            log_routing(prep_res[0], route, exec_res, time.time() - self.started)
+            if getattr(self.args, 'verbose', False):
+                print(f"[INFO] Routed via {route['route']}" + (f" ({route['rule']})" if route['route'] != 'llm' else ''))
+        file_path = (exec_res.get('parameters') or {}).get('file_path')
+        if file_path and intent in ('code_generation', 'code_analysis'):
+            # The agent nodes in the chat flow work on args.file.
+            self.args.file = file_path
         
         # Route to appropriate action
-        if intent == 'clarification_needed':
+        if intent == 'multi_action' and exec_res.get('actions'):
+            return 'multi_action'
+        elif intent == 'clarification_needed':
             return 'clarification'
         elif intent == 'file_management':
             return 'file_management'
@@ -553,6 +1038,52 @@ Analyze the user's intent and respond with the appropriate action."""
         else:
             return 'general_question'
 
+class AnswerNode(Node):
+    """Node that gives the answer to a general question in chat mode.
+
+    The answer normally arrives (and is already streamed) with the intent response; if the
+    model left it out, it is requested here in a follow-up call.
+    """
+
+    def __init__(self, args, llm_proxy, provider='openai', model=None):
+        super().__init__()
+        self.args = args
+        self.llm_proxy = llm_proxy
+        self.provider = provider
+        self.model = model
+
+    def prep(self, shared):
+        return shared.get('intent_result', {}), shared.get('user_input', ''), shared.get('context', '')
+
+    def exec(self, inputs):
+        intent_result, user_input, context = inputs
+        if intent_result.get('answer'):
+            return intent_result['answer'], bool(intent_result.get('answer_streamed'))
+        prompt = f"""Context from previous conversation:
+{context}
+
+Answer the user's question concisely.
+
+User input: {user_input}"""
+        chat_stream = getattr(self.llm_proxy, 'chat_stream', None)
+        if chat_stream is None:
+            return self.llm_proxy.chat(prompt, provider=self.provider, model=self.model), False
+        print("TheAgent: ", end='', flush=True)
+        chunks = []
+        for chunk in chat_stream(prompt, provider=self.provider, model=self.model):
+            chunks.append(chunk)
+            print(chunk, end='', flush=True)
+        print()
+        return ''.join(chunks).strip(), True
+
+    def post(self, shared, prep_res, exec_res):
+        answer, streamed = exec_res
+        if not streamed:
+            print(f"TheAgent: {answer}")
+        shared['answer'] = answer
+        shared.setdefault('chat_history', []).append({'role': 'agent', 'content': answer})
+        return None
+
 class ClarificationNode(Node):
     """Node for requesting clarification from the user."""
     
@@ -578,6 +1109,8 @@ class ClarificationNode(Node):
         chat_history.append({'role': 'user', 'content': exec_res})
         chat_history.append({'role': 'agent', 'content': 'Thank you for the clarification.'})
         shared['chat_history'] = chat_history
+        # Intent recognition runs again on the request completed with the answer (e.g. "/read" + "main.py").
+        shared['user_input'] = f"{shared.get('user_input', '')} {exec_res}".strip()
         return "default"
 
 class FileManagementNode(Node):
@@ -591,6 +1124,8 @@ class FileManagementNode(Node):
         self.model = model
 
     def prep(self, shared):
+        self.symbol_index = shared.get('symbol_index')
+        self.memory = shared.get('memory')
         return shared.get('intent_result', {})
 
     def exec(self, context):
@@ -600,10 +1135,15 @@ class FileManagementNode(Node):
         
         current_dir = os.getcwd()
         
-        if operation == 'list':
-            return self._list_files(current_dir)
+        if operation == 'search':
+            query = intent_data.get('parameters', {}).get('query') or file_path
+            return self._search_symbols(query)
+        elif operation == 'list':
+            return self._list_files(os.path.join(current_dir, file_path) if file_path else current_dir)
         elif operation == 'read':
             return self._read_file(file_path, current_dir)
+        elif operation == 'read_reference':
+            return self._read_reference(intent_data.get('parameters', {}).get('reference') or file_path)
         elif operation == 'create':
             return self._create_file(file_path, current_dir)
         elif operation == 'delete':
@@ -626,6 +1166,25 @@ class FileManagementNode(Node):
         except Exception as e:
             return f"Error listing files: {e}"
 
+    def _search_symbols(self, query):
+        """Look a symbol up in the repository index (built with `theagent index`)."""
+        if not query:
+            return "No symbol specified"
+        index = getattr(self, 'symbol_index', None)
+        if index is None:
+            return "No symbol index available. Run `theagent index` first."
+        try:
+            symbols = index.find_symbols(str(query))
+            result = f"Symbols matching '{query}':\n{format_symbols(symbols)}"
+            exact = [s for s in symbols if s['name'] == query]
+            if exact:
+                callers = index.callers(str(query), limit=10)
+                if callers:
+                    result += "\n\nCalled from:\n" + '\n'.join(f"{c['file']}:{c['line']} in {c['caller']}" for c in callers)
+            return result
+        except Exception as e:
+            return f"Error searching symbols: {e}"
+
     def _read_file(self, instruction, current_dir):
         """Read a file based on instruction."""
         try:
@@ -637,13 +1196,28 @@ class FileManagementNode(Node):
             if not os.path.exists(file_path):
                 return f"File not found: {instruction}"
             
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            prefetch = getattr(self.args, 'prefetch', None)
+            entry = prefetch.get(file_path) if prefetch is not None else None
+            if entry is not None:
+                content = entry['text']
+            else:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
             
             return f"Content of {instruction}:\n{'-' * 40}\n{content}"
         except Exception as e:
             return f"Error reading file: {e}"
 
+    def _read_reference(self, ref_id):
+        """Show an earlier output that the conversation memory replaced by a reference."""
+        if not ref_id:
+            return "No reference specified"
+        memory = getattr(self, 'memory', None)
+        content = memory.resolve(str(ref_id).strip('[]')) if memory is not None else None
+        if content is None:
+            return f"Reference not available: {ref_id}"
+        return f"Content of {ref_id}:\n{'-' * 40}\n{content}"
+
     def _create_file(self, instruction, current_dir):
         """Create a file based on instruction."""
         try:
@@ -680,8 +1254,154 @@ class FileManagementNode(Node):
     def post(self, shared, prep_res, exec_res):
         print(f"\n[FILE OPERATION] {exec_res}")
         shared['file_operation_result'] = exec_res
+        memory = shared.get('memory')
+        if memory is not None:
+            # Large results (file contents) are kept in memory as references, not inline.
+            parameters = (prep_res or {}).get('parameters') or {}
+            source = None
+            if parameters.get('operation') == 'read' and parameters.get('file_path'):
+                source = os.path.join(os.getcwd(), parameters['file_path'])
+            memory.add('agent', exec_res, source=source)
         return "default"
 
+# Agent used for a chat action that does not name one (as in the single-request chat flow).
+DEFAULT_CHAT_AGENTS = {'code_generation': 'doc', 'code_analysis': 'summary'}
+MAX_PARALLEL_ACTIONS = 4
+
+def describe_action(action):
+    parameters = action.get('parameters') or {}
+    what = parameters.get('agent_type') or parameters.get('operation') or ''
+    target = parameters.get('file_path') or parameters.get('query') or ''
+    return ' '.join(part for part in [action.get('intent', 'unknown'), what, target] if part)
+
+def format_action_results(actions, results):
+    """One response for a request's action outputs; numbered sections when there are several."""
+    if len(actions) == 1:
+        return results[0]
+    return "\n\n".join(f"[{i}/{len(actions)}] {describe_action(action)}\n{result}"
+                       for i, (action, result) in enumerate(zip(actions, results), 1))
+
+class MultiActionNode(Node):
+    """Node that runs the actions of a multi-part chat request, independent ones concurrently.
+
+    Actions on the same file run one after another in request order; every other group runs in
+    its own thread with a copy of args, a private shared store and captured output, so the turn
+    takes about as long as its slowest action. The outputs are printed together, in order.
+    """
+
+    def __init__(self, args, llm_proxy, provider='openai', model=None):
+        super().__init__()
+        self.args = args
+        self.llm_proxy = llm_proxy
+        self.provider = provider
+        self.model = model
+
+    def prep(self, shared):
+        base = {key: shared[key] for key in ('symbol_index', 'project_context', 'context', 'user_input')
+                if key in shared}
+        return (shared.get('intent_result') or {}).get('actions') or [], base
+
+    def _node_for(self, action, args):
+        from theagent.flow import AGENT_NODES
+        intent = action.get('intent')
+        if intent == 'file_management':
+            return FileManagementNode(args, self.llm_proxy, provider=self.provider, model=self.model)
+        if intent in DEFAULT_CHAT_AGENTS:
+            agent = (action.get('parameters') or {}).get('agent_type')
+            node_class = AGENT_NODES.get(agent) or AGENT_NODES[DEFAULT_CHAT_AGENTS[intent]]
+            return node_class(args, self.llm_proxy, provider=self.provider, model=self.model)
+        if intent == 'general_question':
+            return AnswerNode(args, self.llm_proxy, provider=self.provider, model=self.model)
+        return None
+
+    def _run_action(self, action, base, output=None):
+        parameters = action.get('parameters') or {}
+        args = copy.copy(self.args)
+        if parameters.get('file_path') and action.get('intent') in DEFAULT_CHAT_AGENTS:
+            args.file = parameters['file_path']
+        node = self._node_for(action, args)
+        if node is None:
+            # Asking for details would block the other actions; report it instead.
+            return f"Skipped: {action.get('reasoning') or 'the request needs more details'}"
+        shared = {**base, 'intent_result': action, 'chat_history': []}
+        if parameters.get('question'):
+            shared['user_input'] = parameters['question']
+        with capture_output(output) as captured:
+            try:
+                node.run(shared)
+            except Exception as e:
+                print(f"[ERROR] {describe_action(action)}: {e}")
+        return captured.getvalue().strip()
+
+    def run_actions(self, actions, base, output_for=None):
+        """Outputs of the actions, in order; output_for(i), if given, is the stream action i prints to."""
+        groups = {}
+        for i, action in enumerate(actions):
+            file_path = (action.get('parameters') or {}).get('file_path')
+            key = os.path.normpath(file_path) if file_path else i
+            groups.setdefault(key, []).append(i)
+        results = [None] * len(actions)
+
+        def run_group(indices):
+            for i in indices:
+                results[i] = self._run_action(actions[i], base, output_for(i) if output_for else None)
+
+        workers = max(1, min(getattr(self.args, 'workers', None) or MAX_PARALLEL_ACTIONS, len(groups)))
+        with OutputThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run_group, groups.values()))
+        return results
+
+    def exec(self, inputs):
+        actions, base = inputs
+        return self.run_actions(actions, base)
+
+    def post(self, shared, prep_res, exec_res):
+        actions, _ = prep_res
+        response = format_action_results(actions, exec_res)
+        print(f"\n{response}")
+        shared['multi_action_results'] = [{'action': action, 'output': result}
+                                          for action, result in zip(actions, exec_res)]
+        memory = shared.get('memory')
+        if memory is not None:
+            memory.add('agent', response)
+        else:
+            shared.setdefault('chat_history', []).append({'role': 'agent', 'content': response})
+        return None
+
+class BackgroundJobNode(Node):
+    """Node that starts an agent request as a background job and returns to the prompt.
+
+    The job runs the request's actions the way MultiActionNode does, printing their output as
+    [JOB n] lines; the chat loop posts the result into the conversation when the job finishes.
+    """
+
+    def __init__(self, args, llm_proxy, jobs, provider='openai', model=None):
+        super().__init__()
+        self.jobs = jobs
+        self.runner = MultiActionNode(args, llm_proxy, provider=provider, model=model)
+
+    def prep(self, shared):
+        actions, base = self.runner.prep(shared)
+        return actions or [shared.get('intent_result') or {}], base
+
+    def exec(self, inputs):
+        actions, base = inputs
+
+        def run(job):
+            def output_for(i):
+                return self.jobs.output(job, label=f"{job.id}.{i + 1}" if len(actions) > 1 else None)
+            return format_action_results(actions, self.runner.run_actions(actions, base, output_for))
+
+        return self.jobs.submit('; '.join(describe_action(action) for action in actions), run)
+
+    def post(self, shared, prep_res, exec_res):
+        job = exec_res
+        print(f"[JOB {job.id}] Started: {job.description} (/jobs to list, /wait {job.id}, /cancel {job.id})")
+        shared['last_job'] = job.id
+        shared.setdefault('chat_history', []).append(
+            {'role': 'agent', 'content': f"Started background job {job.id}: {job.description}"})
+        return None
+
 class SafetyCheckNode(Node):
     """Node for performing safety checks before operations."""
     
@@ -717,6 +1437,7 @@ class ContextAwarenessNode(Node):
         super().__init__()
 
     def prep(self, shared):
+        self.symbol_index = shared.get('symbol_index')
         return shared.get('args', {})
 
     def exec(self, context):
@@ -728,6 +1449,16 @@ class ContextAwarenessNode(Node):
             'available_files': []
         }
         
+        # Use the repository index when there is one instead of listing the directory
+        index = getattr(self, 'symbol_index', None)
+        if index is not None:
+            try:
+                context_info['available_files'] = index.files()
+                context_info['index_stats'] = index.stats()
+                return context_info
+            except Exception as e:
+                print(f"[WARN] Symbol index unavailable: {e}")
+
         # List Python files in current directory
         try:
             files = os.listdir('.')
@@ -749,6 +1480,9 @@ class ContextAwarenessNode(Node):
         print(f"  Python files: {', '.join(exec_res['available_files'][:5])}")
         if len(exec_res['available_files']) > 5:
             print(f"  ... and {len(exec_res['available_files']) - 5} more")
+        if 'index_stats' in exec_res:
+            stats = exec_res['index_stats']
+            print(f"  Index: {stats['symbols']} symbols, {stats['imports']} imports, {stats['calls']} call edges")
         
         return "default"
 
@@ -1,4 +1,4 @@
-from .llm_base import LLMProviderBase
+from .llm_base import LLMProviderBase, split_messages
 import sys
 import subprocess
 from typing import Any
@@ -26,11 +26,13 @@ class AnthropicProvider(LLMProviderBase):
     """
     Anthropic LLM provider adapter.
     """
-    def generate(self, prompt: str, model: str = 'claude-3-haiku-20240307', max_tokens: int = 1024, **kwargs) -> str:
+    def _create_client(self):
         anthropic = ensure_anthropic()
-        client = anthropic.Anthropic(api_key=self.api_key)
+        return anthropic.Anthropic(api_key=self.api_key)
+
+    def generate(self, prompt: str, model: str = 'claude-3-haiku-20240307', max_tokens: int = 1024, **kwargs) -> str:
         try:
-            response = client.messages.create(
+            response = self.client().messages.create(
                 model=model,
                 max_tokens=max_tokens,
                 messages=[{"role": "user", "content": prompt}]
@@ -40,16 +42,49 @@ class AnthropicProvider(LLMProviderBase):
             print(f"[AnthropicProvider] API error: {e}")
             return f"Error: Failed to call Anthropic LLM - {e}"
 
+    def generate_stream(self, prompt: str, model: str = 'claude-3-haiku-20240307', max_tokens: int = 1024, **kwargs):
+        try:
+            with self.client().messages.stream(
+                model=model,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}]
+            ) as stream:
+                for text in stream.text_stream:
+                    yield text
+        except Exception as e:
+            print(f"[AnthropicProvider] API error: {e}")
+            yield f"Error: Failed to call Anthropic LLM - {e}"
+
+    @staticmethod
+    def to_request(messages: list[dict]) -> dict:
+        """Anthropic takes the system prompt as a separate parameter, not as a message."""
+        system, turns = split_messages(messages)
+        request = {"messages": turns}
+        if system:
+            request["system"] = system
+        return request
+
     def chat(self, messages: list[dict], model: str = 'claude-3-haiku-20240307', max_tokens: int = 1024, **kwargs) -> str:
-        anthropic = ensure_anthropic()
-        client = anthropic.Anthropic(api_key=self.api_key)
         try:
-            response = client.messages.create(
+            response = self.client().messages.create(
                 model=model,
                 max_tokens=max_tokens,
-                messages=messages
+                **self.to_request(messages)
             )
             return response.content[0].text.strip() if response.content else "Error: No response from LLM"
         except Exception as e:
             print(f"[AnthropicProvider] API error: {e}")
-            return f"Error: Failed to call Anthropic LLM - {e}" 
\ No newline at end of file
+            return f"Error: Failed to call Anthropic LLM - {e}"
+
+    def chat_stream(self, messages: list[dict], model: str = 'claude-3-haiku-20240307', max_tokens: int = 1024, **kwargs):
+        try:
+            with self.client().messages.stream(
+                model=model,
+                max_tokens=max_tokens,
+                **self.to_request(messages)
+            ) as stream:
+                for text in stream.text_stream:
+                    yield text
+        except Exception as e:
+            print(f"[AnthropicProvider] API error: {e}")
+            yield f"Error: Failed to call Anthropic LLM - {e}"
@@ -1,4 +1,4 @@
-from .llm_base import LLMProviderBase
+from .llm_base import LLMProviderBase, split_messages
 import sys
 import subprocess
 from typing import Any
@@ -26,11 +26,13 @@ class GoogleProvider(LLMProviderBase):
     """
     Google Gemini LLM provider adapter.
     """
-    def generate(self, prompt: str, model: str = 'gemini-2.5-flash', **kwargs) -> str:
+    def _create_client(self):
         genai = ensure_google_genai()
-        client = genai.Client(api_key=self.api_key)
+        return genai.Client(api_key=self.api_key)
+
+    def generate(self, prompt: str, model: str = 'gemini-2.5-flash', **kwargs) -> str:
         try:
-            response = client.models.generate_content(
+            response = self.client().models.generate_content(
                 model=model,
                 contents=prompt,
                 **kwargs
@@ -40,18 +42,54 @@ class GoogleProvider(LLMProviderBase):
             print(f"[GoogleProvider] API error: {e}")
             return f"Error: Failed to call Google Gemini - {e}"
 
-    def chat(self, messages: list[dict], model: str = 'gemini-2.5-flash', **kwargs) -> str:
-        genai = ensure_google_genai()
-        client = genai.Client(api_key=self.api_key)
+    def generate_stream(self, prompt: str, model: str = 'gemini-2.5-flash', **kwargs):
         try:
-            # Convert messages to a single prompt for Gemini
-            prompt = '\n'.join([m['content'] for m in messages if m['role'] == 'user'])
-            response = client.models.generate_content(
+            for chunk in self.client().models.generate_content_stream(
                 model=model,
                 contents=prompt,
                 **kwargs
+            ):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            print(f"[GoogleProvider] API error: {e}")
+            yield f"Error: Failed to call Google Gemini - {e}"
+
+    @staticmethod
+    def to_request(messages: list[dict], config: dict = None) -> dict:
+        """Gemini calls the assistant role 'model' and takes the system prompt as system_instruction."""
+        system, turns = split_messages(messages)
+        request = {"contents": [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+            for m in turns
+        ]}
+        if system:
+            request["config"] = {**(config or {}), "system_instruction": system}
+        elif config:
+            request["config"] = config
+        return request
+
+    def chat(self, messages: list[dict], model: str = 'gemini-2.5-flash', config: dict = None, **kwargs) -> str:
+        try:
+            response = self.client().models.generate_content(
+                model=model,
+                **self.to_request(messages, config),
+                **kwargs
             )
             return response.text.strip()
         except Exception as e:
             print(f"[GoogleProvider] API error: {e}")
-            return f"Error: Failed to call Google Gemini - {e}" 
\ No newline at end of file
+            return f"Error: Failed to call Google Gemini - {e}"
+
+    def chat_stream(self, messages: list[dict], model: str = 'gemini-2.5-flash', config: dict = None, **kwargs):
+        try:
+            for chunk in self.client().models.generate_content_stream(
+                model=model,
+                **self.to_request(messages, config),
+                **kwargs
+            ):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            print(f"[GoogleProvider] API error: {e}")
+            yield f"Error: Failed to call Google Gemini - {e}"
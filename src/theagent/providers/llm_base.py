@@ -1,5 +1,32 @@
+import threading
 from typing import Any
 
+ROLE_ALIASES = {'agent': 'assistant', 'assistant': 'assistant', 'model': 'assistant', 'user': 'user'}
+
+def split_messages(messages):
+    """
+    Normalize chat messages to (system text, turns) for the provider APIs.
+
+    System messages are joined into one system text; 'agent' (TheAgent's own replies) becomes
+    'assistant', consecutive turns of the same role are merged, and the turns always start with
+    a user turn, which is what the strictest APIs (Anthropic, Gemini) require.
+    """
+    system, turns = [], []
+    for message in messages:
+        role = message.get('role', 'user')
+        content = message.get('content') or ''
+        if role == 'system':
+            system.append(content)
+            continue
+        role = ROLE_ALIASES.get(role, 'user')
+        if turns and turns[-1]['role'] == role:
+            turns[-1]['content'] += '\n\n' + content
+        else:
+            turns.append({'role': role, 'content': content})
+    if turns and turns[0]['role'] != 'user':
+        turns.insert(0, {'role': 'user', 'content': '(continuing an earlier conversation)'})
+    return '\n\n'.join(system), turns
+
 class LLMProviderBase:
     """
     Base interface for all LLM provider adapters.
@@ -7,6 +34,21 @@ class LLMProviderBase:
     def __init__(self, api_key: str = None, host: str = None):
         self.api_key = api_key
         self.host = host
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def client(self):
+        """
+        SDK client, created on first use and reused so connections stay pooled across calls.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        raise NotImplementedError
 
     def generate(self, prompt: str, **kwargs) -> str:
         """
@@ -14,8 +56,22 @@ class LLMProviderBase:
         """
         raise NotImplementedError
 
+    def generate_stream(self, prompt: str, **kwargs):
+        """
+        Yield the response in chunks as they arrive; providers without streaming yield it whole.
+        """
+        yield self.generate(prompt, **kwargs)
+
     def chat(self, messages: list[dict], **kwargs) -> str:
         """
-        (Optional) Chat-style interface for providers that support it.
+        Multi-turn chat; providers without a native message API get one flattened prompt.
+        """
+        system, turns = split_messages(messages)
+        transcript = '\n\n'.join(f"{m['role'].capitalize()}: {m['content']}" for m in turns)
+        return self.generate(f"{system}\n\n{transcript}" if system else transcript, **kwargs)
+
+    def chat_stream(self, messages: list[dict], **kwargs):
+        """
+        Streaming variant of chat(); providers without streaming yield the response whole.
         """
-        raise NotImplementedError 
\ No newline at end of file
+        yield self.chat(messages, **kwargs) 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from .llm_base import LLMProviderBase
+from .llm_base import LLMProviderBase, split_messages
 import sys
 import subprocess
 from typing import Any
@@ -26,30 +26,59 @@ class OllamaProvider(LLMProviderBase):
     """
     Ollama LLM provider adapter.
     """
-    def generate(self, prompt: str, model: str = 'llama2', **kwargs) -> str:
+    def _create_client(self):
         ollama = ensure_ollama()
-        host = self.host or "http://localhost:11434"
+        return ollama.Client(host=self.host or "http://localhost:11434")
+
+    def generate(self, prompt: str, model: str = 'llama2', **kwargs) -> str:
         try:
-            response = ollama.chat(
+            response = self.client().chat(
                 model=model,
-                messages=[{"role": "user", "content": prompt}],
-                base_url=host
+                messages=[{"role": "user", "content": prompt}]
             )
             return response.message.content.strip() if response.message else "Error: No response from LLM"
         except Exception as e:
             print(f"[OllamaProvider] API error: {e}")
             return f"Error: Failed to call Ollama LLM - {e}"
 
+    def generate_stream(self, prompt: str, model: str = 'llama2', **kwargs):
+        try:
+            for chunk in self.client().chat(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True
+            ):
+                if chunk.message and chunk.message.content:
+                    yield chunk.message.content
+        except Exception as e:
+            print(f"[OllamaProvider] API error: {e}")
+            yield f"Error: Failed to call Ollama LLM - {e}"
+
+    @staticmethod
+    def to_messages(messages: list[dict]) -> list[dict]:
+        system, turns = split_messages(messages)
+        return ([{"role": "system", "content": system}] if system else []) + turns
+
     def chat(self, messages: list[dict], model: str = 'llama2', **kwargs) -> str:
-        ollama = ensure_ollama()
-        host = self.host or "http://localhost:11434"
         try:
-            response = ollama.chat(
+            response = self.client().chat(
                 model=model,
-                messages=messages,
-                base_url=host
+                messages=self.to_messages(messages)
             )
             return response.message.content.strip() if response.message else "Error: No response from LLM"
         except Exception as e:
             print(f"[OllamaProvider] API error: {e}")
-            return f"Error: Failed to call Ollama LLM - {e}" 
\ No newline at end of file
+            return f"Error: Failed to call Ollama LLM - {e}"
+
+    def chat_stream(self, messages: list[dict], model: str = 'llama2', **kwargs):
+        try:
+            for chunk in self.client().chat(
+                model=model,
+                messages=self.to_messages(messages),
+                stream=True
+            ):
+                if chunk.message and chunk.message.content:
+                    yield chunk.message.content
+        except Exception as e:
+            print(f"[OllamaProvider] API error: {e}")
+            yield f"Error: Failed to call Ollama LLM - {e}"
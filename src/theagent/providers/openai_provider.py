@@ -1,4 +1,4 @@
-from .llm_base import LLMProviderBase
+from .llm_base import LLMProviderBase, split_messages
 from typing import Any
 import sys
 import subprocess
@@ -26,11 +26,13 @@ class OpenAIProvider(LLMProviderBase):
     """
     OpenAI LLM provider adapter.
     """
-    def generate(self, prompt: str, model: str = 'gpt-4o', temperature: float = 0.2, top_p: float = 0.9, max_tokens: int = 1024, **kwargs) -> str:
+    def _create_client(self):
         openai = ensure_openai()
-        openai.api_key = self.api_key
+        return openai.OpenAI(api_key=self.api_key)
+
+    def generate(self, prompt: str, model: str = 'gpt-4o', temperature: float = 0.2, top_p: float = 0.9, max_tokens: int = 1024, **kwargs) -> str:
         try:
-            response = openai.chat.completions.create(
+            response = self.client().chat.completions.create(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=temperature,
@@ -42,13 +44,36 @@ class OpenAIProvider(LLMProviderBase):
             print(f"[OpenAIProvider] API error: {e}")
             return f"Error: Failed to call OpenAI LLM - {e}"
 
+    def generate_stream(self, prompt: str, model: str = 'gpt-4o', temperature: float = 0.2, top_p: float = 0.9, max_tokens: int = 1024, **kwargs):
+        try:
+            stream = self.client().chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                top_p=top_p,
+                max_tokens=max_tokens,
+                stream=True,
+            )
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                stream.close()
+        except Exception as e:
+            print(f"[OpenAIProvider] API error: {e}")
+            yield f"Error: Failed to call OpenAI LLM - {e}"
+
+    @staticmethod
+    def to_messages(messages: list[dict]) -> list[dict]:
+        system, turns = split_messages(messages)
+        return ([{"role": "system", "content": system}] if system else []) + turns
+
     def chat(self, messages: list[dict], model: str = 'gpt-4o', temperature: float = 0.2, top_p: float = 0.9, max_tokens: int = 1024, **kwargs) -> str:
-        openai = ensure_openai()
-        openai.api_key = self.api_key
         try:
-            response = openai.chat.completions.create(
+            response = self.client().chat.completions.create(
                 model=model,
-                messages=messages,
+                messages=self.to_messages(messages),
                 temperature=temperature,
                 top_p=top_p,
                 max_tokens=max_tokens,
@@ -56,4 +81,24 @@ class OpenAIProvider(LLMProviderBase):
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"[OpenAIProvider] API error: {e}")
-            return f"Error: Failed to call OpenAI LLM - {e}" 
\ No newline at end of file
+            return f"Error: Failed to call OpenAI LLM - {e}"
+
+    def chat_stream(self, messages: list[dict], model: str = 'gpt-4o', temperature: float = 0.2, top_p: float = 0.9, max_tokens: int = 1024, **kwargs):
+        try:
+            stream = self.client().chat.completions.create(
+                model=model,
+                messages=self.to_messages(messages),
+                temperature=temperature,
+                top_p=top_p,
+                max_tokens=max_tokens,
+                stream=True,
+            )
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                stream.close()
+        except Exception as e:
+            print(f"[OpenAIProvider] API error: {e}")
+            yield f"Error: Failed to call OpenAI LLM - {e}"
@@ -0,0 +1,328 @@
+"""
+Long-running daemon (`theagent serve`) and the thin client the CLI uses to reach it.
+
+The daemon keeps the LLM proxy (provider clients and a response cache) and the repository
+indexes in memory and runs forwarded CLI commands in-process, so a command costs about as
+much as its LLM calls. It listens on a Unix socket in .theagent/ (or on localhost TCP where
+that is not possible) and speaks JSON lines: the client sends one request and the daemon
+streams {"out": text} lines followed by {"exit": code}.
+
+Only non-interactive commands are forwarded; chat, watch, --enhanced and config always run
+in the calling process.
+"""
+import json
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+CACHE_DIR = ".theagent"
+DAEMON_FILE = "daemon.json"
+SOCKET_FILE = "daemon.sock"
+CONNECT_TIMEOUT = 2.0
+
+def daemon_info_path(root=None):
+    return os.path.join(root or os.getcwd(), CACHE_DIR, DAEMON_FILE)
+
+def read_daemon_info(root=None):
+    """Address of the daemon serving root (default: cwd), or None if none was started there."""
+    try:
+        with open(daemon_info_path(root), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def can_forward(args_obj):
+    """True for commands that need no terminal interaction and so can run inside the daemon."""
+    subcommand = getattr(args_obj, 'subcommand', None)
+    if subcommand == 'index':
+        return True
+    if subcommand is not None or args_obj.chat or args_obj.enhanced:
+        return False
+    return bool(args_obj.agent and (args_obj.file or args_obj.path or args_obj.glob or args_obj.since or args_obj.staged))
+
+def _connect(info, timeout=CONNECT_TIMEOUT):
+    if info.get('transport') == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = info['path']
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = (info.get('host', '127.0.0.1'), info['port'])
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+    sock.settimeout(None)
+    return sock
+
+def _exchange(sock, info, payload, on_message=None):
+    with sock:
+        sock.sendall((json.dumps(dict(payload, token=info.get('token'))) + '\n').encode('utf-8'))
+        with sock.makefile('r', encoding='utf-8') as stream:
+            for line in stream:
+                message = json.loads(line)
+                if 'exit' in message or 'error' in message or 'status' in message:
+                    return message
+                if on_message is not None:
+                    on_message(message)
+    raise ConnectionError("daemon closed the connection before finishing")
+
+def request(info, payload, on_message=None):
+    """Send one request to the daemon and return its final message; on_message sees streamed ones."""
+    return _exchange(_connect(info), info, payload, on_message)
+
+def forward_to_daemon(argv, root=None):
+    """Run argv in the daemon for this directory, printing its output; None if no daemon is reachable."""
+    info = read_daemon_info(root)
+    if info is None:
+        return None
+    def show(message):
+        sys.stdout.write(message.get('out', ''))
+        sys.stdout.flush()
+    try:
+        sock = _connect(info)
+    except OSError:
+        # Stale daemon.json from a daemon that did not shut down cleanly.
+        return None
+    try:
+        result = _exchange(sock, info, {'op': 'run', 'argv': list(argv), 'cwd': os.getcwd()}, show)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Lost connection to the daemon: {e}")
+        return 1
+    if 'error' in result:
+        print(f"[WARN] Daemon refused the command ({result['error']}); running locally")
+        return None
+    return result['exit']
+
+class _StreamWriter:
+    """File-like object that sends printed text to the client as {"out": ...} lines."""
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.broken = False
+
+    def write(self, text):
+        if text and not self.broken:
+            try:
+                self.wfile.write((json.dumps({'out': text}) + '\n').encode('utf-8'))
+            except OSError:
+                # Client went away; keep running so the command is not torn down half-way.
+                self.broken = True
+        return len(text)
+
+    def flush(self):
+        if not self.broken:
+            try:
+                self.wfile.flush()
+            except OSError:
+                self.broken = True
+
+class DaemonState:
+    """Everything kept warm between requests."""
+    def __init__(self, root, response_cache_size=256):
+        self.root = os.path.abspath(root)
+        self.response_cache_size = response_cache_size
+        self.started = time.time()
+        self.requests = 0
+        self.proxies = {}
+        self.symbol_index = None
+        self.semantic_indexes = {}
+        self._lock = threading.Lock()
+
+    def proxy_for(self, args_obj):
+        """One GeneralLLMProxy per set of credentials, so provider clients and cached responses are reused."""
+        from theagent.main import setup_llm_proxy
+        key = tuple(getattr(args_obj, name, None) for name in
+                    ('openai_api_key', 'anthropic_api_key', 'google_api_key', 'ollama_host'))
+        with self._lock:
+            if key not in self.proxies:
+                self.proxies[key] = setup_llm_proxy(args_obj, response_cache_size=self.response_cache_size)
+            return self.proxies[key]
+
+    def indexes_for(self, args_obj):
+        """Shared-store entries for the warm indexes, brought up to date first."""
+        from theagent.main import attach_symbol_index, attach_semantic_index
+        options = {'verbose': args_obj.verbose}
+        shared = {}
+        with self._lock:
+            if self.symbol_index is None:
+                # Opens the index once `theagent index` has created it.
+                self.symbol_index = attach_symbol_index(options, self.root)
+            else:
+                self.symbol_index.update()
+            if self.symbol_index is not None:
+                shared['symbol_index'] = self.symbol_index
+            if getattr(args_obj, 'semantic', False):
+                model = args_obj.embedding_model
+                if self.semantic_indexes.get(model) is None:
+                    self.semantic_indexes[model] = attach_semantic_index(options, args_obj)
+                else:
+                    self.semantic_indexes[model].update()
+                if self.semantic_indexes[model] is not None:
+                    shared['semantic_index'] = self.semantic_indexes[model]
+        return shared
+
+    def status(self):
+        hits = sum(p.cache_hits for p in self.proxies.values())
+        misses = sum(p.cache_misses for p in self.proxies.values())
+        return {
+            'pid': os.getpid(),
+            'root': self.root,
+            'uptime': round(time.time() - self.started, 1),
+            'requests': self.requests,
+            'cache_hits': hits,
+            'cache_misses': misses,
+            'symbol_index': self.symbol_index is not None,
+            'semantic_indexes': sorted(m for m, i in self.semantic_indexes.items() if i is not None),
+        }
+
+    def run(self, argv, out):
+        """Parse and run a forwarded command with its output routed to out; returns the exit code."""
+        from theagent.main import build_parser, run_command, run_index_command
+        from theagent.utils.console import capture_output
+        with self._lock:
+            self.requests += 1
+        with capture_output(out):
+            try:
+                parser = build_parser()
+                args_obj = parser.parse_args(argv)
+                if args_obj.repair_tests:
+                    args_obj.validate_tests = True
+                if not can_forward(args_obj):
+                    print("[ERROR] This command cannot run in the daemon")
+                    return 2
+                args_obj.no_daemon = True
+                if args_obj.subcommand == 'index':
+                    same_root = os.path.abspath(args_obj.root or self.root) == self.root
+                    run_index_command(args_obj, index=self.symbol_index if same_root else None)
+                    return 0
+                run_command(args_obj, parser, llm_proxy=self.proxy_for(args_obj),
+                            extra_shared=self.indexes_for(args_obj))
+                return 0
+            except SystemExit as e:
+                return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except Exception as e:
+                print(f"[ERROR] {e}")
+                return 1
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            payload = json.loads(self.rfile.readline() or b'{}')
+        except ValueError:
+            return self._send({'error': 'malformed request'})
+        server = self.server
+        if server.token and payload.get('token') != server.token:
+            return self._send({'error': 'bad token'})
+        op = payload.get('op')
+        if op == 'status':
+            return self._send({'status': server.state.status()})
+        if op == 'stop':
+            self._send({'status': 'stopping'})
+            threading.Thread(target=server.shutdown, daemon=True).start()
+            return
+        if op != 'run':
+            return self._send({'error': f'unknown op {op!r}'})
+        if os.path.realpath(payload.get('cwd', '')) != os.path.realpath(server.state.root):
+            return self._send({'error': 'daemon serves a different directory'})
+        exit_code = server.state.run(payload.get('argv', []), _StreamWriter(self.wfile))
+        self._send({'exit': exit_code})
+
+    def _send(self, message):
+        try:
+            self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+            self.wfile.flush()
+        except OSError:
+            pass
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def create_server(state, tcp=False, port=0):
+    """Bind the daemon socket: a Unix socket in .theagent/ if possible, else localhost TCP with a token."""
+    directory = os.path.join(state.root, CACHE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    if not tcp and hasattr(socket, 'AF_UNIX'):
+        path = os.path.join(directory, SOCKET_FILE)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            server = _UnixServer(path, _Handler)
+            os.chmod(path, 0o600)
+            server.token = None
+            server.info = {'transport': 'unix', 'path': path}
+        except OSError as e:
+            # e.g. a socket path longer than the platform limit
+            print(f"[WARN] Could not listen on {path} ({e}); using localhost TCP")
+            server = None
+        if server is not None:
+            server.state = state
+            return server
+    server = _TCPServer(('127.0.0.1', port), _Handler)
+    server.token = secrets.token_hex(16)
+    server.info = {'transport': 'tcp', 'host': '127.0.0.1', 'port': server.server_address[1]}
+    server.state = state
+    return server
+
+def serve(server, ready=None):
+    """Record the daemon address, serve until stopped, then clean up; sets ready once reachable."""
+    info_path = daemon_info_path(server.state.root)
+    info = dict(server.info, pid=os.getpid(), token=server.token)
+    fd = os.open(info_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    if ready is not None:
+        ready.set()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if read_daemon_info(server.state.root) == info:
+            os.remove(info_path)
+        if server.info['transport'] == 'unix' and os.path.exists(server.info['path']):
+            os.remove(server.info['path'])
+
+def run_server(args_obj):
+    """`theagent serve`: start the daemon for the current directory, or --stop / --status it."""
+    info = read_daemon_info()
+    if args_obj.stop or args_obj.status:
+        if info is None:
+            print("[INFO] No daemon is running in this directory")
+            return
+        try:
+            result = request(info, {'op': 'stop' if args_obj.stop else 'status'})
+        except OSError as e:
+            print(f"[WARN] Daemon at {info.get('path') or info.get('port')} is not responding ({e})")
+            return
+        if args_obj.stop:
+            print(f"[INFO] Stopped daemon (pid {info.get('pid')})")
+        else:
+            print('\n'.join(f"{key}: {value}" for key, value in result['status'].items()))
+        return
+    if info is not None:
+        try:
+            request(info, {'op': 'status'})
+            print(f"[ERROR] A daemon is already running here (pid {info.get('pid')}); stop it with `theagent serve --stop`")
+            return
+        except OSError:
+            pass
+    state = DaemonState(os.getcwd(), response_cache_size=args_obj.response_cache)
+    server = create_server(state, tcp=args_obj.tcp, port=args_obj.port)
+    address = server.info.get('path') or f"127.0.0.1:{server.info['port']}"
+    # Warm the indexes now rather than on the first request.
+    state.indexes_for(args_obj)
+    # Forwarded commands must never block on the daemon's terminal.
+    sys.stdin = open(os.devnull, 'r')
+    print(f"[INFO] TheAgent daemon listening on {address} (pid {os.getpid()}). Stop with Ctrl+C or `theagent serve --stop`.")
+    try:
+        serve(server)
+    except KeyboardInterrupt:
+        print("\n[GOODBYE] Daemon stopped.")
@@ -0,0 +1,221 @@
+"""
+Run one agent over many files with a shared worker pool.
+
+Parsing is CPU-bound and runs in a process pool; agent runs are LLM I/O-bound and run
+in a thread pool sized by --workers. The process pool hands each file's text and parse
+status to its thread worker, so a file that does not parse is skipped and the others are
+not read again. Files are scheduled largest first so the longest jobs start early and the
+total run is not dominated by one straggler.
+"""
+import ast
+import copy
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .cache import content_hash
+from .console import OutputThreadPoolExecutor, capture_output
+from .journal import unit_key, file_hash
+from .summary_tree import load_summary_cache
+
+DEFAULT_WORKERS = 4
+PROCESS_POOL_THRESHOLD = 16
+
+AGENT_RESULT_KEYS = {
+    'doc': 'docstring_results',
+    'summary': 'summary',
+    'test': 'tests',
+    'bug': 'bug_analysis',
+    'refactor': 'refactored_code',
+    'type': 'typed_code',
+    'migration': 'migrated_code',
+}
+
+# Agents whose output is the rewritten file, and the shared-store key holding it.
+REWRITE_RESULT_KEYS = {
+    'doc': 'documented_code',
+    'refactor': 'refactored_code',
+    'type': 'typed_code',
+    'migration': 'migrated_code',
+}
+
+def inspect_file(path):
+    """Size, text and parse check for one file; runs in a worker process."""
+    info = {'file': path, 'size': 0, 'lines': 0, 'error': None, 'text': None}
+    try:
+        stat = os.stat(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        info.update(size=len(source), lines=source.count('\n') + 1, mtime_ns=stat.st_mtime_ns,
+                    stat_size=stat.st_size)
+        ast.parse(source, filename=path)
+        # Only files that parse carry their text on to the agent.
+        info['text'] = source
+    except (OSError, UnicodeDecodeError, SyntaxError, ValueError) as e:
+        info['error'] = f"{type(e).__name__}: {e}"
+    return info
+
+def inspect_files(paths, processes=None):
+    """Inspect files, using a process pool when there are enough of them to pay for it."""
+    if len(paths) > PROCESS_POOL_THRESHOLD:
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                return list(pool.map(inspect_file, paths, chunksize=8))
+        except (OSError, NotImplementedError) as e:
+            print(f"[WARN] Process pool unavailable ({e}); inspecting files in-process")
+    return [inspect_file(path) for path in paths]
+
+class InspectedFile:
+    """Hands an inspected file's text and cached summary to the agent nodes, like chat's prefetcher."""
+
+    def __init__(self, info, summary_cache=None):
+        self.info = info
+        self._summary_cache = summary_cache
+        self._lock = threading.Lock()
+
+    @property
+    def summary_cache(self):
+        with self._lock:
+            if self._summary_cache is None:
+                self._summary_cache = load_summary_cache()
+            return self._summary_cache
+
+    def get(self, path):
+        """{'text', 'summary', ...} for the inspected file while it is unchanged on disk, else None.
+
+        There is no 'tree': the parse happened in another process, so nodes parse the text
+        themselves. 'summary' is looked up only when the instance was given a summary cache.
+        """
+        info = self.info
+        if os.path.abspath(path) != os.path.abspath(info['file']):
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if (stat.st_mtime_ns, stat.st_size) != (info['mtime_ns'], info['stat_size']):
+            return None
+        summary = None
+        if self._summary_cache is not None:
+            summary = self._summary_cache.get(content_hash('file', info['text']))
+        return {'text': info['text'], 'tree': None, 'symbols': None, 'summary': summary}
+
+    def remember_summary(self, text, summary):
+        """Store a summary of file content text in the summary cache."""
+        if summary and not summary.startswith('Error:'):
+            self.summary_cache.set(content_hash('file', text), summary)
+            self.summary_cache.save()
+
+def _is_error(result):
+    return result is None or (isinstance(result, str) and result.startswith('Error:'))
+
+def process_file(args, path, flow_factory, extra_shared=None, info=None, summary_cache=None):
+    """Run the agent flow for one file with its own args, flow and captured output.
+
+    info is the file's inspect_file() result when the caller already inspected it.
+    """
+    start = time.time()
+    info = info or inspect_file(path)
+    if info['error']:
+        return {'file': path, 'status': 'skipped', 'error': info['error'],
+                'duration': time.time() - start, 'output': '', 'result': None}
+    file_args = copy.copy(args)
+    file_args.file = path
+    if summary_cache is None and getattr(args, 'agent', None) == 'summary':
+        summary_cache = load_summary_cache()
+    file_args.prefetch = InspectedFile(info, summary_cache)
+    shared = dict(extra_shared or {})
+    shared.update({
+        'file': path,
+        'verbose': getattr(args, 'verbose', False),
+        'no_confirm': True,
+    })
+    error = None
+    with capture_output() as output:
+        try:
+            flow_factory(file_args).run(shared)
+        except Exception as e:
+            error = str(e)
+            print(f"[ERROR] {path}: {e}")
+    result = shared.get(AGENT_RESULT_KEYS.get(getattr(args, 'agent', None), ''), None)
+    if error is None and _is_error(result):
+        error = result or "Agent produced no result"
+    return {
+        'file': path,
+        'status': 'error' if error else 'ok',
+        'error': error,
+        'duration': time.time() - start,
+        'output': output.getvalue(),
+        'result': result,
+        'code': shared.get(REWRITE_RESULT_KEYS.get(getattr(args, 'agent', None), '')),
+    }
+
+def run_batch(args, files, flow_factory, workers=None, extra_shared=None):
+    """Run the agent over files concurrently, largest first; returns per-file results in input order.
+
+    extra_shared is copied into every file's shared store (e.g. long-lived indexes). With a job
+    journal on args, each finished file is journaled and files it already holds are replayed.
+    """
+    workers = workers or getattr(args, 'workers', None) or DEFAULT_WORKERS
+    journal = getattr(args, 'journal', None)
+    agent = getattr(args, 'agent', None)
+    results = {}
+    runnable = []
+    input_hashes = {}
+    for info in inspect_files(files):
+        if info['error']:
+            results[info['file']] = {'file': info['file'], 'status': 'skipped', 'error': info['error'],
+                                     'duration': 0.0, 'output': '', 'result': None}
+            continue
+        if journal is not None:
+            input_hashes[info['file']] = file_hash(info['file'])
+            record = journal.lookup(unit_key(agent, info['file']), input_hashes[info['file']])
+            replayed = journal.result(record) if record is not None else None
+            if replayed is not None:
+                results[info['file']] = dict(replayed, file=info['file'], resumed=True)
+                continue
+        runnable.append(info)
+    resumed = [path for path in files if results.get(path, {}).get('resumed')]
+    if resumed:
+        print(f"[INFO] Resuming: {len(resumed)} file(s) already done, {len(runnable)} to go")
+        for path in resumed:
+            if results[path]['output'].strip():
+                print(f"\n[INFO] {path}: replayed from journal")
+                print(results[path]['output'].rstrip())
+    runnable.sort(key=lambda info: info['size'], reverse=True)
+    print_lock = threading.Lock()
+    done = 0
+    # Only the summary agent reads and writes file summaries.
+    summary_cache = load_summary_cache() if agent == 'summary' else None
+    with OutputThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_file, args, info['file'], flow_factory, extra_shared, info, summary_cache): info['file']
+                   for info in runnable}
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['file']] = result
+            if journal is not None and result['status'] == 'ok':
+                journal.record(unit_key(agent, result['file']), input_hashes[result['file']],
+                               {k: result.get(k) for k in ('status', 'error', 'duration', 'output', 'result', 'code')},
+                               file=result['file'], output_hash=file_hash(result['file']))
+            done += 1
+            with print_lock:
+                print(f"\n[INFO] ({done}/{len(runnable)}) {result['file']}: {result['status']} in {result['duration']:.1f}s")
+                if result['output'].strip():
+                    print(result['output'].rstrip())
+    return [results[path] for path in files if path in results]
+
+def format_batch_report(results, total_time=None):
+    counts = {'ok': 0, 'error': 0, 'skipped': 0}
+    lines = []
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+        line = f"  {result['status'].upper():7} {result['file']} ({result['duration']:.1f}s)"
+        if result.get('resumed'):
+            line += " [resumed]"
+        if result['error']:
+            line += f" - {result['error']}"
+        lines.append(line)
+    header = f"{len(results)} file(s): {counts['ok']} ok, {counts['error']} error, {counts['skipped']} skipped"
+    if total_time is not None:
+        header += f" in {total_time:.1f}s"
+    return header + ('\n' + '\n'.join(lines) if lines else '')
@@ -0,0 +1,119 @@
+"""
+On-disk cache helpers shared by the agents (summaries, indexes, journals).
+"""
+import hashlib
+import json
+import os
+import threading
+
+CACHE_DIR = ".theagent"
+BLOB_STORE_DIR = "blobs"
+
+def get_cache_dir(root=None):
+    """Return the .theagent directory for root (default: cwd), creating it if needed."""
+    path = os.path.join(root or os.getcwd(), CACHE_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def content_hash(*parts) -> str:
+    """Stable sha256 hex digest over one or more str/bytes parts."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        h.update(part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+class JsonCache:
+    """Thread-safe key/value cache persisted as a single JSON file."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {}
+        self._dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except Exception as e:
+                print(f"[WARN] Could not load cache {path}: {e}")
+                self._data = {}
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._dirty = True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+                self._dirty = True
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    def save(self):
+        """Write the cache atomically if anything changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Unique per process and thread: the daemon, the CLI and queue workers may save the same cache at once.
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+class BlobStore:
+    """Content-addressed file store under .theagent/blobs/, keyed by content_hash of the bytes.
+
+    Identical content is stored once however many sessions or files refer to it.
+    """
+    def __init__(self, root=None, directory=BLOB_STORE_DIR):
+        self.directory = os.path.join(get_cache_dir(root), directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def put(self, data):
+        """Store data (bytes or str) and return its key."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        key = content_hash(data)
+        path = self._path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return key
+
+    def get(self, key):
+        """Bytes stored under key, or None."""
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
@@ -1,9 +1,13 @@
 # utils/call_llm.py
 import os
+import json
+import threading
 import time
+from collections import OrderedDict
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
 from .utils import ProgressTracker, create_progress_tracker
+from .cache import content_hash
 import sys
 import subprocess
 from theagent.providers.openai_provider import OpenAIProvider
@@ -39,7 +43,8 @@ class GeneralLLMProxy:
     """
     Modular LLM proxy supporting OpenAI, Anthropic, Google Gemini, and Ollama.
     """
-    def __init__(self, openai_api_key=None, anthropic_api_key=None, google_api_key=None, ollama_host=None):
+    def __init__(self, openai_api_key=None, anthropic_api_key=None, google_api_key=None, ollama_host=None,
+                 response_cache_size=0):
         self.openai_api_key = openai_api_key or os.environ.get("OPENAI_API_KEY")
         self.anthropic_api_key = anthropic_api_key or os.environ.get("ANTHROPIC_API_KEY")
         self.google_api_key = google_api_key or os.environ.get("GOOGLE_GENAI_API_KEY")
@@ -50,11 +55,83 @@ class GeneralLLMProxy:
             'google': GoogleProvider(api_key=self.google_api_key),
             'ollama': OllamaProvider(host=self.ollama_host),
         }
+        # Optional in-memory LRU of responses keyed by provider, options and prompt (used by the daemon).
+        self.response_cache_size = response_cache_size
+        self._response_cache = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
-    def call_llm(self, prompt, provider='openai', **kwargs):
+    def _cache_key(self, provider, kwargs, payload):
         if provider not in self.providers:
             raise ValueError(f"Unsupported provider: {provider}")
-        return self.providers[provider].generate(prompt, **kwargs)
+        if not self.response_cache_size:
+            return None
+        return content_hash(provider, json.dumps(kwargs, sort_keys=True, default=str), payload)
+
+    def _cache_put(self, key, response):
+        if key is not None and isinstance(response, str) and response and not response.startswith('Error:'):
+            with self._response_cache_lock:
+                self._response_cache[key] = response
+                self._response_cache.move_to_end(key)
+                while len(self._response_cache) > self.response_cache_size:
+                    self._response_cache.popitem(last=False)
+
+    def _cache_get(self, key):
+        if key is None:
+            return None
+        with self._response_cache_lock:
+            if key in self._response_cache:
+                self._response_cache.move_to_end(key)
+                self.cache_hits += 1
+                return self._response_cache[key]
+            self.cache_misses += 1
+        return None
+
+    def _cached_call(self, key, produce):
+        response = self._cache_get(key)
+        if response is None:
+            response = produce()
+            self._cache_put(key, response)
+        return response
+
+    def _cached_stream(self, key, produce):
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        for chunk in produce():
+            chunks.append(chunk)
+            yield chunk
+        # Only reached when the caller read the whole stream; partial responses are not cached.
+        self._cache_put(key, ''.join(chunks))
+
+    def call_llm(self, prompt, provider='openai', **kwargs):
+        key = self._cache_key(provider, kwargs, prompt)
+        return self._cached_call(key, lambda: self.providers[provider].generate(prompt, **kwargs))
+
+    def stream_llm(self, prompt, provider='openai', **kwargs):
+        """Yield the response in chunks as it is generated; a complete stream is cached like call_llm."""
+        key = self._cache_key(provider, kwargs, prompt)
+        return self._cached_stream(key, lambda: self.providers[provider].generate_stream(prompt, **kwargs))
+
+    def chat_messages(self, messages, provider='openai', model='gpt-4o', **kwargs):
+        """Multi-turn chat through the provider's native message API.
+
+        messages are {'role': 'system'|'user'|'agent'|'assistant', 'content': str} dicts; each
+        provider maps the roles to its own API, so the unchanged history prefix can be reused
+        (prompt-cached) by the provider from one turn to the next.
+        """
+        messages = [{'role': m['role'], 'content': m['content']} for m in messages]
+        key = self._cache_key(provider, {'model': model, **kwargs}, json.dumps(messages))
+        return self._cached_call(key, lambda: self.providers[provider].chat(messages, model=model, **kwargs))
+
+    def chat_messages_stream(self, messages, provider='openai', model='gpt-4o', **kwargs):
+        """Streaming variant of chat_messages(): yields text chunks as they arrive."""
+        messages = [{'role': m['role'], 'content': m['content']} for m in messages]
+        key = self._cache_key(provider, {'model': model, **kwargs}, json.dumps(messages))
+        return self._cached_stream(key, lambda: self.providers[provider].chat_stream(messages, model=model, **kwargs))
 
     # Agent methods
     def generate_docstring(self, function_code: str, provider='openai', model='gpt-4o', **kwargs) -> str:
@@ -102,6 +179,33 @@ class GeneralLLMProxy:
         prompt = f"Summarize this Python code:\n{code}"
         return self.call_llm(f"{system_prompt}\n\n{prompt}", provider=provider, model=model, **kwargs)
 
+    def combine_summaries(self, summaries: list, level: str = 'file', name: str = '', provider='openai', model='gpt-4o', **kwargs) -> str:
+        system_prompt = (
+            "You are an expert Python code summarization agent. "
+            f"You are given summaries of the parts of a Python {level}. "
+            f"Your job is to combine them into one concise, high-level summary of the whole {level}. "
+            "- Only output the summary, do NOT include any code, markdown, or extra text. "
+            "- Mention the main purpose, the most important parts, and how they fit together. "
+            "- Do not list every part; focus on what a new reader needs to know. "
+            "\n\nOutput Format:\nA single concise paragraph. No code, no markdown, no extra text."
+        )
+        parts = '\n'.join(f"- {s}" for s in summaries)
+        prompt = f"Combine these summaries of {level} '{name}':\n{parts}"
+        return self.call_llm(f"{system_prompt}\n\n{prompt}", provider=provider, model=model, **kwargs)
+
+    def summarize_conversation(self, previous_summary: str, transcript: str, max_words: int = 150, provider='openai', model='gpt-4o', **kwargs) -> str:
+        system_prompt = (
+            "You maintain the running summary of a conversation between a user and a coding assistant. "
+            "You are given the summary so far and the turns that happened after it. "
+            "Your job is to produce one updated summary that replaces both. "
+            "- Keep facts that later turns may depend on: file names, symbols, decisions, open questions and user preferences. "
+            "- Drop greetings, repetition and the content of files that were read (keep only that they were read). "
+            f"- Use at most {max_words} words. "
+            "\n\nOutput Format:\nPlain text only. No markdown headings, no extra text."
+        )
+        prompt = f"Summary so far:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"
+        return self.call_llm(f"{system_prompt}\n\n{prompt}", provider=provider, model=model, **kwargs)
+
     def generate_tests(self, function_code: str, provider='openai', model='gpt-4o', **kwargs) -> str:
         system_prompt = (
             "You are an expert Python testing agent. "
@@ -117,6 +221,19 @@ class GeneralLLMProxy:
         prompt = f"Generate unit tests for this Python function:\n{function_code}"
         return self.call_llm(f"{system_prompt}\n\n{prompt}", provider=provider, model=model, **kwargs)
 
+    def repair_tests(self, failing_tests: str, failure_output: str, source_code: str, provider='openai', model='gpt-4o', **kwargs) -> str:
+        system_prompt = (
+            "You are an expert Python testing agent. "
+            "Some generated pytest tests fail. Your job is to fix ONLY the failing tests. "
+            "- Output only the corrected test functions (and any imports they need), keeping the same names. "
+            "- Do NOT include any explanations, markdown, or extra text. "
+            "- Fix the tests, not the code under test: assume the code under test is correct. "
+            "- If a test cannot be made meaningful, make it assert the actual behaviour of the code."
+        )
+        prompt = (f"Code under test:\n{source_code}\n\nFailing tests:\n{failing_tests}\n\n"
+                  f"pytest output:\n{failure_output}")
+        return self.call_llm(f"{system_prompt}\n\n{prompt}", provider=provider, model=model, **kwargs)
+
     def detect_bugs(self, code: str, provider='openai', model='gpt-4o', **kwargs) -> str:
         system_prompt = (
             "You are an expert Python code review agent specializing in bug detection. "
@@ -146,6 +263,33 @@ class GeneralLLMProxy:
         prompt = f"Refactor this Python code to improve quality:\n{code}"
         return self.call_llm(f"{system_prompt}\n\n{prompt}", provider=provider, model=model, **kwargs)
 
+    def generate_patch(self, code: str, task: str, edit_format: str = 'diff', provider='openai', model='gpt-4o', **kwargs) -> str:
+        """Ask for only the changes needed for task, as a unified diff or SEARCH/REPLACE edit blocks."""
+        if edit_format == 'edits':
+            format_rules = (
+                "- Output one or more edit blocks, each in exactly this form:\n"
+                "<<<<<<< SEARCH\n<exact lines copied from the original code>\n=======\n<replacement lines>\n>>>>>>> REPLACE\n"
+                "- Each SEARCH section must match the original code exactly, including indentation. "
+                "- Keep SEARCH sections short but unique; do not repeat unchanged code outside them. "
+            )
+        else:
+            format_rules = (
+                "- Output a unified diff of the file (hunks starting with @@ -start,count +start,count @@). "
+                "- Include 2-3 lines of unchanged context around each change, prefixed with a single space. "
+                "- Prefix removed lines with '-' and added lines with '+'. "
+                "- Do not output unchanged parts of the file outside the hunks. "
+            )
+        system_prompt = (
+            "You are an expert Python code editing agent. "
+            "Your job is to perform the requested change by outputting ONLY the edits, never the whole file. "
+            f"{format_rules}"
+            "- Do NOT include any explanations, markdown, or extra text. "
+            "- The edited code must remain valid Python. "
+            "- If no changes are needed, output exactly NO_CHANGES."
+        )
+        prompt = f"Task: {task}\n\nOriginal code:\n{code}"
+        return self.call_llm(f"{system_prompt}\n\n{prompt}", provider=provider, model=model, **kwargs)
+
     def migrate_code(self, code: str, migration_target: str = "Python 3", provider='openai', model='gpt-4o', **kwargs) -> str:
         system_prompt = (
             "You are an expert Python code migration agent. "
@@ -175,4 +319,8 @@ class GeneralLLMProxy:
 
     def chat(self, prompt: str, provider='openai', model='gpt-4o', **kwargs) -> str:
         """General chat method for intent recognition and other conversational tasks."""
-        return self.call_llm(prompt, provider=provider, model=model, **kwargs)
\ No newline at end of file
+        return self.call_llm(prompt, provider=provider, model=model, **kwargs)
+
+    def chat_stream(self, prompt: str, provider='openai', model='gpt-4o', **kwargs):
+        """Streaming variant of chat(): yields text chunks as they arrive."""
+        return self.stream_llm(prompt, provider=provider, model=model, **kwargs)
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""
+Dependency-sliced context for per-function prompts, and merging of generated test modules.
+
+A slice holds only what the model needs to test one function: the module's imports,
+the signatures of the module-level symbols the function references, and the function
+itself. Slices keep prompts small no matter how large the module is.
+"""
+import ast
+import re
+
+def _lines_of(source_code, node):
+    lines = source_code.split('\n')
+    start = node.decorator_list[0].lineno if getattr(node, 'decorator_list', None) else node.lineno
+    return '\n'.join(lines[start - 1:node.end_lineno])
+
+def _first_doc_line(node):
+    doc = ast.get_docstring(node)
+    return doc.strip().split('\n')[0] if doc else None
+
+def function_signature(source_code, node, indent=''):
+    """Return the 'def ...:' header of a function with its first docstring line and an ellipsis body."""
+    lines = source_code.split('\n')
+    body_start = node.body[0].lineno
+    header = lines[node.lineno - 1:body_start - 1] or [lines[node.lineno - 1]]
+    # Single-line defs ("def f(): return 1") keep only the part up to the body.
+    if body_start == node.lineno:
+        header = [lines[node.lineno - 1][:node.body[0].col_offset].rstrip()]
+    header = [l for l in header if l.strip()]
+    base_indent = len(header[0]) - len(header[0].lstrip())
+    header = [indent + l[base_indent:] for l in header]
+    doc = _first_doc_line(node)
+    body = f'{indent}    """{doc}"""\n{indent}    ...' if doc else f'{indent}    ...'
+    return '\n'.join(header) + '\n' + body
+
+def class_signature(source_code, node):
+    """Return a class header plus the signatures of its methods and class-level assignments."""
+    lines = source_code.split('\n')
+    header = lines[node.lineno - 1].strip()
+    parts = [header]
+    doc = _first_doc_line(node)
+    if doc:
+        parts.append(f'    """{doc}"""')
+    for child in node.body:
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            parts.append(function_signature(source_code, child, indent='    '))
+        elif isinstance(child, (ast.Assign, ast.AnnAssign)):
+            parts.append('    ' + lines[child.lineno - 1].strip())
+    if len(parts) == 1:
+        parts.append('    ...')
+    return '\n'.join(parts)
+
+def module_symbols(tree):
+    """Map each module-level name to the node that defines it."""
+    symbols = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            symbols[node.name] = node
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    symbols[target.id] = node
+        elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+            symbols[node.target.id] = node
+    return symbols
+
+def module_imports(source_code, tree):
+    """Return the source of all top-level import statements."""
+    return [ast.get_source_segment(source_code, node) for node in tree.body
+            if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+def referenced_names(node):
+    """Names loaded anywhere inside node (the local call graph edges)."""
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+
+def _signature_for(source_code, node):
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return function_signature(source_code, node)
+    if isinstance(node, ast.ClassDef):
+        return class_signature(source_code, node)
+    return ast.get_source_segment(source_code, node)
+
+def build_test_slices(source_code, module_name, include_private=False):
+    """Build one minimal context slice per public function and method of a module."""
+    tree = ast.parse(source_code)
+    symbols = module_symbols(tree)
+    imports = module_imports(source_code, tree)
+    targets = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            targets.append((node.name, node, None))
+        elif isinstance(node, ast.ClassDef):
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    if child.name.startswith('_') and child.name != '__init__' and not include_private:
+                        continue
+                    targets.append((f"{node.name}.{child.name}", child, node))
+    slices = []
+    for qualname, node, owner in targets:
+        if qualname.split('.')[-1].startswith('_') and owner is None and not include_private:
+            continue
+        refs = referenced_names(node)
+        own = owner.name if owner is not None else node.name
+        dependencies = []
+        for name in sorted(refs):
+            dep = symbols.get(name)
+            if dep is None or name == own or dep is node:
+                continue
+            signature = _signature_for(source_code, dep)
+            if signature not in dependencies:
+                dependencies.append(signature)
+        import_name = owner.name if owner is not None else node.name
+        parts = [f"# Module: {module_name} (import with: from {module_name} import {import_name})"]
+        if imports:
+            parts.append("# Module imports:\n" + '\n'.join(imports))
+        if owner is not None:
+            parts.append("# Enclosing class:\n" + class_signature(source_code, owner))
+        if dependencies:
+            parts.append("# Signatures of referenced symbols:\n" + '\n\n'.join(dependencies))
+        parts.append("# Function under test:\n" + _lines_of(source_code, node))
+        slices.append({
+            'name': qualname,
+            'line': node.lineno,
+            'end': node.end_lineno,
+            'code': '\n\n'.join(parts),
+        })
+    return slices
+
+def strip_code_fences(code):
+    code = code.strip()
+    match = re.match(r'^```(?:python)?\s*\n(.*?)\n?```\s*$', code, re.DOTALL)
+    return match.group(1) if match else code
+
+def _split_module(code):
+    """Split module source into (import statements, body text)."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        imports, body = [], []
+        for line in code.split('\n'):
+            (imports if re.match(r'^(import |from \S+ import )', line) else body).append(line)
+        return imports, '\n'.join(body).strip(), set()
+    lines = code.split('\n')
+    import_lines = set()
+    imports = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            imports.extend(f"import {ast.unparse(alias)}" for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            module = '.' * node.level + (node.module or '')
+            imports.extend(f"from {module} import {ast.unparse(alias)}" for alias in node.names)
+        else:
+            continue
+        import_lines.update(range(node.lineno - 1, node.end_lineno))
+    body = '\n'.join(l for i, l in enumerate(lines) if i not in import_lines).strip()
+    names = {n.name for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))}
+    return imports, body, names
+
+def _format_imports(imports):
+    """Deduplicate imports, merging 'from x import a' lines per module."""
+    plain, from_names, order = [], {}, []
+    for stmt in imports:
+        match = re.match(r'^from (\S+) import (.+)$', stmt)
+        if match:
+            module = match.group(1)
+            if module not in from_names:
+                from_names[module] = []
+                order.append(('from', module))
+            for name in (n.strip() for n in match.group(2).strip('()').split(',')):
+                if name and name not in from_names[module]:
+                    from_names[module].append(name)
+        elif stmt not in plain:
+            plain.append(stmt)
+            order.append(('plain', stmt))
+    out = []
+    for kind, value in order:
+        out.append(value if kind == 'plain' else f"from {value} import {', '.join(from_names[value])}")
+    return out
+
+def _top_level_definitions(body):
+    """{name: (normalized source, first line, last line)} of the functions and classes in body."""
+    definitions = {}
+    for node in ast.parse(body).body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+            definitions[node.name] = (ast.unparse(node), start, node.end_lineno)
+    return definitions
+
+def _rename(body, name, new_name):
+    """Rename a top-level definition and every reference to it (names and parameters, e.g. fixture arguments)."""
+    tree = ast.parse(body)
+    positions = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == name:
+            positions.add((node.lineno, node.col_offset))
+        elif isinstance(node, ast.arg) and node.arg == name:
+            positions.add((node.lineno, node.col_offset))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.name == name:
+            line = body.split('\n')[node.lineno - 1]
+            match = re.compile(rf'\b(?:def|class)\s+({re.escape(name)})\b').search(line, node.col_offset)
+            if match:
+                positions.add((node.lineno, match.start(1)))
+    lines = body.split('\n')
+    for lineno, col in sorted(positions, reverse=True):
+        line = lines[lineno - 1]
+        # col_offset counts UTF-8 bytes.
+        prefix = line.encode('utf-8')[:col].decode('utf-8')
+        lines[lineno - 1] = prefix + new_name + line[len(prefix) + len(name):]
+    return '\n'.join(lines)
+
+def merge_test_modules(pieces):
+    """Merge generated test modules into one pytest module with deduplicated imports and unique names.
+
+    A function or class another piece already defined identically is dropped; a different one
+    with the same name is renamed together with its uses in its own piece (so a test keeps the
+    fixture or helper it was generated with).
+    """
+    all_imports, bodies, seen = [], [], {}
+    for piece in pieces:
+        if not piece or not piece.strip():
+            continue
+        imports, body, names = _split_module(strip_code_fences(piece))
+        try:
+            definitions = _top_level_definitions(body)
+        except SyntaxError:
+            definitions = None
+        drop = []
+        for name in sorted(names):
+            if name not in seen:
+                seen[name] = definitions[name][0] if definitions else None
+                continue
+            if definitions and definitions[name][0] == seen[name]:
+                drop.append(definitions[name][1:])
+                continue
+            suffix = 2
+            while f"{name}_{suffix}" in seen:
+                suffix += 1
+            new_name = f"{name}_{suffix}"
+            if definitions:
+                body = _rename(body, name, new_name)
+            else:
+                body = re.sub(rf'\b(def|class) {re.escape(name)}\b', rf'\1 {new_name}', body)
+            seen[new_name] = None
+        if drop:
+            lines = body.split('\n')
+            for first, last in sorted(drop, reverse=True):
+                del lines[first - 1:last]
+            body = re.sub(r'\n{3,}', '\n\n\n', '\n'.join(lines)).strip()
+        all_imports.extend(imports)
+        if body:
+            bodies.append(body)
+    header = '\n'.join(_format_imports(all_imports))
+    merged = '\n\n\n'.join(bodies)
+    return f"{header}\n\n\n{merged}\n" if header else f"{merged}\n"
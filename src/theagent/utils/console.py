@@ -0,0 +1,78 @@
+"""
+Per-thread stdout capture so concurrent agent runs do not interleave their output.
+"""
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+class _ThreadRoutedStream:
+    """Stands in for sys.stdout and sends writes to the current thread's buffer, if any."""
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    def _target(self):
+        return getattr(self._local, 'buffer', None) or self._default
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._default, name)
+
+_lock = threading.Lock()
+_router = None
+_users = 0
+
+@contextmanager
+def capture_output(stream=None):
+    """Capture everything the current thread prints; yields a StringIO with the text.
+
+    If stream is given (any object with write/flush), output goes there instead, as it is printed.
+    """
+    global _router, _users
+    with _lock:
+        if _users == 0:
+            # The router (and its thread-local) lives for the whole process: freeing a
+            # threading.local that other threads still hold entries in can crash CPython 3.12.
+            if _router is None:
+                _router = _ThreadRoutedStream(sys.stdout)
+            if sys.stdout is not _router:
+                _router._default = sys.stdout
+                sys.stdout = _router
+        _users += 1
+        router = _router
+    buffer = stream if stream is not None else io.StringIO()
+    previous = getattr(router._local, 'buffer', None)
+    router._local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        router._local.buffer = previous
+        with _lock:
+            _users -= 1
+            if _users == 0:
+                if sys.stdout is _router:
+                    sys.stdout = _router._default
+
+def inherit_output(fn):
+    """Wrap fn so that, run on another thread, it prints where the calling thread prints now."""
+    router = _router
+    buffer = getattr(router._local, 'buffer', None) if router is not None else None
+    if buffer is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with capture_output(buffer):
+            return fn(*args, **kwargs)
+    return run
+
+class OutputThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor whose tasks print to the submitting thread's capture target, if any."""
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(inherit_output(fn), *args, **kwargs)
@@ -0,0 +1,150 @@
+"""
+.gitignore-aware discovery of Python files for directory and glob runs.
+"""
+import fnmatch
+import glob
+import os
+import re
+
+ALWAYS_SKIP = {'.git', '.hg', '.svn', '.theagent', '__pycache__', '.venv', 'venv', '.tox', '.nox', '.mypy_cache', '.pytest_cache'}
+
+def _translate(pattern):
+    """Translate a gitignore glob (without leading '/' or trailing '/') to a regex."""
+    out, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            out.append('/.*')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            out.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            out.append('[^/]')
+            i += 1
+        elif pattern[i] == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                out.append(re.escape(pattern[i]))
+                i += 1
+            else:
+                body = pattern[i + 1:end].replace('\\', '\\\\')
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append(f'[{body}]')
+                i = end + 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(out)
+
+class GitIgnore:
+    """Ordered gitignore rules from any number of .gitignore files; the last match wins."""
+    def __init__(self):
+        self.rules = []
+
+    def add_file(self, path, base_dir):
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        for line in lines:
+            self.add_pattern(line, base_dir)
+
+    def add_pattern(self, line, base_dir=''):
+        line = line.rstrip()
+        if not line or line.startswith('#'):
+            return
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        anchored = '/' in line
+        line = line.lstrip('/')
+        if not line:
+            return
+        regex = _translate(line)
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+        base = base_dir.strip('/')
+        prefix = re.escape(base) + '/' if base else ''
+        self.rules.append((re.compile(f'^{prefix}{regex}$'), negate, dir_only))
+
+    def is_ignored(self, rel_path, is_dir=False):
+        rel_path = rel_path.replace(os.sep, '/').strip('/')
+        ignored = False
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                ignored = not negate
+        return ignored
+
+def iter_python_files(root, gitignore=None, suffixes=('.py',)):
+    """Walk root yielding .py files (or other suffixes) that are not ignored; ignored directories are not entered."""
+    root = os.path.abspath(root)
+    gitignore = gitignore or GitIgnore()
+    repo_root = find_repo_root(root)
+    # .gitignore files between the repository root and root still apply to root.
+    directory, ancestors = root, []
+    while directory != repo_root and os.path.dirname(directory) != directory:
+        directory = os.path.dirname(directory)
+        ancestors.append(directory)
+    for directory in reversed(ancestors):
+        rel = os.path.relpath(directory, repo_root)
+        gitignore.add_file(os.path.join(directory, '.gitignore'), '' if rel == '.' else rel.replace(os.sep, '/'))
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, repo_root)
+        rel_dir = '' if rel_dir == '.' else rel_dir.replace(os.sep, '/')
+        if '.gitignore' in filenames:
+            gitignore.add_file(os.path.join(dirpath, '.gitignore'), rel_dir)
+        kept = []
+        for d in sorted(dirnames):
+            if d in ALWAYS_SKIP or gitignore.is_ignored(f"{rel_dir}/{d}" if rel_dir else d, is_dir=True):
+                continue
+            kept.append(d)
+        dirnames[:] = kept
+        for name in sorted(filenames):
+            if not name.endswith(suffixes):
+                continue
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            if not gitignore.is_ignored(rel):
+                yield os.path.join(dirpath, name)
+
+def find_repo_root(start):
+    """Nearest directory at or above start that contains .git; start itself if none."""
+    current = os.path.abspath(start)
+    while True:
+        if os.path.exists(os.path.join(current, '.git')):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return os.path.abspath(start)
+        current = parent
+
+def discover_files(path=None, pattern=None):
+    """Python files under path (default cwd), optionally filtered by a glob pattern, honouring .gitignore."""
+    root = path or os.getcwd()
+    if pattern and not path and os.path.isabs(pattern):
+        return sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+    files = list(iter_python_files(root))
+    if pattern:
+        base = os.path.abspath(root)
+        pattern = pattern.replace(os.sep, '/')
+        if pattern.startswith('./'):
+            pattern = pattern[2:]
+        regex = re.compile('^' + _translate(pattern) + '$')
+        files = [f for f in files
+                 if regex.match(os.path.relpath(f, base).replace(os.sep, '/'))
+                 or fnmatch.fnmatch(os.path.basename(f), pattern)]
+    return files
@@ -0,0 +1,287 @@
+"""
+Optional semantic code search over a memory-mapped NumPy embedding matrix.
+
+Chunk vectors live in a float32 file opened with numpy.memmap; a SQLite sidecar maps
+rows to chunk ids, files and content hashes. Searches scan the matrix in blocks with
+vectorized dot products, so the index never has to fit in RAM. Upserts only embed
+chunks whose content hash changed; rows freed by deleted chunks are reused.
+"""
+import hashlib
+import heapq
+import math
+import os
+import sqlite3
+import threading
+from .cache import content_hash, get_cache_dir
+from .discovery import iter_python_files
+from .retrieval import chunk_source, estimate_tokens, tokenize
+
+EMBEDDINGS_DIR = "embeddings"
+DEFAULT_EMBEDDING_MODEL = "nomic-embed-text"
+DEFAULT_BLOCK_ROWS = 65536
+INITIAL_CAPACITY = 1024
+EMBED_BATCH = 64
+RELATED_CODE_CHUNKS = 2
+RELATED_CODE_BUDGET = 400
+
+def ensure_numpy():
+    from .call_llm import ensure_package
+    ensure_package('numpy')
+    import numpy
+    return numpy
+
+class StubEmbedder:
+    """Deterministic hashed bag-of-tokens embedder; no model needed (tests, offline use)."""
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f"stub-{dim}"
+
+    def embed(self, texts):
+        np = ensure_numpy()
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in tokenize(text):
+                digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], 'little') % self.dim
+                matrix[i, bucket] += 1.0 if digest[4] & 1 else -1.0
+        return _normalize(np, matrix)
+
+class OllamaEmbedder:
+    """Embeddings from a local Ollama embedding model (e.g. nomic-embed-text)."""
+    def __init__(self, model=DEFAULT_EMBEDDING_MODEL, host=None):
+        self.model = model
+        self.host = host or os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+        self.name = f"ollama-{model}"
+        self.dim = None
+        self._client = None
+
+    def embed(self, texts):
+        np = ensure_numpy()
+        if self._client is None:
+            from theagent.providers.ollama_provider import ensure_ollama
+            self._client = ensure_ollama().Client(host=self.host)
+        response = self._client.embed(model=self.model, input=list(texts))
+        matrix = np.asarray(response['embeddings'], dtype=np.float32)
+        self.dim = matrix.shape[1]
+        return _normalize(np, matrix)
+
+def _normalize(np, matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS rows (
+    row INTEGER PRIMARY KEY, key TEXT UNIQUE, file TEXT, name TEXT, start INTEGER, end_line INTEGER, hash TEXT);
+CREATE TABLE IF NOT EXISTS free (row INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER);
+CREATE INDEX IF NOT EXISTS rows_file ON rows(file);
+"""
+
+class EmbeddingIndex:
+    """Memory-mapped float32 embedding matrix with a SQLite id table."""
+    def __init__(self, embedder, root=None, directory=None, suffixes=('.py',)):
+        self.np = ensure_numpy()
+        self.embedder = embedder
+        self.root = os.path.abspath(root or os.getcwd())
+        self.suffixes = suffixes
+        self.directory = directory or os.path.join(get_cache_dir(self.root), EMBEDDINGS_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(self.directory, "ids.db"), check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        self.dim = int(meta['dim']) if 'dim' in meta else getattr(embedder, 'dim', None)
+        self.count = int(meta.get('count', 0))
+        if meta.get('model') not in (None, embedder.name):
+            # A different model means incomparable vectors: start over.
+            self._reset()
+        self.vectors = None
+        if self.dim:
+            self._open(max(self.count, INITIAL_CAPACITY))
+
+    def _reset(self):
+        with self.conn:
+            for table in ('meta', 'rows', 'free', 'files'):
+                self.conn.execute(f"DELETE FROM {table}")
+        if os.path.exists(self.vectors_path):
+            os.remove(self.vectors_path)
+        self.count = 0
+        self.dim = getattr(self.embedder, 'dim', None)
+
+    def _open(self, capacity):
+        size = capacity * self.dim * 4
+        if not os.path.exists(self.vectors_path) or os.path.getsize(self.vectors_path) < size:
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(size)
+        capacity = os.path.getsize(self.vectors_path) // (self.dim * 4)
+        self.vectors = self.np.memmap(self.vectors_path, dtype=self.np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def _ensure_capacity(self, rows_needed):
+        if self.vectors is not None and rows_needed <= self.vectors.shape[0]:
+            return
+        capacity = max(INITIAL_CAPACITY, self.vectors.shape[0] if self.vectors is not None else 0)
+        while capacity < rows_needed:
+            capacity *= 2
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        self._open(capacity)
+
+    def _save_meta(self):
+        self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                              [('dim', str(self.dim)), ('count', str(self.count)), ('model', self.embedder.name)])
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def upsert(self, chunks):
+        """Add or refresh chunks ({key, file, name, start, end, text}); returns how many were embedded."""
+        with self._lock:
+            pending = []
+            for chunk in chunks:
+                digest = content_hash(chunk['text'])
+                row = self.conn.execute("SELECT row, hash, start, end_line FROM rows WHERE key = ?", (chunk['key'],)).fetchone()
+                if row is not None and row[1] == digest:
+                    if (row[2], row[3]) != (chunk['start'], chunk['end']):
+                        # Same content, moved within the file: only the line numbers change.
+                        with self.conn:
+                            self.conn.execute("UPDATE rows SET start = ?, end_line = ? WHERE row = ?",
+                                              (chunk['start'], chunk['end'], row[0]))
+                    continue
+                pending.append((chunk, digest, row[0] if row is not None else None))
+            for i in range(0, len(pending), EMBED_BATCH):
+                batch = pending[i:i + EMBED_BATCH]
+                matrix = self.embedder.embed([chunk['text'] for chunk, _, _ in batch])
+                if self.dim is None:
+                    self.dim = matrix.shape[1]
+                with self.conn:
+                    for (chunk, digest, row), vector in zip(batch, matrix):
+                        if row is None:
+                            row = self._allocate_row()
+                        self._ensure_capacity(row + 1)
+                        self.vectors[row] = vector
+                        self.conn.execute("INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                          (row, chunk['key'], chunk['file'], chunk['name'], chunk['start'], chunk['end'], digest))
+                    self._save_meta()
+            if pending:
+                self.vectors.flush()
+            return len(pending)
+
+    def _allocate_row(self):
+        free = self.conn.execute("SELECT row FROM free ORDER BY row LIMIT 1").fetchone()
+        if free is not None:
+            self.conn.execute("DELETE FROM free WHERE row = ?", (free[0],))
+            return free[0]
+        self.count += 1
+        return self.count - 1
+
+    def remove(self, keys):
+        """Delete chunks by key; their rows are zeroed and reused by later upserts."""
+        with self._lock, self.conn:
+            for key in keys:
+                row = self.conn.execute("SELECT row FROM rows WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    continue
+                self.vectors[row[0]] = 0.0
+                self.conn.execute("DELETE FROM rows WHERE row = ?", (row[0],))
+                self.conn.execute("INSERT OR IGNORE INTO free VALUES (?)", (row[0],))
+
+    def update(self):
+        """Sync with the repository: re-chunk changed files and embed only changed chunks."""
+        with self._lock:
+            known = {path: (mtime, size) for path, mtime, size in self.conn.execute("SELECT path, mtime, size FROM files")}
+            seen, embedded = set(), 0
+            for path in iter_python_files(self.root, suffixes=self.suffixes):
+                rel = os.path.relpath(path, self.root).replace(os.sep, '/')
+                seen.add(rel)
+                try:
+                    st = os.stat(path)
+                    if known.get(rel) == (st.st_mtime, st.st_size):
+                        continue
+                    with open(path, 'r', encoding='utf-8') as f:
+                        text = f.read()
+                except (OSError, UnicodeDecodeError):
+                    continue
+                lines = text.split('\n')
+                chunks, used_keys = [], set()
+                for name, start, end in chunk_source(rel, text):
+                    key, n = f"{rel}::{name}", 1
+                    while key in used_keys:
+                        n += 1
+                        key = f"{rel}::{name}#{n}"
+                    used_keys.add(key)
+                    chunks.append({'key': key, 'file': rel, 'name': name, 'start': start, 'end': end,
+                                   'text': f"{rel} {name}\n" + '\n'.join(lines[start - 1:end])})
+                current = {key for (key,) in self.conn.execute("SELECT key FROM rows WHERE file = ?", (rel,))}
+                self.remove(current - {c['key'] for c in chunks})
+                embedded += self.upsert(chunks)
+                with self.conn:
+                    self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (rel, st.st_mtime, st.st_size))
+            for rel in set(known) - seen:
+                self.remove([key for (key,) in self.conn.execute("SELECT key FROM rows WHERE file = ?", (rel,))])
+                with self.conn:
+                    self.conn.execute("DELETE FROM files WHERE path = ?", (rel,))
+            return embedded
+
+    def search_vector(self, query_vector, k=5, block_rows=DEFAULT_BLOCK_ROWS, exclude_file=None):
+        """Top-k (score, metadata) by dot product, scanning the memmap block by block."""
+        np = self.np
+        with self._lock:
+            if self.vectors is None or not self.count:
+                return []
+            query_vector = np.asarray(query_vector, dtype=np.float32)
+            # Over-fetch per block so freed (zeroed) rows and excluded files cannot starve the result.
+            per_block = k * 2 + 8
+            heap = []
+            for start in range(0, self.count, block_rows):
+                block = self.vectors[start:min(start + block_rows, self.count)]
+                scores = block @ query_vector
+                take = min(per_block, len(scores))
+                top = np.argpartition(-scores, take - 1)[:take]
+                for i in top:
+                    item = (float(scores[i]), start + int(i))
+                    if len(heap) < per_block:
+                        heapq.heappush(heap, item)
+                    elif item > heap[0]:
+                        heapq.heapreplace(heap, item)
+            results = []
+            for score, row in sorted(heap, reverse=True):
+                meta = self.conn.execute("SELECT key, file, name, start, end_line FROM rows WHERE row = ?", (row,)).fetchone()
+                if meta is None or meta[1] == exclude_file or math.isnan(score):
+                    continue
+                results.append({'score': score, 'key': meta[0], 'file': meta[1], 'name': meta[2],
+                                'start': meta[3], 'end': meta[4]})
+                if len(results) >= k:
+                    break
+            return results
+
+    def search(self, query, k=5, token_budget=None, block_rows=DEFAULT_BLOCK_ROWS, exclude_file=None):
+        """Semantic top-k chunks for query text, with their source text (same shape as BM25 results)."""
+        hits = self.search_vector(self.embedder.embed([query])[0], k=k, block_rows=block_rows, exclude_file=exclude_file)
+        results, used, file_lines = [], 0, {}
+        for hit in hits:
+            if hit['file'] not in file_lines:
+                try:
+                    with open(os.path.join(self.root, hit['file']), 'r', encoding='utf-8') as f:
+                        file_lines[hit['file']] = f.read().split('\n')
+                except (OSError, UnicodeDecodeError):
+                    file_lines[hit['file']] = None
+            if file_lines[hit['file']] is None:
+                continue
+            text = '\n'.join(file_lines[hit['file']][hit['start'] - 1:hit['end']])
+            cost = estimate_tokens(text)
+            if token_budget is not None and used + cost > token_budget:
+                continue
+            used += cost
+            results.append(dict(hit, text=text))
+        return results
+
+    def close(self):
+        with self._lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+                self.vectors = None
+            self.conn.close()
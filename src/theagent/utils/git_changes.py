@@ -0,0 +1,103 @@
+"""
+Find changed files and line ranges with local git, and the symbols those ranges touch.
+
+Used by --since REF / --staged so agents only work on the functions and classes that
+overlap changed hunks instead of whole files.
+"""
+import ast
+import os
+import re
+import subprocess
+
+HUNK_RE = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+class GitError(Exception):
+    """Raised when git is unavailable or a git command fails."""
+    pass
+
+def run_git(args, cwd=None):
+    try:
+        proc = subprocess.run(['git', '-c', 'core.quotepath=off', *args], cwd=cwd,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except OSError as e:
+        raise GitError(f"Could not run git: {e}")
+    if proc.returncode != 0:
+        raise GitError(proc.stderr.strip() or f"git {' '.join(args)} failed")
+    return proc.stdout
+
+def repo_toplevel(cwd=None):
+    return os.path.realpath(run_git(['rev-parse', '--show-toplevel'], cwd=cwd).strip())
+
+def parse_diff_hunks(diff_text, root):
+    """Map absolute paths to the changed (start, end) line ranges on the new side of a -U0 diff."""
+    changes = {}
+    current = None
+    for line in diff_text.split('\n'):
+        if line.startswith('+++ '):
+            target = line[4:].rstrip('\t')
+            current = None if target == '/dev/null' else os.path.join(root, target[2:] if target.startswith('b/') else target)
+            if current is not None:
+                changes.setdefault(current, [])
+            continue
+        match = HUNK_RE.match(line)
+        if match and current is not None:
+            start = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            if count == 0:
+                # Pure deletion after line `start`: touch the lines on either side of it.
+                changes[current].append((max(start, 1), start + 1))
+            else:
+                changes[current].append((start, start + count - 1))
+    return changes
+
+def changed_hunks(since=None, staged=False, cwd=None, suffix='.py'):
+    """Changed line ranges per file, against REF (working tree vs REF) or the index (--staged)."""
+    root = repo_toplevel(cwd)
+    args = ['diff', '--no-color', '--no-ext-diff', '-U0', '--diff-filter=d']
+    if staged:
+        args.append('--cached')
+    if since:
+        args.append(since)
+    args.append('--')
+    changes = parse_diff_hunks(run_git(args, cwd=root), root)
+    return {path: ranges for path, ranges in changes.items()
+            if path.endswith(suffix) and os.path.isfile(path)}
+
+def ranges_for(changed_lines, path):
+    """Changed ranges recorded for path ([] if the file did not change)."""
+    return changed_lines.get(os.path.realpath(path), [])
+
+def overlaps(ranges, start, end):
+    return any(a <= end and start <= b for a, b in ranges)
+
+def _span(node):
+    start = node.decorator_list[0].lineno if getattr(node, 'decorator_list', None) else node.lineno
+    return start, node.end_lineno
+
+def symbols_in_ranges(source_code, ranges):
+    """Functions, methods and classes whose line ranges overlap ranges, in source order.
+
+    A change inside a method selects just that method; a change elsewhere in a class body
+    selects the whole class. Returns dicts with name, start, end and code.
+    """
+    tree = ast.parse(source_code)
+    lines = source_code.split('\n')
+    selected = []
+    defs = (ast.FunctionDef, ast.AsyncFunctionDef)
+    for node in tree.body:
+        if not isinstance(node, defs + (ast.ClassDef,)):
+            continue
+        start, end = _span(node)
+        if not overlaps(ranges, start, end):
+            continue
+        if isinstance(node, ast.ClassDef):
+            methods = [(child, *_span(child)) for child in node.body if isinstance(child, defs)]
+            changed = {line for a, b in ranges for line in range(max(a, start), min(b, end) + 1)}
+            if methods and all(any(s <= line <= e for _, s, e in methods) for line in changed):
+                for child, s, e in methods:
+                    if overlaps(ranges, s, e):
+                        selected.append({'name': f"{node.name}.{child.name}", 'start': s, 'end': e,
+                                         'code': '\n'.join(lines[s - 1:e])})
+                continue
+        selected.append({'name': node.name, 'start': start, 'end': end, 'code': '\n'.join(lines[start - 1:end])})
+    return selected
@@ -0,0 +1,123 @@
+"""
+Local intent routing for chat, so unambiguous requests skip the LLM round trip.
+
+Slash commands (/ls, /read FILE, /find NAME, /doc FILE, /summary FILE) are routed directly.
+Other input goes through a small set of rules with keyword checks, each scored with a
+confidence; only matches at or above the threshold are routed locally and everything else is
+left to the LLM. Every decision is appended to .theagent/routing.jsonl so the rules can be tuned.
+"""
+import json
+import os
+import re
+import time
+from .cache import get_cache_dir
+
+DEFAULT_ROUTE_THRESHOLD = 0.85
+ROUTING_LOG = "routing.jsonl"
+
+# command -> (intent, operation or agent type, argument name or None)
+SLASH_COMMANDS = {
+    '/ls': ('file_management', 'list', None),
+    '/read': ('file_management', 'read', 'FILE'),
+    '/find': ('file_management', 'search', 'NAME'),
+    '/doc': ('code_generation', 'doc', 'FILE'),
+    '/summary': ('code_analysis', 'summary', 'FILE'),
+}
+
+_FILE = r"(?P<file>[\w./\\-]+\.\w+)"
+# (rule name, pattern, intent, operation or agent type, base confidence)
+RULES = [
+    ('list', re.compile(r"^(?:please\s+)?(?:list|show|ls)(?:\s+(?:all|the|me))*\s+files?(?:\s+here)?[.!?]?$", re.I),
+     'file_management', 'list', 0.95),
+    ('read', re.compile(rf"^(?:please\s+)?(?:read|open|cat|show(?:\s+me)?|display|print)\s+(?:the\s+)?(?:file\s+)?{_FILE}[.!?]?$", re.I),
+     'file_management', 'read', 0.9),
+    ('search', re.compile(r"^(?:where\s+is|find|locate)\s+(?:the\s+)?(?P<kind>function\s+|class\s+|method\s+)?"
+                          r"(?P<name>[A-Za-z_][\w.]*)(?:\(\))?(?P<defined>\s+defined)?\s*\??$", re.I),
+     'file_management', 'search', 0.9),
+    ('doc', re.compile(rf"^(?:please\s+)?(?:generate|write|add|create)\s+(?:the\s+)?(?:doc\s*strings?|docs|documentation)"
+                       rf"\s+(?:for|to|in)\s+(?:the\s+)?(?:file\s+)?{_FILE}[.!?]?$", re.I),
+     'code_generation', 'doc', 0.9),
+    ('summary', re.compile(rf"^(?:please\s+)?(?:summari[sz]e|give\s+(?:me\s+)?a\s+summary\s+of)\s+(?:the\s+)?(?:file\s+|code\s+in\s+)?{_FILE}[.!?]?$", re.I),
+     'code_analysis', 'summary', 0.9),
+]
+
+# Words that make an otherwise matching request ambiguous (conditions, several steps, follow-ups).
+HEDGE_WORDS = {'and', 'then', 'if', 'but', 'why', 'how', 'should', 'could', 'instead', 'also', 'except'}
+
+def _intent(intent, operation, confidence, reasoning, **parameters):
+    if intent == 'file_management':
+        parameters['operation'] = operation
+    else:
+        parameters['agent_type'] = operation
+    return {'intent': intent, 'confidence': confidence, 'reasoning': reasoning,
+            'parameters': {k: v for k, v in parameters.items() if v}}
+
+def parse_slash_command(text):
+    """Intent for a slash command, or None if text is not one of ours."""
+    parts = text.strip().split(None, 1)
+    if not parts or parts[0].lower() not in SLASH_COMMANDS:
+        return None
+    command = parts[0].lower()
+    intent, operation, argument = SLASH_COMMANDS[command]
+    value = parts[1].strip() if len(parts) > 1 else ''
+    if argument and not value:
+        return {'intent': 'clarification_needed', 'confidence': 1.0,
+                'reasoning': f"Usage: {command} {argument}", 'parameters': {}}
+    key = 'query' if argument == 'NAME' else 'file_path'
+    return _intent(intent, operation, 1.0, f"slash command {command}", **{key: value})
+
+def classify(text, root=None):
+    """Best local guess for text as (intent dict or None, rule name); confidence lives in the intent."""
+    text = text.strip()
+    words = set(re.findall(r"[a-z']+", text.lower()))
+    for name, pattern, intent, operation, confidence in RULES:
+        match = pattern.match(text)
+        if not match:
+            continue
+        groups = match.groupdict()
+        file_path = groups.get('file')
+        if file_path and not os.path.exists(os.path.join(root or os.getcwd(), file_path)):
+            # Probably not a path we know (e.g. "read about asyncio.py").
+            confidence -= 0.3
+        if name == 'search' and not (groups.get('kind') or groups.get('defined') or re.search(r"[_.]|[a-z][A-Z]", groups['name'])):
+            # "find bugs" is not a symbol lookup; "find load_config" or "where is Parser defined" is.
+            confidence -= 0.3
+        if words & HEDGE_WORDS:
+            confidence -= 0.3
+        return _intent(intent, operation, round(confidence, 2), f"matched local rule '{name}'",
+                       file_path=file_path, query=groups.get('name')), name
+    return None, None
+
+def route_locally(text, threshold=DEFAULT_ROUTE_THRESHOLD, root=None):
+    """Local routing decision for a chat message.
+
+    Returns {'route': 'slash'|'local'|'llm', 'intent': dict or None, 'rule': str or None}; the
+    intent is only acted on for 'slash' and 'local' (for 'llm' it is the rejected guess).
+    """
+    slash = parse_slash_command(text)
+    if slash is not None:
+        return {'route': 'slash', 'intent': slash, 'rule': text.split()[0].lower()}
+    guess, rule = classify(text, root)
+    if guess is not None and guess['confidence'] >= threshold:
+        return {'route': 'local', 'intent': guess, 'rule': rule}
+    return {'route': 'llm', 'intent': guess, 'rule': rule}
+
+def log_routing(text, decision, intent, seconds, root=None):
+    """Append one routing decision to .theagent/routing.jsonl; logging never breaks chat."""
+    guess = decision.get('intent') or {}
+    record = {
+        'time': time.time(),
+        'input': text,
+        'route': decision['route'],
+        'rule': decision.get('rule'),
+        'local_confidence': guess.get('confidence'),
+        'intent': intent.get('intent'),
+        'confidence': intent.get('confidence'),
+        'parameters': intent.get('parameters', {}),
+        'ms': round(seconds * 1000, 1),
+    }
+    try:
+        with open(os.path.join(get_cache_dir(root), ROUTING_LOG), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+    except OSError:
+        pass
@@ -0,0 +1,187 @@
+"""
+Background jobs for chat mode: long agent runs go to worker threads so the prompt stays usable.
+
+Every job has a numeric ID, prints its progress as "[JOB n] ..." lines while it runs, and keeps its
+result until the chat loop posts it back into the conversation. Cancelling is cooperative: the job
+stops at its next line of output (an LLM call already in flight still completes first).
+"""
+import asyncio
+import itertools
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_JOB_WORKERS = 4
+JOB_COMMANDS = ('/jobs', '/wait', '/cancel')
+
+class JobCancelled(BaseException):
+    """Raised in a cancelled job's thread; a BaseException so `except Exception` blocks let it through."""
+
+class Job:
+    def __init__(self, job_id, description):
+        self.id = job_id
+        self.description = description
+        self.status = 'queued'
+        self.started = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancel_requested = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def describe(self):
+        return f"{self.id:>3}  {self.status:<9} {self.elapsed():6.1f}s  {self.description}"
+
+class JobOutput:
+    """Stream a job prints to: keeps the text and echoes complete lines to the console, prefixed."""
+
+    def __init__(self, job, console, label=None, echo=True):
+        self.job = job
+        self.console = console
+        self.prefix = f"[JOB {label or job.id}] "
+        self.echo = echo
+        self._parts = []
+        self._line = ''
+
+    def write(self, text):
+        if self.job.cancel_requested.is_set():
+            raise JobCancelled()
+        self._parts.append(text)
+        if self.echo:
+            *lines, self._line = (self._line + text).split('\n')
+            for line in lines:
+                if line.strip():
+                    self.console.write(self.prefix + line + '\n')
+            self.console.flush()
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return ''.join(self._parts)
+
+class JobManager:
+    """Runs submitted callables as numbered background jobs on a thread pool."""
+
+    def __init__(self, workers=None, console=None, echo=True):
+        self.jobs = {}
+        self.console = console or sys.stdout
+        self.echo = echo
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._finished = deque()
+        self._executor = ThreadPoolExecutor(max_workers=workers or DEFAULT_JOB_WORKERS,
+                                            thread_name_prefix='theagent-job')
+
+    def output(self, job, label=None):
+        """A stream for the job's output (see JobOutput); label defaults to the job ID."""
+        return JobOutput(job, self.console, label=label, echo=self.echo)
+
+    def submit(self, description, fn):
+        """Start fn(job) in the background; its return value (text) becomes the job result."""
+        with self._lock:
+            job = Job(next(self._ids), description)
+            self.jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        job.status = 'running'
+        try:
+            if job.cancel_requested.is_set():
+                raise JobCancelled()
+            job.result = fn(job)
+            job.status = 'done'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.status, job.error = 'failed', str(e)
+        job.finished = time.time()
+        message = {'done': "Finished", 'failed': f"Failed: {job.error}", 'cancelled': "Cancelled"}[job.status]
+        self.console.write(f"\n[JOB {job.id}] {message} after {job.elapsed():.1f}s: {job.description}\n")
+        self.console.flush()
+        self._finished.append(job)
+        return job.result
+
+    def get(self, job_id):
+        try:
+            return self.jobs.get(int(str(job_id).lstrip('#')))
+        except ValueError:
+            return None
+
+    def cancel(self, job_id):
+        """Ask a job to stop; returns the job, or None if there is no such job."""
+        job = self.get(job_id)
+        if job is None or job.done:
+            return job
+        job.cancel_requested.set()
+        if job.future.cancel():
+            # Never started: nothing will run it, so finish it here.
+            job.status, job.finished = 'cancelled', time.time()
+            self._finished.append(job)
+        return job
+
+    async def wait(self, job_id=None, timeout=None):
+        """Wait for one job (or all running ones); returns the jobs waited for."""
+        if job_id is None:
+            jobs = [job for job in self.jobs.values() if not job.done]
+        else:
+            job = self.get(job_id)
+            jobs = [job] if job is not None else []
+        pending = [asyncio.wrap_future(job.future) for job in jobs if not job.future.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+        return jobs
+
+    def collect(self):
+        """Jobs that finished since the last call, in the order they finished."""
+        finished = []
+        while self._finished:
+            finished.append(self._finished.popleft())
+        return finished
+
+    def running(self):
+        return [job for job in self.jobs.values() if not job.done]
+
+    def format_jobs(self):
+        if not self.jobs:
+            return "No jobs."
+        return "\n".join(["ID   status    elapsed  request"] + [job.describe() for job in self.jobs.values()])
+
+    async def command(self, text):
+        """Handle /jobs, /wait [ID] and /cancel ID; returns the reply, or None if text is not one of them."""
+        parts = text.strip().split()
+        if not parts or parts[0].lower() not in JOB_COMMANDS:
+            return None
+        command, argument = parts[0].lower(), (parts[1] if len(parts) > 1 else None)
+        if command == '/jobs':
+            return self.format_jobs()
+        if command == '/wait':
+            jobs = await self.wait(argument)
+            if argument is not None and not jobs:
+                return f"No job {argument}"
+            return "\n".join(job.describe() for job in jobs) or "No running jobs."
+        if argument is None:
+            return "Usage: /cancel ID"
+        job = self.cancel(argument)
+        if job is None:
+            return f"No job {argument}"
+        if job.status == 'cancelled' or not job.done:
+            return f"Cancelling job {job.id}: {job.description}"
+        return f"Job {job.id} already {job.status}"
+
+    def shutdown(self):
+        """Cancel what is still running and stop the pool without waiting for it."""
+        for job in self.running():
+            job.cancel_requested.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,159 @@
+"""
+Append-only job journal so long runs can resume after a crash.
+
+Every finished unit of work (a file, or one function within a file) is appended to a
+JSON-lines journal in .theagent/journal/ and fsync'd before the run moves on. Results are
+stored as content-addressed blobs next to the journal and referenced by hash. With --resume,
+units already journaled for the same input are skipped and their recorded results replayed.
+"""
+import json
+import os
+import threading
+import time
+from .cache import content_hash, get_cache_dir
+
+JOURNAL_DIR = "journal"
+BLOB_DIR = "blobs"
+PREVIOUS_SUFFIX = ".prev"
+
+# Options that change what an agent produces; runs that differ in any of them get separate journals.
+JOB_OPTIONS = ('agent', 'provider', 'model', 'output', 'edit_format', 'test_mode', 'summary_mode',
+               'migration_target', 'prefilter', 'local_only', 'complexity_threshold', 'validate_tests',
+               'repair_tests', 'file', 'path', 'glob', 'since', 'staged')
+
+def job_id(args):
+    """Stable id for a run configuration, used as the journal file name."""
+    options = {name: getattr(args, name, None) for name in JOB_OPTIONS}
+    return content_hash(json.dumps(options, sort_keys=True, default=str))[:16]
+
+def unit_key(agent, path, function=None):
+    """Journal key of a unit: one file for an agent, or one function within it."""
+    key = f"{agent}:{os.path.relpath(os.path.abspath(path)).replace(os.sep, '/')}"
+    return f"{key}::{function}" if function else key
+
+def file_hash(path):
+    try:
+        with open(path, 'rb') as f:
+            return content_hash(f.read())
+    except OSError:
+        return None
+
+def is_failed(result):
+    """True for empty results and the "Error: ..." strings agents return on failure."""
+    if result is None or result == '':
+        return True
+    if isinstance(result, str):
+        return result.lstrip('#"\' ').startswith('Error')
+    return False
+
+def _fsync_write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class JobJournal:
+    """Completed units of one job, persisted as they finish."""
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.blob_dir = os.path.join(os.path.dirname(path), BLOB_DIR)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.completed = {}
+        self.replayed = 0
+        if resume:
+            self._load()
+        elif os.path.exists(path) and os.path.getsize(path) > 0:
+            os.replace(path, path + PREVIOUS_SUFFIX)
+            print(f"[WARN] Starting a new journal; the previous run's checkpoints were moved to "
+                  f"{path + PREVIOUS_SUFFIX} (use --resume to continue a run)")
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    @classmethod
+    def for_args(cls, args, root=None, resume=None):
+        directory = os.path.join(get_cache_dir(root), JOURNAL_DIR)
+        os.makedirs(directory, exist_ok=True)
+        resume = getattr(args, 'resume', False) if resume is None else resume
+        name = job_id(args)
+        shard = getattr(args, 'shard', None)
+        if shard:
+            # Shards of one job run side by side; `theagent merge` folds their journals into the job's.
+            name += f"-shard-{shard[0]}-of-{shard[1]}"
+        return cls(os.path.join(directory, f"{name}.jsonl"), resume=resume)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write; everything before it is intact.
+                    continue
+                self.completed[record['key']] = record
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                # Cut off the torn line so the next record is appended on a line of its own.
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def put_blob(self, value):
+        data = json.dumps(value, sort_keys=True, default=str)
+        ref = content_hash(data)
+        path = os.path.join(self.blob_dir, ref + '.json')
+        if not os.path.exists(path):
+            _fsync_write(path, data)
+        return ref
+
+    def get_blob(self, ref):
+        with open(os.path.join(self.blob_dir, ref + '.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def lookup(self, key, input_hash):
+        """The record for key if it finished on this input (or left the file in its current state)."""
+        with self._lock:
+            record = self.completed.get(key)
+        if record is None or input_hash not in (record['input'], record.get('output_hash')):
+            return None
+        return record
+
+    def result(self, record):
+        try:
+            value = self.get_blob(record['ref'])
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self.replayed += 1
+        return value
+
+    def record(self, key, input_hash, result, **fields):
+        """Append a completed unit; returns once the line is on disk."""
+        ref = self.put_blob(result)
+        record = dict(fields, key=key, input=input_hash, ref=ref, time=time.time())
+        line = json.dumps(record, sort_keys=True) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.completed[key] = record
+        return record
+
+    def replay(self, key, input_hash, compute, **fields):
+        """compute() for a unit, or its journaled result if it already finished; failures are not journaled."""
+        record = self.lookup(key, input_hash)
+        if record is not None:
+            value = self.result(record)
+            if value is not None:
+                return value
+        value = compute()
+        if not is_failed(value):
+            self.record(key, input_hash, value, **fields)
+        return value
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
@@ -0,0 +1,223 @@
+"""
+Token-budgeted conversation memory for chat mode.
+
+Recent turns are kept verbatim; once they no longer fit the budget the oldest ones are folded
+into a rolling summary by a background thread, so the history part of each prompt stays roughly
+the same size however long the session runs. Large messages (file contents read in chat, long
+tool output) are replaced by a short reference: file contents are re-read from disk when needed,
+other output is kept out of the prompt in a bounded reference table (oldest entries are dropped
+first). The file_management read_reference operation in chat shows a reference in full again.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .cache import content_hash
+from .retrieval import estimate_tokens
+
+DEFAULT_MEMORY_BUDGET = 1500
+DEFAULT_KEEP_RECENT = 4
+REFERENCE_TOKENS = 200
+MAX_REFERENCES = 32
+MAX_REFERENCE_CHARS = 200_000
+SUMMARY_WORDS = 150
+PENDING_LINE_WORDS = 25
+
+def format_messages(messages):
+    """Transcript text for a list of {'role', 'content'} messages."""
+    return "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
+
+def _clip_words(text, limit):
+    words = text.split()
+    return ' '.join(words[:limit]) + (' ...' if len(words) > limit else '')
+
+def extractive_summary(previous, messages, max_words=SUMMARY_WORDS):
+    """Summary without the LLM: the first words of each turn appended to the previous summary.
+
+    Used when no summarizer is configured or it fails; the oldest words are dropped first so
+    the result stays within max_words.
+    """
+    lines = [previous] if previous else []
+    lines += [f"{m['role'].capitalize()}: {_clip_words(m['content'], PENDING_LINE_WORDS)}" for m in messages]
+    words = ' '.join(lines).split()
+    return ' '.join(words[-max_words:])
+
+def llm_summarizer(llm_proxy, provider='openai', model=None, max_words=SUMMARY_WORDS):
+    """Summarize function for ConversationMemory backed by GeneralLLMProxy.summarize_conversation."""
+    def summarize(previous, messages):
+        return llm_proxy.summarize_conversation(previous, format_messages(messages), max_words=max_words,
+                                                provider=provider, model=model)
+    return summarize
+
+class ConversationMemory:
+    """Chat history within a token budget: rolling summary, verbatim recent turns, references.
+
+    messages is the live history list (shared['chat_history']); nodes keep appending to it and
+    compact() trims it in place, so the rest of the chat code does not need to know about memory.
+    summarize(previous_summary, messages) -> str runs on a background thread, and on_fold(messages),
+    if set, is called with the turns about to leave the history (e.g. to log them first).
+    """
+
+    def __init__(self, messages=None, token_budget=DEFAULT_MEMORY_BUDGET, keep_recent=DEFAULT_KEEP_RECENT,
+                 reference_tokens=REFERENCE_TOKENS, summarize=None, max_words=SUMMARY_WORDS, state=None,
+                 on_fold=None):
+        self.messages = messages if messages is not None else []
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.reference_tokens = reference_tokens
+        self.summarize = summarize
+        self.max_words = max_words
+        self.on_fold = on_fold
+        state = state or {}
+        self.summary = state.get('summary', '')
+        self.references = dict(state.get('references', {}))
+        self._pending = list(state.get('pending', []))
+        self._lock = threading.RLock()
+        self._executor = None
+        self._folding = None
+        self.compact()
+
+    @property
+    def summary_budget(self):
+        """Tokens of the budget set aside for the summary and not-yet-summarized turns."""
+        return self.token_budget // 4
+
+    def add(self, role, content, source=None):
+        """Append a message; source is the file path when content was read from a file."""
+        message = {'role': role, 'content': content}
+        if source:
+            message['source'] = source
+        with self._lock:
+            self.messages.append(message)
+        self.compact()
+        return message
+
+    def compact(self):
+        """Replace large messages by references and fold the oldest turns out of the budget."""
+        with self._lock:
+            for message in self.messages:
+                if 'ref' not in message and estimate_tokens(message['content']) > self.reference_tokens:
+                    self._make_reference(message)
+            used = sum(estimate_tokens(m['content']) for m in self.messages)
+            folded = 0
+            while (len(self.messages) - folded > self.keep_recent
+                   and used > self.token_budget - self.summary_budget):
+                used -= estimate_tokens(self.messages[folded]['content'])
+                folded += 1
+            if folded:
+                if self.on_fold is not None:
+                    self.on_fold(self.messages[:folded])
+                self._pending.extend(self.messages[:folded])
+                del self.messages[:folded]
+            if self._pending and self._folding is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='theagent-memory')
+                self._folding = self._executor.submit(self._fold_pending)
+        return folded
+
+    def _make_reference(self, message):
+        content = message['content']
+        source = message.get('source')
+        ref_id = 'ref-' + content_hash(content)[:8]
+        lines = content.strip().splitlines()
+        entry = {'tokens': estimate_tokens(content), 'title': lines[0][:80] if lines else '(blank output)'}
+        if source and os.path.isfile(source):
+            # File contents are not stored twice: the file is re-read when the reference is resolved.
+            with open(source, 'rb') as f:
+                entry.update(source=source, hash=content_hash(f.read()))
+        else:
+            entry['content'] = content[:MAX_REFERENCE_CHARS]
+        self.references.pop(ref_id, None)
+        self.references[ref_id] = entry
+        self._evict_references()
+        where = f"re-read from {source}" if 'source' in entry else "kept for a while"
+        message['content'] = (f"[{ref_id}: {entry['title']} ({entry['tokens']} tokens, not shown; {where}; "
+                              f"file_management read_reference {ref_id} shows it)]")
+        message['ref'] = ref_id
+
+    def _evict_references(self):
+        """Drop the oldest references beyond MAX_REFERENCES or MAX_REFERENCE_CHARS of stored output."""
+        stored = sum(len(e.get('content', '')) for e in self.references.values())
+        while self.references and (len(self.references) > MAX_REFERENCES or stored > MAX_REFERENCE_CHARS):
+            oldest = next(iter(self.references))
+            stored -= len(self.references.pop(oldest).get('content', ''))
+
+    def resolve(self, ref_id):
+        """Full text behind a reference (the current file contents for file references), or None.
+
+        None also for references dropped from the table to keep it bounded.
+        """
+        with self._lock:
+            entry = self.references.get(ref_id)
+        if entry is None:
+            return None
+        if 'content' in entry:
+            return entry['content']
+        try:
+            with open(entry['source'], 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _fold_pending(self):
+        while True:
+            with self._lock:
+                batch = list(self._pending)
+                previous = self.summary
+                if not batch:
+                    self._folding = None
+                    return
+            summary = None
+            if self.summarize is not None:
+                try:
+                    summary = self.summarize(previous, batch)
+                except Exception as e:
+                    print(f"[WARN] Conversation summary failed, keeping an extractive one: {e}")
+            if not isinstance(summary, str) or not summary.strip() or summary.startswith('Error:'):
+                summary = extractive_summary(previous, batch, self.max_words)
+            with self._lock:
+                # A summarizer that ignores the word limit must not grow the prompt turn after turn.
+                self.summary = _clip_words(summary.strip(), 2 * self.max_words)
+                del self._pending[:len(batch)]
+
+    def wait(self, timeout=None):
+        """Block until the background summary has caught up (or timeout seconds passed)."""
+        future = self._folding
+        if future is not None:
+            future.result(timeout=timeout)
+
+    def summary_text(self):
+        """The part of the history that is no longer verbatim: summary and turns still being summarized."""
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of earlier conversation:\n{self.summary}")
+            if self._pending:
+                # Not folded into the summary yet: shown clipped, newest first within the summary budget.
+                lines, used = [], estimate_tokens(self.summary)
+                for m in reversed(self._pending):
+                    line = f"{m['role'].capitalize()}: {_clip_words(m['content'], PENDING_LINE_WORDS)}"
+                    used += estimate_tokens(line)
+                    if used > self.summary_budget:
+                        break
+                    lines.append(line)
+                if lines:
+                    parts.append("Earlier turns:\n" + "\n".join(reversed(lines)))
+            return "\n\n".join(parts)
+
+    def render(self):
+        """History text for a prompt: summary, turns still being summarized, then recent turns."""
+        with self._lock:
+            parts = [self.summary_text()] if self.summary or self._pending else []
+            if self.messages:
+                parts.append(format_messages(self.messages))
+            return "\n\n".join(p for p in parts if p)
+
+    def to_dict(self):
+        """State for saved sessions (the recent turns are saved as the chat history itself)."""
+        with self._lock:
+            return {'summary': self.summary, 'pending': list(self._pending), 'references': dict(self.references)}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
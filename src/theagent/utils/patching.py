@@ -0,0 +1,144 @@
+"""
+Apply model-generated patches (unified diffs or SEARCH/REPLACE edit blocks) to source code.
+
+Patches are applied with fuzz tolerance: hunks may be found away from their stated line
+numbers, with whitespace differences, and with up to `fuzz` context lines dropped from
+either end. The result is verified by re-parsing before it is accepted.
+"""
+import ast
+import re
+
+NO_CHANGES = "NO_CHANGES"
+EDIT_BLOCK_RE = re.compile(r'<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE', re.DOTALL)
+HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+class PatchError(Exception):
+    """Raised when a patch cannot be parsed, applied or verified."""
+    pass
+
+_NORMALIZERS = (lambda l: l, lambda l: l.rstrip(), lambda l: ' '.join(l.split()))
+
+def _find_block(lines, block, expected, normalize):
+    if not block:
+        return max(0, min(expected, len(lines)))
+    target = [normalize(l) for l in block]
+    last_start = len(lines) - len(block)
+    if last_start < 0:
+        return -1
+    normalized = [normalize(l) for l in lines]
+    # Search outwards from the expected position so the nearest match wins.
+    for distance in range(0, max(expected, last_start - expected) + 1):
+        for start in (expected - distance, expected + distance):
+            if 0 <= start <= last_start and normalized[start] == target[0] and normalized[start:start + len(block)] == target:
+                return start
+    return -1
+
+def parse_unified_diff(diff_text):
+    """Parse a unified diff into hunks of (tag, text) lines; file headers are ignored."""
+    hunks = []
+    current = None
+    for line in diff_text.split('\n'):
+        header = HUNK_HEADER_RE.match(line)
+        if header:
+            current = {'old_start': int(header.group(1)), 'lines': []}
+            hunks.append(current)
+            continue
+        if current is None or line.startswith(('--- ', '+++ ', 'diff ', 'index ')):
+            continue
+        if line.startswith('\\'):
+            continue
+        if line == '':
+            current['lines'].append((' ', ''))
+        elif line[0] in ' +-':
+            current['lines'].append((line[0], line[1:]))
+        else:
+            # Models sometimes drop the leading space on context lines.
+            current['lines'].append((' ', line))
+    for hunk in hunks:
+        while hunk['lines'] and hunk['lines'][-1] == (' ', ''):
+            hunk['lines'].pop()
+    if not hunks:
+        raise PatchError("No hunks found in diff")
+    return hunks
+
+def _trim_context(hunk_lines, level):
+    start, end = 0, len(hunk_lines)
+    for _ in range(level):
+        if start < end and hunk_lines[start][0] == ' ':
+            start += 1
+        if end > start and hunk_lines[end - 1][0] == ' ':
+            end -= 1
+    return hunk_lines[start:end], start
+
+def apply_unified_diff(source_code, diff_text, fuzz=2):
+    """Apply a unified diff to source_code and return the new source."""
+    lines = source_code.split('\n')
+    offset = 0
+    for number, hunk in enumerate(parse_unified_diff(diff_text), 1):
+        applied = False
+        for level in range(fuzz + 1):
+            hunk_lines, dropped = _trim_context(hunk['lines'], level)
+            old = [t for tag, t in hunk_lines if tag in ' -']
+            new = [t for tag, t in hunk_lines if tag in ' +']
+            expected = hunk['old_start'] - 1 + offset + dropped
+            for normalize in _NORMALIZERS:
+                start = _find_block(lines, old, expected, normalize)
+                if start >= 0:
+                    lines[start:start + len(old)] = new
+                    offset = start - (hunk['old_start'] - 1 + dropped) + len(new) - len(old)
+                    applied = True
+                    break
+            if applied:
+                break
+        if not applied:
+            raise PatchError(f"Hunk {number} (line {hunk['old_start']}) does not match the source")
+    return '\n'.join(lines)
+
+def apply_edit_blocks(source_code, response):
+    """Apply SEARCH/REPLACE edit blocks in order and return the new source."""
+    blocks = EDIT_BLOCK_RE.findall(response)
+    if not blocks:
+        raise PatchError("No SEARCH/REPLACE blocks found")
+    result = source_code
+    for number, (search, replace) in enumerate(blocks, 1):
+        if not search.strip():
+            result = result.rstrip('\n') + '\n' + replace + '\n'
+            continue
+        if search in result:
+            result = result.replace(search, replace, 1)
+            continue
+        lines = result.split('\n')
+        search_lines = search.split('\n')
+        for normalize in _NORMALIZERS[1:]:
+            start = _find_block(lines, search_lines, 0, normalize)
+            if start >= 0:
+                lines[start:start + len(search_lines)] = replace.split('\n')
+                result = '\n'.join(lines)
+                break
+        else:
+            raise PatchError(f"Edit block {number} does not match the source")
+    return result
+
+def _strip_fences(text):
+    text = text.strip()
+    match = re.match(r'^```[\w-]*\s*\n(.*?)\n?```$', text, re.DOTALL)
+    return match.group(1) if match else text
+
+def apply_patch_response(source_code, response, fuzz=2):
+    """Apply an LLM patch response of either format, verifying the result parses."""
+    if response is None:
+        raise PatchError("Empty patch response")
+    text = _strip_fences(response)
+    if text.strip() == NO_CHANGES:
+        return source_code
+    if '<<<<<<< SEARCH' in text:
+        patched = apply_edit_blocks(source_code, text)
+    elif '@@' in text:
+        patched = apply_unified_diff(source_code, text, fuzz=fuzz)
+    else:
+        raise PatchError("Response contains neither a unified diff nor edit blocks")
+    try:
+        ast.parse(patched)
+    except SyntaxError as e:
+        raise PatchError(f"Patched code does not parse: {e}")
+    return patched
@@ -0,0 +1,154 @@
+"""
+Speculative prefetch of the files a chat message mentions.
+
+While the intent call is in flight, the file paths in the message (and the files defining any
+symbols it names, from the symbol index) are read, parsed, and matched with their symbol index
+entries and cached summary, on a small thread pool. The action that follows takes the file from
+here instead of starting from disk; an entry is only used while the file's mtime and size are
+unchanged.
+"""
+import ast
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .cache import content_hash
+from .summary_tree import load_summary_cache
+
+MAX_PREFETCH_FILES = 5
+MAX_PREFETCH_BYTES = 1024 * 1024
+MAX_ENTRIES = 32
+
+_FILE = re.compile(r"[\w./\\-]+\.\w+")
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+
+def mentioned_files(text, root=None, symbol_index=None, limit=MAX_PREFETCH_FILES):
+    """Files named in text that exist under root, then files defining the symbols it names."""
+    root = root or os.getcwd()
+    files = []
+    for match in _FILE.findall(text):
+        path = os.path.normpath(os.path.join(root, match))
+        if path not in files and os.path.isfile(path):
+            files.append(path)
+    if symbol_index is not None:
+        words = set(_IDENTIFIER.findall(_FILE.sub(' ', text)))
+        for word in sorted(words):
+            if len(files) >= limit:
+                break
+            for symbol in symbol_index.find_symbols(word, limit=3):
+                path = os.path.normpath(os.path.join(symbol_index.root, symbol['file']))
+                if symbol['name'] == word and path not in files:
+                    files.append(path)
+    return files[:limit]
+
+class Prefetcher:
+    """Loads the files a chat message mentions in the background, for the action that follows."""
+
+    def __init__(self, root=None, symbol_index=None, summary_cache=None, workers=4):
+        self.root = os.path.abspath(root or os.getcwd())
+        self.symbol_index = symbol_index
+        self._summary_cache = summary_cache
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='theagent-prefetch')
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._discovery = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def summary_cache(self):
+        with self._lock:
+            if self._summary_cache is None:
+                self._summary_cache = load_summary_cache(self.root)
+            return self._summary_cache
+
+    def start(self, text):
+        """Start prefetching what text mentions; returns at once."""
+        self._discovery = self._executor.submit(self._discover, text)
+        return self._discovery
+
+    def add(self, path):
+        """Start loading one file (e.g. the file of the chosen action) unless it is loaded already."""
+        path = os.path.normpath(os.path.join(self.root, path))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            future = self._entries.get(path)
+            if future is not None and not future.done():
+                return
+            if future is not None and future.exception() is None and future.result() is not None:
+                entry = future.result()
+                if (entry['mtime_ns'], entry['size']) == (stat.st_mtime_ns, stat.st_size):
+                    return
+            self._entries[path] = self._executor.submit(self._load, path)
+
+    def _discover(self, text):
+        files = mentioned_files(text, self.root, self.symbol_index)
+        with self._lock:
+            for path in files:
+                self._entries.pop(path, None)
+                self._entries[path] = self._executor.submit(self._load, path)
+            while len(self._entries) > MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return files
+
+    def _load(self, path):
+        stat = os.stat(path)
+        if stat.st_size > MAX_PREFETCH_BYTES:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        entry = {'path': path, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'text': text,
+                 'tree': None, 'symbols': None, 'summary': self.summary_cache.get(content_hash('file', text))}
+        if path.endswith('.py'):
+            try:
+                entry['tree'] = ast.parse(text)
+            except SyntaxError:
+                pass
+            if self.symbol_index is not None:
+                entry['symbols'] = self.symbol_index.file_symbols(path)
+        return entry
+
+    def get(self, path):
+        """The prefetched entry for path ({'text', 'tree', 'symbols', 'summary', ...}) or None.
+
+        Waits for a load still in progress; returns None if path was not prefetched, could not
+        be read, or changed on disk since.
+        """
+        if not path:
+            return None
+        path = os.path.normpath(os.path.join(self.root, path))
+        discovery = self._discovery
+        if discovery is not None:
+            try:
+                discovery.result()
+            except Exception:
+                pass
+        with self._lock:
+            future = self._entries.get(path)
+        entry = None
+        if future is not None:
+            try:
+                entry = future.result()
+                stat = os.stat(path)
+                if entry is not None and (stat.st_mtime_ns, stat.st_size) != (entry['mtime_ns'], entry['size']):
+                    entry = None
+            except Exception:
+                entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def remember_summary(self, text, summary):
+        """Store a summary of file content text, so the next prefetch of the file finds it."""
+        if summary and not summary.startswith('Error:'):
+            self.summary_cache.set(content_hash('file', text), summary)
+            self.summary_cache.save()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
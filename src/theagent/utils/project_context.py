@@ -0,0 +1,144 @@
+"""
+Project context for chat prompts (README, config, entry points) without the raw file text.
+
+Context files are stored in the content-addressed BlobStore and described by a small entry:
+the content hash, the mtime/size they were read at, and a digest (a headline and a symbol
+list) computed once per content. Entries live in .theagent/context.json; a file is re-read only
+when its mtime or size changed, and re-digested only when its hash did. Prompts and saved
+sessions carry the entries, not the contents.
+"""
+import ast
+import os
+import re
+from .cache import BlobStore, JsonCache, content_hash, get_cache_dir
+
+CONTEXT_INDEX = "context.json"
+DEFAULT_CONTEXT_FILES = ("README.md", "pyproject.toml", "requirements.txt", "main.py")
+MAX_SYMBOLS = 20
+MAX_HEADLINE = 200
+
+def _first_sentence(text):
+    text = ' '.join(text.split())
+    match = re.match(r'(.+?[.!?])(\s|$)', text)
+    return (match.group(1) if match else text)[:MAX_HEADLINE]
+
+def _python_digest(text):
+    try:
+        tree = ast.parse(text)
+    except SyntaxError:
+        return '', []
+    symbols = []
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            symbols.append(f"class {node.name}")
+            symbols.extend(f"{node.name}.{item.name}()" for item in node.body
+                           if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and not item.name.startswith('_'))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append(f"{node.name}()")
+    return _first_sentence(ast.get_docstring(tree) or ''), symbols
+
+def _markdown_digest(text):
+    headings = re.findall(r'^#{1,3}\s+(.+?)\s*#*$', text, re.M)
+    paragraph = ''
+    for block in re.split(r'\n\s*\n', text):
+        block = block.strip()
+        if block and not block.startswith(('#', '<', '!', '[', '|', '`', '-', '*')):
+            paragraph = block
+            break
+    headline = headings[0] if headings else ''
+    if paragraph:
+        headline = f"{headline}: {_first_sentence(paragraph)}" if headline else _first_sentence(paragraph)
+    return headline[:MAX_HEADLINE], headings[1:]
+
+def _toml_digest(text):
+    description = re.search(r'^description\s*=\s*["\'](.+?)["\']', text, re.M)
+    name = re.search(r'^name\s*=\s*["\'](.+?)["\']', text, re.M)
+    headline = ' - '.join(m.group(1) for m in (name, description) if m)
+    return headline[:MAX_HEADLINE], re.findall(r'^\[([^\]]+)\]', text, re.M)
+
+def _requirements_digest(text):
+    packages = [re.split(r'[<>=!~;\[\s]', line.strip(), 1)[0] for line in text.splitlines()
+                if line.strip() and not line.strip().startswith(('#', '-'))]
+    return f"{len(packages)} requirement(s)", packages
+
+def file_digest(path, text):
+    """{'headline', 'symbols'} for a context file, by file type; no LLM involved."""
+    name = os.path.basename(path).lower()
+    if name.endswith('.py'):
+        headline, symbols = _python_digest(text)
+    elif name.endswith(('.md', '.rst')):
+        headline, symbols = _markdown_digest(text)
+    elif name.endswith('.toml'):
+        headline, symbols = _toml_digest(text)
+    elif name.startswith('requirements') and name.endswith('.txt'):
+        headline, symbols = _requirements_digest(text)
+    else:
+        headline, symbols = '', []
+    if not headline:
+        headline = next((line.strip()[:MAX_HEADLINE] for line in text.splitlines() if line.strip()), '')
+    return {'headline': headline, 'symbols': symbols[:MAX_SYMBOLS], 'more_symbols': max(0, len(symbols) - MAX_SYMBOLS)}
+
+class ContextCache:
+    """Blob-backed project context entries, refreshed from the file system on demand."""
+
+    def __init__(self, root=None):
+        self.store = BlobStore(root)
+        self.index = JsonCache(os.path.join(get_cache_dir(root), CONTEXT_INDEX))
+        self.reads = 0
+
+    def entry(self, path):
+        """Context entry for path: {'hash', 'mtime_ns', 'size', 'lines', 'headline', 'symbols', ...}."""
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        cached = self.index.get(key)
+        if cached and cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size and cached['hash'] in self.store:
+            return cached
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.reads += 1
+        digest = content_hash(data)
+        if cached and cached['hash'] == digest and digest in self.store:
+            # Touched but not changed: keep the digest.
+            entry = {**cached, 'mtime_ns': stat.st_mtime_ns}
+        else:
+            text = data.decode('utf-8', errors='replace')
+            entry = {'hash': self.store.put(data), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                     'lines': text.count('\n') + 1, **file_digest(path, text)}
+        self.index.set(key, entry)
+        return entry
+
+    def refresh(self, files):
+        """{file: entry} for files (an unreadable file gets {'error': ...})."""
+        context = {}
+        for fname in files:
+            try:
+                context[fname] = self.entry(fname)
+            except Exception as e:
+                context[fname] = {'error': str(e)}
+        self.index.save()
+        return context
+
+    def read(self, entry):
+        """Full text of a context entry from the blob store, or None."""
+        data = self.store.get(entry.get('hash', '')) if isinstance(entry, dict) else None
+        return data.decode('utf-8', errors='replace') if data is not None else None
+
+def default_context_files(root=None):
+    return [f for f in DEFAULT_CONTEXT_FILES if os.path.exists(os.path.join(root or '', f))]
+
+def format_project_context(project_context):
+    """Prompt text for shared['project_context']: one digest per file."""
+    parts = []
+    for fname, entry in project_context.items():
+        if isinstance(entry, str):
+            # Sessions saved before context entries held the file text itself.
+            parts.append(f"[{fname}]\n{entry[:500]}{'...' if len(entry) > 500 else ''}")
+        elif 'error' in entry:
+            parts.append(f"[{fname}] (could not load: {entry['error']})")
+        else:
+            lines = [f"[{fname}] {entry.get('headline', '')}".rstrip()]
+            if entry.get('symbols'):
+                more = f" (+{entry['more_symbols']} more)" if entry.get('more_symbols') else ''
+                lines.append(f"  contains: {', '.join(entry['symbols'])}{more}")
+            parts.append('\n'.join(lines))
+    return '\n'.join(parts)
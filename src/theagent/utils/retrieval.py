@@ -0,0 +1,257 @@
+"""
+Local BM25 retrieval over repository chunks for chat context.
+
+Python files are chunked per function, method and class header; Markdown per heading;
+other text files in fixed line windows. Term frequencies are persisted per file in
+.theagent/ and re-computed only for files whose content changed, so the inverted index
+stays current without re-reading the repository on every turn.
+"""
+import ast
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from .cache import JsonCache, content_hash, get_cache_dir
+from .discovery import iter_python_files
+
+BM25_FILE = "bm25.json"
+INDEX_SUFFIXES = ('.py', '.md', '.rst', '.toml', '.cfg', '.txt')
+DEFAULT_TOP_K = 5
+DEFAULT_CONTEXT_BUDGET = 1500
+MAX_FILE_BYTES = 1 << 20
+TEXT_WINDOW = 40
+K1, B = 1.5, 0.75
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'if', 'in',
+    'is', 'it', 'me', 'my', 'of', 'on', 'or', 'the', 'this', 'that', 'to', 'what', 'when', 'where',
+    'which', 'why', 'with', 'you', 'def', 'self', 'return', 'import', 'none', 'true', 'false', 'not',
+    'class', 'pass', 'else', 'elif', 'try', 'except', 'raise', 'while', 'lambda', 'cls',
+}
+_IDENT_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_PART_RE = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+def _stem(word):
+    """Strip a few common English suffixes so 'loaded', 'loading' and 'loads' match 'load'."""
+    for suffix in ('ing', 'ed', 's'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith('ss'):
+            return word[:-len(suffix)]
+    return word
+
+def tokenize(text):
+    """Lower-cased, lightly stemmed identifiers plus their snake_case/camelCase parts, minus stopwords."""
+    tokens = []
+    for word in _IDENT_RE.findall(text):
+        whole = word.strip('_').lower()
+        if len(whole) > 1 and whole not in STOPWORDS:
+            tokens.append(_stem(whole))
+        parts = _PART_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(_stem(p.lower()) for p in parts if len(p) > 1 and p.lower() not in STOPWORDS)
+    return tokens
+
+def _python_chunks(source_code, lines):
+    tree = ast.parse(source_code)
+    chunks = []
+    defs = (ast.FunctionDef, ast.AsyncFunctionDef)
+    first_def = None
+    for node in tree.body:
+        if not isinstance(node, defs + (ast.ClassDef,)):
+            continue
+        start = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+        first_def = first_def or start
+        methods = [m for m in node.body if isinstance(m, defs)] if isinstance(node, ast.ClassDef) else []
+        if not methods:
+            chunks.append((node.name, start, node.end_lineno))
+            continue
+        first_method = methods[0].decorator_list[0].lineno if methods[0].decorator_list else methods[0].lineno
+        chunks.append((node.name, start, first_method - 1))
+        for method in methods:
+            m_start = method.decorator_list[0].lineno if method.decorator_list else method.lineno
+            chunks.append((f"{node.name}.{method.name}", m_start, method.end_lineno))
+    header_end = (first_def or len(lines) + 1) - 1
+    while header_end > 0 and not lines[header_end - 1].strip():
+        header_end -= 1
+    if any(line.strip() for line in lines[:header_end]):
+        chunks.insert(0, ('<module>', 1, header_end))
+    return chunks
+
+def _markdown_chunks(lines):
+    chunks, start, title = [], 1, '<top>'
+    for number, line in enumerate(lines, 1):
+        if line.startswith('#') and number > start:
+            chunks.append((title, start, number - 1))
+            start = number
+        if line.startswith('#'):
+            title = line.lstrip('#').strip() or title
+    chunks.append((title, start, len(lines)))
+    return [c for c in chunks if any(l.strip() for l in lines[c[1] - 1:c[2]])]
+
+def chunk_source(path, text):
+    """Split a file into (name, start_line, end_line) chunks."""
+    lines = text.split('\n')
+    if path.endswith('.py'):
+        try:
+            return _python_chunks(text, lines)
+        except (SyntaxError, ValueError):
+            pass
+    elif path.endswith('.md'):
+        return _markdown_chunks(lines)
+    return [(f"lines {i + 1}-{min(i + TEXT_WINDOW, len(lines))}", i + 1, min(i + TEXT_WINDOW, len(lines)))
+            for i in range(0, len(lines), TEXT_WINDOW)]
+
+class BM25Index:
+    """Incrementally updated inverted index with BM25 scoring over repository chunks."""
+    def __init__(self, root=None, path=None, suffixes=INDEX_SUFFIXES):
+        self.root = os.path.abspath(root or os.getcwd())
+        self.suffixes = suffixes
+        self.cache = JsonCache(path or os.path.join(get_cache_dir(self.root), BM25_FILE))
+        self._lock = threading.Lock()
+        self.postings = defaultdict(dict)
+        self.chunks = {}
+        self.total_length = 0
+        for rel, entry in self.cache.items():
+            self._add(rel, entry)
+
+    def _add(self, rel, entry):
+        for i, chunk in enumerate(entry['chunks']):
+            key = (rel, i)
+            self.chunks[key] = chunk
+            self.total_length += chunk['length']
+            for term, count in chunk['tf'].items():
+                self.postings[term][key] = count
+
+    def _remove(self, rel, entry):
+        for i, chunk in enumerate(entry['chunks']):
+            key = (rel, i)
+            self.chunks.pop(key, None)
+            self.total_length -= chunk['length']
+            for term in chunk['tf']:
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(key, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def _index_text(self, rel, text):
+        lines = text.split('\n')
+        chunks = []
+        for name, start, end in chunk_source(rel, text):
+            tokens = tokenize(name + '\n' + '\n'.join(lines[start - 1:end]))
+            tf = defaultdict(int)
+            for token in tokens:
+                tf[token] += 1
+            chunks.append({'name': name, 'start': start, 'end': end, 'length': len(tokens), 'tf': dict(tf)})
+        return chunks
+
+    def update(self):
+        """Re-index files whose content changed; returns the number of files re-indexed."""
+        seen, changed = set(), 0
+        with self._lock:
+            for path in iter_python_files(self.root, suffixes=self.suffixes):
+                rel = os.path.relpath(path, self.root).replace(os.sep, '/')
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if st.st_size > MAX_FILE_BYTES:
+                    continue
+                seen.add(rel)
+                entry = self.cache.get(rel)
+                if entry and entry['mtime'] == st.st_mtime and entry['size'] == st.st_size:
+                    continue
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        text = f.read()
+                except (OSError, UnicodeDecodeError):
+                    seen.discard(rel)
+                    continue
+                digest = content_hash(text)
+                if entry and entry['hash'] == digest:
+                    entry = dict(entry, mtime=st.st_mtime, size=st.st_size)
+                    self.cache.set(rel, entry)
+                    continue
+                if entry:
+                    self._remove(rel, entry)
+                entry = {'mtime': st.st_mtime, 'size': st.st_size, 'hash': digest, 'chunks': self._index_text(rel, text)}
+                self.cache.set(rel, entry)
+                self._add(rel, entry)
+                changed += 1
+            for rel, entry in self.cache.items():
+                if rel not in seen:
+                    self._remove(rel, entry)
+                    self.cache.delete(rel)
+                    changed += 1
+            self.cache.save()
+        return changed
+
+    def score(self, query):
+        """BM25 scores of every chunk matching at least one query term."""
+        scores = defaultdict(float)
+        with self._lock:
+            n = len(self.chunks)
+            if not n:
+                return {}
+            avg_length = max(self.total_length / n, 1)
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, tf in postings.items():
+                    length = self.chunks[key]['length']
+                    scores[key] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+        return scores
+
+    def search(self, query, k=DEFAULT_TOP_K, token_budget=DEFAULT_CONTEXT_BUDGET):
+        """Top-k chunks for query, with their text, that fit together within token_budget."""
+        scores = self.score(query)
+        results, used, file_lines = [], 0, {}
+        for key in sorted(scores, key=scores.get, reverse=True):
+            if len(results) >= k:
+                break
+            rel, _ = key
+            chunk = self.chunks[key]
+            if rel not in file_lines:
+                try:
+                    with open(os.path.join(self.root, rel), 'r', encoding='utf-8') as f:
+                        file_lines[rel] = f.read().split('\n')
+                except (OSError, UnicodeDecodeError):
+                    file_lines[rel] = None
+            if file_lines[rel] is None:
+                continue
+            text = '\n'.join(file_lines[rel][chunk['start'] - 1:chunk['end']])
+            cost = estimate_tokens(text)
+            if used + cost > token_budget:
+                continue
+            used += cost
+            results.append({'file': rel, 'name': chunk['name'], 'start': chunk['start'], 'end': chunk['end'],
+                            'score': scores[key], 'text': text})
+        return results
+
+def format_chunks(chunks):
+    return '\n\n'.join(f"[{c['file']}:{c['start']}-{c['end']} {c['name']}]\n{c['text']}" for c in chunks)
+
+def fuse_results(result_lists, k=DEFAULT_TOP_K, token_budget=DEFAULT_CONTEXT_BUDGET, rank_constant=60):
+    """Reciprocal-rank fusion of ranked chunk lists (e.g. BM25 and semantic), deduplicated and cut to the budget."""
+    fused, chunks = defaultdict(float), {}
+    for results in result_lists:
+        for rank, chunk in enumerate(results):
+            key = (chunk['file'], chunk['start'], chunk['end'])
+            fused[key] += 1.0 / (rank_constant + rank + 1)
+            chunks.setdefault(key, chunk)
+    selected, used = [], 0
+    for key in sorted(fused, key=fused.get, reverse=True):
+        if len(selected) >= k:
+            break
+        cost = estimate_tokens(chunks[key]['text'])
+        if used + cost > token_budget:
+            continue
+        used += cost
+        selected.append(chunks[key])
+    return selected
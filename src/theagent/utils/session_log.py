@@ -0,0 +1,295 @@
+"""
+Append-only chat session log (--save-session / --load-session).
+
+Each turn appends compact JSON lines to the log and fsyncs it, so a crash loses at most the
+turn in progress. Records are:
+
+- {"type": "message", "role": ..., "content": ...}: one chat message, in order
+- {"type": "memory", "history_len": N, "memory": {...}}: conversation memory state after a turn;
+  the last N messages before it are the verbatim turns the memory kept
+- {"type": "context", "project_context": {...}}: project context, written only when it changes
+
+Memory and context records supersede earlier ones; once enough have piled up the log is
+compacted (rewritten with every message and only the latest memory and context records).
+Loading reads plain logs backwards from the end, so only the recent turns are parsed however
+long the session is. Logs ending in .gz are gzip-compressed (one gzip member per append) and
+are read forwards instead. Sessions saved by older versions as a single JSON document are
+imported on load and converted when they are written to again.
+"""
+import gzip
+import json
+import os
+import threading
+from collections import deque
+from .cache import content_hash
+
+DEFAULT_HYDRATE = 200
+COMPACT_EVERY = 200
+READ_BLOCK = 1 << 16
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str)
+
+def _size(lines):
+    """Bytes the lines take in the file, newlines included."""
+    return sum(len(line.encode('utf-8')) + 1 for line in lines)
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _reverse_lines(path):
+    """Lines of a plain file from last to first, reading fixed-size blocks from the end."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position, tail = f.tell(), b''
+        while position > 0:
+            size = min(READ_BLOCK, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + tail).split(b'\n')
+            tail = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if tail.strip():
+            yield tail
+
+def _parse(line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        # A torn last line after a crash, or a line from some other file.
+        return None
+    return record if isinstance(record, dict) else None
+
+def is_legacy_session(path):
+    """True if path holds a session saved as a single JSON document (before the session log)."""
+    if path.endswith('.gz') or not os.path.exists(path):
+        return False
+    with open(path, 'r', encoding='utf-8') as f:
+        first = f.readline()
+    if not first.strip():
+        return False
+    record = _parse(first)
+    return record is None or 'type' not in record
+
+def load_legacy_session(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {'chat_history': data.get('chat_history', []), 'project_context': data.get('project_context', {}),
+            'memory_state': data.get('memory', {})}
+
+class SessionLog:
+    """Writer and lazy reader for one session log file."""
+
+    def __init__(self, path, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.compress = path.endswith('.gz')
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._last_message = None
+        self._memory_hash = None
+        self._context_hash = None
+        self._context_at = None
+        self._superseded = 0
+        self._checked = False
+
+    def _open(self, mode):
+        if self.compress:
+            return gzip.open(self.path, mode + 'b')
+        return open(self.path, mode, encoding='utf-8')
+
+    def _append(self, lines):
+        if not lines:
+            return
+        if not self._checked:
+            self._repair()
+        data = ''.join(line + '\n' for line in lines)
+        with self._open('a') as f:
+            f.write(data.encode('utf-8') if self.compress else data)
+            f.flush()
+        # gzip.open has no fileno of its own once closed, so sync the path itself.
+        _fsync_path(self.path)
+
+    def _repair(self):
+        """Make a log left behind by a crash safe to append to (once per SessionLog)."""
+        self._checked = True
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        if not self.compress:
+            with open(self.path, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    # Close off a torn last line so the next record starts on its own line.
+                    f.write(b'\n')
+            return
+        try:
+            with gzip.open(self.path, 'rb') as f:
+                while f.read(READ_BLOCK):
+                    pass
+        except (EOFError, gzip.BadGzipFile):
+            # Records after a truncated gzip member would be unreadable: rewrite what is intact.
+            self._write_atomic([_dumps(r) for r in self.iter_records()])
+
+    def _write_atomic(self, lines):
+        data = ''.join(line + '\n' for line in lines)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with (gzip.open(tmp_path, 'wb') if self.compress else open(tmp_path, 'w', encoding='utf-8')) as f:
+            f.write(data.encode('utf-8') if self.compress else data)
+        _fsync_path(tmp_path)
+        os.replace(tmp_path, self.path)
+        self._checked = True
+
+    def _state_records(self, shared, position, force=False):
+        """Memory/context records to write at byte offset position (context only if it changed)."""
+        records = []
+        context = shared.get('project_context') or {}
+        context_hash = content_hash(_dumps(context))
+        if force or context_hash != self._context_hash:
+            line = _dumps({'type': 'context', 'project_context': context})
+            records.append(line)
+            self._superseded += self._context_hash is not None
+            self._context_hash = context_hash
+            # Memory records point at the context record so loading can seek to it.
+            self._context_at = None if self.compress else position
+        memory = shared.get('memory')
+        state = {'history_len': len(shared.get('chat_history', [])),
+                 'memory': memory.to_dict() if memory is not None else {},
+                 'context_at': self._context_at}
+        memory_hash = content_hash(_dumps(state))
+        if force or memory_hash != self._memory_hash:
+            records.append(_dumps({'type': 'memory', **state}))
+            self._superseded += self._memory_hash is not None
+            self._memory_hash = memory_hash
+        return records
+
+    def record(self, shared):
+        """Append the messages added to shared['chat_history'] since the last call, then the state."""
+        with self._lock:
+            history = shared.get('chat_history', [])
+            start = 0
+            for i in range(len(history) - 1, -1, -1):
+                if history[i] is self._last_message:
+                    start = i + 1
+                    break
+            # If the last logged message is gone, memory folded it (and everything before it) away,
+            # so whatever is left in the history was added after it.
+            lines = [_dumps({'type': 'message', **m}) for m in history[start:]]
+            if history:
+                self._last_message = history[-1]
+            if not self._checked:
+                self._repair()
+            position = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            lines += self._state_records(shared, position + _size(lines))
+            self._append(lines)
+            compact = self._superseded >= self.compact_every
+        if compact:
+            self.compact(shared)
+
+    def rewrite(self, shared, messages=None):
+        """Write the whole log from scratch (atomically): messages, then the current state."""
+        with self._lock:
+            if messages is None:
+                messages = shared.get('chat_history', [])
+            lines = [_dumps({'type': 'message', **m}) for m in messages]
+            lines += self._state_records(shared, _size(lines), force=True)
+            self._write_atomic(lines)
+            history = shared.get('chat_history') or []
+            self._last_message = history[-1] if history else None
+            self._superseded = 0
+
+    def compact(self, shared):
+        """Drop superseded memory and context records, keeping every message."""
+        messages = [{k: v for k, v in r.items() if k != 'type'} for r in self.iter_records() if r.get('type') == 'message']
+        self.rewrite(shared, messages)
+
+    def iter_records(self):
+        """Every record from first to last (skipping unreadable lines)."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with self._open('r') as f:
+                for line in f:
+                    record = _parse(line)
+                    if record is not None:
+                        yield record
+        except (EOFError, gzip.BadGzipFile):
+            # A gzip member cut short by a crash; everything before it is intact.
+            return
+
+    def _iter_reversed(self):
+        if self.compress:
+            yield from reversed(list(self._tail_records()))
+            return
+        for line in _reverse_lines(self.path):
+            record = _parse(line)
+            if record is not None:
+                yield record
+
+    def _read_at(self, offset):
+        """The context record at byte offset, or None if the log no longer has it there."""
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            record = _parse(f.readline())
+        return record if record is not None and record.get('type') == 'context' else None
+
+    def _tail_records(self, keep=DEFAULT_HYDRATE):
+        """Forward scan for compressed logs: the latest state records and the messages around them."""
+        # Memory records are interleaved with the messages, so keep room for both.
+        tail, context = deque(maxlen=3 * keep), None
+        for record in self.iter_records():
+            if record.get('type') == 'context':
+                context = record
+            else:
+                tail.append(record)
+        records = list(tail)
+        if context is not None:
+            records.insert(0, context)
+        return records
+
+    def load(self, recent=DEFAULT_HYDRATE):
+        """Recent state of the session: {'chat_history', 'memory_state', 'project_context', 'turns'}.
+
+        Only the verbatim turns the memory kept (at most `recent`) are hydrated; older messages
+        stay in the log. 'turns' counts the messages read, not the messages in the session.
+        """
+        if is_legacy_session(self.path):
+            state = load_legacy_session(self.path)
+            self._last_message = None
+            state['turns'] = len(state['chat_history'])
+            return state
+        after, before, memory, context = [], [], None, None
+        for record in self._iter_reversed():
+            kind = record.get('type')
+            if kind == 'context' and context is None:
+                context = record
+            elif kind == 'memory' and memory is None:
+                memory = record
+                if context is None and memory.get('context_at') is not None:
+                    context = self._read_at(memory['context_at'])
+            elif kind == 'message':
+                message = {k: v for k, v in record.items() if k != 'type'}
+                if memory is None:
+                    after.append(message)
+                elif len(before) < min(memory.get('history_len', 0), recent):
+                    before.append(message)
+            if memory is not None:
+                hydrated = len(before) >= min(memory.get('history_len', 0), recent)
+            else:
+                hydrated = len(after) >= recent
+            if context is not None and hydrated:
+                break
+        messages = (list(reversed(before)) + list(reversed(after)))[-recent:]
+        # Appending to this log continues after the hydrated messages instead of logging them again.
+        self._last_message = messages[-1] if messages else None
+        if context is not None:
+            self._context_hash = content_hash(_dumps(context.get('project_context', {})))
+            self._context_at = (memory or {}).get('context_at')
+        return {'chat_history': messages,
+                'memory_state': (memory or {}).get('memory', {}),
+                'project_context': (context or {}).get('project_context', {}),
+                'turns': len(before) + len(after)}
@@ -0,0 +1,340 @@
+"""
+Deterministic sharding of batch runs across machines, result bundles and their merge.
+
+Files (or top-level functions/classes) are assigned to shards by a stable hash of their
+repository-relative name, so every machine computes the same split without coordination.
+Each shard writes a self-contained bundle: a manifest of the units it owned, per-file
+results and report, unified diffs of the code it rewrote, and its job-journal entries.
+`theagent merge` checks that the bundles cover every unit exactly once, detects edits
+that overlap between shards, and combines the patches into one change set.
+"""
+import ast
+import difflib
+import hashlib
+import json
+import os
+import shutil
+import time
+from .batch import REWRITE_RESULT_KEYS, format_batch_report
+from .git_changes import overlaps
+from .journal import JOURNAL_DIR, BLOB_DIR, JobJournal, file_hash, job_id
+from .patching import parse_unified_diff, PatchError
+from .cache import get_cache_dir
+
+BUNDLE_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+def parse_shard(spec):
+    """'i/N' (1-based) -> (i, N); raises ValueError for anything else."""
+    try:
+        index, total = (int(part) for part in spec.split('/'))
+    except (AttributeError, ValueError):
+        raise ValueError(f"invalid shard {spec!r}; expected i/N, e.g. 1/4")
+    if total < 1 or not 1 <= index <= total:
+        raise ValueError(f"invalid shard {spec!r}; i must be between 1 and N")
+    return index, total
+
+def shard_of(key, total):
+    """1-based shard owning key; stable across machines, Python versions and runs."""
+    return int(hashlib.sha256(key.encode('utf-8')).hexdigest()[:16], 16) % total + 1
+
+def default_bundle_dir(shard, root=None):
+    return os.path.join(get_cache_dir(root), 'bundles', f"shard-{shard[0]}-of-{shard[1]}")
+
+def relative_name(path, root):
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(root)).replace(os.sep, '/')
+
+def symbol_units(path, root):
+    """(unit key, start, end) for each top-level function and class of a file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    rel = relative_name(path, root)
+    units = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+            units.append((f"{rel}::{node.name}", start, node.end_lineno))
+    return units
+
+def assign_shard(files, index, total, root, by='file', changed_lines=None):
+    """Units of this shard and of the whole run.
+
+    Returns (files, universe, owned, changed_lines): the files this shard must process, every
+    unit key of the run, the unit keys owned by this shard, and, when sharding by symbol, the
+    line ranges of owned symbols per file (in the format of --since) so agents only touch them.
+    Given changed_lines from --since/--staged, only symbols overlapping a change are units.
+    """
+    universe, owned, selected, changed_lines = [], [], [], {}
+    for path in files:
+        rel = relative_name(path, root)
+        if by == 'file':
+            universe.append(rel)
+            if shard_of(rel, total) == index:
+                owned.append(rel)
+                selected.append(path)
+            continue
+        try:
+            units = symbol_units(path, root)
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+            units = []
+        changed = (changed_lines or {}).get(os.path.realpath(path))
+        if changed is not None:
+            units = [u for u in units if overlaps(changed, u[1], u[2])]
+        if not units:
+            # Files without (changed) functions or classes are owned as a whole.
+            units = [(rel, None, None)]
+        ranges, owns_file = [], False
+        for key, start, end in units:
+            universe.append(key)
+            if shard_of(key, total) == index:
+                owned.append(key)
+                owns_file = True
+                if start is not None:
+                    ranges.append((start, end))
+        if owns_file:
+            selected.append(path)
+            if units[0][1] is None:
+                ranges = changed or [(1, float('inf'))]
+            changed_lines[os.path.realpath(path)] = ranges
+    return selected, sorted(universe), sorted(owned), (changed_lines if by == 'symbol' else None)
+
+def make_patch(rel, original, new):
+    """Unified diff turning original into new ('' if they are equal)."""
+    if new is None or new == original:
+        return ''
+    return ''.join(difflib.unified_diff(
+        original.splitlines(True), new.splitlines(True), fromfile=f"a/{rel}", tofile=f"b/{rel}"))
+
+def _unit_file(unit):
+    return unit.split('::', 1)[0]
+
+def write_bundle(directory, args, root, shard, universe, owned, results, originals, journal_path=None):
+    """Write this shard's bundle to directory and return the manifest."""
+    index, total = shard
+    os.makedirs(os.path.join(directory, 'patches'), exist_ok=True)
+    agent = getattr(args, 'agent', None)
+    status_by_file, patches = {}, {}
+    with open(os.path.join(directory, 'results.jsonl'), 'w', encoding='utf-8') as f:
+        for result in results:
+            rel = relative_name(result['file'], root)
+            status_by_file[rel] = result['status']
+            record = {k: result.get(k) for k in ('status', 'error', 'duration', 'output', 'result')}
+            f.write(json.dumps(dict(record, file=rel), default=str) + '\n')
+            new_code = result.get('code')
+            original = originals.get(rel, {}).get('source')
+            if result['status'] != 'ok' or not isinstance(new_code, str) or original is None:
+                continue
+            patch = make_patch(rel, original, new_code.rstrip() + '\n')
+            if patch:
+                patch_path = os.path.join('patches', rel.replace('/', '__') + '.diff')
+                with open(os.path.join(directory, patch_path), 'w', encoding='utf-8') as p:
+                    p.write(patch)
+                patches[rel] = patch_path
+    with open(os.path.join(directory, 'report.txt'), 'w', encoding='utf-8') as f:
+        f.write(format_batch_report(results) + '\n')
+    if journal_path and os.path.exists(journal_path):
+        # Journal entries and their blobs let a later --resume skip what this shard did.
+        cache_dir = os.path.join(directory, 'cache')
+        os.makedirs(os.path.join(cache_dir, BLOB_DIR), exist_ok=True)
+        shutil.copyfile(journal_path, os.path.join(cache_dir, 'journal.jsonl'))
+        blob_dir = os.path.join(os.path.dirname(journal_path), BLOB_DIR)
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    ref = json.loads(line)['ref']
+                except (ValueError, KeyError):
+                    continue
+                source = os.path.join(blob_dir, ref + '.json')
+                if os.path.exists(source):
+                    shutil.copyfile(source, os.path.join(cache_dir, BLOB_DIR, ref + '.json'))
+    manifest = {
+        'version': BUNDLE_VERSION,
+        'job': job_id(args),
+        'agent': agent,
+        'shard': index,
+        'total': total,
+        'shard_by': getattr(args, 'shard_by', 'file'),
+        'created': time.time(),
+        'universe': universe,
+        'units': [{'unit': unit, 'file': _unit_file(unit), 'status': status_by_file.get(_unit_file(unit), 'missing'),
+                   'input_hash': originals.get(_unit_file(unit), {}).get('hash')} for unit in owned],
+        'patches': patches,
+    }
+    with open(os.path.join(directory, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+def read_originals(files, root, agent):
+    """{relative name: {'hash', 'source'}} of each file before the run; source only for rewriting agents."""
+    originals = {}
+    for path in files:
+        rel = relative_name(path, root)
+        originals[rel] = {'hash': file_hash(path), 'source': None}
+        if agent in REWRITE_RESULT_KEYS:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    originals[rel]['source'] = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+    return originals
+
+def load_bundle(directory):
+    with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != BUNDLE_VERSION:
+        raise ValueError(f"{directory}: unsupported bundle version {manifest.get('version')}")
+    manifest['directory'] = directory
+    return manifest
+
+def _core_edits(patch_text):
+    """Hunks reduced to their changed lines: (old_start, old_lines, new_lines), old_start 1-based."""
+    edits = []
+    for hunk in parse_unified_diff(patch_text):
+        lines = hunk['lines']
+        lead = 0
+        while lead < len(lines) and lines[lead][0] == ' ':
+            lead += 1
+        trail = len(lines)
+        while trail > lead and lines[trail - 1][0] == ' ':
+            trail -= 1
+        core = lines[lead:trail]
+        old = [t for tag, t in core if tag in ' -']
+        new = [t for tag, t in core if tag in ' +']
+        # A pure insertion sits after line old_start + lead - 1 (1-based): use a zero-length span there.
+        edits.append((hunk['old_start'] + lead if hunk['old_start'] else 1, old, new))
+    return edits
+
+def _overlap(a, b):
+    a_start, a_old = a[0], len(a[1])
+    b_start, b_old = b[0], len(b[1])
+    if a_old == 0 or b_old == 0:
+        # Insertions conflict with edits that start at or span the same point.
+        return a_start <= b_start + b_old and b_start <= a_start + a_old
+    return a_start < b_start + b_old and b_start < a_start + a_old
+
+def merge_bundles(directories, root=None, apply=False):
+    """Verify and combine shard bundles; returns a dict with the merged report, change set and problems."""
+    root = os.path.abspath(root or os.getcwd())
+    bundles = [load_bundle(d) for d in directories]
+    errors, conflicts = [], []
+    if not bundles:
+        return {'errors': ["no bundles given"], 'conflicts': [], 'patch': '', 'applied': [], 'report': ''}
+    first = bundles[0]
+    for bundle in bundles[1:]:
+        for key in ('job', 'total', 'shard_by', 'universe'):
+            if bundle[key] != first[key]:
+                errors.append(f"{bundle['directory']}: {key} differs from {first['directory']}")
+    shards = [b['shard'] for b in bundles]
+    for shard in sorted(set(shards)):
+        if shards.count(shard) > 1:
+            errors.append(f"shard {shard}/{first['total']} appears {shards.count(shard)} times")
+    missing_shards = sorted(set(range(1, first['total'] + 1)) - set(shards))
+    if missing_shards:
+        total = first['total']
+        errors.append(f"missing shard(s): {', '.join(f'{s}/{total}' for s in missing_shards)}")
+
+    owners = {}
+    for bundle in bundles:
+        for unit in bundle['units']:
+            owners.setdefault(unit['unit'], []).append((bundle, unit))
+    universe = set(first['universe'])
+    for unit, claims in sorted(owners.items()):
+        if len(claims) > 1:
+            errors.append(f"{unit} processed by {len(claims)} shards ({', '.join(str(b['shard']) for b, _ in claims)})")
+        if unit not in universe:
+            errors.append(f"{unit} is not part of the run")
+    unprocessed = sorted(universe - set(owners))
+    if unprocessed:
+        errors.append(f"{len(unprocessed)} unit(s) not processed by any shard: {', '.join(unprocessed[:10])}")
+    # Skipped files (syntax errors) were still handled by their shard; errors and missing results were not.
+    failed = sorted(u['unit'] for b in bundles for u in b['units'] if u['status'] in ('error', 'missing'))
+    if failed:
+        errors.append(f"{len(failed)} unit(s) did not finish: {', '.join(failed[:10])}")
+
+    # Collect every shard's edits per file and look for overlaps between shards.
+    edits_by_file = {}
+    for bundle in bundles:
+        for rel, patch_path in bundle.get('patches', {}).items():
+            with open(os.path.join(bundle['directory'], patch_path), 'r', encoding='utf-8') as f:
+                try:
+                    edits = _core_edits(f.read())
+                except PatchError as e:
+                    errors.append(f"{bundle['directory']}: unreadable patch for {rel} ({e})")
+                    continue
+            edits_by_file.setdefault(rel, []).extend((bundle['shard'], edit) for edit in edits)
+    merged_sources, patch_parts = {}, []
+    for rel, edits in sorted(edits_by_file.items()):
+        clashing = False
+        for i, (shard_a, a) in enumerate(edits):
+            for shard_b, b in edits[i + 1:]:
+                if shard_a != shard_b and _overlap(a, b):
+                    conflicts.append(f"{rel}: shards {shard_a} and {shard_b} both change lines {a[0]}-{a[0] + max(len(a[1]), 1) - 1}")
+                    clashing = True
+        if clashing:
+            continue
+        try:
+            with open(os.path.join(root, rel), 'r', encoding='utf-8') as f:
+                original = f.read()
+        except OSError as e:
+            conflicts.append(f"{rel}: cannot read ({e})")
+            continue
+        lines = original.splitlines(True)
+        ok = True
+        for _, (start, old, new) in sorted(edits, key=lambda e: e[1][0], reverse=True):
+            current = [l.rstrip('\n') for l in lines[start - 1:start - 1 + len(old)]]
+            if current != old:
+                conflicts.append(f"{rel}: line {start} no longer matches what the shard saw (file changed since the run?)")
+                ok = False
+                break
+            lines[start - 1:start - 1 + len(old)] = [l + '\n' for l in new]
+        if ok:
+            merged = ''.join(lines)
+            merged_sources[rel] = merged
+            patch_parts.append(make_patch(rel, original, merged))
+
+    applied = []
+    if apply and not errors and not conflicts:
+        for rel, source in merged_sources.items():
+            with open(os.path.join(root, rel), 'w', encoding='utf-8') as f:
+                f.write(source)
+            applied.append(rel)
+        _import_journals(bundles, root)
+
+    results = []
+    for bundle in sorted(bundles, key=lambda b: b['shard']):
+        path = os.path.join(bundle['directory'], 'results.jsonl')
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        result = json.loads(line)
+                        if first['shard_by'] == 'symbol':
+                            # Several shards handle parts of the same file.
+                            result['file'] += f" (shard {bundle['shard']})"
+                        results.append(result)
+    results.sort(key=lambda r: r['file'])
+    report = format_batch_report(results)
+    return {'errors': errors, 'conflicts': conflicts, 'patch': ''.join(patch_parts), 'applied': applied,
+            'report': report, 'units': len(owners), 'shards': len(bundles)}
+
+def _import_journals(bundles, root):
+    """Append the shards' journal entries to the local journal so --resume skips their work."""
+    directory = os.path.join(get_cache_dir(root), JOURNAL_DIR)
+    os.makedirs(os.path.join(directory, BLOB_DIR), exist_ok=True)
+    target = os.path.join(directory, f"{bundles[0]['job']}.jsonl")
+    # Opening it for resume cuts off a torn last line, so the imported entries start on their own line.
+    JobJournal(target, resume=True).close()
+    with open(target, 'a', encoding='utf-8') as out:
+        for bundle in bundles:
+            cache_dir = os.path.join(bundle['directory'], 'cache')
+            journal = os.path.join(cache_dir, 'journal.jsonl')
+            if not os.path.exists(journal):
+                continue
+            for name in os.listdir(os.path.join(cache_dir, BLOB_DIR)):
+                destination = os.path.join(directory, BLOB_DIR, name)
+                if not os.path.exists(destination):
+                    shutil.copyfile(os.path.join(cache_dir, BLOB_DIR, name), destination)
+            with open(journal, 'r', encoding='utf-8') as f:
+                data = f.read()
+            # Only whole lines: a torn last line would swallow the next shard's first entry.
+            out.write(data[:data.rfind('\n') + 1])
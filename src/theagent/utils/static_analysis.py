@@ -0,0 +1,230 @@
+"""
+Fast local AST checks used to pre-filter code before LLM bug detection.
+
+Checks: undefined names, unused local variables, mutable default arguments,
+bare `except:`, unreachable code and cyclomatic complexity per function.
+"""
+import ast
+import builtins
+
+DEFAULT_COMPLEXITY_THRESHOLD = 10
+MODULE_DUNDERS = {'__name__', '__file__', '__doc__', '__package__', '__spec__', '__loader__',
+                  '__builtins__', '__path__', '__annotations__', '__dict__', '__debug__'}
+BUILTIN_NAMES = set(dir(builtins)) | MODULE_DUNDERS
+SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+MUTABLE_CALLS = {'list', 'dict', 'set', 'defaultdict', 'OrderedDict', 'deque'}
+
+def _finding(node, check, message, symbol=None):
+    return {
+        'line': getattr(node, 'lineno', 0),
+        'col': getattr(node, 'col_offset', 0),
+        'check': check,
+        'message': message,
+        'symbol': symbol,
+    }
+
+def _iter_scope(node):
+    """Yield descendants of node without entering nested function/class/lambda scopes."""
+    for child in ast.iter_child_nodes(node):
+        yield child
+        if not isinstance(child, SCOPE_NODES):
+            yield from _iter_scope(child)
+
+def _bound_names(scope_node):
+    """Names bound directly in a scope (module, function, class or lambda)."""
+    names = set()
+    if isinstance(scope_node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+        a = scope_node.args
+        for arg in a.posonlyargs + a.args + a.kwonlyargs + [a.vararg, a.kwarg]:
+            if arg is not None:
+                names.add(arg.arg)
+    body_nodes = scope_node.body if isinstance(scope_node.body, list) else [scope_node.body]
+    for stmt in body_nodes:
+        for node in [stmt, *_iter_scope(stmt)] if not isinstance(stmt, SCOPE_NODES) else [stmt]:
+            if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                names.add(node.id)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                names.add(node.name)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    names.add((alias.asname or alias.name).split('.')[0])
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                names.add(node.name)
+            elif isinstance(node, (ast.Global, ast.Nonlocal)):
+                names.update(node.names)
+            elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+                names.add(node.name)
+            elif isinstance(node, ast.MatchMapping) and node.rest:
+                names.add(node.rest)
+    return names
+
+def _has_star_import(tree):
+    return any(isinstance(n, ast.ImportFrom) and any(a.name == '*' for a in n.names) for n in ast.walk(tree))
+
+def check_undefined_names(tree):
+    if _has_star_import(tree):
+        return []
+    findings = []
+    module_names = _bound_names(tree) | BUILTIN_NAMES
+
+    def visit(scope_node, visible, symbol):
+        own = _bound_names(scope_node)
+        scope_visible = visible | own
+        body = scope_node.body if isinstance(scope_node.body, list) else [scope_node.body]
+        for stmt in body:
+            nodes = [stmt] if isinstance(stmt, SCOPE_NODES) else [stmt, *_iter_scope(stmt)]
+            for node in nodes:
+                if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in scope_visible:
+                    findings.append(_finding(node, 'undefined-name', f"Undefined name '{node.id}'", symbol))
+                elif isinstance(node, SCOPE_NODES):
+                    # Defaults, decorators and bases are evaluated in the enclosing scope.
+                    outer = []
+                    if not isinstance(node, ast.Lambda):
+                        outer.extend(node.decorator_list)
+                    if isinstance(node, ast.ClassDef):
+                        outer.extend(node.bases + [k.value for k in node.keywords])
+                    else:
+                        outer.extend(node.args.defaults + [d for d in node.args.kw_defaults if d is not None])
+                    for expr in outer:
+                        for n in ast.walk(expr):
+                            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load) and n.id not in scope_visible:
+                                findings.append(_finding(n, 'undefined-name', f"Undefined name '{n.id}'", symbol))
+                    name = getattr(node, 'name', symbol)
+                    # Names bound in a class body are not visible inside its methods.
+                    inner_visible = visible if isinstance(scope_node, ast.ClassDef) else scope_visible
+                    visit(node, inner_visible, name)
+    visit(tree, module_names, None)
+    return findings
+
+def check_unused_variables(tree):
+    findings = []
+    for func in ast.walk(tree):
+        if not isinstance(func, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        declared = set()
+        stored = {}
+        for node in _iter_scope(func):
+            if isinstance(node, (ast.Global, ast.Nonlocal)):
+                declared.update(node.names)
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)) and getattr(node, 'value', None) is not None:
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        stored.setdefault(target.id, target)
+        loaded = {n.id for n in ast.walk(func) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+        if 'locals' in loaded or 'vars' in loaded:
+            continue
+        for name, node in stored.items():
+            if name not in loaded and name not in declared and not name.startswith('_'):
+                findings.append(_finding(node, 'unused-variable', f"Local variable '{name}' is assigned but never used", func.name))
+    return findings
+
+def check_mutable_defaults(tree):
+    findings = []
+    for func in ast.walk(tree):
+        if not isinstance(func, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            continue
+        for default in func.args.defaults + [d for d in func.args.kw_defaults if d is not None]:
+            mutable = isinstance(default, (ast.List, ast.Dict, ast.Set, ast.ListComp, ast.DictComp, ast.SetComp))
+            if isinstance(default, ast.Call) and isinstance(default.func, ast.Name) and default.func.id in MUTABLE_CALLS:
+                mutable = True
+            if mutable:
+                name = getattr(func, 'name', '<lambda>')
+                findings.append(_finding(default, 'mutable-default', f"Mutable default argument in '{name}' is shared between calls", name))
+    return findings
+
+def check_bare_except(tree):
+    return [_finding(node, 'bare-except', "Bare 'except:' also catches SystemExit and KeyboardInterrupt")
+            for node in ast.walk(tree) if isinstance(node, ast.ExceptHandler) and node.type is None]
+
+def check_unreachable_code(tree):
+    findings = []
+    terminators = (ast.Return, ast.Raise, ast.Continue, ast.Break)
+    for node in ast.walk(tree):
+        for field in ('body', 'orelse', 'finalbody'):
+            stmts = getattr(node, field, None)
+            if not isinstance(stmts, list):
+                continue
+            for i, stmt in enumerate(stmts[:-1]):
+                if isinstance(stmt, terminators):
+                    kind = type(stmt).__name__.lower()
+                    findings.append(_finding(stmts[i + 1], 'unreachable-code', f"Unreachable code after '{kind}'"))
+                    break
+    return findings
+
+def cyclomatic_complexity(func):
+    """McCabe-style complexity: 1 + number of decision points in the function."""
+    complexity = 1
+    for node in _iter_scope(func):
+        if isinstance(node, (ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler, ast.Assert)):
+            complexity += 1
+        elif isinstance(node, ast.BoolOp):
+            complexity += len(node.values) - 1
+        elif isinstance(node, ast.comprehension):
+            complexity += 1 + len(node.ifs)
+        elif isinstance(node, ast.match_case):
+            complexity += 1
+    return complexity
+
+def function_complexities(tree):
+    return [{
+        'name': node.name,
+        'line': node.lineno,
+        'end_line': node.end_lineno,
+        'complexity': cyclomatic_complexity(node),
+    } for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+
+def analyze_source(source_code, complexity_threshold=DEFAULT_COMPLEXITY_THRESHOLD):
+    """Run all local checks; returns (findings, tree). tree is None on syntax errors."""
+    try:
+        tree = ast.parse(source_code)
+    except SyntaxError as e:
+        return [{'line': e.lineno or 0, 'col': e.offset or 0, 'check': 'syntax-error', 'message': f"Syntax error: {e.msg}", 'symbol': None}], None
+    findings = (check_undefined_names(tree) + check_unused_variables(tree) + check_mutable_defaults(tree)
+                + check_bare_except(tree) + check_unreachable_code(tree))
+    for func in function_complexities(tree):
+        if func['complexity'] > complexity_threshold:
+            findings.append({'line': func['line'], 'col': 0, 'check': 'high-complexity',
+                             'message': f"Function '{func['name']}' has cyclomatic complexity {func['complexity']}",
+                             'symbol': func['name']})
+    findings.sort(key=lambda f: (f['line'], f['col']))
+    return findings, tree
+
+def select_regions(source_code, findings, tree):
+    """Group findings into the smallest enclosing function (or top-level statement) regions."""
+    lines = source_code.split('\n')
+    if tree is None:
+        return [{'name': '<module>', 'start': 1, 'end': len(lines), 'code': source_code, 'findings': findings}] if findings else []
+    functions = [n for n in ast.walk(tree) if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    regions = {}
+    for finding in findings:
+        enclosing = [f for f in functions if f.lineno <= finding['line'] <= f.end_lineno]
+        if enclosing:
+            node = min(enclosing, key=lambda f: f.end_lineno - f.lineno)
+            start = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+            key, name = (start, node.end_lineno), node.name
+        else:
+            stmt = next((s for s in tree.body if s.lineno <= finding['line'] <= s.end_lineno), None)
+            if stmt is None:
+                key, name = (finding['line'], finding['line']), '<module>'
+            else:
+                key, name = (stmt.lineno, stmt.end_lineno), '<module>'
+        region = regions.setdefault(key, {'name': name, 'start': key[0], 'end': key[1], 'findings': []})
+        region['findings'].append(finding)
+    # Drop regions nested inside another selected region; their findings move to the outer one.
+    selected = []
+    for key in sorted(regions, key=lambda k: (k[0], -k[1])):
+        outer = next((r for r in selected if r['start'] <= key[0] and key[1] <= r['end']), None)
+        if outer:
+            outer['findings'].extend(regions[key]['findings'])
+        else:
+            selected.append(regions[key])
+    for region in selected:
+        region['code'] = '\n'.join(lines[region['start'] - 1:region['end']])
+    return selected
+
+def format_findings(findings, file_name=''):
+    if not findings:
+        return f"No local issues found{' in ' + file_name if file_name else ''}."
+    prefix = f"{file_name}:" if file_name else "line "
+    return '\n'.join(f"{prefix}{f['line']}:{f['col']}: [{f['check']}] {f['message']}" for f in findings)
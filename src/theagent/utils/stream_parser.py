@@ -0,0 +1,102 @@
+"""
+Incremental parsing of the streamed intent response in chat.
+
+The intent call answers with a ```yaml block (intent, confidence, reasoning, parameters). Routing
+only needs the intent and the parameters its action requires, so the block is parsed again at every
+completed line; as soon as those are known the caller can route and stop reading. General
+questions (the answer follows the block) and multi-action requests (the whole action list is
+needed) are only ready when the block is closed.
+"""
+import re
+import yaml
+
+_OPENING_FENCE = re.compile(r"```ya?ml[ \t]*\r?\n")
+
+def required_parameters_present(intent, parameters):
+    """Whether parameters holds what the action for intent needs to start."""
+    if intent == 'clarification_needed':
+        return True
+    if intent == 'file_management':
+        operation = parameters.get('operation')
+        if operation == 'list':
+            return True
+        if operation == 'search':
+            return bool(parameters.get('query') or parameters.get('file_path'))
+        if operation == 'read_reference':
+            return bool(parameters.get('reference') or parameters.get('file_path'))
+        return bool(operation and parameters.get('file_path'))
+    if intent in ('code_generation', 'code_analysis'):
+        return bool(parameters.get('file_path') and parameters.get('agent_type'))
+    return False
+
+class IncrementalIntentParser:
+    """Feed it the response chunk by chunk; `ready` turns true once the intent can be acted on."""
+
+    def __init__(self):
+        self.text = ''
+        self.result = None
+        self.closed = False
+        self.tail = ''
+        self._block_start = None
+        self._parsed_upto = 0
+
+    @property
+    def intent(self):
+        return (self.result or {}).get('intent')
+
+    @property
+    def parameters(self):
+        parameters = (self.result or {}).get('parameters')
+        return parameters if isinstance(parameters, dict) else {}
+
+    @property
+    def ready(self):
+        if self.closed:
+            return self.result is not None
+        return required_parameters_present(self.intent, self.parameters)
+
+    def feed(self, chunk):
+        """Add a chunk of the response and parse whatever lines it completed; returns self.ready."""
+        if self.closed:
+            self.tail += chunk
+            return self.ready
+        self.text += chunk
+        if self._block_start is None:
+            match = _OPENING_FENCE.search(self.text)
+            if match is None:
+                return False
+            self._block_start = self._parsed_upto = match.end()
+        end = self.text.rfind('\n')
+        if end < self._parsed_upto:
+            return self.ready
+        block = self.text[self._block_start:end + 1]
+        fence = re.search(r"^[ \t]*```[ \t]*$", block, re.M)
+        if fence is not None:
+            self.closed = True
+            self.tail = self.text[self._block_start + fence.end():].lstrip('\n')
+            block = block[:fence.start()]
+        self._parsed_upto = end + 1
+        self._parse(block)
+        return self.ready
+
+    def finish(self):
+        """The response ended: parse a block that was never closed (or whose fence had no newline)."""
+        if self.closed or self._block_start is None:
+            return self.result
+        block = self.text[self._block_start:]
+        fence = block.rfind('```')
+        if fence != -1:
+            self.tail = block[fence + 3:].lstrip('\n')
+            block = block[:fence]
+        self.closed = True
+        self._parse(block)
+        return self.result
+
+    def _parse(self, block):
+        try:
+            data = yaml.safe_load(block)
+        except yaml.YAMLError:
+            # A value spread over lines that have not all arrived yet.
+            return
+        if isinstance(data, dict):
+            self.result = data
@@ -0,0 +1,168 @@
+"""
+Hierarchical (map-reduce) summarization of files, packages and repositories.
+
+Symbols are summarized in parallel and reduced into file summaries, which are
+reduced into package and repository summaries. Every node is keyed by a hash
+of its content (files) or of its children's keys (packages), so editing one
+file only recomputes the summaries on its path up to the root.
+"""
+import ast
+import os
+import threading
+from .cache import JsonCache, content_hash, get_cache_dir
+from .console import OutputThreadPoolExecutor
+
+SUMMARY_CACHE_FILE = "summaries.json"
+SKIP_DIRS = {'__pycache__', 'venv', 'env', 'node_modules', 'build', 'dist'}
+
+def extract_symbols(source_code):
+    """Return the top-level functions and classes of a module with their source."""
+    try:
+        tree = ast.parse(source_code)
+    except SyntaxError:
+        return []
+    lines = source_code.split('\n')
+    symbols = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+            symbols.append({
+                'name': node.name,
+                'kind': 'class' if isinstance(node, ast.ClassDef) else 'function',
+                'code': '\n'.join(lines[start - 1:node.end_lineno]),
+                'line': start,
+            })
+    return symbols
+
+def load_summary_cache(root=None):
+    return JsonCache(os.path.join(get_cache_dir(root), SUMMARY_CACHE_FILE))
+
+class HierarchicalSummarizer:
+    """Map-reduce summarizer backed by a content-hash keyed cache."""
+    def __init__(self, llm_proxy, provider='openai', model=None, cache=None, max_workers=4):
+        self.llm_proxy = llm_proxy
+        self.provider = provider
+        self.model = model
+        self.cache = cache if cache is not None else load_summary_cache()
+        self.max_workers = max(1, max_workers or 1)
+        self.llm_calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _cached(self, key, compute):
+        summary = self.cache.get(key)
+        if summary is None:
+            with self._calls_lock:
+                self.llm_calls += 1
+            summary = compute()
+            if summary and not summary.startswith('Error:'):
+                self.cache.set(key, summary)
+        return summary
+
+    def summarize_symbol(self, symbol):
+        key = content_hash('symbol', symbol['code'])
+        return self._cached(key, lambda: self.llm_proxy.summarize_code(
+            symbol['code'], provider=self.provider, model=self.model))
+
+    def summarize_source(self, source_code, name, executor=None):
+        """Summarize one module; returns (key, summary)."""
+        key = content_hash('file', source_code)
+        if key in self.cache:
+            return key, self.cache.get(key)
+        symbols = extract_symbols(source_code)
+        if len(symbols) <= 1:
+            return key, self._cached(key, lambda: self.llm_proxy.summarize_code(
+                source_code, provider=self.provider, model=self.model))
+        if executor is None:
+            with OutputThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                parts = list(pool.map(self.summarize_symbol, symbols))
+        else:
+            parts = list(executor.map(self.summarize_symbol, symbols))
+        labelled = [f"{s['kind']} {s['name']}: {p}" for s, p in zip(symbols, parts)]
+        return key, self._cached(key, lambda: self.llm_proxy.combine_summaries(
+            labelled, level='file', name=name, provider=self.provider, model=self.model))
+
+    def summarize_file(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            source_code = f.read()
+        key, summary = self.summarize_source(source_code, os.path.basename(path))
+        self.cache.save()
+        return {'name': os.path.basename(path), 'path': path, 'kind': 'file', 'key': key, 'summary': summary, 'children': []}
+
+    def build_tree(self, root):
+        """Build the package tree (without summaries) for all .py files under root."""
+        root = os.path.abspath(root)
+        def walk(directory):
+            children = []
+            try:
+                entries = sorted(os.listdir(directory))
+            except OSError:
+                return None
+            for entry in entries:
+                full = os.path.join(directory, entry)
+                if os.path.isdir(full):
+                    if entry.startswith('.') or entry in SKIP_DIRS:
+                        continue
+                    child = walk(full)
+                    if child:
+                        children.append(child)
+                elif entry.endswith('.py'):
+                    children.append({'name': entry, 'path': full, 'kind': 'file', 'children': []})
+            if not children:
+                return None
+            return {'name': os.path.basename(directory) or directory, 'path': directory, 'kind': 'package', 'children': children}
+        tree = walk(root) or {'name': os.path.basename(root), 'path': root, 'kind': 'package', 'children': []}
+        tree['kind'] = 'repository'
+        return tree
+
+    def summarize_tree(self, root):
+        """Summarize every file under root and reduce up to a repository summary."""
+        tree = self.build_tree(root)
+        files = []
+        def collect(node):
+            if node['kind'] == 'file':
+                files.append(node)
+            for child in node['children']:
+                collect(child)
+        collect(tree)
+
+        def summarize_node_file(node):
+            try:
+                with open(node['path'], 'r', encoding='utf-8') as f:
+                    source_code = f.read()
+            except Exception as e:
+                node['key'] = content_hash('error', node['path'])
+                node['summary'] = f"Error: Could not read file - {e}"
+                return
+            node['key'], node['summary'] = self.summarize_source(source_code, node['name'], symbol_pool)
+
+        # Separate pools for files and symbols so nested submissions cannot deadlock.
+        with OutputThreadPoolExecutor(max_workers=self.max_workers) as symbol_pool:
+            with OutputThreadPoolExecutor(max_workers=self.max_workers) as file_pool:
+                list(file_pool.map(summarize_node_file, files))
+
+        def reduce(node):
+            if node['kind'] == 'file':
+                return
+            for child in node['children']:
+                reduce(child)
+            node['key'] = content_hash(node['kind'], *[f"{c['name']}:{c['key']}" for c in node['children']])
+            labelled = [f"{c['kind']} {c['name']}: {c['summary']}" for c in node['children']]
+            if not labelled:
+                node['summary'] = "No Python files found."
+                return
+            if len(labelled) == 1:
+                node['summary'] = node['children'][0]['summary']
+                return
+            node['summary'] = self._cached(node['key'], lambda: self.llm_proxy.combine_summaries(
+                labelled, level=node['kind'], name=node['name'], provider=self.provider, model=self.model))
+        reduce(tree)
+        self.cache.save()
+        return tree
+
+def render_summary_tree(tree, indent=0):
+    """Render a summary tree as indented text, root first."""
+    pad = '  ' * indent
+    lines = [f"{pad}[{tree['kind']}] {tree['name']}: {tree.get('summary', '')}"]
+    for child in tree['children']:
+        lines.append(render_summary_tree(child, indent + 1))
+    return '\n'.join(lines)
@@ -0,0 +1,252 @@
+"""
+Persistent repository symbol index (SQLite under .theagent/).
+
+Stores modules, classes, functions and methods with their signatures and docstring
+presence, plus imports and call edges. Files are parsed in a process pool on the first
+build; later updates only stat files and re-parse those whose mtime/size changed and
+whose content hash actually differs, so re-indexing a large repository is cheap.
+"""
+import ast
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .cache import content_hash, get_cache_dir, CACHE_DIR
+from .discovery import iter_python_files
+
+INDEX_FILE = "index.db"
+SCHEMA_VERSION = 1
+PROCESS_POOL_THRESHOLD = 32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, module TEXT, mtime REAL, size INTEGER, hash TEXT, error TEXT);
+CREATE TABLE IF NOT EXISTS symbols (
+    file TEXT, name TEXT, qualname TEXT, kind TEXT, line INTEGER, end_line INTEGER,
+    signature TEXT, has_docstring INTEGER);
+CREATE TABLE IF NOT EXISTS imports (file TEXT, module TEXT, name TEXT, alias TEXT, line INTEGER);
+CREATE TABLE IF NOT EXISTS calls (file TEXT, caller TEXT, callee TEXT, target TEXT, line INTEGER);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols(name);
+CREATE INDEX IF NOT EXISTS symbols_file ON symbols(file);
+CREATE INDEX IF NOT EXISTS imports_file ON imports(file);
+CREATE INDEX IF NOT EXISTS imports_module ON imports(module);
+CREATE INDEX IF NOT EXISTS calls_file ON calls(file);
+CREATE INDEX IF NOT EXISTS calls_callee ON calls(callee);
+"""
+
+def module_name(rel_path):
+    """Dotted module name for a repository-relative path ('src/' layout prefix dropped)."""
+    parts = rel_path[:-3].split('/') if rel_path.endswith('.py') else rel_path.split('/')
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    if len(parts) > 1 and parts[0] == 'src':
+        parts = parts[1:]
+    return '.'.join(parts)
+
+def _signature(node):
+    if isinstance(node, ast.ClassDef):
+        bases = ', '.join(ast.unparse(b) for b in node.bases + node.keywords)
+        return f"class {node.name}({bases})" if bases else f"class {node.name}"
+    prefix = 'async def' if isinstance(node, ast.AsyncFunctionDef) else 'def'
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ''
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+def extract_index_entries(source_code):
+    """Symbols, imports and call edges of one module as plain tuples (picklable)."""
+    tree = ast.parse(source_code)
+    symbols, imports, calls = [], [], []
+
+    def visit(node, parent, kind_of_parent):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                qualname = f"{parent}.{child.name}" if parent else child.name
+                if isinstance(child, ast.ClassDef):
+                    kind = 'class'
+                else:
+                    kind = 'method' if kind_of_parent == 'class' else 'function'
+                start = child.decorator_list[0].lineno if child.decorator_list else child.lineno
+                symbols.append((child.name, qualname, kind, start, child.end_lineno,
+                                _signature(child), int(ast.get_docstring(child) is not None)))
+                visit(child, qualname, kind)
+            elif isinstance(child, ast.Call):
+                func = child.func
+                if isinstance(func, ast.Name):
+                    calls.append((parent or '<module>', func.id, func.id, child.lineno))
+                elif isinstance(func, ast.Attribute):
+                    calls.append((parent or '<module>', func.attr, ast.unparse(func)[:200], child.lineno))
+                visit(child, parent, kind_of_parent)
+            else:
+                if isinstance(child, ast.Import):
+                    for alias in child.names:
+                        imports.append((alias.name, None, alias.asname, child.lineno))
+                elif isinstance(child, ast.ImportFrom):
+                    module = '.' * child.level + (child.module or '')
+                    for alias in child.names:
+                        imports.append((module, alias.name, alias.asname, child.lineno))
+                visit(child, parent, kind_of_parent)
+
+    visit(tree, '', 'module')
+    return symbols, imports, calls
+
+def index_file(path, rel_path, known_hash=None):
+    """Read, hash and parse one file; runs in a worker process."""
+    result = {'path': rel_path, 'hash': None, 'error': None, 'unchanged': False,
+              'symbols': [], 'imports': [], 'calls': []}
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        result['error'] = str(e)
+        return result
+    result['hash'] = content_hash(data)
+    if known_hash is not None and result['hash'] == known_hash:
+        result['unchanged'] = True
+        return result
+    try:
+        result['symbols'], result['imports'], result['calls'] = extract_index_entries(data.decode('utf-8'))
+    except (SyntaxError, ValueError, UnicodeDecodeError) as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+def _index_file_job(job):
+    return index_file(*job)
+
+class SymbolIndex:
+    """SQLite-backed index of the Python files under root."""
+    def __init__(self, root=None, path=None):
+        self.root = os.path.abspath(root or os.getcwd())
+        self.path = path or os.path.join(get_cache_dir(self.root), INDEX_FILE)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            for table in ('files', 'symbols', 'imports', 'calls'):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    @classmethod
+    def exists(cls, root=None):
+        return os.path.exists(os.path.join(os.path.abspath(root or os.getcwd()), CACHE_DIR, INDEX_FILE))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def _rel(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, '/')
+
+    def update(self, rebuild=False, processes=None):
+        """Bring the index up to date with the files on disk; returns counts and timing."""
+        start = time.time()
+        with self._lock:
+            if rebuild:
+                for table in ('files', 'symbols', 'imports', 'calls'):
+                    self.conn.execute(f"DELETE FROM {table}")
+            known = {row['path']: (row['mtime'], row['size'], row['hash'])
+                     for row in self.conn.execute("SELECT path, mtime, size, hash FROM files")}
+        seen, jobs, stats = set(), [], {}
+        for path in iter_python_files(self.root):
+            rel = self._rel(path)
+            seen.add(rel)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            previous = known.get(rel)
+            if previous and previous[0] == st.st_mtime and previous[1] == st.st_size:
+                continue
+            stats[rel] = (st.st_mtime, st.st_size)
+            jobs.append((path, rel, previous[2] if previous else None))
+        results = self._run_jobs(jobs, processes)
+        removed = set(known) - seen
+        parsed = 0
+        with self._lock, self.conn:
+            for rel in removed:
+                self._delete_file(rel)
+            for result in results:
+                rel = result['path']
+                mtime, size = stats[rel]
+                if result['unchanged']:
+                    self.conn.execute("UPDATE files SET mtime = ?, size = ? WHERE path = ?", (mtime, size, rel))
+                    continue
+                parsed += 1
+                self._delete_file(rel)
+                self.conn.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                                  (rel, module_name(rel), mtime, size, result['hash'], result['error']))
+                self.conn.executemany("INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                      [(rel, *s) for s in result['symbols']])
+                self.conn.executemany("INSERT INTO imports VALUES (?, ?, ?, ?, ?)",
+                                      [(rel, *i) for i in result['imports']])
+                self.conn.executemany("INSERT INTO calls VALUES (?, ?, ?, ?, ?)",
+                                      [(rel, *c) for c in result['calls']])
+        return {'files': len(seen), 'checked': len(jobs), 'parsed': parsed, 'removed': len(removed),
+                'seconds': time.time() - start}
+
+    def _run_jobs(self, jobs, processes=None):
+        if len(jobs) > PROCESS_POOL_THRESHOLD:
+            try:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    return list(pool.map(_index_file_job, jobs, chunksize=64))
+            except (OSError, NotImplementedError) as e:
+                print(f"[WARN] Process pool unavailable ({e}); indexing in-process")
+        return [index_file(*job) for job in jobs]
+
+    def _delete_file(self, rel):
+        for table, column in (('files', 'path'), ('symbols', 'file'), ('imports', 'file'), ('calls', 'file')):
+            self.conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (rel,))
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def find_symbols(self, query, kind=None, limit=20):
+        """Symbols named query (exact matches first, then substring matches on the qualified name)."""
+        kind_sql = " AND kind = ?" if kind else ""
+        kind_args = (kind,) if kind else ()
+        exact = self._query(f"SELECT * FROM symbols WHERE name = ?{kind_sql} ORDER BY file, line LIMIT ?",
+                            (query, *kind_args, limit))
+        if len(exact) >= limit:
+            return exact
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        fuzzy = self._query(f"SELECT * FROM symbols WHERE qualname LIKE ? ESCAPE '\\' AND name != ?{kind_sql} "
+                            f"ORDER BY length(qualname), file, line LIMIT ?", (pattern, query, *kind_args, limit - len(exact)))
+        return exact + fuzzy
+
+    def file_symbols(self, path):
+        return self._query("SELECT * FROM symbols WHERE file = ? ORDER BY line", (self._rel(path),))
+
+    def file_imports(self, path):
+        return self._query("SELECT * FROM imports WHERE file = ? ORDER BY line", (self._rel(path),))
+
+    def callers(self, name, limit=50):
+        """Call sites whose callee name is name."""
+        return self._query("SELECT * FROM calls WHERE callee = ? ORDER BY file, line LIMIT ?", (name, limit))
+
+    def importers(self, module, limit=50):
+        """Files importing module (or one of its submodules)."""
+        return self._query("SELECT DISTINCT file FROM imports WHERE module = ? OR module LIKE ? ORDER BY file LIMIT ?",
+                           (module, module + '.%', limit))
+
+    def undocumented(self, limit=50):
+        return self._query("SELECT * FROM symbols WHERE has_docstring = 0 AND name NOT LIKE '\\_%' ESCAPE '\\' "
+                           "ORDER BY file, line LIMIT ?", (limit,))
+
+    def files(self):
+        return [row['path'] for row in self._query("SELECT path FROM files ORDER BY path")]
+
+    def stats(self):
+        counts = {}
+        for table in ('files', 'symbols', 'imports', 'calls'):
+            counts[table] = self._query(f"SELECT COUNT(*) AS n FROM {table}")[0]['n']
+        return counts
+
+def format_symbols(symbols):
+    if not symbols:
+        return "No matching symbols."
+    return '\n'.join(f"{s['file']}:{s['line']} {s['kind']} {s['qualname']}: {s['signature']}"
+                     + ('' if s['has_docstring'] else ' (no docstring)') for s in symbols)
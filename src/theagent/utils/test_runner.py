@@ -0,0 +1,162 @@
+"""
+Run generated pytest tests in isolated subprocess workers.
+
+Every test id runs in its own pytest subprocess with a timeout, CPU and memory
+limits (POSIX), a throwaway working directory and no pytest cache. All runs in the process
+share one pool of slots sized to the CPU count, so validating many files at once scales
+with cores without oversubscribing the machine.
+"""
+import ast
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from .console import OutputThreadPoolExecutor
+
+DEFAULT_TEST_TIMEOUT = 30
+DEFAULT_MEMORY_LIMIT_MB = 1024
+_SLOTS = threading.BoundedSemaphore(os.cpu_count() or 2)
+
+def collect_test_ids(test_source):
+    """Return pytest node ids (relative to the file) for the tests defined in test_source."""
+    try:
+        tree = ast.parse(test_source)
+    except SyntaxError:
+        return []
+    ids = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith('test'):
+            ids.append(node.name)
+        elif isinstance(node, ast.ClassDef) and node.name.startswith('Test'):
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) and child.name.startswith('test'):
+                    ids.append(f"{node.name}::{child.name}")
+    return ids
+
+# Applies the resource limits inside the child before pytest starts (avoids preexec_fn in threads).
+_BOOTSTRAP = (
+    "import sys\n"
+    "try:\n"
+    "    import resource\n"
+    "    memory_mb, cpu_seconds = int(sys.argv[1]), int(sys.argv[2])\n"
+    "    if memory_mb:\n"
+    "        resource.setrlimit(resource.RLIMIT_AS, (memory_mb << 20, memory_mb << 20))\n"
+    "    if cpu_seconds:\n"
+    "        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))\n"
+    "except (ImportError, ValueError, OSError):\n"
+    "    pass\n"
+    "import pytest\n"
+    "sys.exit(pytest.main(sys.argv[3:]))\n"
+)
+
+def run_single_test(test_file, test_id, timeout=DEFAULT_TEST_TIMEOUT, memory_mb=DEFAULT_MEMORY_LIMIT_MB, source_dir=None):
+    """Run one test id in an isolated subprocess; returns a result dict."""
+    test_file = os.path.abspath(test_file)
+    env = dict(os.environ)
+    paths = [p for p in (source_dir, os.path.dirname(test_file), env.get('PYTHONPATH')) if p]
+    env['PYTHONPATH'] = os.pathsep.join(paths)
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    cmd = [sys.executable, '-c', _BOOTSTRAP, str(memory_mb or 0), str(int(timeout) + 1),
+           '-q', '--no-header', '-p', 'no:cacheprovider',
+           '--rootdir', os.path.dirname(test_file), f"{test_file}::{test_id}"]
+    start = time.time()
+    with _SLOTS, tempfile.TemporaryDirectory(prefix='theagent-test-') as workdir:
+        popen_kwargs = {'start_new_session': True} if os.name == 'posix' else {}
+        proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, **popen_kwargs)
+        try:
+            output, _ = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            if os.name == 'posix':
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+            output, _ = proc.communicate()
+            return {'test': test_id, 'file': test_file, 'status': 'error', 'duration': time.time() - start,
+                    'output': f"Timed out after {timeout}s\n{output or ''}"}
+    if proc.returncode == 0:
+        status = 'passed'
+    elif proc.returncode == 1:
+        status = 'failed'
+    else:
+        status = 'error'
+    return {'test': test_id, 'file': test_file, 'status': status, 'duration': time.time() - start, 'output': output}
+
+def run_tests_parallel(test_files, timeout=DEFAULT_TEST_TIMEOUT, memory_mb=DEFAULT_MEMORY_LIMIT_MB, source_dirs=None, workers=None, only=None):
+    """Run every test in test_files concurrently; source_dirs maps test file -> import root.
+
+    If only is given, just the test ids in it are run.
+    """
+    jobs = []
+    for test_file in test_files:
+        with open(test_file, 'r', encoding='utf-8') as f:
+            ids = collect_test_ids(f.read())
+        if only is not None:
+            ids = [test_id for test_id in ids if test_id in only]
+        source_dir = (source_dirs or {}).get(test_file)
+        if not ids and only is None:
+            jobs.append((test_file, None, source_dir))
+        jobs.extend((test_file, test_id, source_dir) for test_id in ids)
+    def run(job):
+        test_file, test_id, source_dir = job
+        if test_id is None:
+            return {'test': '<module>', 'file': os.path.abspath(test_file), 'status': 'error', 'duration': 0.0,
+                    'output': 'No tests found (or the file does not parse)'}
+        return run_single_test(test_file, test_id, timeout=timeout, memory_mb=memory_mb, source_dir=source_dir)
+    with OutputThreadPoolExecutor(max_workers=workers or os.cpu_count() or 2) as pool:
+        return list(pool.map(run, jobs))
+
+def format_test_results(results):
+    counts = {'passed': 0, 'failed': 0, 'error': 0}
+    lines = []
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+        lines.append(f"  {result['status'].upper():7} {result['test']} ({result['duration']:.2f}s)")
+    header = f"{counts['passed']} passed, {counts['failed']} failed, {counts['error']} error"
+    return header + ('\n' + '\n'.join(lines) if lines else '')
+
+def extract_definitions(source_code, names):
+    """Return the source of the top-level definitions for the given test ids."""
+    tree = ast.parse(source_code)
+    wanted = {name.split('::')[0] for name in names}
+    lines = source_code.split('\n')
+    out = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.name in wanted:
+            start = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+            out.append('\n'.join(lines[start - 1:node.end_lineno]))
+    return '\n\n\n'.join(out)
+
+def replace_definitions(source_code, new_code):
+    """Replace top-level definitions in source_code with same-named ones from new_code.
+
+    Imports in new_code are added if missing; definitions that do not exist yet are appended.
+    """
+    new_tree = ast.parse(new_code)
+    new_lines = new_code.split('\n')
+    replacements, imports = {}, []
+    for node in new_tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+            replacements[node.name] = '\n'.join(new_lines[start - 1:node.end_lineno])
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(ast.get_source_segment(new_code, node))
+    tree = ast.parse(source_code)
+    lines = source_code.split('\n')
+    spans = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.name in replacements:
+            start = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+            spans.append((start - 1, node.end_lineno, replacements.pop(node.name)))
+    for start, end, code in sorted(spans, reverse=True):
+        lines[start:end] = code.split('\n')
+    result = '\n'.join(lines).rstrip('\n')
+    missing_imports = [i for i in imports if i not in source_code]
+    if missing_imports:
+        result = '\n'.join(missing_imports) + '\n' + result
+    for code in replacements.values():
+        result += '\n\n\n' + code
+    return result + '\n'
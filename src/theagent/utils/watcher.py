@@ -0,0 +1,255 @@
+"""
+File watching for `theagent watch`: inotify on Linux (through ctypes), stat polling elsewhere.
+
+Bursts of events are debounced and coalesced per file. The last seen source of every watched
+file is kept, so a save is turned into the line ranges that actually changed (and from there
+into changed functions/classes), and files rewritten by the agents themselves are not
+picked up again as new changes.
+"""
+import ctypes
+import ctypes.util
+import difflib
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from .discovery import ALWAYS_SKIP
+
+DEFAULT_DEBOUNCE = 0.3
+DEFAULT_POLL_INTERVAL = 1.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct('iIII')
+
+def _walk(top, suffixes):
+    """(directories, files) under top, skipping tool and VCS directories."""
+    directories, files = [], []
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames[:] = [d for d in dirnames if d not in ALWAYS_SKIP]
+        directories.append(dirpath)
+        files.extend(os.path.join(dirpath, name) for name in filenames if name.endswith(suffixes))
+    return directories, files
+
+class InotifyWatcher:
+    """Recursive inotify watch on a directory tree (Linux only)."""
+    def __init__(self, root, suffixes=('.py',)):
+        self.root = os.path.abspath(root)
+        self.suffixes = suffixes
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self.dirs = {}
+        self._add_tree(self.root)
+
+    def _add_tree(self, top):
+        directories, files = _walk(top, self.suffixes)
+        for directory in directories:
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(err, f"inotify_add_watch failed for {directory}: {os.strerror(err)}")
+            self.dirs[wd] = directory
+        return files
+
+    def _drain(self):
+        data = b''
+        while True:
+            try:
+                chunk = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return data
+            if not chunk:
+                return data
+            data += chunk
+
+    def read(self, timeout):
+        """Paths touched within timeout seconds (an empty set if nothing happened)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        data, offset, paths = self._drain(), 0, set()
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: report everything and let the content check sort it out.
+                paths.update(_walk(self.root, self.suffixes)[1])
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and os.path.basename(path) not in ALWAYS_SKIP:
+                    # Files may already exist in a new directory before its watch is added.
+                    paths.update(self._add_tree(path))
+                continue
+            if path.endswith(self.suffixes):
+                paths.add(path)
+        return paths
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher:
+    """Portable fallback that compares (mtime, size) snapshots of the tree."""
+    def __init__(self, root, suffixes=('.py',), interval=DEFAULT_POLL_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.suffixes = suffixes
+        self.interval = interval
+        self.state = self._scan()
+
+    def _scan(self):
+        state = {}
+        for path in _walk(self.root, self.suffixes)[1]:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            state[path] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def read(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            state = self._scan()
+            changed = {path for path in state.keys() | self.state.keys() if state.get(path) != self.state.get(path)}
+            self.state = state
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+def create_watcher(root, suffixes=('.py',), poll=False, interval=DEFAULT_POLL_INTERVAL):
+    """inotify watcher on Linux, polling watcher otherwise (or when poll=True or inotify fails)."""
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root, suffixes)
+        except (OSError, AttributeError) as e:
+            print(f"[WARN] inotify unavailable ({e}); falling back to polling")
+    return PollingWatcher(root, suffixes, interval)
+
+def wait_for_changes(watcher, debounce=DEFAULT_DEBOUNCE, idle_timeout=1.0):
+    """Block until something changes, then until no event arrives for `debounce` seconds.
+
+    Returns the coalesced set of touched paths, so a burst of saves (or an editor's
+    write-rename-chmod sequence) produces one run per file.
+    """
+    paths = set()
+    while not paths:
+        paths = watcher.read(idle_timeout)
+    while True:
+        more = watcher.read(debounce)
+        if not more:
+            return paths
+        paths |= more
+
+def changed_line_ranges(old, new):
+    """New-side (start, end) line ranges that differ between two versions of a file.
+
+    A pure deletion touches the lines on either side of it, as in git_changes; a file
+    without a previous version counts as changed throughout.
+    """
+    new_lines = new.splitlines()
+    if old is None:
+        return [(1, max(len(new_lines), 1))]
+    ranges = []
+    matcher = difflib.SequenceMatcher(None, old.splitlines(), new_lines, autojunk=False)
+    for tag, _, _, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        ranges.append((j1 + 1, j2) if j2 > j1 else (max(j1, 1), j1 + 1))
+    return ranges
+
+def _read(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+class WatchSession:
+    """Last seen source of each watched file, used to work out what a save really changed."""
+    def __init__(self, files=()):
+        self.sources = {}
+        self.remember(files)
+
+    def remember(self, paths):
+        """Record the current content of paths (e.g. after the agents rewrote them)."""
+        for path in paths:
+            source = _read(path)
+            if source is None:
+                self.sources.pop(os.path.realpath(path), None)
+            else:
+                self.sources[os.path.realpath(path)] = source
+
+    def changes(self, paths):
+        """{realpath: ranges} for paths whose content differs from the last seen version.
+
+        Deleted or unreadable files are dropped; saves that leave the content unchanged
+        (touch, editor autosave, our own rewrites) produce no entry.
+        """
+        changed = {}
+        for path in paths:
+            key = os.path.realpath(path)
+            source = _read(path)
+            if source is None:
+                self.sources.pop(key, None)
+                continue
+            previous = self.sources.get(key)
+            if source != previous:
+                changed[key] = changed_line_ranges(previous, source)
+        return changed
+
+    def ranges_since(self, path):
+        """Ranges changed between the last remembered version of path and what is on disk now."""
+        source = _read(path)
+        if source is None:
+            return []
+        return changed_line_ranges(self.sources.get(os.path.realpath(path)), source)
+
+def agent_outputs(paths, since):
+    """Files the agents may have written for paths since `since`: the files themselves and `<stem>_*.py` siblings."""
+    outputs = set()
+    for path in paths:
+        directory = os.path.dirname(path) or '.'
+        stem = os.path.splitext(os.path.basename(path))[0] + '_'
+        outputs.add(path)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            candidate = os.path.join(directory, name)
+            if name.startswith(stem) and name.endswith('.py'):
+                try:
+                    if os.path.getmtime(candidate) >= since:
+                        outputs.add(candidate)
+                except OSError:
+                    continue
+    return outputs
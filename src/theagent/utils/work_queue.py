@@ -0,0 +1,405 @@
+"""
+Pull-based work queue for multi-node runs: a coordinator enqueues files, `theagent worker`
+processes lease them one at a time.
+
+A lease expires unless the worker renews it with heartbeats, so units held by a crashed or
+stalled worker go back to the queue; failed units are retried up to a fixed number of
+attempts. Two backends share one interface: SQLite (one host, many processes) and a
+Redis-compatible server (many hosts). LocalRedis is an in-process stand-in for the subset
+of Redis commands used here.
+"""
+import contextlib
+import copy
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from .batch import process_file
+
+DEFAULT_LEASE = 60.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL = 1.0
+
+def _unit_record(unit_id, payload, priority):
+    return {'id': unit_id, 'payload': payload, 'priority': priority, 'status': 'pending', 'attempts': 0,
+            'owner': None, 'expires': None, 'result': None, 'worker': None, 'finished': None}
+
+class SQLiteQueue:
+    """Queue in a SQLite database; safe for many worker processes on one host."""
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection per process; other processes coordinate through SQLite's own locking.
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.RLock()
+        with self._transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS units (id TEXT PRIMARY KEY, payload TEXT, priority REAL, "
+                       "status TEXT, attempts INTEGER, owner TEXT, expires REAL, result TEXT, worker TEXT, finished REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS units_status ON units (status, priority)")
+            db.execute("CREATE TABLE IF NOT EXISTS workers (name TEXT PRIMARY KEY, processed INTEGER, failed INTEGER, "
+                       "busy REAL, first_seen REAL, last_seen REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers never lease the same unit.
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def set_meta(self, key, value):
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    def get_meta(self, key):
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def reset(self):
+        """Drop all units and worker statistics (a new job)."""
+        with self._transaction() as db:
+            db.execute("DELETE FROM units")
+            db.execute("DELETE FROM workers")
+
+    def enqueue(self, units):
+        """Add (id, payload, priority) units; ids already queued (e.g. done in a resumed job) are kept as they are."""
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO units VALUES (?, ?, ?, 'pending', 0, NULL, NULL, NULL, NULL, NULL)",
+                           [(unit_id, json.dumps(payload), priority) for unit_id, payload, priority in units])
+            return db.total_changes - before
+
+    def lease(self, worker, lease_seconds=DEFAULT_LEASE):
+        """Take the highest-priority pending unit (or one whose lease expired); None if there is none."""
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("UPDATE units SET status = 'failed', owner = NULL, "
+                       "result = json_object('status', 'error', 'error', 'lease expired too many times') "
+                       "WHERE status = 'leased' AND expires < ? AND attempts >= ?", (now, self.max_attempts))
+            row = db.execute("SELECT id, payload, attempts FROM units WHERE status = 'pending' "
+                             "OR (status = 'leased' AND expires < ?) ORDER BY priority DESC LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE units SET status = 'leased', owner = ?, expires = ?, attempts = attempts + 1 WHERE id = ?",
+                       (worker, now + lease_seconds, row[0]))
+        return {'id': row[0], 'payload': json.loads(row[1]), 'attempts': row[2] + 1}
+
+    def heartbeat(self, unit_id, worker, lease_seconds=DEFAULT_LEASE):
+        """Extend a lease; False if it already expired or the unit is no longer leased to worker."""
+        with self._transaction() as db:
+            now = time.time()
+            cursor = db.execute("UPDATE units SET expires = ? WHERE id = ? AND owner = ? AND status = 'leased' AND expires >= ?",
+                                (now + lease_seconds, unit_id, worker, now))
+            return cursor.rowcount == 1
+
+    def complete(self, unit_id, worker, result, ok=True, busy=0.0):
+        """Record a finished unit; a failed one goes back to the queue until it runs out of attempts."""
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT attempts FROM units WHERE id = ? AND owner = ? AND status = 'leased'",
+                             (unit_id, worker)).fetchone()
+            if row is None:
+                return False
+            if ok or row[0] >= self.max_attempts:
+                status = 'done' if ok else 'failed'
+                db.execute("UPDATE units SET status = ?, owner = NULL, result = ?, worker = ?, finished = ? WHERE id = ?",
+                           (status, json.dumps(result, default=str), worker, now, unit_id))
+            else:
+                db.execute("UPDATE units SET status = 'pending', owner = NULL, expires = NULL WHERE id = ?", (unit_id,))
+            db.execute("INSERT OR IGNORE INTO workers VALUES (?, 0, 0, 0, ?, ?)", (worker, now - busy, now))
+            db.execute("UPDATE workers SET processed = processed + ?, failed = failed + ?, busy = busy + ?, last_seen = ? "
+                       "WHERE name = ?", (1 if ok else 0, 0 if ok else 1, busy, now, worker))
+        return True
+
+    def counts(self):
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        for status, count in self._query("SELECT status, COUNT(*) FROM units GROUP BY status"):
+            counts[status] = count
+        return counts
+
+    def workers(self):
+        return [dict(zip(('name', 'processed', 'failed', 'busy', 'first_seen', 'last_seen'), row))
+                for row in self._query("SELECT * FROM workers ORDER BY name")]
+
+    def results(self):
+        """{unit id: result} of finished (done or failed) units."""
+        return {unit_id: json.loads(result) for unit_id, result in
+                self._query("SELECT id, result FROM units WHERE result IS NOT NULL")}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class LocalRedis:
+    """In-process stand-in for the Redis commands RedisQueue uses (hashes and sorted sets)."""
+    def __init__(self):
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def hset(self, name, key, value):
+        with self._lock:
+            self.data.setdefault(name, {})[key] = str(value)
+
+    def hget(self, name, key):
+        with self._lock:
+            return self.data.get(name, {}).get(key)
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self.data.get(name, {}))
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self.data.pop(name, None) is not None for name in names)
+
+    def zadd(self, name, mapping, xx=False):
+        with self._lock:
+            zset = self.data.setdefault(name, {})
+            added = 0
+            for member, score in mapping.items():
+                if xx and member not in zset:
+                    continue
+                added += member not in zset
+                zset[member] = float(score)
+            return added
+
+    def zrem(self, name, *members):
+        with self._lock:
+            zset = self.data.get(name, {})
+            return sum(zset.pop(member, None) is not None for member in members)
+
+    def zpopmax(self, name, count=1):
+        with self._lock:
+            zset = self.data.get(name, {})
+            popped = sorted(zset.items(), key=lambda item: item[1], reverse=True)[:count]
+            for member, _ in popped:
+                del zset[member]
+            return popped
+
+    def zrangebyscore(self, name, min, max):
+        low = float('-inf') if min == '-inf' else float(min)
+        high = float('inf') if max == '+inf' else float(max)
+        with self._lock:
+            return [m for m, s in sorted(self.data.get(name, {}).items(), key=lambda item: item[1]) if low <= s <= high]
+
+    def zscore(self, name, member):
+        with self._lock:
+            return self.data.get(name, {}).get(member)
+
+class RedisQueue:
+    """Queue on a Redis-compatible server (or LocalRedis), for workers spread over several hosts.
+
+    Units are JSON records in one hash; pending ids sit in a sorted set by priority and leased
+    ids in a sorted set by lease expiry. ZPOPMAX and ZREM decide races between workers: only the
+    caller that actually removed an id from a set acts on it.
+    """
+    def __init__(self, client, name='theagent', max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.units_key = f"{name}:units"
+        self.pending_key = f"{name}:pending"
+        self.leases_key = f"{name}:leases"
+        self.workers_key = f"{name}:workers"
+        self.meta_key = f"{name}:meta"
+
+    def _get(self, unit_id):
+        raw = self.client.hget(self.units_key, unit_id)
+        return json.loads(raw) if raw else None
+
+    def _put(self, record):
+        self.client.hset(self.units_key, record['id'], json.dumps(record, default=str))
+
+    def set_meta(self, key, value):
+        self.client.hset(self.meta_key, key, json.dumps(value))
+
+    def get_meta(self, key):
+        raw = self.client.hget(self.meta_key, key)
+        return json.loads(raw) if raw else None
+
+    def reset(self):
+        self.client.delete(self.units_key, self.pending_key, self.leases_key, self.workers_key)
+
+    def enqueue(self, units):
+        added = 0
+        for unit_id, payload, priority in units:
+            if self.client.hget(self.units_key, unit_id) is None:
+                self._put(_unit_record(unit_id, payload, priority))
+                self.client.zadd(self.pending_key, {unit_id: priority})
+                added += 1
+        return added
+
+    def _requeue_expired(self, now):
+        for unit_id in self.client.zrangebyscore(self.leases_key, '-inf', now):
+            if not self.client.zrem(self.leases_key, unit_id):
+                continue
+            record = self._get(unit_id)
+            if record['attempts'] >= self.max_attempts:
+                record.update(status='failed', owner=None,
+                              result={'status': 'error', 'error': 'lease expired too many times'})
+            else:
+                record.update(status='pending', owner=None)
+                self.client.zadd(self.pending_key, {unit_id: record['priority']})
+            self._put(record)
+
+    def lease(self, worker, lease_seconds=DEFAULT_LEASE):
+        now = time.time()
+        self._requeue_expired(now)
+        popped = self.client.zpopmax(self.pending_key)
+        if not popped:
+            return None
+        unit_id = popped[0][0]
+        record = self._get(unit_id)
+        record.update(status='leased', owner=worker, expires=now + lease_seconds, attempts=record['attempts'] + 1)
+        self._put(record)
+        self.client.zadd(self.leases_key, {unit_id: record['expires']})
+        return {'id': unit_id, 'payload': record['payload'], 'attempts': record['attempts']}
+
+    def heartbeat(self, unit_id, worker, lease_seconds=DEFAULT_LEASE):
+        record = self._get(unit_id)
+        if record is None or record['owner'] != worker or record['status'] != 'leased':
+            return False
+        now = time.time()
+        current = self.client.zscore(self.leases_key, unit_id)
+        if current is None or current < now:
+            # Expired, and possibly already handed to another worker.
+            return False
+        expires = now + lease_seconds
+        self.client.zadd(self.leases_key, {unit_id: expires}, xx=True)
+        record['expires'] = expires
+        self._put(record)
+        return True
+
+    def complete(self, unit_id, worker, result, ok=True, busy=0.0):
+        record = self._get(unit_id)
+        if record is None or record['owner'] != worker or record['status'] != 'leased':
+            return False
+        if not self.client.zrem(self.leases_key, unit_id):
+            return False
+        now = time.time()
+        if ok or record['attempts'] >= self.max_attempts:
+            record.update(status='done' if ok else 'failed', owner=None, result=result, worker=worker, finished=now)
+        else:
+            record.update(status='pending', owner=None, expires=None)
+            self.client.zadd(self.pending_key, {unit_id: record['priority']})
+        self._put(record)
+        stats = self.get_worker(worker) or {'name': worker, 'processed': 0, 'failed': 0, 'busy': 0.0, 'first_seen': now - busy}
+        stats['processed' if ok else 'failed'] += 1
+        stats.update(busy=stats['busy'] + busy, last_seen=now)
+        self.client.hset(self.workers_key, worker, json.dumps(stats))
+        return True
+
+    def get_worker(self, worker):
+        raw = self.client.hget(self.workers_key, worker)
+        return json.loads(raw) if raw else None
+
+    def counts(self):
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        for raw in self.client.hgetall(self.units_key).values():
+            counts[json.loads(raw)['status']] += 1
+        return counts
+
+    def workers(self):
+        return sorted((json.loads(raw) for raw in self.client.hgetall(self.workers_key).values()), key=lambda w: w['name'])
+
+    def results(self):
+        records = (json.loads(raw) for raw in self.client.hgetall(self.units_key).values())
+        return {r['id']: r['result'] for r in records if r['result'] is not None}
+
+    def close(self):
+        pass
+
+def open_queue(url, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Queue for a URL: redis://host:port/db, local:// (in-process, for tests) or a SQLite path / sqlite:///path."""
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        from .call_llm import ensure_package
+        ensure_package('redis')
+        import redis
+        return RedisQueue(redis.Redis.from_url(url, decode_responses=True), max_attempts=max_attempts)
+    if url.startswith('local://'):
+        return RedisQueue(LocalRedis(), max_attempts=max_attempts)
+    path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+    return SQLiteQueue(path, max_attempts=max_attempts)
+
+def default_worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def throughput(stats, now=None):
+    """Units per minute a worker has finished since it first reported."""
+    elapsed = max((now or stats['last_seen']) - stats['first_seen'], 1e-9)
+    return 60.0 * (stats['processed'] + stats['failed']) / elapsed
+
+def format_queue_status(queue, now=None):
+    counts = queue.counts()
+    total = sum(counts.values())
+    lines = [f"{counts['done'] + counts['failed']}/{total} unit(s) finished: {counts['done']} done, "
+             f"{counts['failed']} failed, {counts['leased']} in progress, {counts['pending']} pending"]
+    for stats in queue.workers():
+        lines.append(f"  {stats['name']}: {stats['processed']} done, {stats['failed']} failed, "
+                     f"{throughput(stats, now):.1f}/min, busy {stats['busy']:.1f}s")
+    return '\n'.join(lines)
+
+class _Heartbeat(threading.Thread):
+    """Renews a lease every third of its length until stopped."""
+    def __init__(self, queue, unit_id, worker, lease_seconds):
+        super().__init__(daemon=True)
+        self.queue, self.unit_id, self.worker, self.lease_seconds = queue, unit_id, worker, lease_seconds
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(self.unit_id, self.worker, self.lease_seconds):
+                self.lost = True
+                return
+
+def run_worker(queue, args, flow_factory, name=None, lease_seconds=DEFAULT_LEASE, poll=DEFAULT_POLL,
+               exit_when_idle=False, should_stop=None):
+    """Lease and process units until stopped (or, with exit_when_idle, until the queue is drained).
+
+    Each unit is a file relative to the working directory, with the changed line ranges to limit
+    the agent to under --since/--staged. Returns the number of units this worker finished.
+    """
+    name = name or default_worker_name()
+    finished = 0
+    while not (should_stop and should_stop()):
+        unit = queue.lease(name, lease_seconds)
+        if unit is None:
+            counts = queue.counts()
+            if exit_when_idle and counts['pending'] == 0 and counts['leased'] == 0:
+                return finished
+            time.sleep(poll)
+            continue
+        payload = unit['payload']
+        unit_args = copy.copy(args)
+        ranges = payload.get('ranges')
+        unit_args.changed_lines = None if ranges is None else {os.path.realpath(payload['file']): [tuple(r) for r in ranges]}
+        heartbeat = _Heartbeat(queue, unit['id'], name, lease_seconds)
+        heartbeat.start()
+        try:
+            result = process_file(unit_args, payload['file'], flow_factory)
+        finally:
+            heartbeat.stopped.set()
+        if heartbeat.lost:
+            print(f"[WARN] Lease on {unit['id']} expired while it was processed; another worker has it now")
+            continue
+        # A file that does not parse is skipped; retrying it would not change that.
+        ok = result['status'] != 'error'
+        record = {k: result.get(k) for k in ('status', 'error', 'duration', 'output', 'result', 'code')}
+        if queue.complete(unit['id'], name, dict(record, attempts=unit['attempts']), ok=ok, busy=result['duration']):
+            finished += 1
+            retry = '' if ok or unit['attempts'] >= queue.max_attempts else ' (will retry)'
+            print(f"[INFO] {name}: {unit['id']} {result['status']} in {result['duration']:.1f}s{retry}")
+    return finished
@@ -0,0 +1,203 @@
+"""
+Tests for .gitignore-aware discovery and the directory/glob batch runner.
+"""
+import os
+import shutil
+import threading
+import time
+from theagent.utils.discovery import GitIgnore, discover_files, iter_python_files
+from theagent.utils.batch import InspectedFile, run_batch, inspect_file, inspect_files, format_batch_report
+from theagent.utils.console import OutputThreadPoolExecutor, capture_output
+from theagent.flow import create_agent_node, create_batch_agent_flow, AGENT_NODES
+from theagent.nodes import DocAgentNode, SummaryAgentNode, TestGenerationAgentNode
+
+
+def write(path, content=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def relative(files, root):
+    return sorted(os.path.relpath(f, str(root)).replace(os.sep, '/') for f in files)
+
+
+def make_tree(tmp_path):
+    os.makedirs(str(tmp_path / '.git'))
+    write(str(tmp_path / '.gitignore'), 'build/\n*_gen.py\n!keep_gen.py\n')
+    write(str(tmp_path / 'src' / 'a.py'), 'def a():\n    return 1\n')
+    write(str(tmp_path / 'src' / 'b_gen.py'), 'x = 1\n')
+    write(str(tmp_path / 'src' / 'keep_gen.py'), 'x = 2\n')
+    write(str(tmp_path / 'src' / 'notes.txt'), 'not python')
+    write(str(tmp_path / 'src' / 'sub' / '.gitignore'), 'local.py\n')
+    write(str(tmp_path / 'src' / 'sub' / 'local.py'), 'y = 1\n')
+    write(str(tmp_path / 'src' / 'sub' / 'c.py'), 'z = 1\n')
+    write(str(tmp_path / 'build' / 'out.py'), 'ignored = True\n')
+    write(str(tmp_path / '__pycache__' / 'd.py'), '')
+    return tmp_path
+
+
+def test_gitignore_rules():
+    rules = GitIgnore()
+    rules.add_pattern('*.log')
+    rules.add_pattern('/top.py')
+    rules.add_pattern('docs/**/gen')
+    rules.add_pattern('cache/')
+    rules.add_pattern('!important.log')
+    assert rules.is_ignored('a/b/x.log')
+    assert not rules.is_ignored('a/important.log')
+    assert rules.is_ignored('top.py')
+    assert not rules.is_ignored('pkg/top.py')
+    assert rules.is_ignored('docs/a/b/gen')
+    assert rules.is_ignored('cache', is_dir=True)
+    assert not rules.is_ignored('cache')
+
+
+def test_discovery_honours_gitignore(tmp_path):
+    root = make_tree(tmp_path)
+    files = relative(discover_files(str(root)), root)
+    assert files == ['src/a.py', 'src/keep_gen.py', 'src/sub/c.py']
+
+
+def test_discovery_from_subdirectory_uses_parent_gitignore(tmp_path):
+    root = make_tree(tmp_path)
+    files = relative(iter_python_files(str(root / 'src')), root)
+    assert 'src/b_gen.py' not in files
+    assert 'src/a.py' in files
+
+
+def test_discovery_glob_filter(tmp_path):
+    root = make_tree(tmp_path)
+    assert relative(discover_files(str(root), 'src/sub/*.py'), root) == ['src/sub/c.py']
+    assert relative(discover_files(str(root), 'keep_*.py'), root) == ['src/keep_gen.py']
+
+
+def test_inspect_files_reports_syntax_errors(tmp_path):
+    good, bad = str(tmp_path / 'good.py'), str(tmp_path / 'bad.py')
+    write(good, 'x = 1\n')
+    write(bad, 'def broken(:\n')
+    infos = {i['file']: i for i in inspect_files([good, bad])}
+    assert infos[good]['error'] is None and infos[good]['text'] == 'x = 1\n'
+    assert 'SyntaxError' in infos[bad]['error'] and infos[bad]['text'] is None
+
+
+def test_nodes_get_the_inspected_text_and_cached_summaries(mock_args, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    good, bad = str(tmp_path / 'good.py'), str(tmp_path / 'bad.py')
+    write(good, 'def f():\n    return 1\n')
+    write(bad, 'def broken(:\n')
+    mock_args.agent = 'summary'
+    proxy = SlowSummaryProxy()
+    flow_factory = lambda a: create_batch_agent_flow(a, proxy)
+    results = run_batch(mock_args, [good, bad], flow_factory, workers=2)
+    assert [r['status'] for r in results] == ['ok', 'skipped'] and 'SyntaxError' in results[1]['error']
+    assert results[0]['result'] == 'summary (22 chars)' and len(proxy.order) == 1
+
+    # The summary was cached, so the next run over the unchanged file makes no LLM call.
+    results = run_batch(mock_args, [good], flow_factory, workers=2)
+    assert results[0]['result'] == 'summary (22 chars)' and len(proxy.order) == 1
+
+    # Nodes read the inspected text instead of the file.
+    info = inspect_file(good)
+    node = DocAgentNode(mock_args, None)
+    mock_args.file, mock_args.prefetch = good, InspectedFile(dict(info, text='# inspected\n'))
+    assert node.read_source() == '# inspected\n'
+
+
+def test_capture_output_is_per_thread():
+    captured = {}
+
+    def worker(name):
+        with capture_output() as out:
+            for _ in range(20):
+                print(name)
+                time.sleep(0.001)
+        captured[name] = out.getvalue().split()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in ('a', 'b', 'c')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(captured[n] == [n] * 20 for n in ('a', 'b', 'c'))
+
+
+def test_pool_threads_print_to_the_callers_capture(mock_args, capsys):
+    class FailingProxy:
+        def generate_tests(self, code, **kwargs):
+            return 'Error: boom'
+
+    with capture_output() as out:
+        with OutputThreadPoolExecutor(max_workers=2) as pool:
+            pool.submit(lambda: pool.submit(print, 'nested').result()).result()
+        node = TestGenerationAgentNode(mock_args, FailingProxy())
+        node._generate_tests([{'name': 'f', 'code': 'def f(): pass'}, {'name': 'g', 'code': 'def g(): pass'}])
+    assert capsys.readouterr().out == ''
+    text = out.getvalue()
+    assert 'nested' in text and 'tests for f: Error: boom' in text and 'tests for g' in text
+
+
+class SlowSummaryProxy:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.order = []
+
+    def summarize_code(self, code, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.order.append(len(code))
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return f"summary ({len(code)} chars)"
+
+
+def test_run_batch_parallel_largest_first(tmp_path, mock_args, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    files = []
+    for i, size in enumerate([1, 5, 3, 2]):
+        path = str(tmp_path / f'm{i}.py')
+        write(path, 'x = 1\n' * size)
+        files.append(path)
+    bad = str(tmp_path / 'bad.py')
+    write(bad, 'def broken(:\n')
+    mock_args.agent = 'summary'
+    mock_args.output = 'console'
+    proxy = SlowSummaryProxy()
+    results = run_batch(mock_args, files + [bad], lambda a: create_batch_agent_flow(a, proxy), workers=1)
+    assert [r['file'] for r in results] == files + [bad]
+    assert [r['status'] for r in results] == ['ok'] * 4 + ['skipped']
+    assert proxy.order == sorted(proxy.order, reverse=True)
+    assert 'summary (30 chars)' in results[1]['output']
+
+    # Start from an empty summary cache so every file is summarized again.
+    shutil.rmtree(tmp_path / '.theagent')
+    proxy = SlowSummaryProxy()
+    run_batch(mock_args, files, lambda a: create_batch_agent_flow(a, proxy), workers=4)
+    assert proxy.peak > 1
+    report = format_batch_report(results, 1.0)
+    assert report.startswith('5 file(s): 4 ok, 0 error, 1 skipped')
+
+
+def test_run_batch_reports_agent_errors(tmp_path, mock_args, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / 'm.py')
+    write(path, 'x = 1\n')
+    mock_args.agent = 'summary'
+
+    class FailingProxy:
+        def summarize_code(self, code, **kwargs):
+            raise RuntimeError("rate limited")
+
+    results = run_batch(mock_args, [path], lambda a: create_batch_agent_flow(a, FailingProxy()), workers=2)
+    assert results[0]['status'] == 'error'
+    assert results[0]['error'].startswith('Error:')
+
+
+def test_create_agent_node(mock_args):
+    mock_args.agent = 'summary'
+    assert isinstance(create_agent_node(mock_args, None), SummaryAgentNode)
+    assert set(AGENT_NODES) == {'doc', 'summary', 'test', 'bug', 'refactor', 'type', 'migration'}
@@ -35,4 +35,33 @@ def test_general_llmproxy_ollama(monkeypatch):
     proxy = GeneralLLMProxy(ollama_host='dummy')
     monkeypatch.setattr(proxy.providers['ollama'], 'generate', lambda prompt, **kwargs: 'ollama-ok')
     result = proxy.call_llm('prompt', provider='ollama')
-    assert result == 'ollama-ok' 
\ No newline at end of file
+    assert result == 'ollama-ok'
+
+
+def test_response_cache_reuses_identical_calls(monkeypatch):
+    proxy = GeneralLLMProxy(openai_api_key='dummy', response_cache_size=2)
+    calls = []
+    def generate(prompt, **kwargs):
+        calls.append(prompt)
+        return 'Error: boom' if prompt == 'bad' else f'answer to {prompt}'
+    monkeypatch.setattr(proxy.providers['openai'], 'generate', generate)
+    assert proxy.call_llm('a', model='m') == 'answer to a'
+    assert proxy.call_llm('a', model='m') == 'answer to a'
+    assert proxy.call_llm('a', model='other') == 'answer to a'
+    assert calls == ['a', 'a']
+    proxy.call_llm('b', model='m')
+    proxy.call_llm('c', model='m')
+    proxy.call_llm('a', model='m')
+    assert calls[-1] == 'a'  # evicted as least recently used
+    proxy.call_llm('bad')
+    proxy.call_llm('bad')
+    assert calls.count('bad') == 2  # errors are never cached
+    assert proxy.cache_hits == 1
+
+def test_provider_client_is_created_once():
+    proxy = GeneralLLMProxy(openai_api_key='dummy')
+    provider = proxy.providers['openai']
+    created = []
+    provider._create_client = lambda: created.append(1) or object()
+    assert provider.client() is provider.client()
+    assert created == [1]
@@ -0,0 +1,78 @@
+"""
+Tests for single-round-trip chat answers: the intent call carries (and streams) the answer.
+"""
+from theagent import nodes
+from theagent.flow import create_chat_flow
+from theagent.utils.call_llm import GeneralLLMProxy
+
+
+GENERAL = ["```yaml\nintent: general_", "question\nconfidence: 0.9\nreasoning: asks about Python\n```\n",
+           "A decorator wraps ", "a function."]
+ACTION = ["```yaml\nintent: file_management\nconfidence: 0.95\nparameters:\n  operation: list\n```\n",
+          "should never be read"]
+
+
+class StreamingProxy:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = 0
+        self.read = []
+        self.closed = False
+
+    def chat_stream(self, prompt, provider=None, model=None):
+        self.calls += 1
+        try:
+            for chunk in self.chunks:
+                self.read.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            self.closed = True
+            raise
+
+
+def test_general_question_is_answered_in_the_intent_call(mock_args, capsys, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    proxy = StreamingProxy(GENERAL)
+    flow = create_chat_flow(mock_args, proxy)
+    shared = {'user_input': 'what does a decorator do in Python?', 'chat_history': []}
+    flow.run(shared)
+    assert proxy.calls == 1
+    assert shared['answer'] == 'A decorator wraps a function.'
+    assert shared['chat_history'][-1] == {'role': 'agent', 'content': 'A decorator wraps a function.'}
+    out = capsys.readouterr().out
+    assert out.count('TheAgent: A decorator wraps a function.') == 1
+
+
+def test_actionable_intent_closes_the_stream(mock_args):
+    proxy = StreamingProxy(ACTION)
+    node = nodes.IntentRecognitionNode(mock_args, proxy)
+    node.route = {'route': 'llm', 'intent': None, 'rule': None}
+    result = node.exec(('show the directory contents please', ''))
+    assert result['parameters']['operation'] == 'list'
+    assert proxy.read == ACTION[:1] and proxy.closed
+
+
+def test_prose_without_intent_block_becomes_the_answer(mock_args, capsys):
+    node = nodes.IntentRecognitionNode(mock_args, StreamingProxy(["Python is ", "a language."]))
+    node.route = {'route': 'llm', 'intent': None, 'rule': None}
+    result = node.exec(('what is Python?', ''))
+    assert result['intent'] == 'general_question' and result['answer'] == 'Python is a language.'
+    answer = nodes.AnswerNode(mock_args, None)
+    shared = {'intent_result': result, 'chat_history': []}
+    answer.run(shared)
+    assert 'TheAgent: Python is a language.' in capsys.readouterr().out
+
+
+def test_stream_llm_caches_only_complete_streams():
+    proxy = GeneralLLMProxy(response_cache_size=4)
+    calls = []
+    def generate_stream(prompt, **kwargs):
+        calls.append(prompt)
+        yield from ["one ", "two"]
+    proxy.providers['openai'].generate_stream = generate_stream
+    partial = proxy.chat_stream('hello')
+    next(partial)
+    partial.close()
+    assert ''.join(proxy.chat_stream('hello')) == 'one two'
+    assert ''.join(proxy.chat_stream('hello')) == 'one two'
+    assert len(calls) == 2 and proxy.cache_hits == 1
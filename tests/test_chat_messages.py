@@ -0,0 +1,72 @@
+"""
+Tests for native multi-turn chat: role mapping per provider and the message lists chat mode sends.
+"""
+from types import SimpleNamespace
+from theagent import nodes
+from theagent.providers.llm_base import split_messages
+from theagent.providers.openai_provider import OpenAIProvider
+from theagent.providers.anthropic_provider import AnthropicProvider
+from theagent.providers.google_provider import GoogleProvider
+
+MESSAGES = [
+    {'role': 'system', 'content': 'be brief'},
+    {'role': 'agent', 'content': 'earlier answer'},
+    {'role': 'user', 'content': 'read main.py'},
+    {'role': 'user', 'content': 'the one in src'},
+    {'role': 'agent', 'content': 'done', 'source': 'src/main.py'},
+    {'role': 'user', 'content': 'and now?'},
+]
+
+
+def test_role_mapping_per_provider():
+    system, turns = split_messages(MESSAGES)
+    assert system == 'be brief'
+    assert [t['role'] for t in turns] == ['user', 'assistant', 'user', 'assistant', 'user']
+    assert turns[2]['content'] == 'read main.py\n\nthe one in src'
+
+    assert OpenAIProvider.to_messages(MESSAGES)[0] == {'role': 'system', 'content': 'be brief'}
+    anthropic = AnthropicProvider.to_request(MESSAGES)
+    assert anthropic['system'] == 'be brief' and anthropic['messages'] == turns
+    google = GoogleProvider.to_request(MESSAGES)
+    assert google['config'] == {'system_instruction': 'be brief'}
+    assert [c['role'] for c in google['contents']] == ['user', 'model', 'user', 'model', 'user']
+    assert google['contents'][3]['parts'] == [{'text': 'done'}]
+
+
+def test_google_chat_sends_the_whole_conversation():
+    sent = {}
+    def generate_content(**kwargs):
+        sent.update(kwargs)
+        return SimpleNamespace(text=' ok ')
+    provider = GoogleProvider(api_key='x')
+    provider._client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+    assert provider.chat(MESSAGES) == 'ok'
+    assert len(sent['contents']) == 5 and sent['config']['system_instruction'] == 'be brief'
+
+
+class MessagesProxy:
+    def __init__(self):
+        self.requests = []
+
+    def chat_messages_stream(self, messages, provider=None, model=None):
+        self.requests.append(messages)
+        yield "```yaml\nintent: general_question\nconfidence: 0.9\n```\nAn answer."
+
+
+def test_chat_mode_sends_a_stable_message_prefix(mock_args, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    proxy = MessagesProxy()
+    node = nodes.IntentRecognitionNode(mock_args, proxy)
+    shared = {'chat_history': [], 'project_context': {'README.md': {'headline': 'A tool', 'symbols': []}}}
+    for question in ('what is a decorator?', 'and a closure?'):
+        shared['chat_history'].append({'role': 'user', 'content': question})
+        shared['user_input'] = question
+        node.run(shared)
+        shared['chat_history'].append({'role': 'agent', 'content': 'An answer.'})
+
+    first, second = proxy.requests
+    assert first[0]['role'] == 'system' and first[0]['content'].startswith(nodes.INTENT_SYSTEM_PROMPT)
+    assert '[README.md] A tool' in first[0]['content']
+    assert [m['role'] for m in second] == ['system', 'user', 'agent', 'user']
+    assert second[:2] == [first[0], {'role': 'user', 'content': 'what is a decorator?'}]
+    assert second[-1]['content'].startswith('User input: and a closure?')
@@ -0,0 +1,114 @@
+"""
+Tests for dependency-sliced test generation.
+"""
+import ast
+import re
+from theagent.utils.code_slicer import build_test_slices, merge_test_modules, function_signature
+from theagent.nodes import TestGenerationAgentNode
+
+
+MODULE = '''import os
+from typing import List
+
+RATE = 0.5
+
+def helper(x: int) -> int:
+    """Double a number."""
+    return x * 2
+
+def unrelated():
+    return os.getcwd()
+
+def compute(values: List[int]) -> int:
+    return sum(helper(v) for v in values) * RATE
+
+class Account:
+    """A bank account."""
+    def __init__(self, balance=0):
+        self.balance = balance
+
+    def deposit(self, amount):
+        self.balance += helper(amount)
+        return self.balance
+
+    def _audit(self):
+        pass
+'''
+
+
+def test_slices_contain_only_referenced_signatures():
+    slices = {s['name']: s for s in build_test_slices(MODULE, 'bank')}
+    assert set(slices) == {'helper', 'unrelated', 'compute', 'Account.__init__', 'Account.deposit'}
+    compute = slices['compute']['code']
+    assert 'from bank import compute' in compute
+    assert 'import os' in compute and 'from typing import List' in compute
+    assert 'def helper(x: int) -> int:' in compute
+    assert 'RATE = 0.5' in compute
+    assert 'return x * 2' not in compute
+    assert 'def unrelated' not in compute
+
+
+def test_method_slice_includes_class_signature():
+    deposit = {s['name']: s for s in build_test_slices(MODULE, 'bank')}['Account.deposit']['code']
+    assert 'from bank import Account' in deposit
+    assert 'class Account:' in deposit
+    assert 'def _audit(self):' in deposit
+    assert 'self.balance += helper(amount)' in deposit
+
+
+def test_function_signature_single_line_def():
+    source = 'def f(a, b): return a + b\n'
+    node = ast.parse(source).body[0]
+    assert function_signature(source, node) == 'def f(a, b):\n    ...'
+
+
+def test_merge_deduplicates_imports_and_names():
+    merged = merge_test_modules([
+        "```python\nimport pytest\nfrom bank import helper\n\ndef test_helper():\n    assert helper(1) == 2\n```",
+        "import pytest\nfrom bank import compute\n\ndef test_helper():\n    assert compute([1]) == 1.0\n",
+    ])
+    assert merged.count('import pytest') == 1
+    assert 'from bank import helper, compute' in merged
+    assert 'def test_helper():' in merged and 'def test_helper_2():' in merged
+    ast.parse(merged)
+
+
+def test_merge_keeps_each_piece_on_its_own_fixtures():
+    fixture = "@pytest.fixture\ndef data():\n    return {'k': %d}\n\n"
+    merged = merge_test_modules([
+        "import pytest\n\n" + fixture % 1 + "def test_f(data):\n    assert data['k'] == 1\n",
+        "import pytest\n\n" + fixture % 2 + "def test_g(data):\n    assert data['k'] == 2\n    assert obj.data(data=data)\n",
+        "import pytest\n\n" + fixture % 1 + "def test_h(data):\n    assert data['k'] == 1\n",
+    ])
+    namespace = {}
+    exec(merged.replace('@pytest.fixture\n', ''), namespace)
+    assert namespace['data']()['k'] == 1 and namespace['data_2']()['k'] == 2
+    assert 'def test_g(data_2):' in merged and 'obj.data(data=data_2)' in merged
+    # An identical fixture is dropped, not renamed.
+    assert merged.count("def data") == 2 and 'def test_h(data):' in merged
+    ast.parse(merged)
+
+
+def test_node_per_function_mode_runs_each_slice(mock_args, temp_py_file, cleanup_temp_files):
+    class Proxy:
+        def __init__(self):
+            self.prompts = []
+
+        def generate_tests(self, code, **kwargs):
+            self.prompts.append(code)
+            name = re.search(r'import with: from \S+ import (\w+)\)', code).group(1)
+            return f"import pytest\n\ndef test_{name.lower()}():\n    assert True\n"
+
+    file_path = temp_py_file(MODULE)
+    cleanup_temp_files(file_path)
+    mock_args.file = file_path
+    mock_args.test_mode = 'per-function'
+    proxy = Proxy()
+    node = TestGenerationAgentNode(mock_args, proxy)
+    slices = node.prep({})
+    tests = node.exec(slices)
+    assert len(proxy.prompts) == 5
+    assert tests.count('import pytest') == 1
+    # Account and Account.deposit produce the same test; the identical copy is dropped.
+    assert tests.count('def test_account():') == 1 and 'test_account_2' not in tests
+    ast.parse(tests)
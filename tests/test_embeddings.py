@@ -0,0 +1,135 @@
+"""
+Tests for the memory-mapped embedding index used for semantic code search.
+"""
+import os
+import time
+import pytest
+from theagent.utils.embeddings import EmbeddingIndex, StubEmbedder, INITIAL_CAPACITY
+from theagent.utils.retrieval import fuse_results
+from theagent import nodes
+
+np = pytest.importorskip("numpy")
+
+
+CONFIG_PY = '''def load_config(path):
+    """Read the TOML config file."""
+    return toml.load(path)
+
+
+def save_config(path, data):
+    with open(path, "w") as f:
+        toml.dump(data, f)
+'''
+
+NETWORK_PY = '''def fetch_page(url, retries=3):
+    for _ in range(retries):
+        response = http_get(url)
+        if response.ok:
+            return response.text
+'''
+
+
+def write(path, content, bump=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    if bump:
+        later = time.time() + bump
+        os.utime(path, (later, later))
+
+
+def make_index(tmp_path, embedder=None):
+    return EmbeddingIndex(embedder or StubEmbedder(64), root=str(tmp_path), directory=str(tmp_path / 'emb'))
+
+
+def make_chunks(n, prefix='chunk'):
+    return [{'key': f"{prefix}{i}", 'file': f"{prefix}.py", 'name': f"{prefix}{i}", 'start': i + 1, 'end': i + 1,
+             'text': f"{prefix} token{i} shared"} for i in range(n)]
+
+
+def test_update_embeds_only_changed_chunks(tmp_path):
+    write(str(tmp_path / 'config.py'), CONFIG_PY)
+    write(str(tmp_path / 'network.py'), NETWORK_PY)
+    index = make_index(tmp_path)
+    assert index.update() == 3
+    assert index.update() == 0
+
+    write(str(tmp_path / 'config.py'), CONFIG_PY.replace('toml.dump', 'json.dump'), bump=10)
+    assert index.update() == 1
+    assert index.search("fetch page url retries", k=1)[0]['name'] == 'fetch_page'
+
+    os.remove(str(tmp_path / 'network.py'))
+    index.update()
+    assert len(index) == 2
+    assert all(r['file'] == 'config.py' for r in index.search("fetch page url", k=5))
+
+    reopened = make_index(tmp_path)
+    assert reopened.update() == 0
+    assert reopened.search("load toml config", k=1)[0]['name'] == 'load_config'
+
+
+def test_removed_rows_are_reused(tmp_path):
+    index = make_index(tmp_path)
+    assert index.upsert(make_chunks(4)) == 4
+    index.remove(['chunk1', 'chunk2'])
+    assert len(index) == 2
+    assert index.upsert(make_chunks(2, prefix='other')) == 2
+    assert index.count == 4
+    assert {r['key'] for r in index.search_vector(index.embedder.embed(['other token1'])[0], k=1)} == {'other1'}
+
+
+def test_blockwise_search_matches_full_scan(tmp_path):
+    index = make_index(tmp_path)
+    index.upsert(make_chunks(50))
+    query = index.embedder.embed(['chunk token37'])[0]
+    full = index.search_vector(query, k=5, block_rows=1000)
+    blocked = index.search_vector(query, k=5, block_rows=7)
+    assert [r['key'] for r in blocked] == [r['key'] for r in full]
+    assert full[0]['key'] == 'chunk37'
+    expected = np.asarray(index.vectors[:index.count]) @ query
+    assert abs(full[0]['score'] - expected.max()) < 1e-5
+
+
+def test_matrix_grows_on_disk(tmp_path):
+    index = make_index(tmp_path)
+    index.upsert(make_chunks(INITIAL_CAPACITY + 5))
+    assert index.vectors.shape[0] >= INITIAL_CAPACITY + 5
+    assert os.path.getsize(index.vectors_path) == index.vectors.shape[0] * 64 * 4
+    # Rows written before the resize survive it.
+    assert np.allclose(index.vectors[3], index.embedder.embed(['chunk token3 shared'])[0])
+    assert np.allclose(index.vectors[INITIAL_CAPACITY + 4], index.embedder.embed([f"chunk token{INITIAL_CAPACITY + 4} shared"])[0])
+
+
+def test_model_change_resets_index(tmp_path):
+    index = make_index(tmp_path)
+    index.upsert(make_chunks(3))
+    index.close()
+    reopened = make_index(tmp_path, StubEmbedder(32))
+    assert len(reopened) == 0
+    assert reopened.upsert(make_chunks(3)) == 3
+    assert reopened.vectors.shape[1] == 32
+
+
+def test_fuse_results_merges_rankings():
+    a = {'file': 'a.py', 'name': 'a', 'start': 1, 'end': 2, 'text': 'x' * 40}
+    b = {'file': 'b.py', 'name': 'b', 'start': 1, 'end': 2, 'text': 'y' * 40}
+    c = {'file': 'c.py', 'name': 'c', 'start': 1, 'end': 2, 'text': 'z' * 40}
+    fused = fuse_results([[a, b], [b, c]], k=2)
+    assert [r['name'] for r in fused] == ['b', 'a']
+    assert fuse_results([[a, b, c]], k=3, token_budget=25) == [a, b]
+
+
+def test_test_slices_include_related_code(tmp_path, mock_args):
+    write(str(tmp_path / 'config.py'), CONFIG_PY)
+    write(str(tmp_path / 'loader.py'), 'def load_settings(path):\n    return load_config(path)\n')
+    index = make_index(tmp_path)
+    index.update()
+    mock_args.file = str(tmp_path / 'config.py')
+    mock_args.test_mode = 'per-function'
+    mock_args.changed_lines = None
+    node = nodes.TestGenerationAgentNode(mock_args, None)
+    slices = node.prep({'semantic_index': index})
+    load = next(s for s in slices if s['name'] == 'load_config')
+    assert '# Related code elsewhere in the repository:' in load['code']
+    assert '[loader.py:1-2 load_settings]' in load['code']
+    assert 'config.py:' not in load['code'].split('# Related code')[1]
@@ -0,0 +1,152 @@
+"""
+Tests for git-aware incremental mode (--since / --staged).
+"""
+import os
+import subprocess
+import pytest
+from theagent.utils.git_changes import parse_diff_hunks, symbols_in_ranges, changed_hunks, GitError
+from theagent import nodes
+from theagent.nodes import DocAgentNode, RefactorCodeAgentNode, BugDetectionAgentNode
+
+
+SOURCE = '''import os
+
+
+def a():
+    return 1
+
+
+def b():
+    return 2
+
+
+class C:
+    attr = 1
+
+    def m(self):
+        return 3
+
+    def n(self):
+        return 4
+'''
+
+
+class RecordingProxy:
+    def __init__(self):
+        self.calls = []
+
+    def generate_docstring(self, code, **kwargs):
+        self.calls.append(code)
+        return '"""Doc."""'
+
+    def refactor_code(self, code, **kwargs):
+        self.calls.append(code)
+        return code.replace('return', 'return 10 +')
+
+    def detect_bugs(self, code, **kwargs):
+        self.calls.append(code)
+        return "no bugs"
+
+    def generate_tests(self, code, **kwargs):
+        self.calls.append(code)
+        return "def test_x():\n    assert True\n"
+
+
+def git(cwd, *args):
+    subprocess.run(['git', *args], cwd=cwd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def test_parse_diff_hunks():
+    diff = (
+        "diff --git a/x.py b/x.py\n--- a/x.py\n+++ b/x.py\n"
+        "@@ -3 +3 @@\n-a\n+b\n"
+        "@@ -10,2 +10,0 @@\n-c\n-d\n"
+        "@@ -20,0 +19,3 @@\n+e\n+f\n+g\n"
+        "diff --git a/gone.py b/gone.py\n--- a/gone.py\n+++ /dev/null\n@@ -1 +0,0 @@\n-x\n"
+    )
+    changes = parse_diff_hunks(diff, '/repo')
+    assert changes == {os.path.join('/repo', 'x.py'): [(3, 3), (10, 11), (19, 21)]}
+
+
+def test_symbols_in_ranges_selects_methods_or_class():
+    assert [s['name'] for s in symbols_in_ranges(SOURCE, [(5, 5)])] == ['a']
+    assert [s['name'] for s in symbols_in_ranges(SOURCE, [(16, 16), (19, 19)])] == ['C.m', 'C.n']
+    # A change in the class body outside any method selects the whole class.
+    assert [s['name'] for s in symbols_in_ranges(SOURCE, [(13, 13)])] == ['C']
+    assert symbols_in_ranges(SOURCE, [(1, 1)]) == []
+    method = symbols_in_ranges(SOURCE, [(16, 16)])[0]
+    assert method['code'] == '    def m(self):\n        return 3'
+
+
+def test_changed_hunks_against_ref_and_index(tmp_path):
+    repo = str(tmp_path)
+    git(repo, 'init', '-q')
+    git(repo, 'config', 'user.email', 'dev@example.com')
+    git(repo, 'config', 'user.name', 'dev')
+    path = os.path.join(repo, 'mod.py')
+    with open(path, 'w') as f:
+        f.write(SOURCE)
+    git(repo, 'add', 'mod.py')
+    git(repo, 'commit', '-q', '-m', 'initial')
+    with open(path, 'w') as f:
+        f.write(SOURCE.replace('return 2', 'return 22'))
+    changes = changed_hunks('HEAD', cwd=repo)
+    assert changes == {os.path.realpath(path): [(9, 9)]}
+    assert changed_hunks(staged=True, cwd=repo) == {}
+    git(repo, 'add', 'mod.py')
+    assert changed_hunks(staged=True, cwd=repo) == {os.path.realpath(path): [(9, 9)]}
+    with pytest.raises(GitError):
+        changed_hunks('no-such-ref', cwd=repo)
+
+
+def make_args(mock_args, path, ranges):
+    mock_args.file = path
+    mock_args.changed_lines = {os.path.realpath(path): ranges}
+    return mock_args
+
+
+def test_doc_agent_only_changed_functions(tmp_path, mock_args):
+    path = str(tmp_path / 'mod.py')
+    with open(path, 'w') as f:
+        f.write(SOURCE)
+    node = DocAgentNode(make_args(mock_args, path, [(9, 9)]), RecordingProxy())
+    assert [f['name'] for f in node.prep({})] == ['b']
+
+
+def test_refactor_rewrites_only_changed_symbols(tmp_path, mock_args):
+    path = str(tmp_path / 'mod.py')
+    with open(path, 'w') as f:
+        f.write(SOURCE)
+    proxy = RecordingProxy()
+    node = RefactorCodeAgentNode(make_args(mock_args, path, [(19, 19)]), proxy)
+    result = node.exec(node.prep({}))
+    assert proxy.calls == ['def n(self):\n    return 4']
+    assert '        return 10 + 4' in result
+    assert 'return 3' in result and 'return 1' in result
+    compile(result, path, 'exec')
+
+
+def test_unchanged_file_is_left_alone(tmp_path, mock_args):
+    path = str(tmp_path / 'mod.py')
+    with open(path, 'w') as f:
+        f.write(SOURCE)
+    mock_args.file = path
+    mock_args.changed_lines = {}
+    proxy = RecordingProxy()
+    node = RefactorCodeAgentNode(mock_args, proxy)
+    assert node.exec(node.prep({})) == SOURCE
+    bug_node = BugDetectionAgentNode(mock_args, proxy)
+    assert bug_node.exec(bug_node.prep({})) == "No changed functions or classes to review."
+    assert proxy.calls == []
+
+
+def test_bug_and_test_agents_only_see_changed_symbols(tmp_path, mock_args):
+    path = str(tmp_path / 'mod.py')
+    with open(path, 'w') as f:
+        f.write(SOURCE)
+    proxy = RecordingProxy()
+    args = make_args(mock_args, path, [(5, 5)])
+    BugDetectionAgentNode(args, proxy).exec(SOURCE)
+    assert len(proxy.calls) == 1 and 'def a():' in proxy.calls[0] and 'def b():' not in proxy.calls[0]
+    slices = nodes.TestGenerationAgentNode(args, proxy).prep({})
+    assert [s['name'] for s in slices] == ['a']
@@ -0,0 +1,62 @@
+"""
+Tests for local intent routing (slash commands and rules) in chat mode.
+"""
+import json
+import pytest
+from theagent.utils.intent_router import parse_slash_command, route_locally
+from theagent import nodes
+
+
+class FailingProxy:
+    """The LLM must not be called for locally routed requests."""
+    def chat(self, *args, **kwargs):
+        raise AssertionError("LLM called for a locally routed request")
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    (tmp_path / 'main.py').write_text('def main():\n    pass\n')
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_slash_commands():
+    assert parse_slash_command('/read src/app.py')['parameters'] == {'file_path': 'src/app.py', 'operation': 'read'}
+    assert parse_slash_command('/find load_config')['parameters'] == {'query': 'load_config', 'operation': 'search'}
+    assert parse_slash_command('/doc app.py')['intent'] == 'code_generation'
+    assert parse_slash_command('/summary app.py')['parameters']['agent_type'] == 'summary'
+    missing = parse_slash_command('/read')
+    assert missing['intent'] == 'clarification_needed' and missing['reasoning'] == 'Usage: /read FILE'
+    assert parse_slash_command('/etc/hosts is broken') is None
+
+
+@pytest.mark.parametrize('text, route, operation', [
+    ('list files', 'local', 'list'),
+    ('read main.py', 'local', 'read'),
+    ('read missing.py', 'llm', 'read'),
+    ('where is parse_config defined?', 'local', 'search'),
+    ('find bugs', 'llm', 'search'),
+    ('read main.py and then fix it', 'llm', None),
+    ('what is a decorator?', 'llm', None),
+])
+def test_rules_respect_the_threshold(repo, text, route, operation):
+    decision = route_locally(text)
+    assert decision['route'] == route
+    if operation:
+        assert decision['intent']['parameters']['operation'] == operation
+
+
+def test_local_routes_skip_the_llm_and_are_logged(repo, mock_args):
+    mock_args.file = None
+    node = nodes.IntentRecognitionNode(mock_args, FailingProxy())
+    shared = {'user_input': 'summarize main.py', 'chat_history': []}
+    action = node.run(shared)
+    assert action == 'code_analysis'
+    assert mock_args.file == 'main.py'
+
+    shared = {'user_input': '/ls', 'chat_history': []}
+    assert node.run(shared) == 'file_management'
+    with open(repo / '.theagent' / 'routing.jsonl', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert [(r['route'], r['intent']) for r in records] == [('local', 'code_analysis'), ('slash', 'file_management')]
+    assert records[0]['rule'] == 'summary'
@@ -0,0 +1,84 @@
+"""
+Tests for background chat jobs: progress lines, /jobs, /wait, /cancel and results posted back.
+"""
+import asyncio
+import io
+import time
+from theagent.flow import create_chat_flow
+from theagent.main import post_job_results
+from theagent.utils.console import capture_output
+from theagent.utils.jobs import JobManager
+
+
+class SlowProxy:
+    delay = 0.3
+
+    def chat_stream(self, prompt, provider=None, model=None):
+        yield "```yaml\nintent: code_analysis\nparameters: {file_path: a.py, agent_type: summary}\n```"
+
+    def summarize_code(self, code, provider=None, model=None):
+        time.sleep(self.delay)
+        return f"summary of {code.strip()}"
+
+
+def test_job_streams_progress_and_is_waited_for():
+    console = io.StringIO()
+    jobs = JobManager(console=console)
+
+    def work(job):
+        with capture_output(jobs.output(job)):
+            print("step one")
+            time.sleep(0.2)
+            print("step two")
+        return "all done"
+
+    job = jobs.submit("two steps", work)
+    listing = asyncio.run(jobs.command('/jobs'))
+    assert 'running' in listing and 'two steps' in listing
+    assert asyncio.run(jobs.command(f'/wait {job.id}')).split()[:2] == ['1', 'done']
+    assert job.result == "all done"
+    assert "[JOB 1] step one\n[JOB 1] step two\n" in console.getvalue()
+    assert jobs.collect() == [job] and jobs.collect() == []
+    assert asyncio.run(jobs.command('/wait 7')) == "No job 7"
+    jobs.shutdown()
+
+
+def test_cancel_stops_a_job_at_its_next_output():
+    jobs = JobManager(console=io.StringIO())
+    steps = []
+
+    def work(job):
+        with capture_output(jobs.output(job)):
+            for i in range(100):
+                steps.append(i)
+                print(f"step {i}")
+                time.sleep(0.02)
+        return "finished"
+
+    job = jobs.submit("long loop", work)
+    time.sleep(0.1)
+    assert asyncio.run(jobs.command('/cancel 1')).startswith('Cancelling job 1')
+    asyncio.run(jobs.wait(1, timeout=2))
+    assert job.status == 'cancelled' and job.result is None and len(steps) < 20
+    assert asyncio.run(jobs.command('/cancel')) == "Usage: /cancel ID"
+    jobs.shutdown()
+
+
+def test_agent_requests_run_in_the_background(mock_args, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.py').write_text('alpha = 1\n')
+    proxy = SlowProxy()
+    jobs = JobManager()
+    flow = create_chat_flow(mock_args, proxy, jobs=jobs)
+    shared = {'chat_history': [], 'user_input': 'summarize a.py'}
+    started = time.time()
+    flow.run(shared)
+    assert time.time() - started < proxy.delay
+    assert shared['chat_history'][-1]['content'] == "Started background job 1: code_analysis summary a.py"
+
+    asyncio.run(jobs.wait())
+    assert post_job_results(shared, jobs) == [jobs.get(1)]
+    assert shared['chat_history'][-1]['content'].startswith("Result of job 1 (code_analysis summary a.py):")
+    assert 'summary of alpha = 1' in shared['chat_history'][-1]['content']
+    assert '[JOB 1] summary of alpha = 1' in capsys.readouterr().out
+    jobs.shutdown()
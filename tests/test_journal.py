@@ -0,0 +1,124 @@
+"""
+Tests for the checkpointed job journal and --resume.
+"""
+import json
+import os
+from theagent.utils.journal import JobJournal, job_id, unit_key, is_failed
+from theagent.utils.batch import run_batch
+from theagent.flow import create_batch_agent_flow
+from theagent import nodes
+
+
+def write(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+class CountingProxy:
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+
+    def summarize_code(self, code, **kwargs):
+        self.calls.append(code)
+        if self.fail_on and self.fail_on in code:
+            raise KeyboardInterrupt
+        return f"summary of {len(code)} chars"
+
+    def generate_docstring(self, code, **kwargs):
+        self.calls.append(code)
+        if self.fail_on and self.fail_on in code:
+            return "Error: rate limited"
+        return "Documented."
+
+
+def test_journal_survives_torn_writes(tmp_path):
+    path = str(tmp_path / 'job.jsonl')
+    journal = JobJournal(path)
+    journal.record('doc:a.py', 'h1', {'value': 1})
+    journal.record('doc:b.py', 'h2', 'second')
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"key": "doc:c.py", "inp')
+
+    resumed = JobJournal(path, resume=True)
+    assert set(resumed.completed) == {'doc:a.py', 'doc:b.py'}
+    assert resumed.result(resumed.lookup('doc:a.py', 'h1')) == {'value': 1}
+    assert resumed.lookup('doc:a.py', 'changed') is None
+    assert resumed.replay('doc:b.py', 'h2', lambda: 'recomputed') == 'second'
+    assert resumed.replay('doc:c.py', 'h3', lambda: 'Error: boom') == 'Error: boom'
+    assert 'doc:c.py' not in resumed.completed
+    resumed.record('doc:d.py', 'h4', 'after the torn line')
+    resumed.close()
+
+    resumed = JobJournal(path, resume=True)
+    assert set(resumed.completed) == {'doc:a.py', 'doc:b.py', 'doc:d.py'}
+    assert resumed.result(resumed.lookup('doc:d.py', 'h4')) == 'after the torn line'
+    resumed.close()
+
+    assert JobJournal(path).completed == {}  # without resume the journal starts over...
+    # ...but the previous run's checkpoints are kept aside.
+    assert 'doc:d.py' in JobJournal(path + '.prev', resume=True).completed
+
+
+def test_job_id_and_unit_keys(mock_args):
+    mock_args.agent = 'doc'
+    mock_args.model = 'a'
+    first = job_id(mock_args)
+    mock_args.model = 'b'
+    assert job_id(mock_args) != first
+    assert unit_key('doc', os.path.join(os.getcwd(), 'pkg', 'm.py'), 'f') == 'doc:pkg/m.py::f'
+    assert is_failed('# Error: no tests') and is_failed('"""Error: x"""') and is_failed('')
+    assert not is_failed('Parses the config file.') and not is_failed([])
+
+
+def test_batch_resume_skips_finished_files(tmp_path, mock_args, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    files = []
+    for name, size in (('a.py', 3), ('b.py', 2), ('c.py', 1)):
+        write(str(tmp_path / name), f'# {name}\n' + 'x = 1\n' * size)
+        files.append(str(tmp_path / name))
+    mock_args.agent = 'summary'
+    mock_args.output = 'console'
+
+    mock_args.journal = JobJournal.for_args(mock_args)
+    crashing = CountingProxy(fail_on='# c.py')
+    try:
+        run_batch(mock_args, files, lambda a: create_batch_agent_flow(a, crashing), workers=1)
+    except KeyboardInterrupt:
+        pass
+    mock_args.journal.close()
+    assert len(crashing.calls) == 3
+
+    mock_args.journal = JobJournal.for_args(mock_args, resume=True)
+    proxy = CountingProxy()
+    results = run_batch(mock_args, files, lambda a: create_batch_agent_flow(a, proxy), workers=1)
+    mock_args.journal.close()
+    assert proxy.calls == [open(files[2]).read()]
+    assert [r.get('resumed', False) for r in results] == [True, True, False]
+    assert all(r['status'] == 'ok' for r in results)
+    assert 'summary of' in results[0]['output']
+
+
+def test_function_units_are_replayed(tmp_path, mock_args, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / 'm.py')
+    write(path, 'def good():\n    return 1\n\n\ndef flaky():\n    return 2\n')
+    mock_args.file = path
+    mock_args.agent = 'doc'
+    mock_args.journal = JobJournal.for_args(mock_args)
+    first = CountingProxy(fail_on='flaky')
+    node = nodes.DocAgentNode(mock_args, first)
+    node.exec(node.prep({}))
+    mock_args.journal.close()
+
+    mock_args.journal = JobJournal.for_args(mock_args, resume=True)
+    second = CountingProxy()
+    node = nodes.DocAgentNode(mock_args, second)
+    results = node.exec(node.prep({}))
+    mock_args.journal.close()
+    assert [c.split('\n')[0] for c in second.calls] == ['def flaky():']
+    assert [r['docstring'] for r in results] == ['"""Documented."""'] * 2
+    with open(mock_args.journal.path, encoding='utf-8') as f:
+        keys = [json.loads(line)['key'] for line in f]
+    assert keys == ['DocAgentNode:m.py::good', 'DocAgentNode:m.py::flaky']
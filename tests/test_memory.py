@@ -0,0 +1,105 @@
+"""
+Tests for the token-budgeted conversation memory used in chat mode.
+"""
+import threading
+from theagent import nodes
+from theagent.main import save_session, load_session
+from theagent.utils.memory import ConversationMemory, extractive_summary
+from theagent.utils.retrieval import estimate_tokens
+
+
+def turn(i):
+    return {'role': 'user' if i % 2 == 0 else 'agent', 'content': f"message {i} " + "about the parser " * 10}
+
+
+def test_prompt_size_stays_bounded_over_long_sessions():
+    calls = []
+    def summarize(previous, messages):
+        calls.append(len(messages))
+        return f"{sum(calls)} earlier turns about the parser"
+    history = []
+    memory = ConversationMemory(history, token_budget=400, keep_recent=4, summarize=summarize)
+    sizes = []
+    for i in range(200):
+        memory.add(turn(i)['role'], turn(i)['content'])
+        memory.wait(timeout=5)
+        sizes.append(estimate_tokens(memory.render()))
+    assert max(sizes[50:]) <= 400
+    assert max(sizes[50:]) - min(sizes[50:]) < 150
+    assert history is memory.messages and 4 <= len(history) < 20
+    assert sum(calls) == 200 - len(history)
+    assert memory.render().startswith(f"Summary of earlier conversation:\n{sum(calls)} earlier turns")
+
+
+def test_turns_waiting_for_the_summary_stay_in_the_prompt():
+    release = threading.Event()
+    def summarize(previous, messages):
+        release.wait(5)
+        return "user is working on the parser"
+    memory = ConversationMemory(token_budget=200, keep_recent=2, summarize=summarize)
+    for i in range(6):
+        memory.add(turn(i)['role'], turn(i)['content'])
+    assert "Earlier turns:" in memory.render()
+    release.set()
+    memory.wait(timeout=5)
+    text = memory.render()
+    assert "Earlier turns:" not in text and "user is working on the parser" in text
+
+
+def test_failed_summary_falls_back_to_extractive():
+    memory = ConversationMemory(token_budget=200, keep_recent=1, summarize=lambda p, m: "Error: quota exceeded")
+    for i in range(4):
+        memory.add(turn(i)['role'], turn(i)['content'])
+    memory.wait(timeout=5)
+    assert memory.summary.startswith("User: message 0")
+    assert len(extractive_summary(memory.summary, [turn(9)] * 50, max_words=30).split()) == 30
+
+
+def test_file_reads_are_stored_as_references(mock_args, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'big.py').write_text("x = 1\n" * 2000)
+    shared = {'chat_history': [], 'intent_result': {'parameters': {'operation': 'read', 'file_path': 'big.py'}}}
+    memory = shared['memory'] = ConversationMemory(shared['chat_history'])
+    nodes.FileManagementNode(mock_args, None).run(shared)
+    message = shared['chat_history'][-1]
+    assert message['content'].startswith(f"[{message['ref']}: Content of big.py:")
+    assert 'x = 1' not in nodes.history_context(shared)
+    assert memory.resolve(message['ref']) == "x = 1\n" * 2000
+    assert 'content' not in memory.references[message['ref']]
+
+    session = tmp_path / 'session.json'
+    save_session(shared, str(session))
+    restored = {}
+    load_session(restored, str(session))
+    again = ConversationMemory(restored['chat_history'], state=restored['memory_state'])
+    assert again.resolve(message['ref']) == "x = 1\n" * 2000
+
+
+def test_references_can_be_read_back_in_chat(mock_args):
+    memory = ConversationMemory()
+    output = "Test results:\n" + "FAILED test_parser\n" * 200
+    message = memory.add('agent', output)
+    assert f"file_management read_reference {message['ref']}" in message['content']
+    shared = {'memory': memory, 'intent_result': {'parameters': {'operation': 'read_reference',
+                                                                 'reference': message['ref']}}}
+    nodes.FileManagementNode(mock_args, None).run(shared)
+    assert shared['file_operation_result'].endswith(output)
+    shared['intent_result']['parameters']['reference'] = 'ref-00000000'
+    nodes.FileManagementNode(mock_args, None).run(shared)
+    assert shared['file_operation_result'] == "Reference not available: ref-00000000"
+
+
+def test_reference_table_is_bounded(monkeypatch):
+    from theagent.utils import memory as memory_module
+    monkeypatch.setattr(memory_module, 'MAX_REFERENCES', 3)
+    memory = ConversationMemory(token_budget=100000)
+    refs = [memory.add('agent', f"output {i}\n" + "line\n" * 400)['ref'] for i in range(5)]
+    assert list(memory.references) == refs[2:] and memory.resolve(refs[0]) is None
+    assert len(memory.to_dict()['references']) == 3
+
+    monkeypatch.setattr(memory_module, 'MAX_REFERENCE_CHARS', 5000)
+    memory = ConversationMemory(token_budget=100000)
+    refs = [memory.add('agent', f"output {i}\n" + "line\n" * 600)['ref'] for i in range(3)]
+    assert list(memory.references) == refs[2:]
+    # Whitespace-only output still gets a reference with a title.
+    assert memory.add('agent', " \n" * 1000)['content'].startswith("[ref-")
@@ -0,0 +1,107 @@
+"""
+Tests for multi-action chat turns: independent actions run concurrently, results come back in order.
+"""
+import threading
+import time
+from theagent import nodes
+from theagent.flow import create_chat_flow
+
+MULTI_ACTION = """```yaml
+intent: multi_action
+confidence: 0.9
+reasoning: three independent requests
+actions:
+  - intent: code_analysis
+    parameters: {file_path: a.py, agent_type: summary}
+  - intent: code_analysis
+    parameters: {file_path: b.py, agent_type: summary}
+  - intent: file_management
+    parameters: {operation: read, file_path: notes.txt}
+```"""
+
+
+class SlowProxy:
+    def __init__(self, response, delay=0.3):
+        self.response = response
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = self.peak = 0
+        self.calls = []
+
+    def chat_stream(self, prompt, provider=None, model=None):
+        yield self.response
+
+    def summarize_code(self, code, provider=None, model=None):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.calls.append(code)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        return f"summary of {code.strip()}"
+
+
+def run_chat(mock_args, proxy, user_input):
+    shared = {'chat_history': [{'role': 'user', 'content': user_input}], 'user_input': user_input}
+    create_chat_flow(mock_args, proxy).run(shared)
+    return shared
+
+
+def test_independent_actions_run_concurrently(mock_args, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.py').write_text('alpha = 1\n')
+    (tmp_path / 'b.py').write_text('beta = 2\n')
+    (tmp_path / 'notes.txt').write_text('remember the milk\n')
+    proxy = SlowProxy(MULTI_ACTION)
+    started = time.time()
+    shared = run_chat(mock_args, proxy, 'summarize a.py and b.py, and show notes.txt')
+    elapsed = time.time() - started
+
+    assert proxy.peak == 2 and elapsed < 2 * proxy.delay
+    results = shared['multi_action_results']
+    assert [r['action']['parameters']['file_path'] for r in results] == ['a.py', 'b.py', 'notes.txt']
+    assert 'summary of alpha = 1' in results[0]['output'] and 'summary of beta = 2' in results[1]['output']
+    assert 'remember the milk' in results[2]['output']
+    response = shared['chat_history'][-1]['content']
+    assert response.index('[1/3] code_analysis summary a.py') < response.index('[3/3] file_management read notes.txt')
+    assert mock_args.file is None
+    out = capsys.readouterr().out
+    assert out.index('summary of alpha') < out.index('summary of beta') < out.index('remember the milk')
+
+
+def test_actions_on_the_same_file_run_in_order(mock_args, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.py').write_text('alpha = 1\n')
+    proxy = SlowProxy(None, delay=0.05)
+    action = {'intent': 'code_analysis', 'parameters': {'file_path': 'a.py', 'agent_type': 'summary'}}
+    node = nodes.MultiActionNode(mock_args, proxy)
+    shared = {'intent_result': {'intent': 'multi_action', 'actions': [action, dict(action)]}}
+    node.run(shared)
+    assert proxy.peak == 1 and len(proxy.calls) == 2
+
+
+def test_single_action_list_is_an_ordinary_request(mock_args, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    node = nodes.IntentRecognitionNode(mock_args, None)
+    shared = {'chat_history': [], 'user_input': 'summarize a.py'}
+    result = {'intent': 'multi_action', 'confidence': 0.8,
+              'actions': [{'intent': 'code_analysis', 'parameters': {'file_path': 'a.py'}}]}
+    assert node.post(shared, ('summarize a.py', ''), result) == 'code_analysis'
+    assert shared['intent_result']['parameters'] == {'file_path': 'a.py'} and mock_args.file == 'a.py'
+
+
+def test_intent_prompt_asks_for_an_action_list(mock_args, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sent = []
+
+    class RecordingProxy:
+        def chat_messages_stream(self, messages, provider=None, model=None):
+            sent.append(messages)
+            yield MULTI_ACTION
+
+    node = nodes.IntentRecognitionNode(mock_args, RecordingProxy())
+    shared = {'chat_history': [], 'user_input': 'summarize utils.py and main.py'}
+    assert node.run(shared) == 'multi_action'
+    system = sent[0][0]['content']
+    assert '6. multi_action' in system and '\nactions:\n  - intent: <action_name>' in system
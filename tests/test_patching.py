@@ -0,0 +1,125 @@
+"""
+Tests for patch-based output: diff/edit parsing, fuzzy application and fallback.
+"""
+import pytest
+from theagent.utils.patching import apply_patch_response, apply_unified_diff, apply_edit_blocks, PatchError
+from theagent.nodes import RefactorCodeAgentNode
+
+
+SOURCE = '''import os
+
+
+def add(a, b):
+    return a + b
+
+
+def sub(a, b):
+    return a - b
+
+
+def mul(a, b):
+    return a * b
+'''
+
+
+def test_unified_diff_applies_with_wrong_line_numbers():
+    diff = '''--- a/m.py
++++ b/m.py
+@@ -40,3 +40,3 @@
+ def sub(a, b):
+-    return a - b
++    return a - b  # subtract
+'''
+    patched = apply_unified_diff(SOURCE, diff)
+    assert 'return a - b  # subtract' in patched
+    assert 'return a + b\n' in patched
+
+
+def test_unified_diff_fuzz_drops_mismatched_context():
+    diff = '''@@ -11,4 +11,4 @@
+ # a comment that is not in the file
+ def mul(a, b):
+-    return a * b
++    return b * a
+'''
+    assert 'return b * a' in apply_unified_diff(SOURCE, diff, fuzz=1)
+    with pytest.raises(PatchError):
+        apply_unified_diff(SOURCE, diff, fuzz=0)
+
+
+def test_multiple_hunks_track_offsets():
+    diff = '''@@ -4,2 +4,3 @@
+ def add(a, b):
++    """Add."""
+     return a + b
+@@ -12,2 +13,3 @@
+ def mul(a, b):
++    """Multiply."""
+     return a * b
+'''
+    patched = apply_unified_diff(SOURCE, diff)
+    assert '"""Add."""' in patched and '"""Multiply."""' in patched
+
+
+def test_edit_blocks_whitespace_tolerant():
+    response = '''<<<<<<< SEARCH
+def add(a, b):
+  return a + b
+=======
+def add(a: int, b: int) -> int:
+    return a + b
+>>>>>>> REPLACE'''
+    assert 'def add(a: int, b: int) -> int:' in apply_edit_blocks(SOURCE, response)
+
+
+def test_patch_response_verifies_syntax():
+    response = '''```diff
+@@ -8,2 +8,2 @@
+ def sub(a, b):
+-    return a - b
++    return a -
+```'''
+    with pytest.raises(PatchError):
+        apply_patch_response(SOURCE, response)
+
+
+def test_no_changes_returns_source():
+    assert apply_patch_response(SOURCE, 'NO_CHANGES') == SOURCE
+
+
+class PatchProxy:
+    def __init__(self, patch):
+        self.patch = patch
+        self.calls = []
+
+    def generate_patch(self, code, task, edit_format='diff', **kwargs):
+        self.calls.append('generate_patch')
+        return self.patch
+
+    def refactor_code(self, code, **kwargs):
+        self.calls.append('refactor_code')
+        return code + '# regenerated\n'
+
+
+def test_refactor_node_uses_patch(mock_args, temp_py_file, cleanup_temp_files):
+    file_path = temp_py_file(SOURCE)
+    cleanup_temp_files(file_path)
+    mock_args.file = file_path
+    mock_args.edit_format = 'diff'
+    proxy = PatchProxy('@@ -5,1 +5,1 @@\n-    return a + b\n+    return sum((a, b))\n')
+    node = RefactorCodeAgentNode(mock_args, proxy)
+    result = node.exec(node.prep({}))
+    assert proxy.calls == ['generate_patch']
+    assert 'return sum((a, b))' in result
+
+
+def test_refactor_node_falls_back_to_full_regeneration(mock_args, temp_py_file, cleanup_temp_files):
+    file_path = temp_py_file(SOURCE)
+    cleanup_temp_files(file_path)
+    mock_args.file = file_path
+    mock_args.edit_format = 'edits'
+    proxy = PatchProxy('<<<<<<< SEARCH\ndef missing():\n=======\ndef other():\n>>>>>>> REPLACE')
+    node = RefactorCodeAgentNode(mock_args, proxy)
+    result = node.exec(node.prep({}))
+    assert proxy.calls == ['generate_patch', 'refactor_code']
+    assert result.endswith('# regenerated\n')
@@ -0,0 +1,85 @@
+"""
+Tests for speculative prefetch of the files mentioned in chat input.
+"""
+import os
+import time
+from theagent.flow import create_chat_flow
+from theagent.utils.cache import content_hash
+from theagent.utils.prefetch import Prefetcher, mentioned_files
+
+SOURCE = "def parse_config(path):\n    return {}\n"
+
+
+class FakeIndex:
+    def __init__(self, root):
+        self.root = root
+
+    def find_symbols(self, word, limit=20):
+        return [{'name': 'parse_config', 'file': 'pkg/config.py'}] if 'parse' in word else []
+
+    def file_symbols(self, path):
+        return [{'name': 'parse_config', 'line': 1}]
+
+
+def test_paths_and_symbols_are_detected(tmp_path):
+    (tmp_path / 'pkg').mkdir()
+    (tmp_path / 'pkg' / 'config.py').write_text(SOURCE)
+    (tmp_path / 'nodes.py').write_text(SOURCE)
+    root = str(tmp_path)
+    assert mentioned_files("what does nodes.py do? and missing.py?", root) == [os.path.join(root, 'nodes.py')]
+    assert mentioned_files("where is parse_config used in nodes.py", root, FakeIndex(root)) == [
+        os.path.join(root, 'nodes.py'), os.path.join(root, 'pkg', 'config.py')]
+
+
+def test_entries_are_parsed_and_dropped_when_the_file_changes(tmp_path):
+    path = tmp_path / 'nodes.py'
+    path.write_text(SOURCE)
+    prefetch = Prefetcher(str(tmp_path), symbol_index=FakeIndex(str(tmp_path)))
+    prefetch.start("explain nodes.py")
+    entry = prefetch.get('nodes.py')
+    assert entry['text'] == SOURCE and entry['tree'].body[0].name == 'parse_config'
+    assert entry['symbols'] == [{'name': 'parse_config', 'line': 1}] and entry['summary'] is None
+    assert prefetch.get('other.py') is None
+
+    path.write_text(SOURCE + "\n# edited\n")
+    assert prefetch.get(str(path)) is None
+    prefetch.close()
+
+
+class IntentProxy:
+    def __init__(self, prefetch):
+        self.prefetch = prefetch
+        self.ready_during_intent = None
+        self.summaries = 0
+
+    def chat_messages_stream(self, messages, provider=None, model=None):
+        time.sleep(0.1)
+        future = self.prefetch._entries.get(os.path.abspath('nodes.py'))
+        self.ready_during_intent = future is not None and future.done()
+        yield "```yaml\nintent: code_analysis\nparameters: {file_path: nodes.py, agent_type: summary}\n```"
+
+    def summarize_code(self, code, provider=None, model=None):
+        self.summaries += 1
+        return "fresh summary"
+
+
+def test_file_is_ready_when_the_action_starts(mock_args, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'nodes.py').write_text(SOURCE)
+    prefetch = Prefetcher(str(tmp_path))
+    prefetch.summary_cache.set(content_hash('file', SOURCE), "cached summary")
+    mock_args.prefetch = prefetch
+    proxy = IntentProxy(prefetch)
+    shared = {'chat_history': [], 'user_input': 'what does nodes.py do'}
+    create_chat_flow(mock_args, proxy).run(shared)
+
+    assert proxy.ready_during_intent
+    assert shared['summary'] == "cached summary" and proxy.summaries == 0 and prefetch.hits > 0
+
+    # A summary computed in chat is cached for the next time the file is mentioned.
+    (tmp_path / 'nodes.py').write_text(SOURCE + "\n")
+    shared = {'chat_history': [], 'user_input': 'what does nodes.py do'}
+    create_chat_flow(mock_args, proxy).run(shared)
+    assert shared['summary'] == "fresh summary"
+    assert prefetch.summary_cache.get(content_hash('file', SOURCE + "\n")) == "fresh summary"
+    prefetch.close()
@@ -0,0 +1,68 @@
+"""
+Tests for blob-backed project context and per-file digests.
+"""
+import os
+from theagent import nodes
+from theagent.main import load_project_context
+from theagent.utils.project_context import ContextCache, file_digest
+from theagent.utils.session_log import SessionLog
+
+MODULE = '''"""Command line entry point. Parses arguments and runs the flow."""
+import sys
+
+class App:
+    def run(self):
+        pass
+
+    def _helper(self):
+        pass
+
+def main():
+    return App().run()
+'''
+
+
+def test_digests_by_file_type():
+    assert file_digest('main.py', MODULE) == {'headline': 'Command line entry point.',
+                                              'symbols': ['class App', 'App.run()', 'main()'], 'more_symbols': 0}
+    readme = file_digest('README.md', "# TheAgent\n\n![badge](x)\n\nAn AI code assistant. It writes docs.\n\n## Setup\n## Usage\n")
+    assert readme == {'headline': 'TheAgent: An AI code assistant.', 'symbols': ['Setup', 'Usage'], 'more_symbols': 0}
+    toml = file_digest('pyproject.toml', '[project]\nname = "theagent"\ndescription = "Code helper"\n[tool.pytest]\n')
+    assert toml['headline'] == 'theagent - Code helper' and toml['symbols'] == ['project', 'tool.pytest']
+    assert file_digest('requirements.txt', "# pinned\nrequests>=2\npyyaml\n")['symbols'] == ['requests', 'pyyaml']
+
+
+def test_files_are_reread_only_when_they_change(tmp_path):
+    path = tmp_path / 'main.py'
+    path.write_text(MODULE)
+    (tmp_path / 'copy.py').write_text(MODULE)
+    cache = ContextCache(str(tmp_path))
+    first = cache.refresh([str(path), str(tmp_path / 'copy.py'), str(tmp_path / 'missing.py')])
+    assert first[str(path)]['hash'] == first[str(tmp_path / 'copy.py')]['hash']
+    assert 'error' in first[str(tmp_path / 'missing.py')]
+    assert cache.read(first[str(path)]) == MODULE
+    assert sum(len(files) for _, _, files in os.walk(cache.store.directory)) == 1
+
+    cache = ContextCache(str(tmp_path))
+    assert cache.refresh([str(path)])[str(path)] == first[str(path)] and cache.reads == 0
+    os.utime(path, ns=(1, 1))
+    assert cache.refresh([str(path)])[str(path)]['hash'] == first[str(path)]['hash'] and cache.reads == 1
+    path.write_text(MODULE + "\ndef extra():\n    pass\n")
+    changed = cache.refresh([str(path)])[str(path)]
+    assert changed['hash'] != first[str(path)]['hash'] and 'extra()' in changed['symbols']
+
+
+def test_prompts_and_sessions_use_digests(mock_args, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'main.py').write_text(MODULE + "# " + "filler " * 500 + "\n")
+    shared = {'chat_history': [], 'user_input': 'what does this project do?'}
+    load_project_context(shared)
+    assert list(shared['project_context']) == ['main.py']
+
+    node = nodes.IntentRecognitionNode(mock_args, None)
+    _, context = node.prep(shared)
+    assert "[main.py] Command line entry point.\n  contains: class App, App.run(), main()" in context
+    assert 'filler' not in context
+
+    SessionLog(str(tmp_path / 'session.jsonl')).rewrite(shared)
+    assert 'filler' not in (tmp_path / 'session.jsonl').read_text()
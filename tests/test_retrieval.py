@@ -0,0 +1,128 @@
+"""
+Tests for BM25 retrieval of chat context.
+"""
+import os
+import time
+from theagent.utils.retrieval import BM25Index, tokenize, chunk_source, estimate_tokens, format_chunks
+from theagent.nodes import IntentRecognitionNode
+
+
+CONFIG_PY = '''"""Configuration loading."""
+import toml
+
+
+def load_config(path):
+    """Read the TOML config file."""
+    return toml.load(path)
+
+
+class ConfigWriter:
+    mode = "w"
+
+    def save_config(self, path, data):
+        with open(path, self.mode) as f:
+            toml.dump(data, f)
+'''
+
+NETWORK_PY = '''def fetch_page(url, retries=3):
+    for _ in range(retries):
+        response = http_get(url)
+        if response.ok:
+            return response.text
+'''
+
+README = '''# Project
+
+Intro text.
+
+## Configuration
+
+Settings live in a TOML config file.
+'''
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def make_repo(tmp_path):
+    write(str(tmp_path / 'app' / 'config.py'), CONFIG_PY)
+    write(str(tmp_path / 'app' / 'network.py'), NETWORK_PY)
+    write(str(tmp_path / 'README.md'), README)
+    return tmp_path
+
+
+def test_tokenize_splits_identifiers():
+    tokens = tokenize("def loadConfigFile(self, config_path): return HTTPServer")
+    assert 'loadconfigfile' in tokens and 'config' in tokens and 'file' in tokens
+    assert 'config_path' in tokens and 'path' in tokens
+    assert 'http' in tokens and 'server' in tokens
+    assert 'self' not in tokens and 'def' not in tokens
+
+
+def test_chunk_source_granularity():
+    assert chunk_source('config.py', CONFIG_PY) == [
+        ('<module>', 1, 2), ('load_config', 5, 7), ('ConfigWriter', 10, 12), ('ConfigWriter.save_config', 13, 15)]
+    assert [c[0] for c in chunk_source('README.md', README)] == ['Project', 'Configuration']
+    assert chunk_source('broken.py', 'def f(:\n') == [('lines 1-2', 1, 2)]
+
+
+def test_search_ranks_relevant_chunks(tmp_path):
+    root = make_repo(tmp_path)
+    index = BM25Index(str(root))
+    assert index.update() == 3
+    results = index.search("how is the config file loaded?", k=2)
+    assert results[0]['name'] == 'load_config'
+    assert results[0]['file'] == 'app/config.py'
+    assert 'toml.load(path)' in results[0]['text']
+    assert all(r['file'] != 'app/network.py' for r in results)
+    assert index.search("retry fetching a url")[0]['name'] == 'fetch_page'
+    assert index.search("zzz unknown") == []
+
+
+def test_search_respects_token_budget(tmp_path):
+    root = make_repo(tmp_path)
+    index = BM25Index(str(root))
+    index.update()
+    results = index.search("config", k=10, token_budget=40)
+    assert sum(estimate_tokens(r['text']) for r in results) <= 40
+    assert results
+    assert '[app/config.py:' in format_chunks(results)
+
+
+def test_incremental_update_and_persistence(tmp_path):
+    root = make_repo(tmp_path)
+    index = BM25Index(str(root))
+    index.update()
+    assert index.update() == 0
+
+    path = str(root / 'app' / 'network.py')
+    write(path, 'def upload_archive(bucket):\n    return bucket.put("archive")\n')
+    later = time.time() + 10
+    os.utime(path, (later, later))
+    os.remove(str(root / 'README.md'))
+    assert index.update() == 2
+    assert index.search("fetch page url") == []
+    assert index.search("upload archive")[0]['name'] == 'upload_archive'
+    assert all(key[0] != 'README.md' for key in index.chunks)
+
+    reloaded = BM25Index(str(root))
+    assert reloaded.update() == 0
+    assert reloaded.search("upload archive")[0]['name'] == 'upload_archive'
+    assert reloaded.total_length == index.total_length
+
+
+def test_intent_prompt_uses_retrieved_chunks(tmp_path, mock_args):
+    root = make_repo(tmp_path)
+    index = BM25Index(str(root))
+    index.update()
+    mock_args.context_budget = 200
+    node = IntentRecognitionNode(mock_args, None)
+    shared = {'user_input': 'where do we save the config?', 'retriever': index, 'chat_history': []}
+    _, context = node.prep(shared)
+    assert context.startswith('Relevant code from the repository:')
+    assert 'save_config' in context
+    assert 'fetch_page' not in context
+    assert shared['retrieved_context'][0]['name'] == 'ConfigWriter.save_config'
@@ -0,0 +1,90 @@
+"""
+Tests for the `theagent serve` daemon and the thin client that forwards to it.
+"""
+import os
+import socket
+import threading
+import pytest
+from theagent.main import build_parser
+from theagent.server import (
+    DaemonState, create_server, serve, request, read_daemon_info, forward_to_daemon, can_forward
+)
+from theagent.utils.symbol_index import SymbolIndex
+
+
+class CountingProxy:
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = self.cache_misses = 0
+
+    def summarize_code(self, code, **kwargs):
+        self.calls += 1
+        return "A module with one function."
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'mod.py').write_text('def add(a, b):\n    return a + b\n')
+    servers = []
+
+    def start(tcp=False):
+        state = DaemonState(str(tmp_path), response_cache_size=8)
+        server = create_server(state, tcp=tcp)
+        ready = threading.Event()
+        thread = threading.Thread(target=serve, args=(server, ready), daemon=True)
+        thread.start()
+        assert ready.wait(5)
+        servers.append((server, thread))
+        return state, read_daemon_info()
+    yield start
+    for server, thread in servers:
+        server.shutdown()
+        thread.join(5)
+
+
+def test_can_forward():
+    parser = build_parser()
+    assert can_forward(parser.parse_args(['--agent', 'doc', '--file', 'x.py']))
+    assert can_forward(parser.parse_args(['--agent', 'doc', '--path', 'src']))
+    assert can_forward(parser.parse_args(['index', '--search', 'foo']))
+    assert not can_forward(parser.parse_args(['--chat']))
+    assert not can_forward(parser.parse_args(['--agent', 'doc', '--file', 'x.py', '--enhanced']))
+    assert not can_forward(parser.parse_args(['watch', '--agent', 'doc']))
+    assert not can_forward(parser.parse_args(['config', 'show']))
+
+
+@pytest.mark.parametrize('tcp', [False, True])
+def test_forwarded_commands_share_warm_state(daemon, tcp):
+    if not tcp and not hasattr(socket, 'AF_UNIX'):
+        pytest.skip("Unix sockets unavailable")
+    state, info = daemon(tcp=tcp)
+    assert info['transport'] == ('tcp' if tcp else 'unix')
+    assert (info['token'] is not None) == tcp
+    proxy = CountingProxy()
+    state.proxies[(None, None, None, None)] = proxy
+
+    assert forward_to_daemon(['index', '--search', 'add']) == 0
+    assert SymbolIndex.exists(state.root)
+    for _ in range(2):
+        assert forward_to_daemon(['--agent', 'summary', '--file', 'mod.py']) == 0
+    assert proxy.calls == 2
+    assert state.symbol_index is not None
+    assert request(info, {'op': 'status'})['status']['requests'] == 3
+
+
+def test_daemon_rejects_bad_token_and_other_directories(daemon, tmp_path):
+    state, info = daemon(tcp=True)
+    assert request(dict(info, token='wrong'), {'op': 'status'}) == {'error': 'bad token'}
+    other = tmp_path / 'elsewhere'
+    other.mkdir()
+    os.chdir(str(other))
+    assert request(info, {'op': 'run', 'argv': [], 'cwd': str(other)})['error'].startswith('daemon serves')
+
+
+def test_stale_daemon_file_falls_back_to_local(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.theagent').mkdir()
+    (tmp_path / '.theagent' / 'daemon.json').write_text(
+        '{"transport": "unix", "path": "%s"}' % (tmp_path / '.theagent' / 'gone.sock'))
+    assert forward_to_daemon(['--agent', 'doc', '--file', 'x.py']) is None
@@ -0,0 +1,106 @@
+"""
+Tests for the append-only chat session log.
+"""
+import gzip
+import json
+from theagent.utils import session_log
+from theagent.utils.memory import ConversationMemory
+from theagent.utils.session_log import SessionLog
+
+
+def chat(log, shared, turns, start=0):
+    for i in range(start, start + turns):
+        shared['chat_history'].append({'role': 'user', 'content': f"question {i}"})
+        shared['chat_history'].append({'role': 'agent', 'content': f"answer {i}"})
+        if shared.get('memory') is not None:
+            shared['memory'].compact()
+        log.record(shared)
+
+
+def messages(path):
+    return [r for r in SessionLog(path).iter_records() if r['type'] == 'message']
+
+
+def test_turns_are_appended_and_a_torn_line_is_ignored(tmp_path):
+    path = str(tmp_path / 'session.jsonl')
+    log = SessionLog(path)
+    shared = {'chat_history': [], 'project_context': {'README.md': 'hello'}}
+    chat(log, shared, 3)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"type":"message","role":"user","cont')
+    assert [m['content'] for m in messages(path)][-2:] == ['question 2', 'answer 2']
+    assert sum(1 for r in SessionLog(path).iter_records() if r['type'] == 'context') == 1
+
+    reader = SessionLog(path)
+    restored = reader.load()
+    assert [m['content'] for m in restored['chat_history']] == [f"{kind} {i}" for i in range(3) for kind in ('question', 'answer')]
+    assert restored['project_context'] == {'README.md': 'hello'}
+    # Appending after the crash starts on a fresh line.
+    chat(reader, restored, 1, start=3)
+    assert [m['content'] for m in messages(path)][-3:] == ['answer 2', 'question 3', 'answer 3']
+
+
+def test_long_sessions_load_lazily_with_memory(tmp_path, monkeypatch):
+    path = str(tmp_path / 'session.jsonl')
+    log = SessionLog(path, compact_every=10 ** 6)
+    shared = {'chat_history': [], 'project_context': {}}
+    memory = shared['memory'] = ConversationMemory(shared['chat_history'], token_budget=60, keep_recent=4,
+                                                   on_fold=lambda m: log.record(shared))
+    chat(log, shared, 5000)
+    memory.wait(timeout=5)
+    log.record(shared)
+    assert len(messages(path)) == 10000
+
+    parsed = []
+    parse = session_log._parse
+    monkeypatch.setattr(session_log, '_parse', lambda line: parsed.append(line) or parse(line))
+    reader = SessionLog(path)
+    restored = reader.load()
+    assert len(parsed) < 50
+    assert restored['chat_history'] == shared['chat_history']
+    assert restored['memory_state']['summary'] == memory.summary
+
+    # Appending to the loaded log continues after the hydrated turns.
+    monkeypatch.setattr(session_log, '_parse', parse)
+    shared = {'chat_history': restored['chat_history'], 'project_context': {}}
+    chat(reader, shared, 1, start=5000)
+    contents = [m['content'] for m in messages(path)]
+    assert len(contents) == 10002 and contents[-3:] == ['answer 4999', 'question 5000', 'answer 5000']
+
+
+def test_compressed_log_and_compaction(tmp_path):
+    path = str(tmp_path / 'session.jsonl.gz')
+    log = SessionLog(path, compact_every=5)
+    shared = {'chat_history': [], 'project_context': {}}
+    for i in range(12):
+        shared['project_context'] = {'notes.md': f"version {i}"}
+        chat(log, shared, 1, start=i)
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert sum(r['type'] == 'message' for r in records) == 24
+    assert sum(r['type'] == 'context' for r in records) < 6
+    restored = SessionLog(path).load()
+    assert restored['project_context'] == {'notes.md': 'version 11'}
+    assert restored['chat_history'][-1] == {'role': 'agent', 'content': 'answer 11'}
+
+    # A gzip member cut short by a crash is dropped before the next append.
+    with open(path, 'ab') as f:
+        f.write(gzip.compress(b'{"type":"message","role":"user","content":"lost"}\n')[:20])
+    reader = SessionLog(path)
+    shared = {**reader.load(), 'project_context': {'notes.md': 'version 11'}}
+    chat(reader, shared, 1, start=12)
+    assert [m['content'] for m in messages(path)][-3:] == ['answer 11', 'question 12', 'answer 12']
+
+
+def test_legacy_json_session_is_imported_and_converted(tmp_path):
+    path = tmp_path / 'theagent_session.json'
+    path.write_text(json.dumps({'chat_history': [{'role': 'user', 'content': 'hi'}],
+                                'project_context': {'main.py': 'print(1)'}}, indent=2))
+    log = SessionLog(str(path))
+    shared = {**log.load(), 'chat_history': []}
+    restored = SessionLog(str(path)).load()
+    assert restored['chat_history'] == [{'role': 'user', 'content': 'hi'}]
+    shared['chat_history'] = restored['chat_history']
+    log.rewrite(shared)
+    assert not session_log.is_legacy_session(str(path))
+    assert SessionLog(str(path)).load()['project_context'] == {'main.py': 'print(1)'}
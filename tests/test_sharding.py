@@ -0,0 +1,138 @@
+"""
+Tests for deterministic sharding, shard result bundles and `theagent merge`.
+"""
+import os
+from types import SimpleNamespace
+import pytest
+from theagent.utils.sharding import (parse_shard, shard_of, assign_shard, read_originals, write_bundle,
+                                     merge_bundles, symbol_units)
+
+
+MODULE = '''import os
+
+
+def first(a):
+    return a + 1
+
+
+def second(b):
+    return b * 2
+
+
+class Third:
+    def method(self):
+        return 3
+'''
+
+
+def write(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def make_repo(tmp_path, count=6):
+    files = []
+    for i in range(count):
+        path = str(tmp_path / f"mod{i}.py")
+        write(path, MODULE)
+        files.append(path)
+    return files
+
+
+def mark_lines(source, ranges, label):
+    """Simulate an agent rewriting the first line of each owned symbol."""
+    lines = source.splitlines(True)
+    for start, _ in ranges:
+        lines[start - 1] = lines[start - 1].rstrip('\n') + f"  # {label}\n"
+    return ''.join(lines)
+
+
+def run_shards(tmp_path, files, total, by):
+    """Write one bundle per shard as if each shard had run the refactor agent."""
+    root = str(tmp_path)
+    bundles = []
+    for index in range(1, total + 1):
+        args = SimpleNamespace(agent='refactor', shard_by=by)
+        selected, universe, owned, changed = assign_shard(files, index, total, root, by=by)
+        originals = read_originals(selected, root, args.agent)
+        results = []
+        for path in selected:
+            source = originals[os.path.relpath(path, root)]['source']
+            ranges = changed[os.path.realpath(path)] if changed else [(1, 1)]
+            code = mark_lines(source, ranges, f"shard {index}")
+            results.append({'file': path, 'status': 'ok', 'error': None, 'duration': 0.1,
+                            'output': '', 'result': code, 'code': code})
+        bundle = str(tmp_path / 'bundles' / f"shard{index}")
+        write_bundle(bundle, args, root, (index, total), universe, owned, results, originals)
+        bundles.append(bundle)
+    return bundles
+
+
+def run_shards_all(tmp_path, files, name, index):
+    """A bundle claiming shard index of 2 that rewrote the first line of every file."""
+    root = str(tmp_path)
+    args = SimpleNamespace(agent='refactor', shard_by='file')
+    universe = sorted(os.path.relpath(p, root) for p in files)
+    owned = universe if index == 1 else []
+    originals = read_originals(files, root, args.agent)
+    results = [{'file': p, 'status': 'ok', 'error': None, 'duration': 0.0, 'output': '', 'result': None,
+                'code': mark_lines(MODULE, [(1, 1)], name)} for p in files]
+    bundle = str(tmp_path / 'bundles' / name)
+    write_bundle(bundle, args, root, (index, 2), universe, owned, results, originals)
+    return bundle
+
+
+def test_parse_shard():
+    assert parse_shard('2/4') == (2, 4)
+    for bad in ('0/4', '5/4', '1/0', 'two/4', '3'):
+        with pytest.raises(ValueError):
+            parse_shard(bad)
+    assert shard_of('src/app.py', 7) == shard_of('src/app.py', 7)
+
+
+@pytest.mark.parametrize('by', ['file', 'symbol'])
+def test_shards_partition_the_units(tmp_path, by):
+    files = make_repo(tmp_path)
+    owned_by_shard = [assign_shard(files, i, 3, str(tmp_path), by=by)[2] for i in (1, 2, 3)]
+    universe = assign_shard(files, 1, 3, str(tmp_path), by=by)[1]
+    everything = [unit for owned in owned_by_shard for unit in owned]
+    assert sorted(everything) == universe
+    assert len(set(everything)) == len(everything)
+    if by == 'symbol':
+        assert len(universe) == 3 * len(files)
+
+
+def test_merge_applies_symbol_shards_to_the_same_file(tmp_path):
+    files = make_repo(tmp_path, count=2)
+    bundles = run_shards(tmp_path, files, 3, 'symbol')
+    merged = merge_bundles(bundles, root=str(tmp_path), apply=True)
+    assert merged['errors'] == [] and merged['conflicts'] == []
+    assert merged['units'] == 6
+    for path in files:
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        for start, _ in [(u[1], u[2]) for u in symbol_units(path, str(tmp_path))]:
+            assert '# shard' in source.splitlines()[start - 1]
+        assert 'import os\n' in source
+    assert merged['patch'].count('+++ b/') == 2
+
+
+def test_merge_reports_missing_duplicate_and_conflicting_shards(tmp_path):
+    files = make_repo(tmp_path)
+    bundles = run_shards(tmp_path, files, 2, 'file')
+    merged = merge_bundles(bundles[:1], root=str(tmp_path))
+    assert any('missing shard(s): 2/2' in e for e in merged['errors'])
+    assert any('not processed by any shard' in e for e in merged['errors'])
+
+    merged = merge_bundles(bundles + bundles[:1], root=str(tmp_path), apply=True)
+    assert any('shard 1/2 appears 2 times' in e for e in merged['errors'])
+    assert merged['applied'] == []
+    with open(files[0], encoding='utf-8') as f:
+        assert f.read() == MODULE
+
+    # Two runs that each rewrote every file clash on the same lines.
+    one = run_shards_all(tmp_path, files, 'one', 1)
+    two = run_shards_all(tmp_path, files, 'two', 2)
+    merged = merge_bundles([one, two], root=str(tmp_path))
+    assert merged['conflicts'] and 'shards 1 and 2 both change lines 1-1' in merged['conflicts'][0]
+
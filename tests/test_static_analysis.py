@@ -0,0 +1,128 @@
+"""
+Tests for the local static-analysis pre-filter used by BugDetectionAgentNode.
+"""
+from theagent.utils.static_analysis import analyze_source, select_regions, cyclomatic_complexity
+from theagent.nodes import BugDetectionAgentNode
+import ast
+
+
+CODE = '''import os
+
+LIMIT = 10
+
+def clean(items=[]):
+    total = 0
+    unused = os.getcwd()
+    for item in items:
+        total += item
+    return total
+    print("never")
+
+def risky(path):
+    try:
+        return open(path).read()
+    except:
+        return missing_name
+
+class Box:
+    size = LIMIT
+    def grow(self, n):
+        return [x * self.size for x in range(n)]
+
+def fine(a, b):
+    return a + b
+'''
+
+
+def checks(findings):
+    return {(f['check'], f['line']) for f in findings}
+
+
+def test_detects_each_local_check():
+    findings, tree = analyze_source(CODE)
+    found = checks(findings)
+    assert ('mutable-default', 5) in found
+    assert ('unused-variable', 7) in found
+    assert ('unreachable-code', 11) in found
+    assert ('bare-except', 16) in found
+    assert ('undefined-name', 17) in found
+    assert not any(f['symbol'] in ('grow', 'fine') for f in findings)
+
+
+def test_no_false_positives_for_scopes():
+    code = '''import json as j
+def outer(x, *args, key=None, **kw):
+    def inner():
+        return x + len(args)
+    data = [y for y in range(3) if y]
+    with open(x) as fh:
+        pass
+    try:
+        pass
+    except ValueError as err:
+        print(err)
+    if (n := len(data)) > 1:
+        return n, fh, key, kw, j, inner, __name__
+'''
+    findings, _ = analyze_source(code)
+    assert findings == []
+
+
+def test_class_body_names_not_visible_in_methods():
+    findings, _ = analyze_source('class A:\n    x = 1\n    def m(self):\n        return x\n')
+    assert ('undefined-name', 4) in checks(findings)
+
+
+def test_regions_only_cover_flagged_functions():
+    findings, tree = analyze_source(CODE)
+    regions = select_regions(CODE, findings, tree)
+    assert [r['name'] for r in regions] == ['clean', 'risky']
+    assert regions[0]['code'].startswith('def clean')
+
+
+def test_complexity_threshold_selects_function():
+    code = 'def branchy(a, b):\n' + ''.join(f'    if a == {i} and b:\n        return {i}\n' for i in range(6)) + '    return -1\n'
+    assert cyclomatic_complexity(ast.parse(code).body[0]) == 13
+    findings, tree = analyze_source(code, complexity_threshold=10)
+    assert [f['check'] for f in findings] == ['high-complexity']
+    assert [r['name'] for r in select_regions(code, findings, tree)] == ['branchy']
+
+
+def test_syntax_error_is_a_finding():
+    findings, tree = analyze_source('def broken(:\n')
+    assert tree is None and findings[0]['check'] == 'syntax-error'
+
+
+class RecordingProxy:
+    def __init__(self):
+        self.prompts = []
+
+    def detect_bugs(self, code, **kwargs):
+        self.prompts.append(code)
+        return 'LLM analysis'
+
+
+def test_node_local_only_makes_no_llm_call(mock_args, temp_py_file, cleanup_temp_files):
+    file_path = temp_py_file(CODE)
+    cleanup_temp_files(file_path)
+    mock_args.file = file_path
+    mock_args.local_only = True
+    proxy = RecordingProxy()
+    node = BugDetectionAgentNode(mock_args, proxy)
+    result = node.exec(node.prep({}))
+    assert proxy.prompts == []
+    assert '[bare-except]' in result
+
+
+def test_node_prefilter_sends_regions_with_hints(mock_args, temp_py_file, cleanup_temp_files):
+    file_path = temp_py_file(CODE)
+    cleanup_temp_files(file_path)
+    mock_args.file = file_path
+    mock_args.prefilter = True
+    proxy = RecordingProxy()
+    node = BugDetectionAgentNode(mock_args, proxy)
+    result = node.exec(node.prep({}))
+    assert len(proxy.prompts) == 2
+    assert all('Local static analysis findings' in p for p in proxy.prompts)
+    assert not any('def fine' in p for p in proxy.prompts)
+    assert 'LLM review' in result
@@ -0,0 +1,66 @@
+"""
+Tests for incremental parsing of the streamed intent response and early routing.
+"""
+from theagent import nodes
+from theagent.utils.prefetch import Prefetcher
+from theagent.utils.stream_parser import IncrementalIntentParser
+
+READ_RESPONSE = ["```yaml\nintent: file_", "management\nparameters:\n  file_path: main.py\n",
+                 "  operation: read\n", "reasoning: the user wants to see main.py\n", "confidence: 0.9\n```\n"]
+
+
+def feed(chunks):
+    parser = IncrementalIntentParser()
+    states = [parser.feed(chunk) for chunk in chunks]
+    return parser, states
+
+
+def test_ready_once_intent_and_required_parameters_arrive():
+    parser, states = feed(READ_RESPONSE)
+    assert states == [False, False, True, True, True]
+    assert parser.closed and parser.result['confidence'] == 0.9
+
+    parser, states = feed(["```yaml\nintent: code_analysis\nparameters: {file_path: a.py, agent_type: summary}\n",
+                           "reasoning: long text that is not needed"])
+    assert states[0] and parser.parameters == {'file_path': 'a.py', 'agent_type': 'summary'}
+    parser, states = feed(["```yaml\nintent: clarification_needed\n", "reasoning: which file?\n"])
+    assert states == [True, True]
+
+
+def test_answers_and_action_lists_wait_for_the_block_to_close():
+    parser, states = feed(["```yaml\nintent: general_question\nconfidence: 0.9\n", "```\nA decorator ", "wraps."])
+    assert states == [False, True, True] and parser.tail == "A decorator wraps."
+    parser, states = feed(["```yaml\nintent: multi_action\nactions:\n  - intent: file_management\n",
+                           "    parameters: {operation: list}\n", "```"])
+    assert states == [False, False, False]
+    assert parser.finish()['actions'] == [{'intent': 'file_management', 'parameters': {'operation': 'list'}}]
+
+
+class StreamingProxy:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.sent = 0
+        self.closed = False
+
+    def chat_messages_stream(self, messages, provider=None, model=None):
+        try:
+            for chunk in self.chunks:
+                self.sent += 1
+                yield chunk
+        finally:
+            self.closed = True
+
+
+def test_intent_node_routes_before_the_response_ends(mock_args, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'main.py').write_text("print('hi')\n")
+    mock_args.prefetch = Prefetcher(str(tmp_path))
+    proxy = StreamingProxy(READ_RESPONSE)
+    node = nodes.IntentRecognitionNode(mock_args, proxy)
+    shared = {'chat_history': [], 'user_input': 'show me the entry point'}
+    assert node.run(shared) == 'file_management'
+    assert proxy.sent == 3 and proxy.closed
+    assert shared['intent_result']['parameters'] == {'file_path': 'main.py', 'operation': 'read'}
+    # The chosen file was not in the input; it is prefetched from the streamed parameters.
+    assert mock_args.prefetch.get('main.py')['text'] == "print('hi')\n"
+    mock_args.prefetch.close()
@@ -0,0 +1,114 @@
+"""
+Tests for hierarchical map-reduce summarization.
+"""
+import os
+import threading
+from theagent.utils.cache import JsonCache
+from theagent.utils.summary_tree import HierarchicalSummarizer, extract_symbols, render_summary_tree
+from theagent.nodes import SummaryAgentNode
+
+
+class CountingProxy:
+    """Mock proxy that records every summarization call."""
+    def __init__(self):
+        self.calls = []
+
+    def summarize_code(self, code, **kwargs):
+        self.calls.append(('summarize_code', code))
+        return f"summary of {code.splitlines()[0]}"
+
+    def combine_summaries(self, summaries, level='file', name='', **kwargs):
+        self.calls.append(('combine_summaries', name))
+        return f"{level} {name} combining {len(summaries)} parts"
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def make_repo(tmp_path):
+    write(str(tmp_path / 'pkg' / 'a.py'), 'def f():\n    return 1\n\nclass C:\n    pass\n')
+    write(str(tmp_path / 'pkg' / 'b.py'), 'def g():\n    return 2\n')
+    write(str(tmp_path / 'other' / 'c.py'), 'def h():\n    return 3\n')
+    return tmp_path
+
+
+def test_extract_symbols_top_level_only():
+    symbols = extract_symbols('import os\n\ndef f():\n    def inner():\n        pass\n\nclass C:\n    def m(self):\n        pass\n')
+    assert [s['name'] for s in symbols] == ['f', 'C']
+    assert symbols[1]['code'].startswith('class C:')
+
+
+def test_extract_symbols_invalid_source():
+    assert extract_symbols('def broken(:') == []
+
+
+def test_summarize_tree_reduces_to_repository(tmp_path):
+    repo = make_repo(tmp_path)
+    proxy = CountingProxy()
+    summarizer = HierarchicalSummarizer(proxy, cache=JsonCache(str(tmp_path / 'cache.json')))
+    tree = summarizer.summarize_tree(str(repo))
+    assert tree['kind'] == 'repository'
+    assert [c['name'] for c in tree['children']] == ['other', 'pkg']
+    assert 'repository' in tree['summary']
+    rendered = render_summary_tree(tree)
+    assert 'a.py' in rendered and 'c.py' in rendered
+
+
+def test_changing_one_file_only_recomputes_its_path(tmp_path):
+    repo = make_repo(tmp_path)
+    cache = JsonCache(str(tmp_path / 'cache.json'))
+    HierarchicalSummarizer(CountingProxy(), cache=cache).summarize_tree(str(repo))
+
+    write(str(repo / 'pkg' / 'b.py'), 'def g():\n    return 20\n')
+    proxy = CountingProxy()
+    HierarchicalSummarizer(proxy, cache=JsonCache(str(tmp_path / 'cache.json'))).summarize_tree(str(repo))
+    # b.py itself, the pkg package and the repository root; a.py and other/ come from cache.
+    assert ('summarize_code', 'def g():\n    return 20\n') in proxy.calls
+    assert sorted(name for method, name in proxy.calls if method == 'combine_summaries') == sorted([os.path.basename(str(repo)), 'pkg'])
+    assert len(proxy.calls) == 3
+
+
+def test_summary_node_map_reduce_mode(tmp_path, mock_args):
+    repo = make_repo(tmp_path)
+    args = mock_args
+    args.file = str(repo)
+    args.summary_mode = 'map-reduce'
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        node = SummaryAgentNode(args, CountingProxy())
+        shared = {}
+        path = node.prep(shared)
+        summary = node.exec(path)
+        node.post(shared, path, summary)
+    finally:
+        os.chdir(cwd)
+    assert shared['summary'].startswith('[repository]')
+    assert os.path.exists(tmp_path / '.theagent' / 'summaries.json')
+
+
+def test_concurrent_cache_saves_do_not_collide(tmp_path):
+    path = str(tmp_path / 'summaries.json')
+    errors = []
+
+    def save(i):
+        # Separate instances, as in separate processes sharing one cache file.
+        cache = JsonCache(path)
+        for n in range(20):
+            cache.set(f"{i}-{n}", n)
+            try:
+                cache.save()
+            except OSError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == [] and os.listdir(tmp_path) == ['summaries.json']
+    # Last writer wins, but the file is always a complete cache.
+    assert len(JsonCache(path)) >= 20
@@ -0,0 +1,145 @@
+"""
+Tests for the persistent SQLite symbol index.
+"""
+import os
+import time
+from theagent.utils.symbol_index import SymbolIndex, extract_index_entries, module_name, format_symbols
+from theagent.nodes import FileManagementNode, ContextAwarenessNode, lookup_mentioned_symbols
+
+
+MODULE = '''"""Module doc."""
+import os
+from .helpers import load as load_helper
+
+
+def parse_config(path: str) -> dict:
+    """Parse a config file."""
+    return load_helper(os.path.join(path, 'x'))
+
+
+class Loader(Base):
+    def run(self):
+        return parse_config(self.path)
+
+    async def _private(self):
+        pass
+'''
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def make_repo(tmp_path, files=3):
+    write(str(tmp_path / 'src' / 'pkg' / '__init__.py'), '')
+    write(str(tmp_path / 'src' / 'pkg' / 'config.py'), MODULE)
+    for i in range(files):
+        write(str(tmp_path / 'src' / 'pkg' / f'mod{i}.py'), f'from pkg.config import parse_config\n\ndef f{i}():\n    return parse_config("{i}")\n')
+    return tmp_path
+
+
+def test_module_name():
+    assert module_name('src/pkg/config.py') == 'pkg.config'
+    assert module_name('pkg/__init__.py') == 'pkg'
+    assert module_name('setup.py') == 'setup'
+
+
+def test_extract_index_entries():
+    symbols, imports, calls = extract_index_entries(MODULE)
+    by_name = {s[1]: s for s in symbols}
+    assert by_name['parse_config'][2] == 'function'
+    assert by_name['parse_config'][5] == 'def parse_config(path: str) -> dict'
+    assert by_name['parse_config'][6] == 1
+    assert by_name['Loader'][5] == 'class Loader(Base)'
+    assert by_name['Loader.run'][2] == 'method'
+    assert by_name['Loader._private'][5].startswith('async def _private')
+    assert ('os', None, None, 2) in imports
+    assert ('.helpers', 'load', 'load_helper', 3) in imports
+    assert ('Loader.run', 'parse_config', 'parse_config', 13) in calls
+    assert ('parse_config', 'join', 'os.path.join', 8) in calls
+
+
+def test_build_query_and_incremental_update(tmp_path):
+    root = make_repo(tmp_path)
+    index = SymbolIndex(str(root))
+    stats = index.update()
+    assert stats['files'] == 5 and stats['parsed'] == 5
+    assert index.stats()['symbols'] == 7
+    found = index.find_symbols('parse_config')
+    assert found[0]['file'] == 'src/pkg/config.py' and found[0]['line'] == 6
+    assert {c['caller'] for c in index.callers('parse_config')} == {'Loader.run', 'f0', 'f1', 'f2'}
+    assert [r['file'] for r in index.importers('pkg')] == ['src/pkg/mod0.py', 'src/pkg/mod1.py', 'src/pkg/mod2.py']
+    assert [s['qualname'] for s in index.undocumented()] == ['Loader', 'Loader.run', 'f0', 'f1', 'f2']
+    assert [s['qualname'] for s in index.find_symbols('load')] == ['Loader', 'Loader.run', 'Loader._private']
+
+    # Nothing changed: nothing is re-read.
+    stats = index.update()
+    assert stats['checked'] == 0 and stats['parsed'] == 0
+
+    # Touched but identical content: stat is refreshed, nothing is re-parsed.
+    path = str(root / 'src' / 'pkg' / 'mod0.py')
+    later = time.time() + 10
+    os.utime(path, (later, later))
+    stats = index.update()
+    assert stats['checked'] == 1 and stats['parsed'] == 0
+    assert index.update()['checked'] == 0
+
+    write(path, 'def g():\n    pass\n')
+    os.remove(str(root / 'src' / 'pkg' / 'mod1.py'))
+    stats = index.update()
+    assert stats['parsed'] == 1 and stats['removed'] == 1
+    assert index.find_symbols('f0') == []
+    assert index.find_symbols('g')[0]['file'] == 'src/pkg/mod0.py'
+    assert 'src/pkg/mod1.py' not in index.files()
+    index.close()
+
+    # The index persists across instances.
+    reopened = SymbolIndex(str(root))
+    assert reopened.update()['parsed'] == 0
+    assert reopened.find_symbols('g')
+    reopened.close()
+
+
+def test_parallel_build_matches_serial(tmp_path):
+    root = make_repo(tmp_path, files=40)
+    index = SymbolIndex(str(root))
+    stats = index.update()
+    assert stats['parsed'] == 42
+    assert len(index.callers('parse_config')) == 41
+    index.close()
+
+
+def test_syntax_errors_are_recorded(tmp_path):
+    write(str(tmp_path / 'bad.py'), 'def broken(:\n')
+    index = SymbolIndex(str(tmp_path))
+    index.update()
+    assert index.files() == ['bad.py']
+    assert index.stats()['symbols'] == 0
+    index.close()
+
+
+def test_nodes_query_the_index(tmp_path, mock_args):
+    root = make_repo(tmp_path)
+    index = SymbolIndex(str(root))
+    index.update()
+    node = FileManagementNode(mock_args, None)
+    node.prep({'symbol_index': index})
+    result = node.exec({'parameters': {'operation': 'search', 'query': 'parse_config'}})
+    assert 'src/pkg/config.py:6 function parse_config' in result
+    assert 'Called from:' in result and 'Loader.run' in result
+    assert [s['qualname'] for s in lookup_mentioned_symbols(index, 'why does Loader call parse_config?')] == ['Loader', 'parse_config']
+
+    context = ContextAwarenessNode()
+    info = context.exec(context.prep({'symbol_index': index}))
+    assert 'src/pkg/config.py' in info['available_files']
+    assert info['index_stats']['symbols'] == 7
+    index.close()
+
+
+def test_search_without_index(mock_args):
+    node = FileManagementNode(mock_args, None)
+    node.prep({})
+    assert 'theagent index' in node.exec({'parameters': {'operation': 'search', 'query': 'x'}})
+    assert format_symbols([]) == "No matching symbols."
@@ -0,0 +1,95 @@
+"""
+Tests for sandboxed parallel execution of generated tests.
+"""
+import os
+from theagent.utils.test_runner import (
+    collect_test_ids, run_tests_parallel, replace_definitions, extract_definitions
+)
+from theagent.nodes import TestGenerationAgentNode
+
+
+GENERATED = '''import time
+from calc import add
+
+
+def test_add_ok():
+    assert add(1, 2) == 3
+
+
+def test_add_wrong():
+    assert add(1, 2) == 4
+
+
+class TestSlow:
+    def test_sleeps(self):
+        time.sleep(10)
+'''
+
+
+def write(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return str(path)
+
+
+def test_collect_test_ids():
+    assert collect_test_ids(GENERATED) == ['test_add_ok', 'test_add_wrong', 'TestSlow::test_sleeps']
+    assert collect_test_ids('def broken(:') == []
+
+
+def test_run_tests_parallel_reports_each_test(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    write(src / 'calc.py', 'def add(a, b):\n    return a + b\n')
+    test_file = write(tmp_path / 'test_calc.py', GENERATED)
+    results = run_tests_parallel([test_file], timeout=3, source_dirs={test_file: str(src)})
+    status = {r['test']: r['status'] for r in results}
+    assert status == {'test_add_ok': 'passed', 'test_add_wrong': 'failed', 'TestSlow::test_sleeps': 'error'}
+    assert 'Timed out' in [r for r in results if r['test'] == 'TestSlow::test_sleeps'][0]['output']
+    # Tests run in a throwaway working directory.
+    assert not os.path.exists(tmp_path / '.pytest_cache')
+
+
+def test_replace_definitions_swaps_only_named_tests():
+    fixed = 'import math\n\ndef test_add_wrong():\n    assert add(1, 2) == 3\n'
+    merged = replace_definitions(GENERATED, fixed)
+    assert 'assert add(1, 2) == 4' not in merged
+    assert 'def test_add_ok' in merged and 'class TestSlow' in merged
+    assert merged.startswith('import math\n')
+    assert extract_definitions(merged, ['test_add_wrong']) == 'def test_add_wrong():\n    assert add(1, 2) == 3'
+
+
+def test_node_validates_and_repairs_failing_tests(mock_args, tmp_path):
+    source = write(tmp_path / 'calc.py', 'def add(a, b):\n    return a + b\n')
+
+    class Proxy:
+        def __init__(self):
+            self.repair_calls = []
+
+        def generate_tests(self, code, **kwargs):
+            return GENERATED.replace('class TestSlow:\n    def test_sleeps(self):\n        time.sleep(10)\n', '')
+
+        def repair_tests(self, failing, output, source_code, **kwargs):
+            self.repair_calls.append(failing)
+            return 'def test_add_wrong():\n    assert add(2, 2) == 4\n'
+
+    mock_args.file = source
+    mock_args.validate_tests = True
+    mock_args.repair_tests = 1
+    mock_args.test_timeout = 10
+    proxy = Proxy()
+    node = TestGenerationAgentNode(mock_args, proxy)
+    shared = {}
+    source_code = node.prep(shared)
+    tests = node.exec(source_code)
+    node.post(shared, source_code, tests)
+    assert len(proxy.repair_calls) == 1 and 'test_add_ok' not in proxy.repair_calls[0]
+    assert 'add(2, 2) == 4' in tests
+    assert {r['test']: r['status'] for r in shared['test_results']} == {'test_add_ok': 'passed', 'test_add_wrong': 'passed'}
+
+    # Reused without validation, the node does not report the previous run's results.
+    mock_args.validate_tests = False
+    shared = {}
+    tests = node.exec(node.prep(shared))
+    node.post(shared, None, tests)
+    assert 'test_results' not in shared
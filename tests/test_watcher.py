@@ -0,0 +1,107 @@
+"""
+Tests for watch mode: change detection, debouncing and own-write suppression.
+"""
+import os
+import sys
+import time
+import pytest
+from theagent.utils.watcher import (
+    InotifyWatcher, PollingWatcher, WatchSession, changed_line_ranges, wait_for_changes, agent_outputs
+)
+from theagent.utils.git_changes import symbols_in_ranges
+
+SOURCE = '''def first():
+    return 1
+
+
+def second():
+    return 2
+'''
+
+
+def write(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def test_changed_line_ranges():
+    assert changed_line_ranges(SOURCE, SOURCE) == []
+    edited = SOURCE.replace('return 2', 'return 3')
+    assert changed_line_ranges(SOURCE, edited) == [(6, 6)]
+    assert [s['name'] for s in symbols_in_ranges(edited, changed_line_ranges(SOURCE, edited))] == ['second']
+    assert changed_line_ranges(SOURCE, SOURCE.replace('    return 1\n', '')) == [(1, 2)]
+    assert changed_line_ranges(None, SOURCE) == [(1, 6)]
+
+
+def test_session_ignores_unchanged_and_own_writes(tmp_path):
+    path = str(tmp_path / 'mod.py')
+    write(path, SOURCE)
+    session = WatchSession([path])
+    assert session.changes([path]) == {}
+
+    write(path, SOURCE.replace('return 1', 'return 10'))
+    assert session.changes([path]) == {os.path.realpath(path): [(2, 2)]}
+    # An agent rewrites the file in place; once remembered, the rewrite is not a new change.
+    write(path, '"""Docs."""\n' + SOURCE.replace('return 1', 'return 10'))
+    # Later agents see both the user edit and the earlier agent rewrite.
+    assert session.ranges_since(path) == [(1, 1), (3, 3)]
+    session.remember([path])
+    assert session.changes([path]) == {}
+
+    os.remove(path)
+    assert session.changes([path]) == {}
+    assert os.path.realpath(path) not in session.sources
+
+
+def test_agent_outputs(tmp_path):
+    path = str(tmp_path / 'mod.py')
+    write(path, SOURCE)
+    start = time.time() - 1
+    write(str(tmp_path / 'mod_typed.py'), SOURCE)
+    write(str(tmp_path / 'other.py'), SOURCE)
+    assert agent_outputs([path], start) == {path, str(tmp_path / 'mod_typed.py')}
+    assert agent_outputs([path], time.time() + 60) == {path}
+
+
+class FakeWatcher:
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def read(self, timeout):
+        return self.batches.pop(0) if self.batches else set()
+
+
+def test_wait_for_changes_coalesces_bursts():
+    watcher = FakeWatcher([set(), {'a.py'}, {'a.py', 'b.py'}, {'a.py'}, set(), {'c.py'}])
+    assert wait_for_changes(watcher, debounce=0.01) == {'a.py', 'b.py'}
+    assert wait_for_changes(watcher, debounce=0.01) == {'c.py'}
+
+
+def test_polling_watcher_detects_changes(tmp_path):
+    path = str(tmp_path / 'mod.py')
+    write(path, SOURCE)
+    watcher = PollingWatcher(str(tmp_path), interval=0.01)
+    assert watcher.read(0.05) == set()
+    write(str(tmp_path / 'notes.txt'), 'ignored')
+    write(path, SOURCE + '\n# more\n')
+    os.utime(path, (time.time() + 5, time.time() + 5))
+    assert watcher.read(0.05) == {path}
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="inotify is Linux-only")
+def test_inotify_watcher_follows_new_directories(tmp_path):
+    watcher = InotifyWatcher(str(tmp_path))
+    try:
+        path = str(tmp_path / 'mod.py')
+        write(path, SOURCE)
+        assert path in wait_for_changes(watcher, debounce=0.05)
+        os.makedirs(str(tmp_path / 'pkg'))
+        nested = str(tmp_path / 'pkg' / 'inner.py')
+        write(nested, SOURCE)
+        seen = wait_for_changes(watcher, debounce=0.1)
+        write(nested, SOURCE + '\n')
+        seen |= wait_for_changes(watcher, debounce=0.05)
+        assert nested in seen
+        assert watcher.read(0.01) == set()
+    finally:
+        watcher.close()
@@ -0,0 +1,90 @@
+"""
+Tests for the pull-based work queue (SQLite and Redis-compatible backends) and its workers.
+"""
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from theagent.utils.work_queue import SQLiteQueue, RedisQueue, LocalRedis, run_worker, format_queue_status
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def queue(request, tmp_path):
+    if request.param == 'sqlite':
+        q = SQLiteQueue(str(tmp_path / 'queue.db'), max_attempts=2)
+    else:
+        q = RedisQueue(LocalRedis(), max_attempts=2)
+    yield q
+    q.close()
+
+
+def units(*names):
+    return [(name, {'file': name, 'ranges': None}, size) for size, name in enumerate(names)]
+
+
+def test_lease_complete_and_retry(queue):
+    assert queue.enqueue(units('small.py', 'big.py')) == 2
+    assert queue.enqueue(units('small.py')) == 0
+    first = queue.lease('w1')
+    assert first['id'] == 'big.py' and first['attempts'] == 1
+    second = queue.lease('w2')
+    assert second['id'] == 'small.py'
+    assert queue.lease('w3') is None
+
+    assert queue.complete('big.py', 'w1', {'status': 'ok'})
+    assert not queue.complete('small.py', 'w1', {'status': 'ok'})
+    # A failure is retried until it runs out of attempts.
+    assert queue.complete('small.py', 'w2', {'status': 'error'}, ok=False)
+    retry = queue.lease('w1')
+    assert retry['id'] == 'small.py' and retry['attempts'] == 2
+    queue.complete('small.py', 'w1', {'status': 'error', 'error': 'boom'}, ok=False)
+    assert queue.counts() == {'pending': 0, 'leased': 0, 'done': 1, 'failed': 1}
+    assert queue.results()['small.py']['error'] == 'boom'
+    assert {w['name']: (w['processed'], w['failed']) for w in queue.workers()} == {'w1': (1, 1), 'w2': (0, 1)}
+
+
+def test_expired_lease_moves_to_another_worker(queue):
+    queue.enqueue(units('a.py'))
+    queue.lease('stalled', lease_seconds=0.05)
+    assert queue.lease('w2') is None
+    time.sleep(0.1)
+    assert not queue.heartbeat('a.py', 'stalled')
+    taken = queue.lease('w2', lease_seconds=0.05)
+    assert taken['id'] == 'a.py' and taken['attempts'] == 2
+    assert queue.heartbeat('a.py', 'w2', lease_seconds=10)
+    assert not queue.complete('a.py', 'stalled', {'status': 'ok'})
+    assert queue.complete('a.py', 'w2', {'status': 'ok'})
+
+
+def test_workers_drain_the_queue_in_parallel(queue, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    paths = []
+    for i in range(8):
+        path = tmp_path / f"m{i}.py"
+        path.write_text(f"def f{i}():\n    return {i}\n")
+        paths.append(str(path))
+    queue.enqueue([(p, {'file': p, 'ranges': None}, 1) for p in paths])
+
+    class SlowFlow:
+        def __init__(self, args):
+            self.args = args
+
+        def run(self, shared):
+            time.sleep(0.05)
+            shared['summary'] = f"summary of {self.args.file}"
+
+    args = SimpleNamespace(agent='summary', verbose=False)
+    finished = {}
+    def work(name):
+        finished[name] = run_worker(queue, args, SlowFlow, name=name, poll=0.01, exit_when_idle=True)
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(finished.values()) == 8
+    assert time.time() - start < 8 * 0.05
+    assert queue.counts()['done'] == 8
+    assert queue.results()[paths[3]]['result'] == f"summary of {paths[3]}"
+    assert format_queue_status(queue).startswith("8/8 unit(s) finished: 8 done")